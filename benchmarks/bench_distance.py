@@ -0,0 +1,78 @@
+"""
+Benchmarks for distances between point clouds: kNN, Hausdorff, chamfer and Sinkhorn.
+"""
+import numpy as np
+import point_cloud_utils as pcu
+
+from .common import POINT_COUNTS, THREAD_COUNTS, ThreadScaling, random_points, skip_if_too_large
+
+
+class KNearestNeighbors:
+    params = (POINT_COUNTS, [1, 8])
+    param_names = ["num_points", "k"]
+    timeout = 600
+
+    def setup(self, num_points, k):
+        skip_if_too_large(num_points)
+        self.source = random_points(num_points, seed=0)
+        self.target = random_points(num_points, seed=1)
+
+    def time_k_nearest_neighbors(self, num_points, k):
+        pcu.k_nearest_neighbors(self.source, self.target, k)
+
+    def peakmem_k_nearest_neighbors(self, num_points, k):
+        pcu.k_nearest_neighbors(self.source, self.target, k)
+
+
+class HausdorffChamfer:
+    params = POINT_COUNTS
+    param_names = ["num_points"]
+    timeout = 600
+
+    def setup(self, num_points):
+        skip_if_too_large(num_points)
+        self.x = random_points(num_points, seed=0)
+        self.y = random_points(num_points, seed=1)
+
+    def time_hausdorff_distance(self, num_points):
+        pcu.hausdorff_distance(self.x, self.y)
+
+    def time_chamfer_distance(self, num_points):
+        pcu.chamfer_distance(self.x, self.y)
+
+    def peakmem_chamfer_distance(self, num_points):
+        pcu.chamfer_distance(self.x, self.y)
+
+
+class Sinkhorn:
+    # Sinkhorn needs the dense #x by #y distance matrix so it only scales to a few thousand points
+    params = [10 ** 2, 10 ** 3, 2 * 10 ** 3]
+    param_names = ["num_points"]
+
+    def setup(self, num_points):
+        self.x = random_points(num_points, seed=0)
+        self.y = random_points(num_points, seed=1)
+        self.w = np.full(num_points, 1.0 / num_points)
+        self.M = pcu.pairwise_distances(self.x, self.y)
+
+    def time_pairwise_distances(self, num_points):
+        pcu.pairwise_distances(self.x, self.y)
+
+    def time_sinkhorn(self, num_points):
+        pcu.sinkhorn(self.w, self.w, self.M, eps=1e-3)
+
+    def peakmem_sinkhorn(self, num_points):
+        pcu.sinkhorn(self.w, self.w, self.M, eps=1e-3)
+
+
+class KNearestNeighborsThreads(ThreadScaling):
+    params = THREAD_COUNTS
+    param_names = ["num_threads"]
+
+    def setup(self, num_threads):
+        self.limit_threads(num_threads)
+        self.source = random_points(10 ** 6, seed=0)
+        self.target = random_points(10 ** 6, seed=1)
+
+    def time_k_nearest_neighbors(self, num_threads):
+        pcu.k_nearest_neighbors(self.source, self.target, 8)
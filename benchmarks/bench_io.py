@@ -0,0 +1,77 @@
+"""
+Benchmarks for loading and saving meshes and point clouds.
+"""
+import os
+import shutil
+import tempfile
+
+import point_cloud_utils as pcu
+
+from .common import DATA_DIR, POINT_COUNTS, grid_mesh, random_points, skip_if_too_large
+
+
+class LoadDataMeshes:
+    params = ["cube_twist.obj", "duplicated_pcloud.ply"]
+    param_names = ["filename"]
+
+    def setup(self, filename):
+        pcu.disable_mesh_cache()
+        self.path = os.path.join(DATA_DIR, filename)
+
+    def time_load_triangle_mesh(self, filename):
+        pcu.load_triangle_mesh(self.path)
+
+    def time_load_mesh_vf(self, filename):
+        pcu.load_mesh_vf(self.path)
+
+
+class PointCloudIO:
+    params = (POINT_COUNTS, [".ply", ".obj"])
+    param_names = ["num_points", "extension"]
+    timeout = 600
+
+    def setup(self, num_points, extension):
+        skip_if_too_large(num_points)
+        pcu.disable_mesh_cache()
+        self.tmpdir = tempfile.mkdtemp()
+        self.v = random_points(num_points)
+        self.n = random_points(num_points, seed=1)
+        self.load_path = os.path.join(self.tmpdir, "load" + extension)
+        self.save_path = os.path.join(self.tmpdir, "save" + extension)
+        pcu.save_triangle_mesh(self.load_path, v=self.v, vn=self.n)
+
+    def teardown(self, num_points, extension):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def time_save_triangle_mesh(self, num_points, extension):
+        pcu.save_triangle_mesh(self.save_path, v=self.v, vn=self.n)
+
+    def time_load_triangle_mesh(self, num_points, extension):
+        pcu.load_triangle_mesh(self.load_path)
+
+    def peakmem_load_triangle_mesh(self, num_points, extension):
+        pcu.load_triangle_mesh(self.load_path)
+
+
+class TriangleMeshIO:
+    params = ([10 ** 4, 10 ** 6], [".ply", ".obj", ".off"])
+    param_names = ["num_vertices", "extension"]
+    timeout = 600
+
+    def setup(self, num_vertices, extension):
+        skip_if_too_large(num_vertices)
+        pcu.disable_mesh_cache()
+        self.tmpdir = tempfile.mkdtemp()
+        self.v, self.f = grid_mesh(num_vertices)
+        self.load_path = os.path.join(self.tmpdir, "load" + extension)
+        self.save_path = os.path.join(self.tmpdir, "save" + extension)
+        pcu.save_mesh_vf(self.load_path, self.v, self.f)
+
+    def teardown(self, num_vertices, extension):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def time_save_mesh_vf(self, num_vertices, extension):
+        pcu.save_mesh_vf(self.save_path, self.v, self.f)
+
+    def time_load_mesh_vf(self, num_vertices, extension):
+        pcu.load_mesh_vf(self.load_path)
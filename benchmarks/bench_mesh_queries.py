@@ -0,0 +1,61 @@
+"""
+Benchmarks for queries against a triangle mesh: signed distances, closest points and signed distance grids.
+"""
+import point_cloud_utils as pcu
+
+from .common import POINT_COUNTS, THREAD_COUNTS, ThreadScaling, load_mesh, random_points, skip_if_too_large
+
+
+class MeshQueries:
+    params = POINT_COUNTS
+    param_names = ["num_queries"]
+    timeout = 600
+
+    def setup(self, num_queries):
+        skip_if_too_large(num_queries)
+        self.v, self.f = load_mesh()
+        self.p = random_points(num_queries)
+        self.mesh_query = pcu.MeshQuery(self.v, self.f)
+
+    def time_signed_distance(self, num_queries):
+        pcu.signed_distance(self.p, self.v, self.f)
+
+    def peakmem_signed_distance(self, num_queries):
+        pcu.signed_distance(self.p, self.v, self.f)
+
+    def time_signed_distance_band(self, num_queries):
+        pcu.signed_distance(self.p, self.v, self.f, band=0.05)
+
+    def time_closest_points_on_mesh(self, num_queries):
+        pcu.closest_points_on_mesh(self.p, self.v, self.f)
+
+    def time_mesh_query_signed_distance(self, num_queries):
+        self.mesh_query.signed_distance(self.p)
+
+
+class SignedDistanceGrid:
+    params = ([64, 128, 256], [False, True])
+    param_names = ["resolution", "sparse"]
+    timeout = 600
+
+    def setup(self, resolution, sparse):
+        self.v, self.f = load_mesh()
+
+    def time_signed_distance_grid(self, resolution, sparse):
+        pcu.signed_distance_grid(self.v, self.f, resolution=resolution, band=0.05, sparse=sparse)
+
+    def peakmem_signed_distance_grid(self, resolution, sparse):
+        pcu.signed_distance_grid(self.v, self.f, resolution=resolution, band=0.05, sparse=sparse)
+
+
+class SignedDistanceThreads(ThreadScaling):
+    params = THREAD_COUNTS
+    param_names = ["num_threads"]
+
+    def setup(self, num_threads):
+        self.limit_threads(num_threads)
+        self.v, self.f = load_mesh()
+        self.p = random_points(10 ** 6)
+
+    def time_signed_distance(self, num_threads):
+        pcu.signed_distance(self.p, self.v, self.f)
@@ -0,0 +1,47 @@
+"""
+Benchmarks for point cloud and mesh normal estimation.
+"""
+import point_cloud_utils as pcu
+
+from .common import POINT_COUNTS, THREAD_COUNTS, ThreadScaling, grid_mesh, skip_if_too_large, surface_points
+
+
+class EstimatePointCloudNormals:
+    params = (POINT_COUNTS, [8, 32])
+    param_names = ["num_points", "k"]
+    timeout = 600
+
+    def setup(self, num_points, k):
+        skip_if_too_large(num_points)
+        self.points, _ = surface_points(num_points)
+
+    def time_estimate_point_cloud_normals(self, num_points, k):
+        pcu.estimate_point_cloud_normals(self.points, k=k)
+
+    def peakmem_estimate_point_cloud_normals(self, num_points, k):
+        pcu.estimate_point_cloud_normals(self.points, k=k)
+
+
+class EstimateMeshNormals:
+    params = POINT_COUNTS
+    param_names = ["num_vertices"]
+    timeout = 600
+
+    def setup(self, num_vertices):
+        skip_if_too_large(num_vertices)
+        self.v, self.f = grid_mesh(num_vertices)
+
+    def time_estimate_mesh_normals(self, num_vertices):
+        pcu.estimate_mesh_normals(self.v, self.f)
+
+
+class EstimatePointCloudNormalsThreads(ThreadScaling):
+    params = THREAD_COUNTS
+    param_names = ["num_threads"]
+
+    def setup(self, num_threads):
+        self.limit_threads(num_threads)
+        self.points, _ = surface_points(10 ** 6)
+
+    def time_estimate_point_cloud_normals(self, num_threads):
+        pcu.estimate_point_cloud_normals(self.points, k=16)
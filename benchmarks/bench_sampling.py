@@ -0,0 +1,75 @@
+"""
+Benchmarks for point cloud downsampling, voxelization and mesh sampling.
+"""
+import point_cloud_utils as pcu
+
+from .common import POINT_COUNTS, THREAD_COUNTS, ThreadScaling, grid_mesh, load_mesh, random_points, \
+    skip_if_too_large, surface_points
+
+
+class DownsampleVoxelGrid:
+    params = POINT_COUNTS
+    param_names = ["num_points"]
+    timeout = 600
+
+    def setup(self, num_points):
+        skip_if_too_large(num_points)
+        self.points = random_points(num_points)
+
+    def time_downsample_point_cloud_voxel_grid(self, num_points):
+        pcu.downsample_point_cloud_voxel_grid(1.0 / 64.0, self.points)
+
+    def peakmem_downsample_point_cloud_voxel_grid(self, num_points):
+        pcu.downsample_point_cloud_voxel_grid(1.0 / 64.0, self.points)
+
+    def time_voxelize_point_cloud(self, num_points):
+        pcu.voxelize_point_cloud(self.points, 1.0 / 64.0, features=self.points)
+
+    def peakmem_voxelize_point_cloud(self, num_points):
+        pcu.voxelize_point_cloud(self.points, 1.0 / 64.0, features=self.points)
+
+
+class DownsamplePoissonDisk:
+    params = POINT_COUNTS
+    param_names = ["num_points"]
+    timeout = 600
+
+    def setup(self, num_points):
+        skip_if_too_large(num_points)
+        self.points, _ = surface_points(num_points)
+
+    def time_downsample_point_cloud_poisson_disk(self, num_points):
+        pcu.downsample_point_cloud_poisson_disk(self.points, num_points // 10, random_seed=1)
+
+    def peakmem_downsample_point_cloud_poisson_disk(self, num_points):
+        pcu.downsample_point_cloud_poisson_disk(self.points, num_points // 10, random_seed=1)
+
+
+class SampleMesh:
+    params = (["cube_twist", "grid_10^6"], [10 ** 3, 10 ** 5])
+    param_names = ["mesh", "num_samples"]
+    timeout = 600
+
+    def setup(self, mesh, num_samples):
+        self.v, self.f = load_mesh() if mesh == "cube_twist" else grid_mesh(10 ** 6)
+
+    def time_sample_mesh_random(self, mesh, num_samples):
+        pcu.sample_mesh_random(self.v, self.f, num_samples, random_seed=1)
+
+    def time_sample_mesh_poisson_disk(self, mesh, num_samples):
+        pcu.sample_mesh_poisson_disk(self.v, self.f, num_samples, random_seed=1)
+
+    def peakmem_sample_mesh_poisson_disk(self, mesh, num_samples):
+        pcu.sample_mesh_poisson_disk(self.v, self.f, num_samples, random_seed=1)
+
+
+class VoxelizeThreads(ThreadScaling):
+    params = THREAD_COUNTS
+    param_names = ["num_threads"]
+
+    def setup(self, num_threads):
+        self.limit_threads(num_threads)
+        self.points = random_points(10 ** 7)
+
+    def time_voxelize_point_cloud(self, num_threads):
+        pcu.voxelize_point_cloud(self.points, 1.0 / 256.0, features=self.points)
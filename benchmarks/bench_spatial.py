@@ -0,0 +1,96 @@
+"""
+Benchmarks for spatial indexing: Morton codes, octrees and KD trees.
+"""
+import numpy as np
+import point_cloud_utils as pcu
+
+from .common import POINT_COUNTS, THREAD_COUNTS, ThreadScaling, random_points, skip_if_too_large
+
+
+class Morton:
+    params = POINT_COUNTS
+    param_names = ["num_points"]
+    timeout = 600
+
+    def setup(self, num_points):
+        skip_if_too_large(num_points)
+        self.points = (random_points(num_points) * 1000.0).astype(np.int32)
+        self.queries = (random_points(10 ** 4, seed=1) * 1000.0).astype(np.int32)
+        self.codes = np.sort(pcu.morton_encode(self.points))
+        self.query_codes = pcu.morton_encode(self.queries)
+
+    def time_morton_encode(self, num_points):
+        pcu.morton_encode(self.points)
+
+    def time_morton_decode(self, num_points):
+        pcu.morton_decode(self.codes)
+
+    def time_morton_knn(self, num_points):
+        pcu.morton_knn(self.codes, self.query_codes, 16)
+
+    def peakmem_morton_encode(self, num_points):
+        pcu.morton_encode(self.points)
+
+
+class Octree:
+    params = POINT_COUNTS
+    param_names = ["num_points"]
+    timeout = 600
+
+    def setup(self, num_points):
+        skip_if_too_large(num_points)
+        self.points = random_points(num_points)
+        self.octree = pcu.Octree(10)
+        self.octree.build_from_point_cloud(self.points)
+
+    def time_build_from_point_cloud(self, num_points):
+        pcu.Octree(10).build_from_point_cloud(self.points)
+
+    def peakmem_build_from_point_cloud(self, num_points):
+        pcu.Octree(10).build_from_point_cloud(self.points)
+
+    def time_find(self, num_points):
+        self.octree.find(self.points)
+
+    def time_point_depths(self, num_points):
+        self.octree.point_depths(self.points)
+
+
+class KDTree:
+    params = POINT_COUNTS
+    param_names = ["num_points"]
+    timeout = 600
+
+    def setup(self, num_points):
+        skip_if_too_large(num_points)
+        self.points = random_points(num_points)
+        self.queries = random_points(10 ** 5, seed=1)
+        self.tree = pcu.KDTree(self.points)
+        self.shared_tree = self.tree.to_shared_memory()
+
+    def teardown(self, num_points):
+        self.shared_tree.unlink()
+
+    def time_build(self, num_points):
+        pcu.KDTree(self.points)
+
+    def peakmem_build(self, num_points):
+        pcu.KDTree(self.points)
+
+    def time_query(self, num_points):
+        self.tree.query(self.queries, k=4)
+
+    def time_attach_shared_memory(self, num_points):
+        pcu.KDTree.from_shared_memory(self.shared_tree.shared_memory_name).close()
+
+
+class MortonThreads(ThreadScaling):
+    params = THREAD_COUNTS
+    param_names = ["num_threads"]
+
+    def setup(self, num_threads):
+        self.limit_threads(num_threads)
+        self.points = (random_points(10 ** 7) * 1000.0).astype(np.int32)
+
+    def time_morton_encode(self, num_threads):
+        pcu.morton_encode(self.points)
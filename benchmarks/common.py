@@ -0,0 +1,91 @@
+"""
+Shared inputs and parameters for the benchmark suite.
+
+Point cloud benchmarks are parameterized by the number of points, from 10^3 to 10^8. Sizes above the value of the
+PCU_BENCHMARK_MAX_POINTS environment variable (10^6 by default) are skipped so a default run finishes quickly and fits
+in the memory of a laptop. Set PCU_BENCHMARK_MAX_POINTS=100000000 to run the full sweep.
+"""
+import os
+
+import numpy as np
+import point_cloud_utils as pcu
+
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "data")
+
+POINT_COUNTS = [10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7, 10 ** 8]
+THREAD_COUNTS = [1, 2, 4, 8, 16]
+
+
+def skip_if_too_large(num_points):
+    """
+    Skip the current benchmark (asv treats NotImplementedError raised in setup as a skip) if num_points exceeds
+    PCU_BENCHMARK_MAX_POINTS.
+    """
+    max_points = int(os.environ.get("PCU_BENCHMARK_MAX_POINTS", 10 ** 6))
+    if num_points > max_points:
+        raise NotImplementedError("Skipping %d points, PCU_BENCHMARK_MAX_POINTS is %d" % (num_points, max_points))
+
+
+def skip_if_too_many_threads(num_threads):
+    """
+    Skip the current benchmark if this machine has fewer than num_threads cores.
+    """
+    if num_threads > (os.cpu_count() or 1):
+        raise NotImplementedError("Skipping %d threads on a machine with %d cores" % (num_threads, os.cpu_count()))
+
+
+def random_points(num_points, seed=0):
+    """
+    Return a (num_points, 3) array of points sampled uniformly at random in the unit cube.
+    """
+    return np.random.default_rng(seed).random((num_points, 3))
+
+
+def surface_points(num_points, seed=0):
+    """
+    Return a (num_points, 3) array of points sampled uniformly at random on the unit sphere along with their normals.
+    Unlike random_points, these look like a scan of a surface.
+    """
+    n = np.random.default_rng(seed).normal(size=(num_points, 3))
+    n /= np.linalg.norm(n, axis=1, keepdims=True)
+    return n.copy(), n
+
+
+def load_mesh():
+    """
+    Load the test mesh in the data directory, scaled to fit in the unit cube.
+    """
+    v, f = pcu.load_mesh_vf(os.path.join(DATA_DIR, "cube_twist.obj"))
+    v = v - v.min(0)
+    return v / v.max(), f
+
+
+def grid_mesh(num_vertices):
+    """
+    Return a triangulated grid of the unit square with roughly num_vertices vertices and a bumpy height field.
+    """
+    n = max(2, int(np.sqrt(num_vertices)))
+    x, y = np.meshgrid(np.linspace(0.0, 1.0, n), np.linspace(0.0, 1.0, n), indexing='ij')
+    z = 0.1 * np.sin(8.0 * x) * np.cos(8.0 * y)
+    v = np.stack([x.ravel(), y.ravel(), z.ravel()], axis=1)
+    idx = np.arange(n * n).reshape(n, n)
+    a, b, c, d = idx[:-1, :-1].ravel(), idx[1:, :-1].ravel(), idx[1:, 1:].ravel(), idx[:-1, 1:].ravel()
+    f = np.concatenate([np.stack([a, b, c], axis=1), np.stack([a, c, d], axis=1)]).astype(np.int32)
+    return v, f
+
+
+class ThreadScaling:
+    """
+    Base class for benchmarks parameterized by the number of threads. Subclasses call limit_threads from setup and
+    the previous thread limit is restored in teardown.
+    """
+    def limit_threads(self, num_threads):
+        skip_if_too_many_threads(num_threads)
+        self._prev_num_threads = pcu.get_num_threads()
+        pcu.set_num_threads(num_threads)
+
+    def teardown(self, *params):
+        prev_num_threads = getattr(self, "_prev_num_threads", None)
+        if prev_num_threads is not None:
+            pcu.set_num_threads(prev_num_threads)
@@ -415,13 +415,13 @@ template <typename DerivedP>
 void Octree::ConvertFromPointCloud(const Eigen::MatrixBase<DerivedP>& point_cloud,
                                    double size_expand) {
     if (size_expand > 1 || size_expand < 0) {
-        pybind11::value_error("pad_amount should be between 0 and 1");
+        throw pybind11::value_error("pad_amount should be between 0 and 1");
     }
 
     // Set bounds
     Clear();
-    Eigen::Array3d min_bound = point_cloud.rowwise().minCoeff().eval().template cast<double>().array();
-    Eigen::Array3d max_bound = point_cloud.rowwise().maxCoeff().eval().template cast<double>().array();
+    Eigen::Array3d min_bound = point_cloud.colwise().minCoeff().eval().template cast<double>().array();
+    Eigen::Array3d max_bound = point_cloud.colwise().maxCoeff().eval().template cast<double>().array();
     Eigen::Array3d center = (min_bound + max_bound) / 2;
     Eigen::Array3d half_sizes = center - min_bound;
     double max_half_size = half_sizes.maxCoeff();
@@ -52,7 +52,7 @@ namespace vcg {
             class ImporterOBJ
             {
             public:
-                static int &MRGBLineCount(){static int _MRGBLineCount=0; return _MRGBLineCount;}
+                static int &MRGBLineCount(){static thread_local int _MRGBLineCount=0; return _MRGBLineCount;}  // Per thread so files can be loaded concurrently
 
                 typedef typename OpenMeshType::VertexPointer VertexPointer;
                 typedef typename OpenMeshType::ScalarType ScalarType;
@@ -93,6 +93,10 @@ namespace vcg {
                     /// number of normals
                     int numNormals;
 
+                    /// directory against which relative material library paths are resolved
+                    /// (if empty they are resolved against the current working directory)
+                    std::string materialDir;
+
                 }; // end class
 
 
@@ -595,6 +599,9 @@ namespace vcg {
                             {
                                 // obtain the name of the file containing materials library
                                 std::string materialFileName = tokens[1];
+                                if (!oi.materialDir.empty() && materialFileName[0] != '/' && materialFileName[0] != '\\' &&
+                                    !(materialFileName.size() > 1 && materialFileName[1] == ':'))
+                                    materialFileName = oi.materialDir + "/" + materialFileName;
                                 if (!LoadMaterials( materialFileName.c_str(), materials, m.textures))
                                     result = E_MATERIAL_FILE_NOT_FOUND;
                             }
@@ -1,15 +1,56 @@
-from ._pcu_internal import sample_mesh_poisson_disk, sample_mesh_random, \
-    downsample_point_cloud_poisson_disk, estimate_point_cloud_normals, \
-    k_nearest_neighbors, one_sided_hausdorff_distance, \
-    morton_encode, morton_decode, morton_knn, \
-    lloyd_2d, lloyd_3d, voronoi_centroids_unit_cube, sample_mesh_lloyd, \
-    remove_duplicate_points, remove_duplicate_mesh_vertices, signed_distance, \
-    closest_points_on_mesh
-
-from ._sinkhorn import *
-from ._mesh_io import *
+import importlib
+import os
+import warnings
+
 import numpy as np
-from ._octree import *
+
+
+# Public names which live in submodules. These are imported the first time they are accessed (see __getattr__) so
+# importing point_cloud_utils is cheap and only loads the parts of the library that are actually used. The native
+# code is split into independently loadable extension modules:
+#  - _pcu_distance: nearest neighbors and KD trees, Hausdorff distances, closest points, signed distances and
+#    MeshQuery
+#  - _pcu_sampling: mesh sampling and point cloud downsampling and voxelization (VCG)
+#  - _pcu_io: mesh loading and saving (VCG)
+#  - _pcu_voronoi: Lloyd relaxation and Voronoi diagrams (geogram)
+#  - _pcu_morton: Morton codes
+#  - _pcu_internal: everything else (normals, octrees, voxel meshes, duplicate removal and thread limits)
+_lazy_submodule_attributes = {
+    '._pcu_distance': ('k_nearest_neighbors', 'one_sided_hausdorff_distance', 'signed_distance'),
+    '._pcu_sampling': ('sample_mesh_poisson_disk', 'downsample_point_cloud_poisson_disk'),
+    '._pcu_voronoi': ('voronoi_centroids_unit_cube',),
+    '._pcu_morton': ('morton_encode', 'morton_decode', 'morton_knn'),
+    '._sinkhorn': ('pairwise_distances', 'sinkhorn'),
+    '._mesh_io': ('MESH_ATTRIBUTES', 'TriangleMesh', 'MeshCache', 'enable_mesh_cache', 'disable_mesh_cache',
+                  'save_triangle_mesh', 'save_mesh_v', 'save_mesh_vf', 'save_mesh_vn', 'save_mesh_vc', 'save_mesh_vnc',
+                  'save_mesh_vfn', 'save_mesh_vfnc', 'load_triangle_mesh', 'load_meshes', 'load_mesh_v', 'load_mesh_vf',
+                  'load_mesh_vn', 'load_mesh_vc', 'load_mesh_vnc', 'load_mesh_vfn', 'load_mesh_vfnc'),
+    '._octree': ('Octree',),
+    '._kd_tree': ('KDTree',),
+    '._restricted_voronoi': ('RestrictedVoronoi',),
+    '._mesh_query': ('MeshQuery',),
+    '._num_threads': ('get_num_threads', 'set_num_threads', 'limit_num_threads'),
+    '._profiling': ('profile',),
+}
+_lazy_attributes = {name: module for module, names in _lazy_submodule_attributes.items() for name in names}
+
+
+def __getattr__(name):
+    module_name = _lazy_attributes.get(name)
+    if module_name is None:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value  # Cache the attribute so __getattr__ is only called once per name
+    return value
+
+
+def __dir__():
+    return sorted(set(__all__) | {name for name in globals() if name.startswith('__')})
+
+
+# PCU_PROFILE profiles the whole program so profiling has to be enabled before any native module is loaded
+if os.environ.get('PCU_PROFILE', '') not in ('', '0'):
+    importlib.import_module('._profiling', __name__)
 
 
 def hausdorff_distance(x, y, return_index=False, squared_distances=False, max_points_per_leaf=10):
@@ -33,6 +74,8 @@ def hausdorff_distance(x, y, return_index=False, squared_distances=False, max_po
     and `(i, j)` are such that `source[i, :]` and `target[j, :]` are the two points with maximum shortest
     distance.
     """
+    from ._pcu_distance import one_sided_hausdorff_distance
+
     hausdorff_x_to_y, idx_x1, idx_y1 = one_sided_hausdorff_distance(x, y, return_index=True,
                                                                     squared_distances=squared_distances,
                                                                     max_points_per_leaf=max_points_per_leaf)
@@ -69,6 +112,8 @@ def chamfer_distance(x, y, return_index=False, squared_distances=False, max_poin
     If return_index is set, then this function returns a tuple (chamfer_dist, corrs_x_to_y, corrs_y_to_x) where
     corrs_x_to_y and corrs_y_to_x are described above.
     """
+    from ._pcu_distance import k_nearest_neighbors
+
     dists_x_to_y, corrs_x_to_y = k_nearest_neighbors(x, y, k=1,
                                                      squared_distances=squared_distances,
                                                      max_points_per_leaf=max_points_per_leaf)
@@ -107,7 +152,7 @@ def downsample_point_cloud_voxel_grid(voxel_size, points, normals=None, colors=N
     A triple (v, n, c) of downsampled vertices, normals and colors. If no vertices or colors are passed in, then
     n and c are None.
     """
-    from ._pcu_internal import downsample_point_cloud_voxel_grid_internal
+    from ._pcu_sampling import downsample_point_cloud_voxel_grid_internal
 
     if np.isscalar(voxel_size):
         voxel_size = np.array([voxel_size] * 3)
@@ -151,3 +196,740 @@ def downsample_point_cloud_voxel_grid(voxel_size, points, normals=None, colors=N
     if has_colors:
         ret[2] = ret_c
     return tuple(ret)
+
+
+def sample_mesh_random(v, f, num_samples, random_seed=0, n=None, return_positions=False, return_normals=False):
+    """
+    Generate uniformly distributed random point samples on a mesh.
+
+    Samples are drawn from the cumulative distribution of face areas using a counter-based random number generator,
+    so the result only depends on random_seed and not on the number of threads used to compute it.
+
+    Parameters
+    ----------
+    v : #v by 3 array of mesh vertex positions
+    f : #f by 3 array of mesh face indices
+    num_samples : The number of samples to generate
+    random_seed : A random seed used to generate the samples.
+                  Passing in 0 will use the current time. (0 by default).
+    n : An optional #v by 3 array of vertex normals. If set and return_normals is True, the returned normals are
+        interpolated from these and normalized. Otherwise the returned normals are the face normals.
+    return_positions : If True, also return the 3D position of each sample. (False by default).
+    return_normals : If True, also return the unit normal at each sample. (False by default).
+
+    Returns
+    -------
+    A (num_samples,) shaped array of face indices into f
+    A (num_samples, 3) shaped array of barycentric coordinates
+    If return_positions is set, a (num_samples, 3) shaped array of sample positions
+    If return_normals is set, a (num_samples, 3) shaped array of sample normals
+    """
+    from ._pcu_sampling import sample_mesh_random_internal
+
+    if n is None:
+        n = np.zeros([0, 3], dtype=v.dtype)
+
+    fi, bc, p, nrm = sample_mesh_random_internal(v, f, n.astype(v.dtype, copy=False), num_samples, random_seed,
+                                                 return_positions, return_normals)
+    ret = [fi, bc]
+    if return_positions:
+        ret.append(p)
+    if return_normals:
+        ret.append(nrm)
+    return tuple(ret)
+
+
+def interpolate_barycentric(v_attrs, f, fi, bc):
+    """
+    Interpolate per-vertex attributes at points on a mesh given as (face index, barycentric coordinate) pairs, such
+    as the ones returned by sample_mesh_random, sample_mesh_poisson_disk and closest_points_on_mesh.
+
+    All the attributes are interpolated in a single parallel pass over the samples without gathering per-face
+    vertex values into temporary arrays.
+
+    Parameters
+    ----------
+    v_attrs : A #v by d array of per-vertex attributes (e.g. positions, normals, colors, uvs) or a list of such
+              arrays (the arrays can have different widths d).
+    f : #f by 3 array of mesh face indices
+    fi : A (#p,) shaped array of face indices into f
+    bc : A (#p, 3) shaped array of barycentric coordinates within each face in fi
+
+    Returns
+    -------
+    A (#p, d) shaped array of interpolated attributes if v_attrs is a single array, or a list of such arrays
+    (one per attribute in v_attrs) if v_attrs is a list.
+    Interpolated attributes have the same dtype as bc.
+    """
+    from ._pcu_internal import interpolate_barycentric_internal
+
+    is_single_attr = isinstance(v_attrs, np.ndarray)
+    if is_single_attr:
+        v_attrs = [v_attrs]
+    v_attrs = [np.ascontiguousarray(a, dtype=bc.dtype) for a in v_attrs]
+    fi = np.ascontiguousarray(fi, dtype=np.int64)
+
+    ret = interpolate_barycentric_internal(v_attrs, f, fi, bc)
+    if is_single_attr:
+        return ret[0]
+    return ret
+
+
+def estimate_point_cloud_normals(v, k=10, radius=None, smoothing_iterations=0, view_point=None, sensor_positions=None,
+                                 max_points_per_leaf=10, return_curvature=False, return_eigenvalues=False,
+                                 kd_tree=None):
+    """
+    Estimate normals for a point cloud by locally fitting a plane to a neighborhood of each point.
+
+    The neighborhood of a point is either its k nearest neighbors, or if radius is set, the points within radius of
+    it (keeping only the k nearest of these if k > 0). Radius neighborhoods adapt to point clouds with very uneven
+    density. Points with fewer than 3 neighbors within the radius use their 3 nearest neighbors instead.
+
+    Normals are computed in parallel directly from the input array. If view_point or sensor_positions is set, each
+    normal is flipped to point towards the viewpoint (or the sensor position of its point). Otherwise normals are
+    made consistent by propagating orientations along the nearest neighbor graph.
+
+    Parameters
+    ----------
+    v : #v by 3 array of vertex positions (each row is a vertex)
+    k : Number of nearest neighbors to use in the estimate for the normal of a point. If radius is set, this is the
+        maximum number of neighbors within the radius to use (pass k <= 0 to use all of them). Default: 10.
+    radius : If set, use the points within this distance of each point to estimate its normal. Default: None.
+    smoothing_iterations : Number of smoothing iterations to apply to the estimated normals. Default: 0.
+    view_point : An optional 3D point towards which all the normals are oriented. Default: None.
+    sensor_positions : An optional #v by 3 array where each row is the position of the sensor which captured the
+                       corresponding point in v. Normals are oriented towards their sensor position.
+                       If set, view_point is ignored. Default: None.
+    max_points_per_leaf : The maximum number of points per leaf node in the KD tree used by this function.
+                          Ignored if kd_tree is set. Default is 10.
+    return_curvature : If True, also return the surface variation lambda_0 / (lambda_0 + lambda_1 + lambda_2) of the
+                       neighborhood of each point, where lambda_0 <= lambda_1 <= lambda_2 are the eigenvalues of the
+                       neighborhood's covariance matrix. This is 0 on flat regions and at most 1/3. Default: False.
+    return_eigenvalues : If True, also return the eigenvalues of the neighborhood's covariance matrix for each
+                         point sorted in increasing order. Default: False.
+    kd_tree : An optional KDTree built over v (e.g. pcu.KDTree(v)) which is used for the neighborhood queries instead
+              of building a new tree on every call. This saves rebuilding the tree when estimating normals of the
+              same point cloud several times (e.g. with different parameters), and the tree can be attached from
+              shared memory or a file (see KDTree). Both k nearest neighbor and radius neighborhoods are supported.
+              Default: None.
+
+    Returns
+    -------
+    A #v x 3 array of normals where each row i is the normal at vertex v[i]
+    If return_curvature is set, a (#v,) shaped array of per-point surface variation
+    If return_eigenvalues is set, a #v x 3 array of per-point covariance eigenvalues
+    """
+    from ._pcu_internal import estimate_point_cloud_normals_internal
+
+    if sensor_positions is None:
+        sensor_positions = np.zeros([0, 3], dtype=v.dtype)
+
+    if radius is not None and radius <= 0.0:
+        raise ValueError("Invalid radius (%s), must be greater than 0." % str(radius))
+    if radius is None:
+        radius = 0.0
+
+    use_view_point = view_point is not None
+    if view_point is None:
+        view_point = [0.0, 0.0, 0.0]
+    if len(view_point) != 3:
+        raise ValueError("Invalid view_point, must be a 3D point but got %s." % str(view_point))
+
+    # The tree is passed in as its arrays, an empty tree_points tells the native code to build its own tree
+    if kd_tree is None:
+        tree_points, tree_indices = np.zeros([0, 3], dtype=v.dtype), np.zeros([0], dtype=np.int64)
+        tree_nodes, tree_splits = np.zeros([0, 4], dtype=np.int64), np.zeros([0], dtype=v.dtype)
+    else:
+        from ._kd_tree import KDTree
+        if not isinstance(kd_tree, KDTree):
+            raise ValueError("Invalid kd_tree, must be a KDTree but got %s." % type(kd_tree).__name__)
+        if kd_tree.dtype != v.dtype or kd_tree.num_points != v.shape[0] or \
+                not np.array_equal(kd_tree._tree_points, v[kd_tree._indices]):
+            raise ValueError("Invalid kd_tree, must be built over the input points v.")
+        tree_points, tree_indices, tree_nodes, tree_splits = \
+            kd_tree._tree_points, kd_tree._indices, kd_tree._nodes, kd_tree._splits
+
+    n, curvature, eigenvalues = estimate_point_cloud_normals_internal(
+        v, sensor_positions.astype(v.dtype, copy=False), k, float(radius), smoothing_iterations, use_view_point,
+        float(view_point[0]), float(view_point[1]), float(view_point[2]), max_points_per_leaf,
+        return_curvature, return_eigenvalues, tree_points, tree_indices, tree_nodes, tree_splits)
+
+    if not return_curvature and not return_eigenvalues:
+        return n
+    ret = [n]
+    if return_curvature:
+        ret.append(curvature.ravel())
+    if return_eigenvalues:
+        ret.append(eigenvalues)
+    return tuple(ret)
+
+
+def estimate_mesh_normals(v, f, weighting_type='uniform', out=None):
+    """
+    Compute vertex normals of a mesh from its vertices and faces by averaging the normals of the faces around
+    each vertex.
+
+    Normals are computed in parallel and faces can be int32, int64, uint32 or uint64 arrays without being copied.
+    Vertices which are not referenced by any non-degenerate face get a zero normal.
+
+    Parameters
+    ----------
+    v : #v by 3 array of mesh vertex 3D positions
+    f : #f by 3 array of face (triangle) indices
+    weighting_type : How face normals are weighted around a vertex. Must be one of 'uniform', 'angle', or 'area'
+                     (default is 'uniform')
+    out : An optional C-contiguous #v by 3 array with the same dtype as v to write the normals into. Passing this in
+          avoids allocating a new array on repeated calls (e.g. for each frame of an animated mesh). Default: None.
+
+    Returns
+    -------
+    n : #v by 3 array of unit vertex normals (this is out if it was passed in)
+    """
+    from ._pcu_internal import estimate_mesh_normals_internal
+
+    if out is None:
+        out = np.empty([v.shape[0], 3], dtype=v.dtype)
+
+    return estimate_mesh_normals_internal(v, f, weighting_type, out)
+
+
+def lloyd_2d(n, num_lloyd=10, num_newton=10, tol=0.0, random_seed=0, num_threads=-1, init_samples=None):
+    """
+    Generate n samples in the unit square, [0, 1]^2 using Lloyd's algorithm
+    (https://en.wikipedia.org/wiki/Lloyd%27s_algorithm).
+
+    Parameters
+    ----------
+    n : The number of 2d point samples to generate
+    num_lloyd : The (maximum) number of Lloyd iterations to do (default 10)
+    num_newton : The (maximum) number of Newton iterations to do when computing Voronoi diagrams (default 10)
+    tol : If positive, stop Lloyd iterations once no sample moves by more than tol times the size of the domain, and
+          stop Newton iterations once they decrease the CVT energy by less than a fraction tol. (default 0.0)
+    random_seed : A seed for the random initial samples. Passing in 0 will use the current time. (default 0)
+    num_threads : The maximum number of threads used to compute Voronoi diagrams. Passing in a non-positive
+                  value uses get_num_threads(). (default -1)
+    init_samples : An optional n by 2 array of initial samples (e.g. from a Poisson disk sampler) used instead of
+                   random initial samples. (default None)
+
+    Returns
+    -------
+    A n by 2 array of point samples in the unit square [0, 1]^2
+    """
+    from ._pcu_voronoi import lloyd_2d_internal
+
+    if init_samples is None:
+        init_samples = np.zeros([0, 2], dtype=np.float64)
+
+    return lloyd_2d_internal(n, num_lloyd, num_newton, tol, random_seed, num_threads, init_samples)
+
+
+def lloyd_3d(n, num_lloyd=10, num_newton=10, tol=0.0, random_seed=0, num_threads=-1, init_samples=None):
+    """
+    Generate n samples in the unit cube, [0, 1]^3 using Lloyd's algorithm
+    (https://en.wikipedia.org/wiki/Lloyd%27s_algorithm).
+
+    Parameters
+    ----------
+    n : The number of 3d point samples to generate
+    num_lloyd : The (maximum) number of Lloyd iterations to do (default 10)
+    num_newton : The (maximum) number of Newton iterations to do when computing Voronoi diagrams (default 10)
+    tol : If positive, stop Lloyd iterations once no sample moves by more than tol times the size of the domain, and
+          stop Newton iterations once they decrease the CVT energy by less than a fraction tol. (default 0.0)
+    random_seed : A seed for the random initial samples. Passing in 0 will use the current time. (default 0)
+    num_threads : The maximum number of threads used to compute Voronoi diagrams. Passing in a non-positive
+                  value uses get_num_threads(). (default -1)
+    init_samples : An optional n by 3 array of initial samples used instead of random initial samples.
+                   (default None)
+
+    Returns
+    -------
+    A n by 3 array of point samples in the unit cube [0, 1]^3
+    """
+    from ._pcu_voronoi import lloyd_3d_internal
+
+    if init_samples is None:
+        init_samples = np.zeros([0, 3], dtype=np.float64)
+
+    return lloyd_3d_internal(n, num_lloyd, num_newton, tol, random_seed, num_threads, init_samples)
+
+
+def sample_mesh_lloyd(v, f, num_samples, num_lloyd=10, num_newton=10, return_mesh=None, tol=0.0, random_seed=0,
+                      num_threads=-1, init_samples=None):
+    """
+    Generate n samples on a surface defined by a triangle mesh using
+    Lloyd's algorithm (https://en.wikipedia.org/wiki/Lloyd%27s_algorithm).
+
+    Parameters
+    ----------
+    v : A #v by 3 array where each row is a vertex of the input mesh
+    f : A #f by 3 array of indices into `v` where each row is a triangle of the input mesh.
+    num_samples : The number of surface samples to generate
+    num_lloyd : The (maximum) number of Lloyd iterations to do (default 10)
+    num_newton : The (maximum) number of Newton iterations to do when computing Voronoi diagrams (default 10)
+    return_mesh : Deprecated and ignored, only kept so existing positional calls still work. (default None)
+    tol : If positive, stop Lloyd iterations once no sample moves by more than tol times the bounding box diagonal
+          of the mesh, and stop Newton iterations once they decrease the CVT energy by less than a fraction tol.
+          (default 0.0)
+    random_seed : A seed for the random initial samples. Passing in 0 will use the current time. (default 0)
+    num_threads : The maximum number of threads used to compute Voronoi diagrams. Passing in a non-positive
+                  value uses get_num_threads(). (default -1)
+    init_samples : An optional num_samples by 3 array of initial samples on the mesh (e.g. the output of
+                   sample_mesh_poisson_disk) used instead of random initial samples. Starting from well spread
+                   samples means far fewer iterations are needed. (default None)
+
+    Returns
+    -------
+    A num_samples by 3 array of point samples on the input surface defined by (v, f)
+    """
+    from ._pcu_voronoi import sample_mesh_lloyd_internal
+
+    if return_mesh is not None:
+        warnings.warn("The return_mesh argument of sample_mesh_lloyd is deprecated and ignored.", DeprecationWarning,
+                      stacklevel=2)
+    if init_samples is None:
+        init_samples = np.zeros([0, 3], dtype=v.dtype)
+
+    return sample_mesh_lloyd_internal(v, f, num_samples, num_lloyd, num_newton, tol, random_seed, num_threads,
+                                      init_samples.astype(v.dtype, copy=False))
+
+
+def voronoi_diagram_3d(centers, bbox_min=None, bbox_max=None, return_geometry=True):
+    """
+    Compute the 3D Voronoi diagram of a set of centers clipped to an axis aligned bounding box.
+
+    Cells are computed in parallel and returned as flat (CSR) arrays:
+      - The faces of cell i are cell_face_offsets[i]:cell_face_offsets[i+1]
+      - Face j separates its cell from the cell of center face_neighbors[j] (or the outside of the bounding box if
+        face_neighbors[j] == -1), and has area face_areas[j]
+      - The vertices of face j in order around the face are
+        vertices[face_vertices[face_vertex_offsets[j]:face_vertex_offsets[j+1]]]
+    Vertices are not shared between cells.
+
+    Parameters
+    ----------
+    centers : A (n, 3) array of Voronoi centers (n >= 4) which must lie in the bounding box
+    bbox_min : The minimum corner of the bounding box. Default is (0, 0, 0).
+    bbox_max : The maximum corner of the bounding box. Default is (1, 1, 1).
+    return_geometry : If False, only compute volumes, face areas and adjacency, skipping the (much more expensive)
+                      extraction of the face polygons. Default is True.
+
+    Returns
+    -------
+    volumes : A (n,) shaped array of cell volumes
+    cell_face_offsets : A (n+1,) shaped int64 array of offsets of the faces of each cell
+    face_neighbors : A (#faces,) shaped int64 array of the neighboring center of each face (-1 for the box boundary)
+    face_areas : A (#faces,) shaped array of face areas
+    If return_geometry is set:
+    vertices : A (#vertices, 3) array of Voronoi vertex positions
+    face_vertex_offsets : A (#faces+1,) shaped int64 array of offsets of the vertices of each face
+    face_vertices : A (#face_vertices,) shaped int64 array of indices into vertices
+    """
+    from ._pcu_voronoi import voronoi_diagram_3d_internal
+
+    if bbox_min is None:
+        bbox_min = (0.0, 0.0, 0.0)
+    if bbox_max is None:
+        bbox_max = (1.0, 1.0, 1.0)
+    if len(bbox_min) != 3 or len(bbox_max) != 3:
+        raise ValueError("Invalid bounding box, bbox_min and bbox_max must be 3D points.")
+
+    volumes, cell_face_offsets, face_neighbors, face_areas, vertices, face_vertex_offsets, face_vertices = \
+        voronoi_diagram_3d_internal(centers, float(bbox_min[0]), float(bbox_min[1]), float(bbox_min[2]),
+                                    float(bbox_max[0]), float(bbox_max[1]), float(bbox_max[2]), return_geometry)
+
+    ret = [volumes.ravel(), cell_face_offsets.ravel(), face_neighbors.ravel(), face_areas.ravel()]
+    if return_geometry:
+        ret += [vertices, face_vertex_offsets.ravel(), face_vertices.ravel()]
+    return tuple(ret)
+
+
+def remove_duplicate_points(x, epsilon, return_index=False):
+    """
+    Removes duplicated points from a point cloud where two points are considered the same if their distance is below
+    some threshold.
+
+    Points are bucketed into a hash grid and processed in parallel. Each point is merged into the lowest indexed point
+    within epsilon of it, so points closer than epsilon are merged even if they lie on different sides of a grid cell
+    boundary. The kept points are returned in their original order.
+
+    Merging is transitive: if point c is merged into b and b is merged into a, then c is merged into a. A chain of
+    points each closer than epsilon to the next is collapsed into its lowest indexed point, so a point can end up
+    further than epsilon (at most epsilon times the length of the chain) from the point it was merged into.
+
+    Parameters
+    ----------
+    x : #x by 3 array of 3D positions
+    epsilon : threshold below which two points are considered equal (if 0, only exactly equal points are merged)
+    return_index : If true, return indices to map between input and output
+
+    Returns
+    -------
+    x_new : #x_new x 3 Point cloud with duplicates removed
+    if return indices is set, this function also returns:
+        svi : (#x_new,) int64 indices so that x_new = x[svi]
+        svj : (#x,) int64 indices so that x_new[svj] are the points each point in x was merged into (see above for
+              how far apart they can be)
+
+    See also
+    --------
+    remove_duplicate_mesh_vertices
+    """
+    from ._pcu_internal import remove_duplicate_points_internal
+
+    x_new, svi, svj = remove_duplicate_points_internal(x, epsilon)
+    if return_index:
+        return x_new, svi.ravel(), svj.ravel()
+    return x_new
+
+
+def remove_duplicate_mesh_vertices(v, f, epsilon, return_index=False):
+    """
+    Removes duplicated vertices from a triangle mesh two vertices are considered the same if their distance is below
+    some threshold. See remove_duplicate_points for details on how points are merged.
+
+    Parameters
+    ----------
+    v : #v by 3 array of mesh vertex 3D positions
+    f : #f by 3 array of face (triangle) indices
+    epsilon : threshold below which two points are considered equal (if 0, only exactly equal points are merged)
+    return_index : If true, return indices to map between input and output
+
+    Returns
+    -------
+    v_new : #v_new x 3 array of vertices with duplicates removed
+    f_new : #f x 3 array of faces indexing into v_new (with the same dtype as f)
+    if return indices is set, this function also returns:
+        svi : (#v_new,) int64 indices so that v_new = v[svi]
+        svj : (#v,) int64 indices so that v_new[svj] are the vertices each vertex in v was merged into
+
+    See also
+    --------
+    remove_duplicate_points
+    """
+    from ._pcu_internal import remove_duplicate_mesh_vertices_internal
+
+    v_new, f_new, svi, svj = remove_duplicate_mesh_vertices_internal(v, f, epsilon)
+    if return_index:
+        return v_new, f_new, svi.ravel(), svj.ravel()
+    return v_new, f_new
+
+
+def closest_points_on_mesh(p, v, f, return_points=False):
+    """
+    Compute distances from a set of points p to a triangle mesh (v, f)
+
+    Every query is processed in parallel in a single pass which computes its distance, closest face and barycentric
+    coordinates together. The mesh is used in place without being copied, so large meshes with int64 faces are
+    supported directly.
+
+    Parameters
+    ----------
+    p : (#p, 3)-shaped array of query point positions
+    v : (#v, 3)-shaped array of mesh vertex positions (with the same dtype as p)
+    f : (#f, 3)-shaped array of triangle face indices
+    return_points : If set, also return the closest point on the mesh to each query point
+
+    Returns
+    -------
+    A tuple (d, f_idx, bc) where:
+     - d is a (#p,)-shaped array of shortest distances for each query point p
+     - f_idx is a (#p,)-shaped array (with the same dtype as f) of indices into f of the face containing the closest
+       point to each query point
+     - bc is a (#p, 3)-shaped array of barycentric coordinates for each query point
+    If return_points is set, this function also returns:
+     - c, a (#p, 3)-shaped array of the closest point on the mesh to each query point
+
+    Notes
+    -----
+    This only computes distances to triangles, so unreferenced vertices are ignored. Degenerate triangles are
+    handled correctly: triangle [1 2 2] is treated as a segment [1 2], and triangle [1 1 1] is treated as a point.
+    To query the same mesh many times, use MeshQuery which builds the acceleration structure once.
+    """
+    from ._pcu_distance import closest_points_on_mesh_internal
+
+    d, fi, bc, c = closest_points_on_mesh_internal(p, v, f, return_points)
+    if return_points:
+        return d.ravel(), fi.ravel(), bc, c
+    return d.ravel(), fi.ravel(), bc
+
+
+def signed_distance_grid(v, f, bbox=None, resolution=None, occupancy=False, band=None, brick_size=8, sparse=False,
+                         out=None):
+    """
+    Evaluate the signed distance (or occupancy) of a triangle mesh on the nodes of a regular grid without
+    materializing the grid points.
+
+    The grid is processed in parallel in bricks of brick_size^3 nodes. The distance to the center of each brick is
+    computed first: bricks which the surface can't cross get their sign from a single winding number evaluation (and
+    bricks farther than band from the surface are filled directly), and only nodes closer to the surface than the grid
+    spacing evaluate the winding number themselves. This is much faster than calling signed_distance on every node.
+    The sign is determined by thresholding the fast winding number at 0.5, so (unlike signed_distance) values are
+    exact distances with a sign of +1 or -1.
+
+    Sharing signs between nodes assumes the mesh is closed (watertight and consistently oriented). For open meshes
+    (e.g. scans or meshes with holes) the winding number changes away from the surface, so every node evaluates its
+    own winding number instead. This gives the same signs as signed_distance but is slower.
+
+    Parameters
+    ----------
+    v : (#v, 3)-shaped array of mesh vertex positions
+    f : (#f, 3)-shaped array of mesh face indices into v
+    bbox : A pair (bbox_min, bbox_max) of 3D points giving the corners of the grid. The first and last node along each
+           axis lie on the bounding box. If None, use the bounding box of v padded by 5% on every side.
+    resolution : The number of grid nodes along each axis, either an integer or a 3-tuple. Defaults to the shape of
+                 out if it is passed in and 128 otherwise.
+    occupancy : If True, return 1.0 for nodes inside the mesh and 0.0 for nodes outside instead of signed distances.
+    band : Distances are clamped to [-band, band] (default no clamping for dense grids and the length of a grid cell
+           diagonal for sparse grids). Bricks entirely farther than band from the surface are not evaluated.
+    brick_size : The number of nodes along each side of a brick (default 8)
+    sparse : If True, return only the bricks which have a node within band of the surface instead of a dense volume.
+    out : An optional preallocated, C-contiguous float32 array of shape resolution to write the dense grid to.
+
+    Returns
+    -------
+    If sparse is False, a float32 array of shape resolution where out[i, j, k] is the value at node
+    bbox_min + (i, j, k) * (bbox_max - bbox_min) / (resolution - 1). This is out if it was passed in.
+    If sparse is True, a tuple (brick_ijk, bricks) where:
+     - brick_ijk is a (#bricks, 3)-shaped int64 array of brick indices. Node (i, j, k) of brick b is the grid node
+       brick_ijk[b] * brick_size + (i, j, k).
+     - bricks is a (#bricks, brick_size, brick_size, brick_size)-shaped float32 array of node values. Nodes of bricks
+       on the boundary which lie outside the grid are NaN.
+    """
+    from ._pcu_distance import signed_distance_grid_internal, sparse_signed_distance_grid_internal
+
+    if bbox is None:
+        bbox_min, bbox_max = v.min(0), v.max(0)
+        pad = 0.05 * (bbox_max - bbox_min)
+        bbox_min, bbox_max = bbox_min - pad, bbox_max + pad
+    else:
+        bbox_min, bbox_max = np.asarray(bbox[0], dtype=np.float64), np.asarray(bbox[1], dtype=np.float64)
+        if bbox_min.shape != (3,) or bbox_max.shape != (3,):
+            raise ValueError("Invalid bbox must be a pair (bbox_min, bbox_max) of 3D points")
+    if np.any(bbox_max - bbox_min <= 0.0):
+        raise ValueError("Invalid bbox, bbox_max must be greater than bbox_min in every dimension")
+
+    if resolution is None:
+        resolution = out.shape if out is not None else 128
+    if np.isscalar(resolution):
+        resolution = (int(resolution),) * 3
+    resolution = tuple(int(r) for r in resolution)
+    if len(resolution) != 3:
+        raise ValueError("Invalid resolution, must be an integer or a 3-tuple")
+    if out is not None and tuple(out.shape) != resolution:
+        raise ValueError("Invalid out, must have shape %s but got %s" % (str(resolution), str(out.shape)))
+
+    if band is None:
+        if sparse:
+            band = float(np.linalg.norm((bbox_max - bbox_min) / (np.array(resolution) - 1)))
+        else:
+            band = np.inf
+
+    args = (v, f, float(bbox_min[0]), float(bbox_min[1]), float(bbox_min[2]),
+            float(bbox_max[0]), float(bbox_max[1]), float(bbox_max[2]))
+    if sparse:
+        brick_ijk, bricks = sparse_signed_distance_grid_internal(*args, resolution[0], resolution[1], resolution[2],
+                                                                 brick_size, band, occupancy)
+        return brick_ijk, bricks.reshape(-1, brick_size, brick_size, brick_size)
+
+    if out is None:
+        out = np.empty(resolution, dtype=np.float32)
+    signed_distance_grid_internal(*args, brick_size, band, occupancy, out)
+    return out
+
+
+def voxel_mesh(voxels, voxel_size=1.0, voxel_origin=None, isovalue=0.0, marching_cubes=False):
+    """
+    Extract a triangle mesh of the boundary of a voxel grid. The grid is meshed in parallel, slab by slab, and the
+    output mesh has shared (deduplicated) vertices with consistently oriented, outward facing triangles.
+
+    Voxel (i, j, k) occupies the box from voxel_origin + (i, j, k) * voxel_size to
+    voxel_origin + (i + 1, j + 1, k + 1) * voxel_size.
+    By default, the output mesh consists of the faces of the inside voxels which touch an outside voxel (or the
+    boundary of the grid). If marching_cubes is True, the values of voxels are treated as samples of a function at the
+    voxel centers and the output mesh is the isosurface of that function computed with marching cubes. In this case,
+    the isosurface ends at the centers of the boundary voxels of the grid, so pad the grid with outside values if you
+    want a closed mesh.
+
+    Parameters
+    ----------
+    voxels : Either a dense 3D array of shape (nx, ny, nz) where voxels with values greater than isovalue are inside,
+             or a sparse (#voxels, 3)-shaped integer array of the (i, j, k) coordinates of the inside voxels.
+    voxel_size : A scalar or a 3-tuple representing the size of each voxel along each axis (default 1.0).
+    voxel_origin : A 3-tuple representing the position of the minimum corner of voxel (0, 0, 0) (default (0, 0, 0)).
+    isovalue : Voxels with values greater than isovalue are inside (default 0.0). Ignored for sparse voxels.
+    marching_cubes : If True, extract a smooth isosurface with marching cubes instead of the faces of the voxels.
+                     For sparse voxels, the surface lies halfway between the centers of inside and outside voxels
+                     and is always closed.
+
+    Returns
+    -------
+    A tuple (v, f) where:
+     - v is a (#v, 3)-shaped array of mesh vertex positions. These are float32 if voxels is float32 and float64
+       otherwise.
+     - f is a (#f, 3)-shaped int32 array of triangle indices into v.
+    """
+    from ._pcu_internal import voxel_mesh_internal, voxel_marching_cubes_internal
+
+    if np.isscalar(voxel_size):
+        voxel_size = np.array([voxel_size] * 3, dtype=np.float64)
+    else:
+        voxel_size = np.asarray(voxel_size, dtype=np.float64)
+        if voxel_size.shape != (3,):
+            raise ValueError("Invalid voxel_size must be a 3-tuple or a single float")
+    if np.any(voxel_size <= 0.0):
+        raise ValueError("Invalid voxel_size, must be positive")
+
+    if voxel_origin is None:
+        voxel_origin = np.zeros(3)
+    else:
+        voxel_origin = np.asarray(voxel_origin, dtype=np.float64)
+        if voxel_origin.shape != (3,):
+            raise ValueError("Invalid voxel_origin must be a 3-tuple")
+
+    voxels = np.asarray(voxels)
+    out_dtype = np.float32 if voxels.dtype == np.float32 else np.float64
+    if voxels.ndim == 2:
+        # Sparse voxel coordinates, rasterize them into the smallest dense grid containing them. For marching cubes
+        # the grid is padded by an outside voxel on every side so the surface is closed.
+        if voxels.shape[1] != 3 or not np.issubdtype(voxels.dtype, np.integer):
+            raise ValueError("Invalid sparse voxels, must be an integer array with shape (#voxels, 3)")
+        if voxels.shape[0] == 0:
+            return np.zeros([0, 3], dtype=out_dtype), np.zeros([0, 3], dtype=np.int32)
+        pad = 1 if marching_cubes else 0
+        ijk_min = voxels.min(0) - pad
+        dense = np.zeros(voxels.max(0) - ijk_min + 1 + pad, dtype=np.float32 if marching_cubes else bool)
+        dense[tuple((voxels - ijk_min).T)] = 1
+        voxel_origin = voxel_origin + ijk_min * voxel_size
+        voxels, isovalue = dense, 0.5
+    elif voxels.ndim != 3:
+        raise ValueError("Invalid voxels, must be a dense 3D array or a (#voxels, 3)-shaped array of voxel coordinates")
+
+    if marching_cubes:
+        # Samples are at voxel centers
+        voxel_origin = voxel_origin + 0.5 * voxel_size
+        internal_fn = voxel_marching_cubes_internal
+        supported_dtypes = (np.float32, np.float64)
+    else:
+        internal_fn = voxel_mesh_internal
+        supported_dtypes = (np.bool_, np.uint8, np.int32, np.int64, np.float32, np.float64)
+    if voxels.dtype not in supported_dtypes:
+        voxels = voxels.astype(np.float32 if marching_cubes else np.float64)
+
+    nx, ny, nz = voxels.shape
+    v, f = internal_fn(np.ascontiguousarray(voxels).ravel(), nx, ny, nz, float(isovalue),
+                       float(voxel_origin[0]), float(voxel_origin[1]), float(voxel_origin[2]),
+                       float(voxel_size[0]), float(voxel_size[1]), float(voxel_size[2]))
+    return v.astype(out_dtype, copy=False), f
+
+
+def voxelize_point_cloud(points, voxel_size, min_bound=None, max_bound=None, features=None, reduction='mean',
+                         dense=False):
+    """
+    Bucket the points of a point cloud into the voxels of a regular grid, returning the occupied voxels, the number of
+    points in each voxel and (optionally) a per-voxel reduction of per-point features.
+
+    Voxel (i, j, k) occupies the box from min_bound + (i, j, k) * voxel_size to min_bound + (i + 1, j + 1, k + 1) *
+    voxel_size. The grid has floor((max_bound - min_bound) / voxel_size) + 1 voxels along each axis so it always
+    contains max_bound. Points outside the grid are ignored.
+
+    Parameters
+    ----------
+    points : a #v x 3 array of 3d points.
+    voxel_size : a scalar representing the size of each voxel or a 3 tuple representing the size per axis of each voxel.
+    min_bound : a 3 tuple representing the minimum coordinate of the voxel grid or None to use the minimum of the
+                bounding box of the input point cloud.
+    max_bound : a 3 tuple representing the maximum coordinate of the voxel grid or None to use the maximum of the
+                bounding box of the input point cloud.
+    features : a #v x #c array of per-point features, a #v array of scalar features, or None for no features.
+    reduction : how to combine the features of the points in each voxel. One of 'mean' (default), 'sum', 'max',
+                or 'min'.
+    dense : If True, return dense arrays over the whole voxel grid instead of a list of occupied voxels
+            (default False).
+
+    Returns
+    -------
+    If dense is False, a tuple (ijk, point_voxel, counts, voxel_features) where:
+     - ijk is an (#voxels, 3)-shaped int64 array of the coordinates of the occupied voxels, sorted lexicographically.
+     - point_voxel is a (#v,)-shaped int64 array mapping each point to the row of its voxel in ijk (or -1 if the point
+       is outside the grid).
+     - counts is a (#voxels,)-shaped int64 array of the number of points in each occupied voxel.
+     - voxel_features is a (#voxels, #c)-shaped (or (#voxels,)-shaped for 1D features) array of the reduced features
+       in each occupied voxel or None if features is None.
+    If dense is True, a pair (counts, voxel_features) where:
+     - counts is an int64 array whose shape is the grid size (nx, ny, nz) holding the number of points in each voxel.
+       Use counts > 0 to get an occupancy grid.
+     - voxel_features is an (nx, ny, nz, #c)-shaped (or (nx, ny, nz)-shaped for 1D features) array of the reduced
+       features in each voxel, which are zero for empty voxels, or None if features is None.
+    """
+    from ._pcu_sampling import voxelize_point_cloud_internal
+
+    points = np.asarray(points)
+    if points.ndim != 2 or points.shape[1] != 3:
+        raise ValueError("Invalid points must have shape (#points, 3)")
+    if points.dtype not in (np.float32, np.float64):
+        points = points.astype(np.float64)
+
+    if np.isscalar(voxel_size):
+        voxel_size = np.array([voxel_size] * 3, dtype=np.float64)
+    else:
+        voxel_size = np.asarray(voxel_size, dtype=np.float64)
+        if voxel_size.shape != (3,):
+            raise ValueError("Invalid voxel_size must be a 3-tuple or a single float")
+    if np.any(voxel_size <= 0.0):
+        raise ValueError("Invalid voxel_size, must be positive")
+
+    if min_bound is None or max_bound is None:
+        if points.shape[0] == 0:
+            raise ValueError("min_bound and max_bound must be set if points is empty")
+    min_bound = np.min(points, axis=0) if min_bound is None else min_bound
+    max_bound = np.max(points, axis=0) if max_bound is None else max_bound
+    min_bound = np.asarray(min_bound, dtype=np.float64)
+    max_bound = np.asarray(max_bound, dtype=np.float64)
+    if min_bound.shape != (3,):
+        raise ValueError("min_bound must be a 3 tuple")
+    if max_bound.shape != (3,):
+        raise ValueError("max_bound must be a 3 tuple")
+    if np.any(max_bound < min_bound):
+        raise ValueError("Invalid min_bound and max_bound. max_bound must be at least min_bound in all dimensions")
+    grid_shape = np.floor((max_bound - min_bound) / voxel_size).astype(np.int64) + 1
+
+    scalar_features = False
+    if features is None:
+        features = np.zeros([0, 0], dtype=points.dtype)
+    else:
+        features = np.asarray(features)
+        if features.ndim == 1:
+            scalar_features = True
+            features = features[:, np.newaxis]
+        if features.ndim != 2:
+            raise ValueError("Invalid features must have shape (#points,) or (#points, #channels)")
+        if features.dtype not in (np.float32, np.float64):
+            features = features.astype(np.float64)
+
+    ijk, point_voxel, counts, voxel_features = voxelize_point_cloud_internal(
+        points, features, voxel_size[0], voxel_size[1], voxel_size[2],
+        min_bound[0], min_bound[1], min_bound[2], int(grid_shape[0]), int(grid_shape[1]), int(grid_shape[2]),
+        reduction)
+
+    if features.shape[1] == 0:
+        voxel_features = None
+    elif scalar_features:
+        voxel_features = voxel_features[:, 0]
+
+    if not dense:
+        return ijk, point_voxel, counts, voxel_features
+
+    ijk = tuple(ijk.T)
+    dense_counts = np.zeros(grid_shape, dtype=np.int64)
+    dense_counts[ijk] = counts
+    dense_features = None
+    if voxel_features is not None:
+        dense_features = np.zeros(tuple(grid_shape) + voxel_features.shape[1:], dtype=voxel_features.dtype)
+        dense_features[ijk] = voxel_features
+    return dense_counts, dense_features
+
+
+# The public API is every function defined in this file and every lazily imported name
+__all__ = sorted(set(_lazy_attributes) |
+                 {name for name, value in list(globals().items())
+                  if not name.startswith('_') and getattr(value, '__module__', None) == __name__})
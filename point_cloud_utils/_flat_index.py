@@ -0,0 +1,314 @@
+import json
+import struct
+import sys
+
+import numpy as np
+
+
+# Spatial index buffers hold every array of a spatial index (e.g. a KDTree or an Octree) in one flat buffer which can
+# be attached without copying or rebuilding anything, for example from shared memory or a memory-mapped file. The
+# layout follows mesh cache files (see _mesh_io.py):
+#   - 8 bytes: the magic string INDEX_BUFFER_MAGIC
+#   - 8 bytes: the length H of the header as a little endian uint64
+#   - H bytes: a UTF-8 JSON header with the keys
+#       "version": INDEX_BUFFER_VERSION
+#       "type": the name of the index class (e.g. "KDTree")
+#       "metadata": a dict of the scalar parameters of the index
+#       "arrays": a dict mapping array names to {"dtype", "shape", "offset"} where dtype is a numpy dtype string (e.g.
+#                 "<f8"), and offset is relative to the start of the data section
+#   - The data section, starting at the first multiple of INDEX_BUFFER_ALIGNMENT after the header, containing each
+#     array in C order starting at a multiple of INDEX_BUFFER_ALIGNMENT bytes.
+INDEX_BUFFER_MAGIC = b'PCUINDX\x00'
+INDEX_BUFFER_VERSION = 1
+INDEX_BUFFER_ALIGNMENT = 64
+
+
+def _align(offset):
+    return (offset + INDEX_BUFFER_ALIGNMENT - 1) // INDEX_BUFFER_ALIGNMENT * INDEX_BUFFER_ALIGNMENT
+
+
+def _attach_shared_memory(name):
+    from multiprocessing import shared_memory
+    if sys.version_info >= (3, 13):
+        # Only the process which created the segment should unlink it
+        return shared_memory.SharedMemory(name=name, track=False)
+    return shared_memory.SharedMemory(name=name)
+
+
+class FlatIndex:
+    """
+    Base class for spatial indices stored in flat arrays, which can be serialized into a single buffer and attached
+    zero-copy in other processes.
+
+    An index can be shared with the workers of a multiprocessing or concurrent.futures pool in three ways:
+      - to_shared_memory() copies the index into a multiprocessing.shared_memory segment. Pickling the returned index
+        only sends the name of the segment, and unpickling it attaches to the segment without copying.
+      - save(filename) writes the index to a file. load(filename) memory-maps the file so every process shares the
+        same pages, and pickling a loaded index only sends the filename.
+      - to_buffer() and from_buffer(buffer) serialize into and attach to any buffer (e.g. a bytearray, a numpy array
+        or an mmap object).
+    Pickling any other index copies it into the pickle.
+
+    Subclasses list the attribute names of their arrays in _array_names (which are stored without leading
+    underscores), and implement _metadata(), _init_from_arrays(metadata, arrays) where arrays is a dict mapping the
+    names in _array_names to arrays, and _validate().
+    """
+    _array_names = ()
+
+    _shared_memory = None
+    _owns_shared_memory = False
+    _filename = None
+    _mmap_mode = None
+
+    def _metadata(self):
+        raise NotImplementedError()
+
+    def _init_from_arrays(self, metadata, arrays):
+        raise NotImplementedError()
+
+    def _validate(self):
+        """
+        Raise a ValueError if the arrays of an attached index are inconsistent (e.g. the buffer is corrupt or was
+        written by a different index). This is called once by from_buffer, so it has to be cheap compared to building
+        the index but must check everything native queries rely on to stay in bounds.
+        """
+        raise NotImplementedError()
+
+    def _layout(self):
+        array_info = {}
+        offset = 0
+        for name in self._array_names:
+            arr = getattr(self, name)
+            array_info[name.lstrip('_')] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": offset}
+            offset = _align(offset + arr.nbytes)
+        header = json.dumps({"version": INDEX_BUFFER_VERSION, "type": type(self).__name__,
+                             "metadata": self._metadata(), "arrays": array_info}).encode('utf-8')
+        data_start = _align(len(INDEX_BUFFER_MAGIC) + 8 + len(header))
+        return header, data_start, array_info, data_start + offset
+
+    @property
+    def nbytes(self):
+        """
+        The size in bytes of the buffer this index is serialized into by to_buffer().
+        """
+        return self._layout()[3]
+
+    def to_buffer(self, buffer=None):
+        """
+        Serialize this index into a flat buffer which can be attached with from_buffer.
+
+        Parameters
+        ----------
+        buffer : An optional writable buffer of at least nbytes bytes to serialize into (e.g. the buf of a
+                 multiprocessing.shared_memory.SharedMemory). If None, a new bytearray is allocated.
+
+        Returns
+        -------
+        The buffer holding the serialized index
+        """
+        header, data_start, array_info, nbytes = self._layout()
+        if buffer is None:
+            buffer = bytearray(nbytes)
+        out = np.frombuffer(buffer, dtype=np.uint8)
+        if out.size < nbytes:
+            raise ValueError("Invalid buffer has %d bytes but the index needs %d" % (out.size, nbytes))
+
+        out[:len(INDEX_BUFFER_MAGIC)] = np.frombuffer(INDEX_BUFFER_MAGIC, dtype=np.uint8)
+        out[len(INDEX_BUFFER_MAGIC):len(INDEX_BUFFER_MAGIC) + 8] = np.frombuffer(struct.pack('<Q', len(header)),
+                                                                                 dtype=np.uint8)
+        out[len(INDEX_BUFFER_MAGIC) + 8:len(INDEX_BUFFER_MAGIC) + 8 + len(header)] = np.frombuffer(header,
+                                                                                                   dtype=np.uint8)
+        for name in self._array_names:
+            arr = getattr(self, name)
+            start = data_start + array_info[name.lstrip('_')]["offset"]
+            out[start:start + arr.nbytes] = np.ascontiguousarray(arr).reshape(-1).view(np.uint8)
+        return buffer
+
+    @classmethod
+    def from_buffer(cls, buffer):
+        """
+        Attach to an index serialized by to_buffer without copying it. The arrays of the returned index are views
+        into buffer, so buffer must stay alive and unmodified while the index is in use.
+
+        Parameters
+        ----------
+        buffer : A writable object supporting the buffer protocol holding a serialized index (e.g. a bytearray, a
+                 numpy array, an mmap object or the buf of a multiprocessing.shared_memory.SharedMemory). Native
+                 functions take writable views of the arrays of the index but never modify them.
+
+        Returns
+        -------
+        An index of this class whose arrays are views into buffer
+        """
+        data = np.frombuffer(buffer, dtype=np.uint8)
+        if data.size < len(INDEX_BUFFER_MAGIC) + 8 or \
+                data[:len(INDEX_BUFFER_MAGIC)].tobytes() != INDEX_BUFFER_MAGIC:
+            raise ValueError("Invalid spatial index buffer")
+        header_size, = struct.unpack('<Q', data[len(INDEX_BUFFER_MAGIC):len(INDEX_BUFFER_MAGIC) + 8].tobytes())
+        header_start = len(INDEX_BUFFER_MAGIC) + 8
+        header = json.loads(data[header_start:header_start + header_size].tobytes().decode('utf-8'))
+        if header.get("version") != INDEX_BUFFER_VERSION:
+            raise ValueError("Unsupported spatial index buffer version %s" % str(header.get("version")))
+        if header.get("type") != cls.__name__:
+            raise ValueError("Invalid spatial index buffer holds a %s, not a %s" % (header.get("type"), cls.__name__))
+        data_start = _align(header_start + header_size)
+
+        arrays = {}
+        for name in cls._array_names:
+            try:
+                info = header["arrays"][name.lstrip('_')]
+                dtype, shape = np.dtype(info["dtype"]), tuple(int(d) for d in info["shape"])
+                start = data_start + int(info["offset"])
+            except (KeyError, TypeError) as e:
+                raise ValueError("Invalid spatial index buffer has a bad entry for array %s (%s)" % (name, str(e)))
+            count = int(np.prod(shape))
+            if start < data_start or count < 0 or start + count * dtype.itemsize > data.size:
+                raise ValueError("Invalid spatial index buffer is truncated")
+            arrays[name] = data[start:start + count * dtype.itemsize].view(dtype).reshape(shape)
+
+        index = cls.__new__(cls)
+        try:
+            index._init_from_arrays(header["metadata"], arrays)
+        except (KeyError, TypeError) as e:
+            raise ValueError("Invalid spatial index buffer has bad metadata (%s)" % str(e))
+        # Native queries trust the structure of the index, so a corrupt buffer must be rejected before it is used
+        index._validate()
+        return index
+
+    def save(self, filename):
+        """
+        Save this index to a file which can be memory-mapped by load.
+
+        Parameters
+        ----------
+        filename : Path to the file to write
+        """
+        with open(filename, 'wb') as fh:
+            fh.write(self.to_buffer())
+
+    @classmethod
+    def load(cls, filename, mmap_mode='c'):
+        """
+        Load an index saved by save by memory-mapping the file. Pickling the returned index only sends the filename.
+
+        Parameters
+        ----------
+        filename : Path to the file
+        mmap_mode : How to memory-map the file (see numpy.memmap). The default 'c' (copy-on-write) shares pages
+                    between every process loading the same file.
+
+        Returns
+        -------
+        An index whose arrays are memory-mapped from the file
+        """
+        index = cls.from_buffer(np.memmap(filename, dtype=np.uint8, mode=mmap_mode))
+        index._filename = filename
+        index._mmap_mode = mmap_mode
+        return index
+
+    def to_shared_memory(self, name=None):
+        """
+        Copy this index into a new multiprocessing.shared_memory segment. Pickling the returned index (e.g. to pass
+        it to the workers of a process pool) only sends the name of the segment, and unpickling it attaches to the
+        segment without copying.
+
+        The returned index owns the segment, which stays alive until unlink() is called. It can be used as a context
+        manager which unlinks the segment on exit.
+
+        Parameters
+        ----------
+        name : An optional name for the segment. If None, a unique name is generated.
+
+        Returns
+        -------
+        An index attached to the new shared memory segment
+        """
+        from multiprocessing import shared_memory
+        segment = shared_memory.SharedMemory(name=name, create=True, size=self.nbytes)
+        try:
+            self.to_buffer(segment.buf)
+            index = type(self).from_buffer(segment.buf)
+        except BaseException:
+            segment.close()
+            segment.unlink()
+            raise
+        index._shared_memory = segment
+        index._owns_shared_memory = True
+        return index
+
+    @classmethod
+    def from_shared_memory(cls, name):
+        """
+        Attach to an index in a shared memory segment created by to_shared_memory without copying it.
+
+        Parameters
+        ----------
+        name : The name of the segment
+
+        Returns
+        -------
+        An index attached to the shared memory segment
+        """
+        segment = _attach_shared_memory(name)
+        index = cls.from_buffer(segment.buf)
+        index._shared_memory = segment
+        return index
+
+    @property
+    def shared_memory_name(self):
+        """
+        The name of the shared memory segment this index is attached to, or None if it is not in shared memory.
+        """
+        return None if self._shared_memory is None else self._shared_memory.name
+
+    def close(self):
+        """
+        Release the arrays of this index and detach from its shared memory segment (if any). The index can't be used
+        after it is closed.
+        """
+        for name in self._array_names:
+            setattr(self, name, None)
+        if self._shared_memory is not None:
+            self._shared_memory.close()
+
+    def unlink(self):
+        """
+        Close this index and destroy the shared memory segment it owns (see to_shared_memory). Other processes
+        attached to the segment can keep using it until they close it.
+        """
+        owns_shared_memory = self._owns_shared_memory
+        self.close()
+        if owns_shared_memory:
+            self._shared_memory.unlink()
+            self._owns_shared_memory = False
+
+    def _detach(self):
+        """
+        Stop using the buffer this index was attached to before its arrays are replaced (e.g. when an Octree is
+        rebuilt), so pickling doesn't refer to stale data. A shared memory segment owned by this index is destroyed.
+        """
+        if self._shared_memory is not None:
+            self.unlink()
+            self._shared_memory = None
+        self._filename = None
+        self._mmap_mode = None
+
+    def __del__(self):
+        # Release the arrays before the shared memory segment they view (if any) so the segment closes cleanly
+        for name in self._array_names:
+            self.__dict__.pop(name, None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.unlink()
+        return False
+
+    def __reduce__(self):
+        if self._shared_memory is not None:
+            return type(self).from_shared_memory, (self._shared_memory.name,)
+        elif self._filename is not None:
+            return type(self).load, (self._filename, self._mmap_mode)
+        else:
+            return type(self).from_buffer, (self.to_buffer(),)
@@ -0,0 +1,108 @@
+import numpy as np
+
+from ._flat_index import FlatIndex
+
+
+class KDTree(FlatIndex):
+    """
+    A KD tree over a 3D point cloud for nearest neighbor queries. The tree is stored in flat arrays, so it can be
+    built once and shared zero-copy with other processes through shared memory or a memory-mapped file (see
+    FlatIndex), and it can be pickled.
+
+    Example
+    -------
+    tree = pcu.KDTree(reference_points)
+    dists, corrs = tree.query(query_points, k=4)
+
+    # Share the tree with a process pool without copying or rebuilding it in each worker
+    with tree.to_shared_memory() as shared_tree:
+        with concurrent.futures.ProcessPoolExecutor() as pool:
+            results = list(pool.map(query_chunk, [shared_tree] * len(chunks), chunks))
+    """
+    _array_names = ('_tree_points', '_indices', '_nodes', '_splits')
+
+    def __init__(self, points, max_points_per_leaf=10):
+        """
+        Build a KD tree over a point cloud.
+
+        Parameters
+        ----------
+        points : n by 3 array of reference points (float32 or float64). Queries must have the same dtype.
+        max_points_per_leaf : The maximum number of points per leaf node of the tree. Default is 10.
+        """
+        from ._pcu_distance import build_kd_tree_internal
+        tree_points, indices, nodes, splits = build_kd_tree_internal(points, max_points_per_leaf)
+        self._init_from_arrays(dict(max_points_per_leaf=int(max_points_per_leaf)),
+                               dict(_tree_points=tree_points, _indices=indices, _nodes=nodes, _splits=splits))
+
+    def _metadata(self):
+        return dict(max_points_per_leaf=self.max_points_per_leaf)
+
+    def _init_from_arrays(self, metadata, arrays):
+        self.max_points_per_leaf = metadata["max_points_per_leaf"]
+        for name in self._array_names:
+            setattr(self, name, arrays[name])
+
+    def _validate(self):
+        tree_points, nodes = self._tree_points, self._nodes
+        if tree_points.ndim != 2 or tree_points.shape[0] == 0 or tree_points.shape[1] != 3 or \
+                tree_points.dtype not in (np.float32, np.float64) or self._indices.shape != (tree_points.shape[0],) or \
+                nodes.ndim != 2 or nodes.shape[0] == 0 or nodes.shape[1] != 4 or \
+                self._splits.shape != (nodes.shape[0],) or self._splits.dtype != tree_points.dtype or \
+                self._indices.dtype != np.int64 or nodes.dtype != np.int64:
+            raise ValueError("Invalid KDTree: tree_points.shape = %s, indices.shape = %s, nodes.shape = %s, "
+                             "splits.shape = %s, indices.dtype = %s, nodes.dtype = %s" %
+                             (str(tree_points.shape), str(self._indices.shape), str(nodes.shape),
+                              str(self._splits.shape), str(self._indices.dtype), str(nodes.dtype)))
+
+        # Indices map tree points back into the original point cloud
+        if np.any(self._indices < 0) or np.any(self._indices >= tree_points.shape[0]):
+            raise ValueError("Invalid KDTree: point indices are out of range")
+
+        # Every node must cover a range of tree_points, and the children of internal nodes must come after them
+        # (so searches terminate) and be in range. Searches use an explicit stack so deep trees are fine.
+        num_points, num_nodes = tree_points.shape[0], nodes.shape[0]
+        node_ids = np.arange(num_nodes)
+        begin, end, right_child, split_dim = nodes[:, 0], nodes[:, 1], nodes[:, 2], nodes[:, 3]
+        is_leaf = split_dim == -1
+        valid = (0 <= begin) & (begin <= end) & (end <= num_points)
+        valid &= is_leaf | ((split_dim >= 0) & (split_dim < 3) & (node_ids + 1 < right_child) &
+                            (right_child < num_nodes))
+        valid &= ~is_leaf | (right_child == -1)
+        if begin[0] != 0 or end[0] != num_points or not np.all(valid):
+            raise ValueError("Invalid KDTree: %d of %d nodes are out of range" % (np.sum(~valid), num_nodes))
+
+    @property
+    def num_points(self):
+        """
+        The number of points in the tree.
+        """
+        return self._tree_points.shape[0]
+
+    @property
+    def dtype(self):
+        """
+        The dtype of the points in the tree.
+        """
+        return self._tree_points.dtype
+
+    def query(self, x, k=1, squared_distances=False):
+        """
+        Find the k nearest neighbors (L2 distance) in the tree of each point in x.
+
+        Parameters
+        ----------
+        x : n by 3 array of query points with the same dtype as the tree.
+        k : The number of nearest neighbors to query per point. Default is 1.
+        squared_distances : If set to True, then return squared L2 distances. Default is False.
+
+        Returns
+        -------
+        A pair `(dists, corrs)` as returned by k_nearest_neighbors where the target is the point cloud the tree was
+        built over. `dists[i, k]` contains the k^th shortest L2 distance from the point `x[i, :]` to the tree, and
+        `corrs[i, k]` contains the index into the tree's point cloud of the k^th nearest point to `x[i, :]`. If the
+        tree has fewer than k points, the missing entries are -1.
+        """
+        from ._pcu_distance import query_kd_tree_internal
+        return query_kd_tree_internal(x, self._tree_points, self._indices, self._nodes, self._splits, k,
+                                      squared_distances)
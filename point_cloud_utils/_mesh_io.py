@@ -1,6 +1,18 @@
 import numpy as np
-from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
 import os
+import struct
+import tempfile
+
+from ._ply_io import is_ply_file, load_ply_vf, save_ply
+
+
+# Names of the attributes which can be loaded from a mesh (these match the arguments to save_triangle_mesh)
+MESH_ATTRIBUTES = ('v', 'vn', 'vt', 'vti', 'vc', 'vq', 'vr', 'vflags',
+                   'f', 'fn', 'fc', 'fq', 'fflags',
+                   'wc', 'wn', 'wt', 'wti')
 
 
 class TriangleMesh:
@@ -68,24 +80,6 @@ class TriangleMesh:
             self.flags = np.zeros([0], dtype=int)
             self._set_empty_to_none()
 
-        def _reset_if_none(self):
-            if self.positions is None:
-                self.positions = np.zeros([0, 3])
-            if self.normals is None:
-                self.normals = np.zeros([0, 3])
-            if self.texcoords is None:
-                self.texcoords = np.zeros([0, 2])
-            if self.colors is None:
-                self.colors = np.zeros([0, 4])
-            if self.quality is None:
-                self.quality = np.zeros([0])
-            if self.radius is None:
-                self.radius = np.zeros([0])
-            if self.tex_ids is None:
-                self.tex_ids = np.zeros([0], dtype=int)
-            if self.flags is None:
-                self.flags = np.zeros([0], dtype=int)
-
         def _set_empty_to_none(self):
             for k, v in self.__dict__.items():
                 if isinstance(v, np.ndarray):
@@ -125,27 +119,6 @@ class TriangleMesh:
             self.wedge_tex_ids = np.zeros([0, 3], dtype=int)
             self._set_empty_to_none()
 
-        def _reset_if_none(self):
-            if self.vertex_ids is None:
-                self.vertex_ids = np.zeros([0, 3], dtype=int)
-            if self.normals is None:
-                self.normals = np.zeros([0, 3])
-            if self.colors is None:
-                self.colors = np.zeros([0, 4])
-            if self.quality is None:
-                self.quality = np.zeros([0])
-            if self.flags is None:
-                self.flags = np.zeros([0], dtype=int)
-
-            if self.wedge_colors is None:
-                self.wedge_colors = np.zeros([0, 3, 4])
-            if self.wedge_normals is None:
-                self.wedge_normals = np.zeros([0, 3, 3])
-            if self.wedge_texcoords is None:
-                self.wedge_texcoords = np.zeros([0, 3, 2])
-            if self.wedge_tex_ids is None:
-                self.wedge_tex_ids = np.zeros([0, 3], dtype=int)
-
         def _set_empty_to_none(self):
             for k, v in self.__dict__.items():
                 if isinstance(v, np.ndarray):
@@ -185,71 +158,66 @@ class TriangleMesh:
         return self.face_data.colors
 
     def save(self, filename):
-        from ._pcu_internal import save_mesh_internal
-        dtype = np.float64
-        self.vertex_data._reset_if_none()
-        self.face_data._reset_if_none()
-
-        # Handle RBG colors by just concatenating alpha=1
-        vcolors = self.vertex_data.colors
-        if vcolors.shape[-1] == 3 and len(vcolors.shape) == 2:
-            vcolors = np.concatenate([np.ascontiguousarray(self.vertex_data.colors),
-                                      np.ones([vcolors.shape[0], 1], dtype=vcolors.dtype)], axis=-1)
-
-        fcolors = self.face_data.colors
-        if fcolors.shape[-1] == 3 and len(fcolors.shape) == 2:
-            fcolors = np.concatenate([np.ascontiguousarray(fcolors),
-                                      np.ones([fcolors.shape[0], 1], dtype=self.face_data.colors.dtype)], axis=-1)
-
-        wcolors = self.face_data.wedge_colors
-        if wcolors.shape[-1] == 3 and len(wcolors.shape) == 3:
-            wcolors = np.concatenate([np.ascontiguousarray(wcolors),
-                                      np.ones([wcolors.shape[0], wcolors.shape[1], 1], dtype=wcolors.dtype)], axis=-1)
+        """
+        Save this mesh to a file.
+
+        Attributes are passed to the writer as they are (float32 or float64, int32 or int64, RGB or RGBA colors) without
+        being converted or copied. PLY files which only have vertex positions, normals, colors and faces are streamed
+        directly to disk.
+
+        Parameters
+        ----------
+        filename : Path to the mesh file to write
+        """
+        from ._pcu_io import save_mesh_internal
+
+        vd, fd = self.vertex_data, self.face_data
+        if is_ply_file(filename) and len(self.textures) == 0 and len(self.normal_maps) == 0:
+            others = [vd.texcoords, vd.tex_ids, vd.quality, vd.radius, vd.flags,
+                      fd.normals, fd.colors, fd.quality, fd.flags,
+                      fd.wedge_colors, fd.wedge_normals, fd.wedge_texcoords, fd.wedge_tex_ids]
+            if all(a is None or np.size(a) == 0 for a in others):
+                save_ply(filename, vd.positions, f=fd.vertex_ids, vn=vd.normals, vc=vd.colors)
+                return
 
         save_mesh_internal(filename,
-                           np.ascontiguousarray(self.vertex_data.positions.astype(dtype)),
-                           np.ascontiguousarray(self.vertex_data.normals.astype(dtype)),
-                           np.ascontiguousarray(self.vertex_data.texcoords.astype(dtype)),
-                           np.ascontiguousarray(vcolors.astype(dtype)),
-                           np.ascontiguousarray(self.vertex_data.quality.astype(dtype)),
-                           np.ascontiguousarray(self.vertex_data.radius.astype(dtype)),
-                           np.ascontiguousarray(self.vertex_data.tex_ids.astype(np.int32)),
-                           np.ascontiguousarray(self.vertex_data.flags.astype(np.int32)),
-
-                           np.ascontiguousarray(self.face_data.vertex_ids.astype(np.int32)),
-                           np.ascontiguousarray(self.face_data.normals.astype(dtype)),
-                           np.ascontiguousarray(fcolors.astype(dtype)),
-                           np.ascontiguousarray(self.face_data.quality.astype(dtype)),
-                           np.ascontiguousarray(self.face_data.flags.astype(np.int32)),
-
-                           np.ascontiguousarray(wcolors.astype(dtype)),
-                           np.ascontiguousarray(self.face_data.wedge_normals.astype(dtype)),
-                           np.ascontiguousarray(self.face_data.wedge_texcoords.astype(dtype)),
-                           np.ascontiguousarray(self.face_data.wedge_tex_ids.astype(np.int32)),
-                           self.textures, self.normal_maps, dtype, np.int32)
-        self.vertex_data._set_empty_to_none()
-        self.face_data._set_empty_to_none()
+                           vd.positions, vd.normals, vd.texcoords, vd.colors,
+                           vd.quality, vd.radius, vd.tex_ids, vd.flags,
+                           fd.vertex_ids, fd.normals, fd.colors, fd.quality, fd.flags,
+                           fd.wedge_colors, fd.wedge_normals, fd.wedge_texcoords, fd.wedge_tex_ids,
+                           self.textures, self.normal_maps)
 
-    def load(self, filename, dtype=np.float64):
-        from ._pcu_internal import load_mesh_internal
+    def load(self, filename, dtype=np.float64, attributes=None):
+        """
+        Load a mesh from a file
+
+        Parameters
+        ----------
+        filename : Path to the mesh file
+        dtype : The floating point dtype of the loaded attributes (default np.float64)
+        attributes : An optional list of attribute names to load (see MESH_ATTRIBUTES). Only these attributes are
+                     copied out of the file and everything else is set to None. If None, load every attribute in the
+                     file (default None).
+        """
+        from ._pcu_io import load_mesh_internal
         if not os.path.exists(filename):
             raise FileNotFoundError("Invalid path " + filename + " does not exist")
+        if attributes is None:
+            attributes = MESH_ATTRIBUTES
+        for a in attributes:
+            if a not in MESH_ATTRIBUTES:
+                raise ValueError("Invalid mesh attribute '%s', must be one of %s" % (a, str(MESH_ATTRIBUTES)))
+
+        cache = _mesh_cache
+        if cache is not None and cache.load(self, filename, dtype, attributes):
+            return
         mesh_root_path = os.path.dirname(filename)
         if mesh_root_path.strip() == '':
             mesh_root_path = '.'
-        mesh_filename = os.path.basename(filename)
-
-        @contextmanager
-        def pushd(new_dir):
-            previous_dir = os.getcwd()
-            os.chdir(new_dir)
-            try:
-                yield
-            finally:
-                os.chdir(previous_dir)
 
-        with pushd(mesh_root_path):
-            mesh_dict = load_mesh_internal(mesh_filename, dtype)
+        # Texture and material paths are resolved relative to the mesh file without changing the working directory,
+        # so meshes can be loaded from several threads at once
+        mesh_dict = load_mesh_internal(filename, mesh_root_path, list(attributes), dtype)
 
         self.textures = mesh_dict["textures"]
         self.normal_maps = mesh_dict["normal_maps"]
@@ -264,6 +232,251 @@ class TriangleMesh:
         self.vertex_data._set_empty_to_none()
         self.face_data._set_empty_to_none()
 
+        if cache is not None:
+            cache.store(self, filename, dtype, attributes)
+
+
+# Mesh cache files hold every array of a TriangleMesh in a single file which can be memory-mapped without parsing.
+# The layout is:
+#   - 8 bytes: the magic string MESH_CACHE_MAGIC
+#   - 8 bytes: the length H of the header as a little endian uint64
+#   - H bytes: a UTF-8 JSON header with the keys
+#       "version": MESH_CACHE_VERSION
+#       "textures", "normal_maps": the texture lists of the mesh
+#       "arrays": a dict mapping "vertex_data.<name>" and "face_data.<name>" to {"dtype", "shape", "offset"} where
+#                 dtype is a numpy dtype string (e.g. "<f8"), and offset is relative to the start of the data section
+#       "source": optional information about the file the mesh was loaded from
+#   - The data section, starting at the first multiple of MESH_CACHE_ALIGNMENT after the header, containing each array
+#     in C order starting at a multiple of MESH_CACHE_ALIGNMENT bytes.
+# Attributes which are None are not stored.
+MESH_CACHE_MAGIC = b'PCUMESH\x00'
+MESH_CACHE_VERSION = 1
+MESH_CACHE_ALIGNMENT = 64
+
+
+def _align(offset):
+    return (offset + MESH_CACHE_ALIGNMENT - 1) // MESH_CACHE_ALIGNMENT * MESH_CACHE_ALIGNMENT
+
+
+def save_mesh_cache_file(filename, mesh, source=None):
+    """
+    Save a TriangleMesh to a mesh cache file which can be loaded without parsing by load_mesh_cache_file.
+
+    Parameters
+    ----------
+    filename : Path to the cache file to write
+    mesh : The TriangleMesh to save
+    source : An optional JSON serializable object describing where the mesh came from which is stored in the header
+    """
+    arrays = []
+    for prefix, data in (("vertex_data", mesh.vertex_data), ("face_data", mesh.face_data)):
+        for k, v in data.__dict__.items():
+            if isinstance(v, np.ndarray) and v.size > 0:
+                arrays.append((prefix + "." + k, v))
+
+    array_info = {}
+    offset = 0
+    for name, arr in arrays:
+        array_info[name] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": offset}
+        offset = _align(offset + arr.nbytes)
+
+    header = json.dumps({"version": MESH_CACHE_VERSION,
+                         "textures": list(mesh.textures), "normal_maps": list(mesh.normal_maps),
+                         "arrays": array_info, "source": source}).encode('utf-8')
+    data_start = _align(len(MESH_CACHE_MAGIC) + 8 + len(header))
+
+    with open(filename, 'wb') as fh:
+        fh.write(MESH_CACHE_MAGIC)
+        fh.write(struct.pack('<Q', len(header)))
+        fh.write(header)
+        for name, arr in arrays:
+            fh.write(b'\x00' * (data_start + array_info[name]["offset"] - fh.tell()))
+            np.ascontiguousarray(arr).tofile(fh)
+
+
+def load_mesh_cache_file(filename, mmap_mode='c'):
+    """
+    Load a TriangleMesh from a mesh cache file written by save_mesh_cache_file. Raises a ValueError if the file is not
+    a valid mesh cache file (e.g. if it is truncated).
+
+    Parameters
+    ----------
+    filename : Path to the cache file
+    mmap_mode : How to memory-map arrays in the file (see numpy.memmap). The default 'c' (copy-on-write) shares
+                pages between every process reading the same file and only copies pages which are modified.
+                Pass None to read the arrays into memory instead.
+
+    Returns
+    -------
+    A TriangleMesh whose arrays are memory-mapped from the file
+    """
+    with open(filename, 'rb') as fh:
+        if fh.read(len(MESH_CACHE_MAGIC)) != MESH_CACHE_MAGIC:
+            raise ValueError("Invalid mesh cache file %s" % filename)
+        header_size_bytes = fh.read(8)
+        if len(header_size_bytes) != 8:
+            raise ValueError("Invalid mesh cache file %s is truncated" % filename)
+        header_size, = struct.unpack('<Q', header_size_bytes)
+        header_bytes = fh.read(header_size)
+        if len(header_bytes) != header_size:
+            raise ValueError("Invalid mesh cache file %s is truncated" % filename)
+        header = json.loads(header_bytes.decode('utf-8'))
+        if not isinstance(header, dict):
+            raise ValueError("Invalid mesh cache file %s" % filename)
+        if header.get("version") != MESH_CACHE_VERSION:
+            raise ValueError("Unsupported mesh cache file version %s in %s" % (str(header.get("version")), filename))
+        data_start = _align(len(MESH_CACHE_MAGIC) + 8 + header_size)
+
+        mesh = TriangleMesh()
+        try:
+            mesh.textures = header["textures"]
+            mesh.normal_maps = header["normal_maps"]
+            for name, info in header["arrays"].items():
+                prefix, k = name.split(".")
+                data = mesh.vertex_data if prefix == "vertex_data" else mesh.face_data
+                if not hasattr(data, k):
+                    raise ValueError("Invalid array %s in mesh cache file %s" % (name, filename))
+                dtype, shape = np.dtype(info["dtype"]), tuple(info["shape"])
+                if mmap_mode is None:
+                    fh.seek(data_start + info["offset"])
+                    arr = np.fromfile(fh, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+                else:
+                    # Raises a ValueError if the file is too short to hold the array
+                    arr = np.memmap(filename, dtype=dtype, mode=mmap_mode, offset=data_start + info["offset"],
+                                    shape=shape)
+                setattr(data, k, arr)
+        except (KeyError, TypeError, AttributeError) as e:
+            raise ValueError("Invalid mesh cache file %s (%s)" % (filename, str(e)))
+    return mesh
+
+
+class MeshCache:
+    """
+    A directory of mesh cache files (see save_mesh_cache_file) holding parsed meshes so they can be reloaded without
+    parsing. Entries are keyed on the absolute path, modification time and size of the source file (as well as the
+    dtype and attributes requested), so modified files are reparsed. Once the total size of the cache exceeds
+    max_size bytes, the least recently used entries are removed. The directory can be shared between processes.
+    """
+    SUFFIX = '.pcumesh'
+
+    def __init__(self, directory, max_size=4 << 30):
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+
+    def _entry_path(self, filename, dtype, attributes):
+        stat = os.stat(filename)
+        key = json.dumps([os.path.abspath(filename), stat.st_mtime_ns, stat.st_size,
+                          np.dtype(dtype).str, sorted(attributes)])
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + self.SUFFIX)
+
+    def load(self, mesh, filename, dtype, attributes):
+        """
+        Load filename into mesh from the cache, returning False if it is not in the cache
+        """
+        path = self._entry_path(filename, dtype, attributes)
+        try:
+            cached = load_mesh_cache_file(path)
+            os.utime(path)  # Mark this entry as recently used
+        except (OSError, ValueError):
+            return False
+        mesh.vertex_data = cached.vertex_data
+        mesh.face_data = cached.face_data
+        mesh.textures = cached.textures
+        mesh.normal_maps = cached.normal_maps
+        return True
+
+    def store(self, mesh, filename, dtype, attributes):
+        """
+        Add mesh, which was loaded from filename, to the cache and evict old entries if the cache is too large
+        """
+        path = self._entry_path(filename, dtype, attributes)
+        # Write to a temporary file and move it into place so other processes never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            os.close(fd)
+            save_mesh_cache_file(tmp_path, mesh, source={"path": os.path.abspath(filename)})
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache is no larger than max_size bytes
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(self.SUFFIX):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue  # Removed by another process
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total_size = sum(e[1] for e in entries)
+        for _, size, name in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total_size -= size
+
+    def clear(self):
+        """
+        Remove every entry in the cache
+        """
+        for name in os.listdir(self.directory):
+            if name.endswith(self.SUFFIX):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+
+_mesh_cache = None
+
+
+def enable_mesh_cache(directory=None, max_size=4 << 30):
+    """
+    Cache meshes loaded with load_triangle_mesh (and TriangleMesh.load, load_meshes and the load_mesh_* functions)
+    in directory so repeated loads of the same file memory-map the cached arrays instead of parsing the file again.
+
+    Cached arrays are memory-mapped copy-on-write, so they can be modified without changing the cache.
+
+    Parameters
+    ----------
+    directory : The cache directory. If None, use the PCU_MESH_CACHE_DIR environment variable if it is set or
+                ~/.cache/point_cloud_utils/meshes otherwise (default None)
+    max_size : The maximum total size in bytes of the cache, beyond which the least recently used entries are
+               removed (default 4GiB)
+
+    Returns
+    -------
+    The MeshCache being used
+    """
+    global _mesh_cache
+    if directory is None:
+        directory = os.environ.get("PCU_MESH_CACHE_DIR",
+                                   os.path.join(os.path.expanduser("~"), ".cache", "point_cloud_utils", "meshes"))
+    _mesh_cache = MeshCache(directory, max_size=max_size)
+    return _mesh_cache
+
+
+def disable_mesh_cache():
+    """
+    Stop caching loaded meshes (this does not remove the cache directory)
+    """
+    global _mesh_cache
+    _mesh_cache = None
+
+
+if os.environ.get("PCU_MESH_CACHE_DIR"):
+    enable_mesh_cache()
+
 
 def save_triangle_mesh(filename, v, f=None,
                        vn=None, vt=None, vc=None, vq=None, vr=None, vti=None, vflags=None,
@@ -272,6 +485,8 @@ def save_triangle_mesh(filename, v, f=None,
     """
     Save a triangle mesh to a file with various per-vertex, per-face, and per-wedge attributes. Each argument (except v)
     is optional and can be None.
+    Floating point attributes can be float32 or float64 and integer attributes can be int32 or int64. Arrays are
+    written as they are without being copied.
 
     Parameters
     ----------
@@ -280,17 +495,17 @@ def save_triangle_mesh(filename, v, f=None,
     f           : [F, 3]-shaped numpy array of integer face indices into TrianglMesh.vertex_data.positions (or None)
     vn          : [V, 3]-shaped numpy array of per-vertex normals (or None)
     vt          : [V, 2]-shaped numpy array of per-vertex uv coordinates (or None)
-    vc          : [V, 4]-shaped numpy array of per-vertex RBGA colors in [0.0, 1.0] (or None)
+    vc          : [V, 3] or [V, 4]-shaped numpy array of per-vertex RBG(A) colors in [0.0, 1.0] (or None)
     vq          : [V,]-shaped numpy array of per-vertex quality measures (or None)
     vr          : [V,]-shaped numpy array of per-vertex curvature radii (or None)
     vti         : [V,]-shaped numpy array of integer indices into TriangleMesh.textures indicating which texture to
                   use at this vertex (or None)
     vflags      : [V,]-shaped numpy array of 32-bit integer flags per vertex (or None)
     fn          : [F, 3]-shaped numpy array of per-face normals (or None)
-    fc          : [F, 4]-shaped numpy array of per-face RBGA colors in [0.0, 1.0] (or None)
+    fc          : [F, 3] or [F, 4]-shaped numpy array of per-face RBG(A) colors in [0.0, 1.0] (or None)
     fq          : [F,]-shaped numpy array of per-face quality measures (or None)
     fflags      : [F,]-shaped numpy array of 32-bit integer flags per face (or None)
-    wc          : [F, 3, 4]-shaped numpy array of per-wedge RBGA colors in [0.0, 1.0] (or None)
+    wc          : [F, 3, 3] or [F, 3, 4]-shaped numpy array of per-wedge RBG(A) colors in [0.0, 1.0] (or None)
     wn          : [F, 3, 3]-shaped numpy array of per-wedge normals (or None)
     wt          : [F, 3, 2]-shaped numpy array of per-wedge] uv coordinates (or None)
     wti         : [F, 3]-shaped numpy array of integer indices into TriangleMesh.textures indicating which
@@ -359,42 +574,98 @@ def save_mesh_vfnc(filename, v, f, n, c):
 
 
 
-def load_triangle_mesh(filename, dtype=np.float64):
+def load_triangle_mesh(filename, dtype=np.float64, attributes=None):
     ret = TriangleMesh()
-    ret.load(filename, dtype=dtype)
+    ret.load(filename, dtype=dtype, attributes=attributes)
     return ret
 
 
+def _load_ply_vf_fast(filename, dtype, load_faces):
+    """
+    Try to load a PLY file with the NumPy reader in _ply_io, returning None if the general mesh loader is needed
+    """
+    if not is_ply_file(filename):
+        return None
+    if not os.path.exists(filename):
+        raise FileNotFoundError("Invalid path " + filename + " does not exist")
+    ret = load_ply_vf(filename, dtype=dtype, load_faces=load_faces)
+    if ret is None:
+        return None
+    v, f = ret
+    if v.size <= 0:
+        v = None
+    if f is not None and f.size <= 0:
+        f = None
+    return v, f
+
+
+def load_meshes(filenames, n_threads=None, dtype=np.float64, attributes=None):
+    """
+    Load many mesh files concurrently.
+
+    Parameters
+    ----------
+    filenames : A list of paths to mesh files
+    n_threads : The number of threads used to load files. If None, use os.cpu_count() (default None)
+    dtype : The floating point dtype of the loaded attributes (default np.float64)
+    attributes : An optional list of attribute names to load from each file (see load_triangle_mesh)
+
+    Returns
+    -------
+    A list of TriangleMesh objects, one per filename and in the same order as filenames.
+    """
+    filenames = list(filenames)
+    if n_threads is None:
+        n_threads = os.cpu_count() or 1
+    if n_threads <= 0:
+        raise ValueError("n_threads must be a positive integer, got %s" % str(n_threads))
+    n_threads = min(n_threads, max(len(filenames), 1))
+
+    if n_threads == 1:
+        return [load_triangle_mesh(fname, dtype=dtype, attributes=attributes) for fname in filenames]
+
+    # The native loader releases the GIL while parsing so this runs in parallel
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        return list(executor.map(lambda fname: load_triangle_mesh(fname, dtype=dtype, attributes=attributes),
+                                 filenames))
+
+
 def load_mesh_v(filename, dtype=float):
-    return load_triangle_mesh(filename, dtype=dtype).v
+    ret = _load_ply_vf_fast(filename, dtype, load_faces=False)
+    if ret is not None:
+        return ret[0]
+    return load_triangle_mesh(filename, dtype=dtype, attributes=['v']).v
 
 
 def load_mesh_vf(filename, dtype=float):
-    ret = load_triangle_mesh(filename, dtype=dtype)
+    ret = _load_ply_vf_fast(filename, dtype, load_faces=True)
+    if ret is not None:
+        return ret
+    ret = load_triangle_mesh(filename, dtype=dtype, attributes=['v', 'f'])
     return ret.v, ret.f
 
 
 def load_mesh_vn(filename, dtype=float):
-    ret = load_triangle_mesh(filename, dtype=dtype)
+    ret = load_triangle_mesh(filename, dtype=dtype, attributes=['v', 'vn'])
     return ret.v, ret.vn
 
 
 def load_mesh_vc(filename, dtype=float):
-    ret = load_triangle_mesh(filename, dtype=dtype)
+    ret = load_triangle_mesh(filename, dtype=dtype, attributes=['v', 'vc'])
     return ret.v, ret.vc
 
 
 def load_mesh_vnc(filename, dtype=float):
-    ret = load_triangle_mesh(filename, dtype=dtype)
+    ret = load_triangle_mesh(filename, dtype=dtype, attributes=['v', 'vn', 'vc'])
     return ret.v, ret.vn, ret.vc
 
 
 def load_mesh_vfn(filename, dtype=float):
-    ret = load_triangle_mesh(filename, dtype=dtype)
+    ret = load_triangle_mesh(filename, dtype=dtype, attributes=['v', 'f', 'vn'])
     return ret.v, ret.f, ret.vn
 
 
 def load_mesh_vfnc(filename, dtype=float):
-    ret = load_triangle_mesh(filename, dtype=dtype)
-    return ret.v, ret.f, ret.vn, ret.c
+    ret = load_triangle_mesh(filename, dtype=dtype, attributes=['v', 'f', 'vn', 'vc'])
+    return ret.v, ret.f, ret.vn, ret.vc
 
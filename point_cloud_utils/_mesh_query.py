@@ -0,0 +1,122 @@
+import numpy as np
+
+
+class MeshQuery:
+    """
+    A triangle mesh with acceleration structures for answering many geometric queries against it.
+
+    Functions like closest_points_on_mesh and signed_distance build an AABB tree (and a fast winding number tree) over
+    the mesh on every call. A MeshQuery builds these once when it is constructed (the winding number tree is built the
+    first time it is needed) and reuses them for every query, which is much faster when querying the same mesh with
+    many small batches of points.
+    """
+    def __init__(self, v, f):
+        """
+        Build a MeshQuery for a triangle mesh.
+
+        Parameters
+        ----------
+        v : (#v, 3)-shaped array of mesh vertex positions
+        f : (#f, 3)-shaped array of triangle face indices into v
+        """
+        from ._pcu_distance import MeshQuery as _MeshQuery, mesh_query_set_mesh_internal
+        self.__internal_mq = _MeshQuery()
+        mesh_query_set_mesh_internal(self.__internal_mq, v, f)
+
+    @property
+    def num_vertices(self):
+        return self.__internal_mq.num_vertices()
+
+    @property
+    def num_faces(self):
+        return self.__internal_mq.num_faces()
+
+    def closest_points(self, p):
+        """
+        Compute the closest points on the mesh to a set of query points.
+
+        Parameters
+        ----------
+        p : (#p, 3)-shaped array of query point positions
+
+        Returns
+        -------
+        A tuple (d, fi, bc) where:
+         - d is a (#p,)-shaped array of shortest distances for each query point
+         - fi is a (#p,)-shaped int64 array of indices of the face containing the closest point to each query point
+         - bc is a (#p, 3)-shaped array of barycentric coordinates of the closest point in face fi
+        """
+        from ._pcu_distance import mesh_query_closest_points_internal
+        d, fi, bc = mesh_query_closest_points_internal(self.__internal_mq, p)
+        return d.ravel(), fi.ravel(), bc
+
+    def signed_distance(self, p, lower_bound=-np.inf, upper_bound=np.inf, band=np.inf):
+        """
+        Compute signed distances from a set of query points to the mesh using fast winding numbers to determine the
+        sign (points inside the mesh have negative distances). As in signed_distance, distances are scaled by
+        1 - 2|w| where w is the winding number at the query, except outside the bounding box of the mesh where the
+        factor is exactly 1.
+
+        Parameters
+        ----------
+        p : (#p, 3)-shaped array of query point positions
+        lower_bound : The minimum signed distance of interest (default -inf). Points whose distance falls outside
+                      [lower_bound, upper_bound] are not signed and get a distance of NaN and a face index of -1.
+        upper_bound : The maximum signed distance of interest (default inf).
+        band : Width of the narrow band around the surface in which to compute exact distances (default inf).
+               Queries farther than band from the mesh exit the closest point search early and get a signed distance
+               of +/-band, a face index of -1 and a closest point of NaN.
+
+        Returns
+        -------
+        A tuple (s, fi, c) where
+         - s is a (#p,)-shaped array of signed distance values for each query point
+         - fi is a (#p,)-shaped int64 array of indices of the closest face to each query point (or -1 for points
+           outside the distance bounds or the band)
+         - c is a (#p, 3)-shaped array of the closest point on the mesh to each query point
+        """
+        from ._pcu_distance import mesh_query_signed_distance_internal
+        s, fi, c = mesh_query_signed_distance_internal(self.__internal_mq, p, lower_bound, upper_bound, band)
+        return s.ravel(), fi.ravel(), c
+
+    def winding_number(self, p):
+        """
+        Compute the (fast, approximate) generalized winding number of the mesh at a set of query points.
+        This is close to 1 inside a closed mesh and close to 0 outside of it.
+
+        Parameters
+        ----------
+        p : (#p, 3)-shaped array of query point positions
+
+        Returns
+        -------
+        A (#p,)-shaped array of winding numbers for each query point
+        """
+        from ._pcu_distance import mesh_query_winding_number_internal
+        return mesh_query_winding_number_internal(self.__internal_mq, p).ravel()
+
+    def ray_intersect(self, ray_o, ray_d):
+        """
+        Compute the first intersection of a set of rays with the mesh.
+
+        Parameters
+        ----------
+        ray_o : (#rays, 3)-shaped array of ray origins
+        ray_d : (#rays, 3)-shaped array of ray directions, or a single (3,)-shaped direction shared by every ray.
+                Directions do not need to be normalized.
+
+        Returns
+        -------
+        A tuple (t, fi, bc) where
+         - t is a (#rays,)-shaped array of ray parameters such that the hit point is ray_o + t * ray_d (inf for rays
+           which miss the mesh)
+         - fi is a (#rays,)-shaped int64 array of indices of the face each ray hit (-1 for rays which miss)
+         - bc is a (#rays, 3)-shaped array of barycentric coordinates of each hit point in face fi
+        """
+        from ._pcu_distance import mesh_query_ray_intersect_internal
+        ray_o = np.asarray(ray_o)
+        ray_d = np.asarray(ray_d, dtype=ray_o.dtype)
+        if ray_d.ndim == 1:
+            ray_d = ray_d[np.newaxis, :]
+        t, fi, bc = mesh_query_ray_intersect_internal(self.__internal_mq, ray_o, ray_d)
+        return t.ravel(), fi.ravel(), bc
@@ -0,0 +1,58 @@
+def get_num_threads():
+    """
+    Get the maximum number of threads native functions called from the current thread will use.
+
+    Returns
+    -------
+    The maximum number of threads used by parallel functions (e.g. OpenMP loops, Voronoi diagrams and Lloyd
+    relaxation with geogram, and nearest neighbor queries with nanoflann) called from the current thread.
+    """
+    from ._pcu_internal import get_num_threads_internal
+    return get_num_threads_internal()
+
+
+def set_num_threads(num_threads):
+    """
+    Set the maximum number of threads native functions called from the current thread will use.
+
+    This bounds every parallel function in the library, including geogram (Voronoi diagrams, Lloyd relaxation)
+    unless a function is passed an explicit positive num_threads argument. Following OpenMP, the setting applies to
+    the calling thread so each worker of a thread pool should set its own limit (e.g. with limit_num_threads) to
+    avoid oversubscription.
+
+    geogram only has a process-wide thread limit, so geogram functions called from different threads run one at a
+    time, each with the limit of the thread which called it.
+
+    Parameters
+    ----------
+    num_threads : A positive integer representing the maximum number of threads to use.
+    """
+    from ._pcu_internal import set_num_threads_internal
+    num_threads = int(num_threads)
+    if num_threads <= 0:
+        raise ValueError("Invalid num_threads must be positive")
+    set_num_threads_internal(num_threads)
+
+
+class limit_num_threads:
+    """
+    A context manager which limits the number of threads native functions called from the current thread will use
+    and restores the previous limit on exit. See set_num_threads.
+
+    Example
+    -------
+    with pcu.limit_num_threads(1):
+        dists, corrs = pcu.k_nearest_neighbors(x, y, k=4)
+    """
+    def __init__(self, num_threads):
+        self.num_threads = num_threads
+        self._prev_num_threads = []
+
+    def __enter__(self):
+        self._prev_num_threads.append(get_num_threads())
+        set_num_threads(self.num_threads)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        set_num_threads(self._prev_num_threads.pop())
+        return False
@@ -1,43 +1,114 @@
 import numpy as np
 
+from ._flat_index import FlatIndex
+
+
+class Octree(FlatIndex):
+    """
+    An octree over a 3D point cloud. The octree is stored in flat arrays, so it can be built once and shared zero-copy
+    with other processes through shared memory or a memory-mapped file (see FlatIndex), and it can be pickled.
+    """
+    _array_names = ('_children', '_point_offsets', '_point_indices')
 
-class Octree:
     def __init__(self, max_depth, origin=np.array((0.0, 0.0, 0.0)), size=0.0):
-        from ._pcu_internal import Octree
-        self.__internal_octree = Octree(max_depth, origin[0], origin[1], origin[2], size)
+        self._init_from_arrays(dict(max_depth=int(max_depth), origin=[float(o) for o in origin], size=float(size)),
+                               dict(_children=np.zeros((0, 8), dtype=np.int64),
+                                    _point_offsets=np.zeros(1, dtype=np.int64),
+                                    _point_indices=np.zeros(0, dtype=np.int64)))
+
+    def _metadata(self):
+        return dict(max_depth=self.max_depth, origin=[float(o) for o in self._origin], size=self._size)
+
+    def _init_from_arrays(self, metadata, arrays):
+        self.max_depth = metadata["max_depth"]
+        self._origin = np.array(metadata["origin"], dtype=np.float64)
+        self._size = metadata["size"]
+        for name in self._array_names:
+            setattr(self, name, arrays[name])
+
+    def _validate(self):
+        children, point_offsets = self._children, self._point_offsets
+        if children.ndim != 2 or children.shape[1] != 8 or point_offsets.shape != (children.shape[0] + 1,) or \
+                self._point_indices.ndim != 1 or self.max_depth < 0 or self._origin.shape != (3,):
+            raise ValueError("Invalid Octree: children.shape = %s, point_offsets.shape = %s, point_indices.shape = %s"
+                             % (str(children.shape), str(point_offsets.shape), str(self._point_indices.shape)))
+
+        # Children must come after their parent (so queries terminate) and be in range
+        num_nodes = children.shape[0]
+        node_ids = np.arange(num_nodes)[:, np.newaxis]
+        valid_children = (children == -1) | ((children > node_ids) & (children < num_nodes))
+        valid_offsets = point_offsets[0] == 0 and point_offsets[-1] == self._point_indices.shape[0] and \
+            np.all(np.diff(point_offsets) >= 0)
+        if not np.all(valid_children) or not valid_offsets:
+            raise ValueError("Invalid Octree: child or point indices are out of range")
 
     def clear(self):
-        self.__internal_octree.clear()
+        self._detach()
+        self.__init__(self.max_depth)
 
     def is_empty(self):
-        return self.__internal_octree.is_empty()
+        return self._children.shape[0] == 0
 
     @property
     def min_bound(self):
-        return np.array(self.__internal_octree.get_min_bound())
+        return np.zeros(3) if self.is_empty() else self._origin.copy()
 
     @property
     def max_bound(self):
-        return np.array(self.__internal_octree.get_max_bound())
+        return np.zeros(3) if self.is_empty() else self._origin + self._size
 
     @property
     def center(self):
-        return np.array(self.__internal_octree.get_center())
+        return self._origin + self._size / 2.0
 
     def build_from_point_cloud(self, points, pad_amount=0.01):
         points = self._check_shape(points)
-        from ._pcu_internal import build_octree_from_pointcloud_internal
-        build_octree_from_pointcloud_internal(self.__internal_octree, points, pad_amount)
+        from ._pcu_internal import Octree, build_octree_from_pointcloud_internal, flatten_octree_internal
+        octree = Octree(self.max_depth, self._origin[0], self._origin[1], self._origin[2], self._size)
+        build_octree_from_pointcloud_internal(octree, points, pad_amount)
+        children, point_offsets, point_indices, origin, size = flatten_octree_internal(octree)
+        self._detach()
+        self._init_from_arrays(dict(max_depth=self.max_depth, origin=origin, size=size),
+                               dict(_children=children.reshape(-1, 8), _point_offsets=point_offsets.reshape(-1),
+                                    _point_indices=point_indices.reshape(-1)))
+
+    def _query(self, points):
+        from ._pcu_internal import query_octree_internal
+        leaf, depth, origin, size, child_index = query_octree_internal(points, self._children, self._origin[0],
+                                                                      self._origin[1], self._origin[2], self._size,
+                                                                      self.max_depth)
+        return leaf.reshape(-1), depth.reshape(-1), origin, size.reshape(-1), child_index.reshape(-1)
 
     def find(self, points):
+        """
+        Find the leaf node containing each point.
+
+        Parameters
+        ----------
+        points : n by 3 array of query points
+
+        Returns
+        -------
+        A pair (info, indices) of lists of length n. If a leaf contains points[i], then info[i] is a tuple
+        (origin, size, depth, child_index) describing the leaf and indices[i] is an array of the indices of the
+        points in the leaf. Otherwise info[i] is None and indices[i] is empty.
+        """
         points = self._check_shape(points)
-        from ._pcu_internal import get_octree_point_leaves_internal
-        return get_octree_point_leaves_internal(self.__internal_octree, points)
+        leaf, depth, origin, size, child_index = self._query(points)
+        info, indices = [], []
+        for i in range(points.shape[0]):
+            if leaf[i] < 0:
+                info.append(None)
+                indices.append(np.zeros(0, dtype=self._point_indices.dtype))
+            else:
+                info.append((origin[i], size[i], depth[i], child_index[i]))
+                start, end = self._point_offsets[leaf[i]], self._point_offsets[leaf[i] + 1]
+                indices.append(self._point_indices[start:end].copy())
+        return info, indices
 
     def point_depths(self, points):
         points = self._check_shape(points)
-        from ._pcu_internal import get_octree_point_depths_internal
-        return get_octree_point_depths_internal(self.__internal_octree, points)
+        return self._query(points)[1]
 
     @staticmethod
     def _check_shape(points):
@@ -0,0 +1,346 @@
+"""
+A minimal reader and writer for PLY files which reads vertex and face blocks directly into NumPy arrays.
+
+This only handles the common case of PLY files containing vertex positions and triangle faces, which covers most
+large point clouds and scans, and is much faster and uses much less memory than going through the general mesh
+loader. Binary files are memory-mapped so the only allocation is the output arrays. Files which need the general
+loader (e.g. polygon faces, non-float vertex positions, face indices which don't fit in an int32 or list properties
+before the vertex or face blocks) are detected from the header and data, in which case the readers here return
+None.
+"""
+import itertools
+import os
+
+import numpy as np
+
+
+_PLY_TYPES = {
+    'char': 'i1', 'int8': 'i1',
+    'uchar': 'u1', 'uint8': 'u1',
+    'short': 'i2', 'int16': 'i2',
+    'ushort': 'u2', 'uint16': 'u2',
+    'int': 'i4', 'int32': 'i4',
+    'uint': 'u4', 'uint32': 'u4',
+    'float': 'f4', 'float32': 'f4',
+    'double': 'f8', 'float64': 'f8',
+}
+
+_PLY_FORMATS = {
+    'ascii': None,
+    'binary_little_endian': '<',
+    'binary_big_endian': '>',
+}
+
+
+class _PlyElement:
+    def __init__(self, name, count):
+        self.name = name
+        self.count = count
+        self.properties = []  # (name, type) for scalars or (name, count_type, item_type) for lists
+
+    @property
+    def has_lists(self):
+        return any(len(p) == 3 for p in self.properties)
+
+    def triangle_dtype(self, byte_order):
+        """
+        The record dtype of this element assuming every list property has exactly 3 items
+        """
+        fields = []
+        for p in self.properties:
+            if len(p) == 3:
+                fields.append((p[0] + '__count', byte_order + _PLY_TYPES[p[1]]))
+                fields.append((p[0], byte_order + _PLY_TYPES[p[2]], (3,)))
+            else:
+                fields.append((p[0], byte_order + _PLY_TYPES[p[1]]))
+        return np.dtype(fields)
+
+
+def _read_ply_header(fh):
+    """
+    Read the header of a PLY file from the binary file handle fh, leaving fh at the start of the data.
+    Returns the format string and list of elements, or None if this is not a valid PLY header.
+    """
+    if fh.readline().strip() != b'ply':
+        return None
+
+    fmt = None
+    elements = []
+    while True:
+        line = fh.readline()
+        if not line:
+            return None
+        tokens = line.decode('ascii', errors='replace').split()
+        if len(tokens) == 0 or tokens[0] in ('comment', 'obj_info'):
+            continue
+        if tokens[0] == 'end_header':
+            break
+        if tokens[0] == 'format' and len(tokens) >= 2:
+            fmt = tokens[1]
+        elif tokens[0] == 'element' and len(tokens) == 3:
+            elements.append(_PlyElement(tokens[1], int(tokens[2])))
+        elif tokens[0] == 'property' and len(elements) > 0:
+            if tokens[1] == 'list' and len(tokens) == 5:
+                if tokens[2] not in _PLY_TYPES or tokens[3] not in _PLY_TYPES:
+                    return None
+                elements[-1].properties.append((tokens[4], tokens[2], tokens[3]))
+            elif len(tokens) == 3 and tokens[1] in _PLY_TYPES:
+                elements[-1].properties.append((tokens[2], tokens[1]))
+            else:
+                return None
+        else:
+            return None
+
+    if fmt not in _PLY_FORMATS:
+        return None
+    return fmt, elements
+
+
+def _face_list_property(element):
+    """
+    The name of the vertex index list of a face element, or None if the element isn't a plain list of integer vertex
+    indices which fit in an int32 (in which case the file needs the general loader)
+    """
+    lists = [p for p in element.properties if len(p) == 3]
+    if len(lists) != 1 or lists[0][0] not in ('vertex_indices', 'vertex_index'):
+        return None
+    name, count_type, index_type = lists[0]
+    if _PLY_TYPES[count_type][0] not in 'iu' or _PLY_TYPES[index_type][0] not in 'iu':
+        return None
+    return name
+
+
+def _has_float_positions(element):
+    """
+    Whether a vertex element has scalar float or double x, y and z properties
+    """
+    types = {p[0]: p[1] for p in element.properties if len(p) == 2}
+    return all(c in types and _PLY_TYPES[types[c]][0] == 'f' for c in ('x', 'y', 'z'))
+
+
+def _fits_int32(indices):
+    return indices.size == 0 or (indices.min() >= 0 and indices.max() <= np.iinfo(np.int32).max)
+
+
+def _read_binary_element(filename, element, byte_order, offset):
+    """
+    Memory-map an element of a binary PLY file at offset, assuming list properties have 3 items.
+    Returns the record array and the offset of the next element.
+    """
+    dtype = element.triangle_dtype(byte_order)
+    if element.count == 0:
+        return np.zeros([0], dtype=dtype), offset
+    records = np.memmap(filename, dtype=dtype, mode='r', offset=offset, shape=(element.count,))
+    return records, offset + element.count * dtype.itemsize
+
+
+def _read_ascii_element(fh, element):
+    """
+    Read the lines of an element of an ASCII PLY file, assuming list properties have 3 items.
+    Returns a [count, num_columns] float64 array or None if rows don't all have the same number of columns.
+    """
+    num_columns = sum(4 if len(p) == 3 else 1 for p in element.properties)
+    if element.count == 0:
+        return np.zeros([0, num_columns])
+    lines = list(itertools.islice(fh, element.count))
+    try:
+        data = np.loadtxt(lines, dtype=np.float64, ndmin=2)
+    except ValueError:
+        return None
+    if data.shape != (element.count, num_columns):
+        return None
+    return data
+
+
+def load_ply_vf(filename, dtype=np.float64, load_faces=True):
+    """
+    Load vertex positions and (optionally) triangle faces from a PLY file.
+
+    Parameters
+    ----------
+    filename : Path to the PLY file
+    dtype : The dtype of the returned vertex positions (default np.float64)
+    load_faces : If False, skip the face block and return None for the faces (default True)
+
+    Returns
+    -------
+    A [V, 3]-shaped array of vertex positions and a [F, 3]-shaped int32 array of faces (or None if load_faces is
+    False), or None if the file cannot be read by this loader and needs the general mesh loader.
+    """
+    with open(filename, 'rb') as fh:
+        header = _read_ply_header(fh)
+        if header is None:
+            return None
+        fmt, elements = header
+        byte_order = _PLY_FORMATS[fmt]
+        offset = fh.tell()
+
+        v, f = None, None
+        for element in elements:
+            if v is not None and (f is not None or not load_faces):
+                break
+
+            if element.name == 'vertex':
+                if element.has_lists or not _has_float_positions(element):
+                    return None
+            elif element.name == 'face':
+                if _face_list_property(element) is None:
+                    return None
+            elif element.has_lists and byte_order is not None:
+                return None  # We can't skip over variable sized binary elements without parsing them
+
+            if byte_order is not None:
+                records, offset = _read_binary_element(filename, element, byte_order, offset)
+                if element.name == 'vertex':
+                    v = np.empty([element.count, 3], dtype=dtype)
+                    for i, c in enumerate(('x', 'y', 'z')):
+                        v[:, i] = records[c]
+                elif element.name == 'face':
+                    face_prop = _face_list_property(element)
+                    if np.any(records[face_prop + '__count'] != 3) or not _fits_int32(records[face_prop]):
+                        return None
+                    f = np.ascontiguousarray(records[face_prop], dtype=np.int32)
+                del records
+            elif element.name not in ('vertex', 'face'):
+                for _ in itertools.islice(fh, element.count):
+                    pass
+            else:
+                data = _read_ascii_element(fh, element)
+                if data is None:
+                    return None
+                columns = {}
+                col = 0
+                for p in element.properties:
+                    columns[p[0]] = col
+                    col += 4 if len(p) == 3 else 1
+                if element.name == 'vertex':
+                    v = np.ascontiguousarray(data[:, [columns[c] for c in ('x', 'y', 'z')]], dtype=dtype)
+                else:
+                    col = columns[_face_list_property(element)]
+                    if np.any(data[:, col] != 3) or not _fits_int32(data[:, col + 1:col + 4]):
+                        return None
+                    f = np.ascontiguousarray(data[:, col + 1:col + 4], dtype=np.int32)
+
+        if v is None:
+            return None
+        if not load_faces:
+            return v, None
+        if f is None:
+            f = np.zeros([0, 3], dtype=np.int32)
+        return v, f
+
+
+_NUMPY_TO_PLY_TYPES = {
+    np.dtype('int8'): 'char', np.dtype('uint8'): 'uchar',
+    np.dtype('int16'): 'short', np.dtype('uint16'): 'ushort',
+    np.dtype('int32'): 'int', np.dtype('uint32'): 'uint',
+    np.dtype('float32'): 'float', np.dtype('float64'): 'double',
+}
+
+
+def _check_vertex_attribute(name, arr, num_vertices, num_cols):
+    if arr is None:
+        return None
+    arr = np.asarray(arr)
+    if arr.size == 0:
+        return None
+    if arr.ndim != 2 or arr.shape[0] != num_vertices or arr.shape[1] not in num_cols:
+        raise ValueError("Invalid shape for %s, must have shape [%d, %s] but got %s" %
+                         (name, num_vertices, " or ".join(str(c) for c in num_cols), str(arr.shape)))
+    return arr
+
+
+def save_ply(filename, v, f=None, vn=None, vc=None, chunk_size=1 << 20):
+    """
+    Save vertex positions, and optionally triangle faces, vertex normals and vertex colors to a binary little endian
+    PLY file.
+
+    The file is streamed to disk directly from the input arrays: Vertex positions are written without a copy if they
+    are the only vertex attribute and are C-contiguous and little endian, and everything else is written in chunks of
+    chunk_size elements so the extra memory used does not grow with the size of the mesh.
+
+    Parameters
+    ----------
+    filename : Path to the PLY file to write
+    v : A [V, 3]-shaped array of vertex positions (float32 or float64)
+    f : An optional [F, 3]-shaped integer array of triangle indices into v
+    vn : An optional [V, 3]-shaped array of vertex normals
+    vc : An optional [V, 3] or [V, 4]-shaped array of RGB(A) vertex colors, either as floats in [0, 1] or uint8
+    chunk_size : The number of vertices or faces to write at a time
+    """
+    v = np.asarray(v)
+    if v.ndim != 2 or v.shape[1] != 3:
+        raise ValueError("Invalid shape for v, must have shape [V, 3] but got %s" % str(v.shape))
+    vtype = np.float32 if v.dtype == np.float32 else np.float64
+    vn = _check_vertex_attribute("vn", vn, v.shape[0], (3,))
+    vc = _check_vertex_attribute("vc", vc, v.shape[0], (3, 4))
+
+    if f is not None:
+        f = np.asarray(f)
+        if f.size == 0:
+            f = None
+        elif f.ndim != 2 or f.shape[1] != 3:
+            raise ValueError("Invalid shape for f, must have shape [F, 3] but got %s" % str(f.shape))
+        elif f.min() < 0 or f.max() >= v.shape[0]:
+            raise ValueError("Invalid face index in f, all indices must be in [0, #v).")
+
+    # PLY has no 64 bit integer type, so write indices as int unless they only fit in a uint
+    face_index_type = np.dtype('int32')
+    if f is not None and f.max() > np.iinfo(np.int32).max:
+        if f.max() > np.iinfo(np.uint32).max:
+            raise ValueError("Invalid face index in f, PLY files can only hold indices up to %d but got %d" %
+                             (np.iinfo(np.uint32).max, f.max()))
+        face_index_type = np.dtype('uint32')
+
+    vertex_fields = [(c, vtype) for c in ('x', 'y', 'z')]
+    if vn is not None:
+        vertex_fields += [(c, vtype) for c in ('nx', 'ny', 'nz')]
+    if vc is not None:
+        vertex_fields += [(c, np.uint8) for c in ('red', 'green', 'blue', 'alpha')]
+    vertex_dtype = np.dtype([(name, np.dtype(t).newbyteorder('<')) for name, t in vertex_fields])
+
+    header = ["ply", "format binary_little_endian 1.0", "element vertex %d" % v.shape[0]]
+    header += ["property %s %s" % (_NUMPY_TO_PLY_TYPES[np.dtype(t)], name) for name, t in vertex_fields]
+    if f is not None:
+        header += ["element face %d" % f.shape[0],
+                   "property list uchar %s vertex_indices" % _NUMPY_TO_PLY_TYPES[face_index_type]]
+    header += ["end_header"]
+
+    face_dtype = np.dtype([('count', 'u1'), ('vertex_indices', face_index_type.newbyteorder('<'), (3,))])
+    with open(filename, 'wb') as fh:
+        fh.write(("\n".join(header) + "\n").encode('ascii'))
+
+        if vn is None and vc is None and v.flags.c_contiguous and v.dtype == np.dtype(vtype).newbyteorder('<'):
+            v.tofile(fh)
+        else:
+            buf = np.empty([min(chunk_size, v.shape[0])], dtype=vertex_dtype)
+            if vc is not None:
+                buf['alpha'] = 255
+            for start in range(0, v.shape[0], chunk_size):
+                end = min(start + chunk_size, v.shape[0])
+                chunk = buf[:end - start]
+                for i, c in enumerate(('x', 'y', 'z')):
+                    chunk[c] = v[start:end, i]
+                if vn is not None:
+                    for i, c in enumerate(('nx', 'ny', 'nz')):
+                        chunk[c] = vn[start:end, i]
+                if vc is not None:
+                    for i, c in enumerate(('red', 'green', 'blue', 'alpha')[:vc.shape[1]]):
+                        if vc.dtype == np.uint8:
+                            chunk[c] = vc[start:end, i]
+                        else:
+                            # Match the truncation the general mesh writer uses
+                            chunk[c] = np.clip(vc[start:end, i] * 255.0, 0.0, 255.0)
+                chunk.tofile(fh)
+
+        if f is not None:
+            buf = np.empty([min(chunk_size, f.shape[0])], dtype=face_dtype)
+            buf['count'] = 3
+            for start in range(0, f.shape[0], chunk_size):
+                end = min(start + chunk_size, f.shape[0])
+                buf['vertex_indices'][:end - start] = f[start:end]
+                buf[:end - start].tofile(fh)
+
+
+def is_ply_file(filename):
+    return os.path.splitext(filename)[1].lower() == '.ply'
@@ -0,0 +1,151 @@
+import atexit
+import json
+import os
+import sys
+import threading
+
+
+# The native extension modules. Each one keeps its own profiling flag and records, so profiling is enabled and records
+# are collected in every one of these which is loaded. Modules loaded while profiling is enabled pick up the setting
+# from is_profiling_enabled() when they are initialized.
+_NATIVE_MODULES = ('point_cloud_utils._pcu_distance', 'point_cloud_utils._pcu_sampling', 'point_cloud_utils._pcu_io',
+                   'point_cloud_utils._pcu_voronoi', 'point_cloud_utils._pcu_morton', 'point_cloud_utils._pcu_internal')
+
+_lock = threading.RLock()
+_active_profiles = []
+_next_call_id = 0
+
+
+def is_profiling_enabled():
+    """
+    Return True if native kernels are currently recording profiles (i.e. inside a pcu.profile() block or when the
+    PCU_PROFILE environment variable is set).
+    """
+    return len(_active_profiles) > 0
+
+
+def _loaded_native_modules():
+    return [sys.modules[name] for name in _NATIVE_MODULES if name in sys.modules]
+
+
+def _collect_records():
+    """
+    Move the records of every loaded native module to the active profiles. Call ids are only unique within a module
+    so they are renumbered to be unique within the process.
+    """
+    global _next_call_id
+    with _lock:
+        records = []
+        for module in _loaded_native_modules():
+            call_ids = {}
+            for record in module.take_profile_records_internal():
+                if record['call_id'] not in call_ids:
+                    call_ids[record['call_id']] = _next_call_id
+                    _next_call_id += 1
+                record['call_id'] = call_ids[record['call_id']]
+                record['module'] = module.__name__.split('.')[-1]
+                records.append(record)
+        records.sort(key=lambda r: r['call_id'])
+        for p in _active_profiles:
+            p.records.extend(records)
+
+
+class profile:
+    """
+    A context manager which records the time native kernels spend in each phase of their work (e.g. copying inputs,
+    building a spatial index, querying it, and copying outputs) along with the number of bytes copied or allocated
+    and the number of threads available to them. The profile object is the report.
+
+    Profiling applies to the whole process: calls made from every thread while the block is running are recorded.
+    Profiles can be nested in which case each one receives the records made while it was active. When no profile is
+    active, kernels only check a flag so the overhead of the instrumentation is negligible.
+
+    Setting the environment variable PCU_PROFILE profiles the whole program. With PCU_PROFILE=1 a summary is printed
+    to stderr when the program exits and with PCU_PROFILE=<path> the report is written to path as JSON.
+
+    Example
+    -------
+    with pcu.profile() as p:
+        dists, corrs = pcu.k_nearest_neighbors(x, y, k=4)
+    print(p)  # A table with the total time spent in each phase of each kernel
+    metrics = p.summary()  # The same information as a list of dicts
+    """
+    def __init__(self):
+        self.records = []
+
+    def __enter__(self):
+        with _lock:
+            if len(_active_profiles) == 0:
+                # Discard anything recorded by a previous profile which was never collected
+                for module in _loaded_native_modules():
+                    module.take_profile_records_internal()
+            else:
+                _collect_records()
+            _active_profiles.append(self)
+            for module in _loaded_native_modules():
+                module.set_profiling_enabled_internal(True)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        with _lock:
+            _collect_records()
+            _active_profiles.remove(self)
+            if len(_active_profiles) == 0:
+                for module in _loaded_native_modules():
+                    module.set_profiling_enabled_internal(False)
+        return False
+
+    def summary(self):
+        """
+        Aggregate the records of this profile by kernel and phase.
+
+        Returns
+        -------
+        A list of dicts with keys 'kernel', 'phase', 'calls', 'seconds', 'bytes' and 'max_threads' representing,
+        for each phase of each kernel (in the order they were first recorded), the number of calls, the total time
+        in seconds and bytes copied or allocated, and the largest number of threads available to a call.
+        """
+        summary = {}
+        for record in self.records:
+            key = (record['kernel'], record['phase'])
+            if key not in summary:
+                summary[key] = dict(kernel=record['kernel'], phase=record['phase'], calls=0, seconds=0.0, bytes=0,
+                                    max_threads=0)
+            entry = summary[key]
+            entry['calls'] += 1
+            entry['seconds'] += record['seconds']
+            entry['bytes'] += record['bytes']
+            entry['max_threads'] = max(entry['max_threads'], record['num_threads'])
+        return list(summary.values())
+
+    def to_json(self):
+        """
+        Return a JSON string with the raw records of this profile (under 'records') and their summary (under
+        'summary'). Each record is a dict with keys 'call_id', 'module', 'kernel', 'phase', 'seconds', 'bytes' and
+        'num_threads'. Phases of the same kernel call share a call_id.
+        """
+        return json.dumps(dict(records=self.records, summary=self.summary()))
+
+    def __str__(self):
+        header = ("kernel", "phase", "calls", "seconds", "MB", "threads")
+        rows = [(s['kernel'], s['phase'], str(s['calls']), "%.6f" % s['seconds'], "%.3f" % (s['bytes'] / 2 ** 20),
+                 str(s['max_threads'])) for s in self.summary()]
+        widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+        lines = ["  ".join(c.ljust(w) if i < 2 else c.rjust(w) for i, (c, w) in enumerate(zip(row, widths)))
+                 for row in [header] + rows]
+        lines.insert(1, "-" * len(lines[0]))
+        return "\n".join(lines)
+
+
+def _report_process_profile(process_profile, destination):
+    process_profile.__exit__(None, None, None)
+    if destination == "1":
+        sys.stderr.write("point_cloud_utils profile:\n" + str(process_profile) + "\n")
+    else:
+        with open(destination, "w") as f:
+            f.write(process_profile.to_json())
+
+
+if os.environ.get("PCU_PROFILE", "") not in ("", "0"):
+    _process_profile = profile().__enter__()
+    atexit.register(_report_process_profile, _process_profile, os.environ["PCU_PROFILE"])
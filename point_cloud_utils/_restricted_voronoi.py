@@ -0,0 +1,85 @@
+import numpy as np
+
+
+class RestrictedVoronoi:
+    """
+    A Voronoi diagram restricted to a fixed domain which can be queried repeatedly for different centers.
+
+    The domain is either the unit cube [0, 1]^3 (the default), a triangle mesh (v, f), or a tet mesh (v, t). It is set
+    up once when the object is constructed so each query only needs to rebuild the Delaunay triangulation of the
+    centers. This makes it suitable for use inside optimization loops which move the centers a little at each step.
+    """
+    def __init__(self, v=None, f=None, t=None):
+        """
+        Create a restricted Voronoi diagram on a domain.
+
+        Parameters
+        ----------
+        v : An optional #v by 3 array of domain vertex positions. If None, the domain is the unit cube [0, 1]^3.
+        f : A #f by 3 array of triangle indices into v. Required for triangle mesh domains and optional (boundary
+            faces) for tet mesh domains.
+        t : An optional #t by 4 array of tet indices into v. If set, the domain is the volume of this tet mesh.
+        """
+        from ._pcu_voronoi import RestrictedVoronoi as _RestrictedVoronoi, restricted_voronoi_set_domain_internal
+
+        if v is None:
+            if f is not None or t is not None:
+                raise ValueError("Cannot pass f or t without passing v.")
+            v = np.zeros([0, 3], dtype=np.float64)
+            f = np.zeros([0, 3], dtype=np.int32)
+            t = np.zeros([0, 4], dtype=np.int32)
+        elif t is None:
+            if f is None:
+                raise ValueError("Must pass faces f (for a surface domain) or tets t (for a volume domain) with v.")
+            t = np.zeros([0, 4], dtype=f.dtype)
+        elif f is None:
+            f = np.zeros([0, 3], dtype=t.dtype)
+
+        self.__internal_rv = _RestrictedVoronoi()
+        restricted_voronoi_set_domain_internal(self.__internal_rv, v, f, t.astype(f.dtype, copy=False))
+
+    @property
+    def is_volumetric(self):
+        return self.__internal_rv.is_volumetric()
+
+    def centroids(self, centers, return_masses=False):
+        """
+        Compute the centroids of the restricted Voronoi cells of a set of centers.
+
+        Parameters
+        ----------
+        centers : A (n, 3) array of Voronoi centers (n >= 4)
+        return_masses : If True, also return the volume (or area for surface domains) of each cell.
+
+        Returns
+        -------
+        A (n, 3) array where row i is the centroid of the cell of centers[i]. Centers with an empty cell are
+        returned unchanged.
+        If return_masses is set, a (n,) shaped array of cell volumes (or areas)
+        """
+        from ._pcu_voronoi import restricted_voronoi_centroids_internal
+        ctrs, masses = restricted_voronoi_centroids_internal(self.__internal_rv, centers)
+        if return_masses:
+            return ctrs, masses.ravel()
+        return ctrs
+
+    def cvt_energy(self, centers, return_gradient=False):
+        """
+        Compute the centroidal Voronoi tesselation (CVT) energy of a set of centers, i.e. the sum over cells of the
+        integrated squared distance to the cell's center.
+
+        Parameters
+        ----------
+        centers : A (n, 3) array of Voronoi centers (n >= 4)
+        return_gradient : If True, also return the gradient of the energy with respect to the centers.
+
+        Returns
+        -------
+        The CVT energy
+        If return_gradient is set, a (n, 3) array of the gradient of the energy with respect to each center
+        """
+        from ._pcu_voronoi import restricted_voronoi_energy_internal
+        energy, grad = restricted_voronoi_energy_internal(self.__internal_rv, centers)
+        if return_gradient:
+            return energy, grad
+        return energy
@@ -1,60 +1,73 @@
 #include <npe.h>
 
-#include <igl/point_mesh_squared_distance.h>
-#include <igl/barycentric_coordinates.h>
+#include <igl/AABB.h>
+
+#include <cstdint>
+#include <limits>
 
 #include "common.h"
+#include "triangle_utils.h"
 
 
-const char* closest_points_on_mesh_doc = R"Qu8mg5v7(
-Compute distances from a set of points p to a triangle mesh (v, f)
-
-Parameters
-----------
-p : (#p, 3)-shaped array of query point positions
-v : (#v, 3)-shaped array of mesh vertex positions
-f : (#f, 3)-shaped array of triangle face indices
-
-Returns
--------
-A tuple (d, f_idx, bc) where:
- - d is a (#p,)-shaped array of shortest distances for each query point p
- - f_idx is a (#p,)-shaped array of indices into f of the face containing the closest
-   point to eaach query point
- - bc is a (#p, 3)-shaped array of barycentric coordinates for each query point
-
-Notes
------
-Known bugs: This only computes distances to given primitives. So
-unreferenced vertices are ignored. However, degenerate primitives are
-handled correctly: triangle [1 2 2] is treated as a segment [1 2], and
-triangle [1 1 1] is treated as a point. So one _could_ add extra
-combinatorially degenerate rows to Ele for all unreferenced vertices to
-also get distances to points.
+const char* closest_points_on_mesh_internal_doc = R"Qu8mg5v7(
+See closest_points_on_mesh
 )Qu8mg5v7";
-npe_function(closest_points_on_mesh)
+npe_function(closest_points_on_mesh_internal)
 npe_arg(p, dense_float, dense_double)
 npe_arg(v, npe_matches(p))
-npe_arg(f, dense_int, dense_longlong, dense_uint, dense_ulonglong)
-npe_doc(closest_points_on_mesh_doc)
+npe_arg(f, dense_int, dense_long, dense_longlong, dense_uint, dense_ulong, dense_ulonglong)
+npe_arg(return_points, bool)
+npe_doc(closest_points_on_mesh_internal_doc)
 npe_begin_code()
 {
+    typedef npe_Scalar_p Scalar;
+    typedef Eigen::Matrix<Scalar, 1, 3> RowVector3;
+
     validate_point_cloud(p);
     validate_mesh(v, f);
+    // The AABB tree stores face indices as ints, vertex indices can be 64 bit
+    if (f.rows() >= std::numeric_limits<int>::max()) {
+        throw pybind11::value_error("Invalid mesh, the number of faces must be less than " +
+                                    std::to_string(std::numeric_limits<int>::max()) + ".");
+    }
+    for (std::ptrdiff_t i = 0; i < f.rows(); i += 1) {
+        for (int j = 0; j < 3; j += 1) {
+            if (std::int64_t(f(i, j)) < 0 || std::int64_t(f(i, j)) >= std::int64_t(v.rows())) {
+                throw pybind11::value_error("Invalid face index in f, all indices must be in [0, #v).");
+            }
+        }
+    }
+
+    Eigen::Matrix<Scalar, Eigen::Dynamic, 1> dists(p.rows());
+    Eigen::Matrix<npe_Scalar_f, Eigen::Dynamic, 1> face_idxs(p.rows());
+    Eigen::Matrix<Scalar, Eigen::Dynamic, 3, Eigen::RowMajor> barycentric_coords(p.rows(), 3);
+    Eigen::Matrix<Scalar, Eigen::Dynamic, 3, Eigen::RowMajor> closest_points(return_points ? p.rows() : 0, 3);
+    {
+        pybind11::gil_scoped_release release;
+
+        // Build the tree directly on the input arrays so we don't copy or narrow the mesh
+        igl::AABB<typename std::decay<decltype(v)>::type, 3> tree;
+        tree.init(v, f);
 
-    npe_Matrix_p sqr_dists, closest_points, barycentric_coords;
-    npe_Matrix_f face_idxs;
-    igl::point_mesh_squared_distance(p, v, f, sqr_dists, face_idxs, closest_points);
+        // Distance, face index, barycentric coordinates and closest point are all computed in one pass per query
+        #pragma omp parallel for
+        for (std::ptrdiff_t i = 0; i < p.rows(); i += 1) {
+            const RowVector3 q = p.row(i);
+            RowVector3 c;
+            int fi = -1;
+            const Scalar sqr_dist = tree.squared_distance(v, f, q, fi, c);
 
-    npe_Matrix_p v_a(p.rows(), 3), v_b(p.rows(), 3), v_c(p.rows(), 3);
-    for (int i = 0; i < face_idxs.rows(); i++) {
-        v_a.row(i) = v.row(f(face_idxs(i), 0));
-        v_b.row(i) = v.row(f(face_idxs(i), 1));
-        v_c.row(i) = v.row(f(face_idxs(i), 2));
-        sqr_dists(i) = sqrt(sqr_dists(i));
+            dists(i) = std::sqrt(sqr_dist);
+            face_idxs(i) = npe_Scalar_f(fi);
+            barycentric_coords.row(i) = triangle_barycentric_coordinates<Scalar>(
+                    c, v.row(f(fi, 0)), v.row(f(fi, 1)), v.row(f(fi, 2)));
+            if (return_points) {
+                closest_points.row(i) = c;
+            }
+        }
     }
-    igl::barycentric_coordinates(closest_points, v_a, v_b, v_c, barycentric_coords);
 
-    return std::make_tuple(npe::move(sqr_dists), npe::move(face_idxs), npe::move(barycentric_coords));
+    return std::make_tuple(npe::move(dists), npe::move(face_idxs), npe::move(barycentric_coords),
+                           npe::move(closest_points));
 }
 npe_end_code()
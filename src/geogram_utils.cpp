@@ -1,5 +1,8 @@
 #include "geogram_utils.h"
 
+#include <chrono>
+#include <cstdlib>
+
 
 // Put geogram log messages in the trash where they belong
 class GeoTrashCan: public GEO::LoggerClient {
@@ -18,6 +21,9 @@ protected:
 bool geogram_is_initialized = false;
 std::mutex geogram_init_mutex;
 
+// Serializes GeogramThreadLimit since geogram's thread limit is process-wide
+std::mutex geogram_thread_limit_mutex;
+
 // Initialize geogram exactly once.
 void init_geogram_only_once() {
   std::lock_guard<std::mutex> guard(geogram_init_mutex);
@@ -37,3 +43,16 @@ void init_geogram_only_once() {
     geogram_is_initialized = true;
   }
 }
+
+// Geogram draws its random numbers from the C library generators
+void seed_geogram_random(unsigned int seed) {
+  if (seed == 0) {
+    seed = (unsigned int) std::chrono::high_resolution_clock::now().time_since_epoch().count();
+  }
+#ifdef GEO_OS_WINDOWS
+  srand(seed);
+#else
+  srandom(seed);
+  srand48(long(seed));
+#endif
+}
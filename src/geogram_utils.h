@@ -5,9 +5,14 @@
 #include <geogram/basic/command_line_args.h>
 #include <geogram/voronoi/CVT.h>
 #include <geogram/voronoi/RVD.h>
+#include <geogram/basic/process.h>
 
 #include <mutex>
 
+#include <pybind11/pybind11.h>
+
+#include "parallel_utils.h"
+
 #ifndef GEOGRAM_UTILS_H
 #define GEOGRAM_UTILS_H
 
@@ -19,6 +24,49 @@ extern std::mutex geogram_init_mutex;
  */
 void init_geogram_only_once();
 
+/*
+ * Seed the global random number generator geogram uses (e.g. for CVT initial sampling).
+ * A seed of 0 seeds the generator from the current time (like the other samplers in this library).
+ */
+void seed_geogram_random(unsigned int seed);
+
+/*
+ * Limit the number of threads geogram uses for the lifetime of this object.
+ * A non-positive num_threads uses the thread limit of the calling thread (see max_num_threads) so geogram
+ * respects the same setting as the rest of the library.
+ *
+ * Geogram's thread limit is process-wide, so only one GeogramThreadLimit can exist at a time and constructing another
+ * one (from a different thread) waits until the current one is destroyed. This keeps the limit of each caller in
+ * place for the whole computation and restores limits in order. The GIL is released while waiting so the current
+ * holder can reacquire it.
+ */
+extern std::mutex geogram_thread_limit_mutex;
+
+class GeogramThreadLimit {
+    std::unique_lock<std::mutex> lock;
+    GEO::index_t prev_max_threads;
+public:
+    explicit GeogramThreadLimit(int num_threads = -1) : lock(geogram_thread_limit_mutex, std::defer_lock) {
+        const GEO::index_t max_threads = GEO::index_t(num_threads > 0 ? num_threads : max_num_threads());
+        if (PyGILState_Check()) {
+            pybind11::gil_scoped_release release;
+            lock.lock();
+        } else {
+            lock.lock();
+        }
+        prev_max_threads = GEO::Process::max_threads();
+        if (max_threads != prev_max_threads) {
+            GEO::Process::set_max_threads(max_threads);
+        }
+    }
+
+    ~GeogramThreadLimit() {
+        if (GEO::Process::max_threads() != prev_max_threads) {
+            GEO::Process::set_max_threads(prev_max_threads);
+        }
+    }
+};
+
 /*
  * Convert a (V, F) pair to a geogram mesh
  */
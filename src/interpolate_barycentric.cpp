@@ -0,0 +1,113 @@
+#include <npe.h>
+#include <pybind11/stl.h>
+
+#include <vector>
+#include <string>
+
+#include "common.h"
+
+
+npe_function(interpolate_barycentric_internal)
+npe_arg(v_attrs, std::vector<pybind11::array>)
+npe_arg(f, dense_int, dense_longlong, dense_uint, dense_ulonglong)
+npe_arg(fi, dense_long, dense_longlong)
+npe_arg(bc, dense_float, dense_double)
+npe_begin_code()
+{
+    typedef npe_Scalar_bc Scalar;
+
+    if (f.cols() != 3) {
+        throw pybind11::value_error("Invalid shape for f, must have shape (#f, 3) but got (" +
+                                    std::to_string(f.rows()) + ", " + std::to_string(f.cols()) + ").");
+    }
+    if (fi.cols() != 1) {
+        throw pybind11::value_error("Invalid shape for fi, must have shape (#p,) but got (" +
+                                    std::to_string(fi.rows()) + ", " + std::to_string(fi.cols()) + ").");
+    }
+    if (bc.cols() != 3 || bc.rows() != fi.rows()) {
+        throw pybind11::value_error("Invalid shape for bc, must have shape (#p, 3) where fi has shape (#p,). Got "
+                                    "bc.shape = (" + std::to_string(bc.rows()) + ", " + std::to_string(bc.cols()) +
+                                    "), fi.shape = (" + std::to_string(fi.rows()) + ",).");
+    }
+
+    const std::ptrdiff_t num_samples = fi.rows();
+    const std::ptrdiff_t num_faces = f.rows();
+    const std::size_t num_attrs = v_attrs.size();
+
+    // Validate every attribute array and allocate its output before touching any data
+    std::vector<const Scalar*> attr_ptrs(num_attrs);
+    std::vector<Scalar*> out_ptrs(num_attrs);
+    std::vector<std::ptrdiff_t> attr_dims(num_attrs);
+    std::vector<pybind11::array> ret;
+    ret.reserve(num_attrs);
+    for (std::size_t k = 0; k < num_attrs; k += 1) {
+        pybind11::array& attr = v_attrs[k];
+        if (!attr.dtype().equal(pybind11::dtype::of<Scalar>())) {
+            throw pybind11::value_error("Invalid dtype for attribute " + std::to_string(k) +
+                                        ", must have the same dtype as bc.");
+        }
+        if (!(attr.flags() & pybind11::array::c_style)) {
+            throw pybind11::value_error("Invalid attribute " + std::to_string(k) + ", must be C-contiguous.");
+        }
+        if (attr.ndim() != 1 && attr.ndim() != 2) {
+            throw pybind11::value_error("Invalid attribute " + std::to_string(k) + ", must have shape (#v,) or "
+                                        "(#v, d) but got " + std::to_string(attr.ndim()) + " dimensions.");
+        }
+        if (attr.shape(0) != v_attrs[0].shape(0)) {
+            throw pybind11::value_error("Invalid attribute " + std::to_string(k) + ", all attributes must have "
+                                        "the same number of rows (one per vertex).");
+        }
+
+        attr_dims[k] = attr.ndim() == 1 ? 1 : attr.shape(1);
+        attr_ptrs[k] = static_cast<const Scalar*>(attr.data());
+        if (attr.ndim() == 1) {
+            ret.push_back(pybind11::array_t<Scalar>({num_samples}));
+        } else {
+            ret.push_back(pybind11::array_t<Scalar>({num_samples, attr_dims[k]}));
+        }
+        out_ptrs[k] = static_cast<Scalar*>(ret.back().mutable_data());
+    }
+    const std::ptrdiff_t num_vertices = num_attrs > 0 ? v_attrs[0].shape(0) : 0;
+
+    bool invalid_face_index = false;
+    bool invalid_vertex_index = false;
+    {
+        pybind11::gil_scoped_release release;
+
+        #pragma omp parallel for reduction(||: invalid_face_index, invalid_vertex_index)
+        for (std::ptrdiff_t i = 0; i < num_samples; i += 1) {
+            const std::ptrdiff_t fidx = fi(i, 0);
+            if (fidx < 0 || fidx >= num_faces) {
+                invalid_face_index = true;
+                continue;
+            }
+            const std::ptrdiff_t i0 = f(fidx, 0), i1 = f(fidx, 1), i2 = f(fidx, 2);
+            if (i0 < 0 || i1 < 0 || i2 < 0 || i0 >= num_vertices || i1 >= num_vertices || i2 >= num_vertices) {
+                invalid_vertex_index = num_attrs > 0;
+                continue;
+            }
+            const Scalar b0 = bc(i, 0), b1 = bc(i, 1), b2 = bc(i, 2);
+
+            for (std::size_t k = 0; k < num_attrs; k += 1) {
+                const std::ptrdiff_t d = attr_dims[k];
+                const Scalar* a0 = attr_ptrs[k] + i0 * d;
+                const Scalar* a1 = attr_ptrs[k] + i1 * d;
+                const Scalar* a2 = attr_ptrs[k] + i2 * d;
+                Scalar* out = out_ptrs[k] + i * d;
+                for (std::ptrdiff_t j = 0; j < d; j += 1) {
+                    out[j] = b0 * a0[j] + b1 * a1[j] + b2 * a2[j];
+                }
+            }
+        }
+    }
+
+    if (invalid_face_index) {
+        throw pybind11::value_error("Invalid face index in fi, all indices must be in [0, #f).");
+    }
+    if (invalid_vertex_index) {
+        throw pybind11::value_error("Invalid vertex index in f, all indices must be in [0, #v).");
+    }
+
+    return ret;
+}
+npe_end_code()
@@ -0,0 +1,242 @@
+#include <npe.h>
+
+#include <algorithm>
+#include <cstdint>
+#include <map>
+#include <numeric>
+#include <type_traits>
+#include <utility>
+#include <vector>
+
+#include "common.h"
+#include "kd_tree.h"
+#include "profiling.h"
+
+
+namespace {
+
+/*
+ * Nodes are split at the median index along the axis of largest extent, so the shape of the tree only depends on the
+ * number of points and the leaf size. This lets us compute where every node goes up front and build subtrees in
+ * parallel.
+ */
+class KDTreeLayout {
+    std::int64_t max_points_per_leaf;
+    std::map<std::int64_t, std::int64_t> subtree_sizes;
+
+public:
+    KDTreeLayout(std::int64_t num_points, std::int64_t max_leaf_size) : max_points_per_leaf(max_leaf_size) {
+        num_nodes(num_points);
+    }
+
+    bool is_leaf(std::int64_t num_points) const {
+        return num_points <= max_points_per_leaf;
+    }
+
+    // The number of nodes in a subtree over num_points points. Results are cached and there are at most two distinct
+    // subtree sizes at each depth so this is cheap.
+    std::int64_t num_nodes(std::int64_t num_points) {
+        auto it = subtree_sizes.find(num_points);
+        if (it != subtree_sizes.end()) {
+            return it->second;
+        }
+        std::int64_t ret = 1;
+        if (!is_leaf(num_points)) {
+            ret += num_nodes(num_points / 2) + num_nodes(num_points - num_points / 2);
+        }
+        subtree_sizes[num_points] = ret;
+        return ret;
+    }
+
+    // Read only lookup which is safe to call from several threads once the layout of the whole tree is computed
+    std::int64_t cached_num_nodes(std::int64_t num_points) const {
+        return subtree_sizes.at(num_points);
+    }
+};
+
+
+template <typename DerivedP, typename Scalar>
+void build_kd_tree_node(const DerivedP& points, const KDTreeLayout& layout, std::int64_t node,
+                        std::int64_t begin, std::int64_t end, Eigen::Matrix<Scalar, 1, 3> min_bound,
+                        Eigen::Matrix<Scalar, 1, 3> max_bound, std::vector<std::int64_t>& perm,
+                        EigenDenseI64& nodes, Eigen::Matrix<Scalar, Eigen::Dynamic, 1>& splits) {
+    nodes(node, NodeBegin) = begin;
+    nodes(node, NodeEnd) = end;
+    nodes(node, NodeRightChild) = -1;
+    nodes(node, NodeSplitDim) = -1;
+    splits[node] = Scalar(0);
+    if (layout.is_leaf(end - begin)) {
+        return;
+    }
+
+    // The bounds are those of the parent clipped to the split, which is a good enough estimate of the extent of the
+    // points to pick the split axis and saves a pass over the points at every node
+    int split_dim = 0;
+    (max_bound - min_bound).maxCoeff(&split_dim);
+
+    const std::int64_t mid = begin + (end - begin) / 2;
+    std::nth_element(perm.begin() + begin, perm.begin() + mid, perm.begin() + end,
+                     [&](std::int64_t a, std::int64_t b) { return points(a, split_dim) < points(b, split_dim); });
+
+    const std::int64_t right_child = node + 1 + layout.cached_num_nodes(mid - begin);
+    const Scalar split = points(perm[mid], split_dim);
+    nodes(node, NodeRightChild) = right_child;
+    nodes(node, NodeSplitDim) = split_dim;
+    splits[node] = split;
+
+    Eigen::Matrix<Scalar, 1, 3> left_max_bound = max_bound, right_min_bound = min_bound;
+    left_max_bound[split_dim] = split;
+    right_min_bound[split_dim] = split;
+
+    // The two halves are disjoint ranges of perm and nodes, so large subtrees are built in parallel
+    #pragma omp task default(shared) if(end - begin > 65536)
+    build_kd_tree_node(points, layout, node + 1, begin, mid, min_bound, left_max_bound, perm, nodes, splits);
+    build_kd_tree_node(points, layout, right_child, mid, end, right_min_bound, max_bound, perm, nodes, splits);
+    #pragma omp taskwait
+}
+
+
+} // namespace
+
+
+
+const char* build_kd_tree_internal_doc = R"Qu8mg5v7(
+Build a KD tree over a point cloud stored in flat arrays (see KDTree).
+
+Parameters
+----------
+points : #n x 3 array of reference points
+max_points_per_leaf : The maximum number of points in each leaf node of the tree
+
+Returns
+-------
+A tuple (tree_points, indices, nodes, splits) of the arrays which make up the tree where tree_points has the same
+dtype as points, indices and nodes are int64 and splits has the same dtype as points.
+)Qu8mg5v7";
+npe_function(build_kd_tree_internal)
+npe_arg(points, dense_float, dense_double)
+npe_arg(max_points_per_leaf, int)
+npe_doc(build_kd_tree_internal_doc)
+npe_begin_code()
+{
+    validate_point_cloud(points, false /* allow_0 */);
+    if (max_points_per_leaf <= 0) {
+        throw pybind11::value_error("Invalid max_points_per_leaf (" + std::to_string(max_points_per_leaf) +
+                                    ") must be greater than 0.");
+    }
+
+    KernelProfiler profiler("build_kd_tree");
+    const std::int64_t num_points = points.rows();
+    KDTreeLayout layout(num_points, max_points_per_leaf);
+    const std::int64_t num_nodes = layout.num_nodes(num_points);
+
+    profiler.phase("build_index", num_points * sizeof(std::int64_t) +
+                                  num_nodes * (4 * sizeof(std::int64_t) + sizeof(npe_Scalar_points)));
+    EigenDenseLike<npe_Matrix_points> tree_points(num_points, 3);
+    EigenDenseI64 indices(num_points, 1);
+    EigenDenseI64 nodes(num_nodes, 4);
+    Eigen::Matrix<npe_Scalar_points, Eigen::Dynamic, 1> splits(num_nodes);
+    {
+        pybind11::gil_scoped_release release;
+
+        std::vector<std::int64_t> perm(num_points);
+        std::iota(perm.begin(), perm.end(), 0);
+        const Eigen::Matrix<npe_Scalar_points, 1, 3> min_bound = points.colwise().minCoeff();
+        const Eigen::Matrix<npe_Scalar_points, 1, 3> max_bound = points.colwise().maxCoeff();
+        #pragma omp parallel
+        #pragma omp single
+        build_kd_tree_node(points, layout, 0, 0, num_points, min_bound, max_bound, perm, nodes, splits);
+
+        profiler.phase("copy_outputs", num_points * 3 * sizeof(npe_Scalar_points));
+        #pragma omp parallel for
+        for (std::int64_t i = 0; i < num_points; i += 1) {
+            tree_points.row(i) = points.row(perm[i]);
+            indices(i, 0) = perm[i];
+        }
+    }
+
+    return std::make_tuple(npe::move(tree_points), npe::move(indices), npe::move(nodes), npe::move(splits));
+}
+npe_end_code()
+
+
+
+const char* query_kd_tree_internal_doc = R"Qu8mg5v7(
+Find the k nearest neighbors of each query point in a KD tree built by build_kd_tree_internal.
+
+Parameters
+----------
+queries : #q x 3 array of query points
+tree_points : The tree_points array of the tree
+indices : The indices array of the tree
+nodes : The nodes array of the tree
+splits : The splits array of the tree
+k : The number of nearest neighbors to find per query point
+squared_distances : If set to True, then return squared L2 distances
+
+Returns
+-------
+A pair `(dists, corrs)` with the same meaning as the return values of k_nearest_neighbors
+)Qu8mg5v7";
+npe_function(query_kd_tree_internal)
+npe_arg(queries, dense_float, dense_double)
+npe_arg(tree_points, npe_matches(queries))
+npe_arg(indices, dense_long, dense_longlong)
+npe_arg(nodes, npe_matches(indices))
+npe_arg(splits, npe_matches(queries))
+npe_arg(k, int)
+npe_default_arg(squared_distances, bool, false)
+npe_doc(query_kd_tree_internal_doc)
+npe_begin_code()
+{
+    validate_point_cloud(queries);
+    validate_kd_tree(tree_points, indices, nodes, splits);
+    if (k <= 0) {
+        throw pybind11::value_error("Invalid value for k (" + std::to_string(k) + ") must be greater than 0.");
+    }
+
+    typedef npe_Scalar_queries Scalar;
+    using IndexType = typename npe_Matrix_queries::Index;
+    KernelProfiler profiler("query_kd_tree");
+    profiler.phase("allocate_outputs", std::int64_t(queries.rows()) * k * (sizeof(Scalar) + sizeof(IndexType)));
+    EigenDenseLike<npe_Matrix_queries> dists(queries.rows(), k);
+    Eigen::Matrix<IndexType, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor> corrs(queries.rows(), k);
+
+    profiler.phase("query");
+    {
+        pybind11::gil_scoped_release release;
+
+        #pragma omp parallel
+        {
+            std::vector<Scalar> best_dists(k);
+            std::vector<std::int64_t> best_idxs(k);
+            std::vector<std::pair<std::int64_t, Scalar>> stack;
+            // Instantiate with the types of the arguments (maps of the numpy arrays) so the search reads the tree in
+            // place instead of binding its references to temporary copies
+            KDTreeSearch<typename std::decay<decltype(tree_points)>::type, typename std::decay<decltype(nodes)>::type,
+                         typename std::decay<decltype(splits)>::type, Scalar> searcher(
+                    tree_points, nodes, splits, k, best_dists.data(), best_idxs.data(), stack);
+
+            #pragma omp for schedule(dynamic, 256)
+            for (std::ptrdiff_t i = 0; i < queries.rows(); i += 1) {
+                searcher.num_found = 0;
+                for (int d = 0; d < 3; d += 1) {
+                    searcher.query[d] = queries(i, d);
+                }
+                searcher.search(0);
+
+                for (int j = 0; j < searcher.num_found; j += 1) {
+                    corrs(i, j) = IndexType(indices(best_idxs[j], 0));
+                    dists(i, j) = squared_distances ? best_dists[j] : std::sqrt(best_dists[j]);
+                }
+                for (int j = searcher.num_found; j < k; j += 1) {
+                    corrs(i, j) = -1;
+                    dists(i, j) = -1.0;
+                }
+            }
+        }
+    }
+
+    return std::make_tuple(npe::move(dists), npe::move(corrs));
+}
+npe_end_code()
@@ -0,0 +1,226 @@
+#include <npe.h>
+
+#include <algorithm>
+#include <cstddef>
+#include <cstdint>
+#include <limits>
+#include <sstream>
+#include <utility>
+#include <vector>
+
+#ifndef KD_TREE_H
+#define KD_TREE_H
+
+/*
+ * KD trees are stored in flat arrays so they can be written to a single buffer and queried directly out of memory
+ * owned by python (e.g. shared memory or a memory-mapped file) without rebuilding or fixing up pointers:
+ *   - tree_points: #n x 3 reference points, reordered so the points under each node are contiguous
+ *   - indices: #n index of each row of tree_points in the original point cloud
+ *   - nodes: #m x 4 rows [begin, end, right_child, split_dim] in depth first order, so the left child of node i is
+ *            node i + 1. Node i holds tree_points[begin:end]. Leaves have right_child = split_dim = -1.
+ *   - splits: #m split value of each internal node (0 for leaves). Points in the left child of node i have
+ *             tree_points(j, split_dim) <= splits[i] and points in the right child have tree_points(j, split_dim) >=
+ *             splits[i].
+ */
+enum KDTreeNodeField { NodeBegin = 0, NodeEnd = 1, NodeRightChild = 2, NodeSplitDim = 3 };
+
+
+/*
+ * k nearest neighbor search for one query point. The neighbors found so far are kept sorted by distance in best_dists
+ * and best_idxs (positions in tree_points) which have room for k entries.
+ *
+ * The tree is traversed with an explicit stack rather than recursion, so a degenerate (e.g. corrupt) tree can't
+ * overflow the native stack however deep it is. The stack is passed in so it can be reused between searches.
+ */
+template <typename TP, typename TN, typename TS, typename Scalar, typename IndexType = std::int64_t>
+struct KDTreeSearch {
+    typedef std::vector<std::pair<std::int64_t, Scalar>> Stack;  // Nodes left to visit and a lower bound on their distance
+
+    const TP& tree_points;
+    const TN& nodes;
+    const TS& splits;
+    const int k;
+    Scalar* best_dists;
+    IndexType* best_idxs;
+    int num_found;
+    Scalar query[3];
+    Stack& stack;
+
+    KDTreeSearch(const TP& p, const TN& n, const TS& s, int num_nbrs, Scalar* dists, IndexType* idxs, Stack& st) :
+        tree_points(p), nodes(n), splits(s), k(num_nbrs), best_dists(dists), best_idxs(idxs), num_found(0),
+        stack(st) {}
+
+    Scalar worst_dist() const {
+        return num_found < k ? std::numeric_limits<Scalar>::max() : best_dists[k - 1];
+    }
+
+    void insert(Scalar dist, std::int64_t idx) {
+        if (num_found < k) {
+            num_found += 1;
+        }
+        int i = num_found - 1;
+        for (; i > 0 && best_dists[i - 1] > dist; i -= 1) {
+            best_dists[i] = best_dists[i - 1];
+            best_idxs[i] = best_idxs[i - 1];
+        }
+        best_dists[i] = dist;
+        best_idxs[i] = IndexType(idx);
+    }
+
+    void search(std::int64_t root) {
+        stack.clear();
+        stack.emplace_back(root, Scalar(0));
+        while (!stack.empty()) {
+            const std::int64_t node = stack.back().first;
+            const Scalar bound = stack.back().second;
+            stack.pop_back();
+            if (bound >= worst_dist()) {
+                continue;
+            }
+
+            const std::int64_t split_dim = nodes(node, NodeSplitDim);
+            if (split_dim < 0) {
+                for (std::int64_t i = nodes(node, NodeBegin); i < nodes(node, NodeEnd); i += 1) {
+                    const Scalar dx = tree_points(i, 0) - query[0];
+                    const Scalar dy = tree_points(i, 1) - query[1];
+                    const Scalar dz = tree_points(i, 2) - query[2];
+                    const Scalar dist = dx * dx + dy * dy + dz * dz;
+                    if (dist < worst_dist()) {
+                        insert(dist, i);
+                    }
+                }
+                continue;
+            }
+
+            // Visit the child on the query's side of the split first (it is pushed last)
+            const Scalar diff = query[split_dim] - Scalar(splits(node, 0));
+            const std::int64_t left = node + 1, right = nodes(node, NodeRightChild);
+            stack.emplace_back(diff < 0 ? right : left, diff * diff);
+            stack.emplace_back(diff < 0 ? left : right, bound);
+        }
+    }
+};
+
+
+/*
+ * Append (position in tree_points, squared distance) of every point strictly closer than sqrt(radius_sq) to query to
+ * matches, in no particular order. Like KDTreeSearch, this uses an explicit stack.
+ */
+template <typename TP, typename TN, typename TS, typename Scalar, typename IndexType>
+void kd_tree_radius_search(const TP& tree_points, const TN& nodes, const TS& splits, const Scalar* query,
+                           Scalar radius_sq, std::vector<std::pair<IndexType, Scalar>>& matches,
+                           std::vector<std::int64_t>& stack) {
+    stack.clear();
+    stack.push_back(0);
+    while (!stack.empty()) {
+        const std::int64_t node = stack.back();
+        stack.pop_back();
+
+        const std::int64_t split_dim = nodes(node, NodeSplitDim);
+        if (split_dim < 0) {
+            for (std::int64_t i = nodes(node, NodeBegin); i < nodes(node, NodeEnd); i += 1) {
+                const Scalar dx = tree_points(i, 0) - query[0];
+                const Scalar dy = tree_points(i, 1) - query[1];
+                const Scalar dz = tree_points(i, 2) - query[2];
+                const Scalar dist = dx * dx + dy * dy + dz * dz;
+                if (dist < radius_sq) {
+                    matches.emplace_back(IndexType(i), dist);
+                }
+            }
+            continue;
+        }
+
+        // The child on the query's side of the split always intersects the ball, the other one only if the ball
+        // crosses the split
+        const Scalar diff = query[split_dim] - Scalar(splits(node, 0));
+        const std::int64_t left = node + 1, right = nodes(node, NodeRightChild);
+        if (diff * diff < radius_sq) {
+            stack.push_back(diff < 0 ? right : left);
+        }
+        stack.push_back(diff < 0 ? left : right);
+    }
+}
+
+
+/*
+ * Read only view of a flat KD tree with the query interface of a nanoflann KDTreeSingleIndexAdaptor (knnSearch and
+ * radiusSearch), so code written against nanoflann trees can run on a prebuilt KDTree. Returned indices are rows of
+ * the original point cloud (i.e. mapped through indices) rather than positions in tree_points.
+ *
+ * Queries only read the tree and use per-thread scratch space, so a view can be shared between threads.
+ */
+template <typename TP, typename TI, typename TN, typename TS>
+class FlatKDTreeView {
+public:
+    typedef typename TP::Scalar ElementType;
+    typedef typename TP::Scalar DistanceType;
+
+private:
+    const TP& tree_points;
+    const TI& indices;
+    const TN& nodes;
+    const TS& splits;
+
+public:
+    FlatKDTreeView(const TP& p, const TI& i, const TN& n, const TS& s) :
+        tree_points(p), indices(i), nodes(n), splits(s) {}
+
+    std::size_t size() const {
+        return std::size_t(tree_points.rows());
+    }
+
+    std::size_t knnSearch(const ElementType* query, std::size_t k, std::size_t* out_indices,
+                          DistanceType* out_dists) const {
+        typedef KDTreeSearch<TP, TN, TS, DistanceType, std::size_t> Searcher;
+        static thread_local typename Searcher::Stack stack;
+
+        Searcher searcher(tree_points, nodes, splits, int(k), out_dists, out_indices, stack);
+        for (int d = 0; d < 3; d += 1) {
+            searcher.query[d] = query[d];
+        }
+        searcher.search(0);
+        for (int j = 0; j < searcher.num_found; j += 1) {
+            out_indices[j] = std::size_t(indices(out_indices[j], 0));
+        }
+        return std::size_t(searcher.num_found);
+    }
+
+    // Like nanoflann, matches is cleared first and is sorted by distance if params.sorted is set
+    template <typename SearchParams>
+    std::size_t radiusSearch(const ElementType* query, DistanceType radius_sq,
+                             std::vector<std::pair<std::size_t, DistanceType>>& matches,
+                             const SearchParams& params) const {
+        static thread_local std::vector<std::int64_t> stack;
+
+        matches.clear();
+        kd_tree_radius_search(tree_points, nodes, splits, query, radius_sq, matches, stack);
+        for (auto& match : matches) {
+            match.first = std::size_t(indices(match.first, 0));
+        }
+        if (params.sorted) {
+            std::sort(matches.begin(), matches.end(),
+                      [](const std::pair<std::size_t, DistanceType>& a, const std::pair<std::size_t, DistanceType>& b) {
+                          return a.second < b.second;
+                      });
+        }
+        return matches.size();
+    }
+};
+
+
+// Only the shapes are checked here since this runs on every query. Trees attached from a buffer have every node
+// checked once when they are attached (see KDTree._validate).
+template <typename TP, typename TI, typename TN, typename TS>
+void validate_kd_tree(const TP& tree_points, const TI& indices, const TN& nodes, const TS& splits) {
+    if (tree_points.cols() != 3 || tree_points.rows() == 0 || indices.size() != tree_points.rows() ||
+        nodes.cols() != 4 || nodes.rows() == 0 || splits.size() != nodes.rows() ||
+        nodes(0, NodeBegin) != 0 || nodes(0, NodeEnd) != tree_points.rows()) {
+        std::stringstream ss;
+        ss << "Invalid KD tree: tree_points.shape = (" << tree_points.rows() << ", " << tree_points.cols() << "), "
+           << "indices.size = " << indices.size() << ", nodes.shape = (" << nodes.rows() << ", " << nodes.cols()
+           << "), splits.size = " << splits.size() << ".";
+        throw pybind11::value_error(ss.str());
+    }
+}
+
+#endif // KD_TREE_H
@@ -4,6 +4,8 @@
 #include <mutex>
 #include <sstream>
 #include <chrono>
+#include <algorithm>
+#include <cmath>
 
 
 #include <geogram/mesh/mesh_tetrahedralize.h>
@@ -30,31 +32,112 @@
 
 namespace {
 
+/*
+ * Compute the CVT energy of the current points of a CVT
+ */
+double cvt_energy(GEO::CentroidalVoronoiTesselation& CVT) {
+    const GEO::index_t num_points = CVT.nb_points();
+    std::vector<double> grad(num_points * CVT.dimension(), 0.0);
+    double energy = 0.0;
+    CVT.delaunay()->set_vertices(num_points, CVT.embedding(0));
+    CVT.RVD()->compute_CVT_func_grad(energy, grad.data());
+    return energy;
+}
+
+
+/*
+ * Run num_lloyd Lloyd iterations followed by num_newton Newton (L-BFGS) iterations on a CVT.
+ *
+ * If tol > 0, Lloyd iterations stop once no point moves by more than tol * scale in an iteration, and Newton
+ * iterations are run in small blocks which stop once a block decreases the CVT energy by less than tol (relative).
+ */
+void run_cvt_iterations(GEO::CentroidalVoronoiTesselation& CVT, int num_lloyd, int num_newton,
+                        double tol, double scale) {
+    if (tol <= 0.0) {
+        if (num_lloyd > 0) {
+            CVT.Lloyd_iterations(num_lloyd);
+        }
+        if (num_newton > 0) {
+            CVT.Newton_iterations(num_newton);
+        }
+        return;
+    }
+
+    const GEO::index_t dim = CVT.dimension();
+    const GEO::index_t num_coords = CVT.nb_points() * dim;
+    std::vector<double> prev_points(num_coords);
+    for (int i = 0; i < num_lloyd; i += 1) {
+        std::copy_n(CVT.embedding(0), num_coords, prev_points.data());
+        CVT.Lloyd_iterations(1);
+
+        double max_disp_sq = 0.0;
+        const double* points = CVT.embedding(0);
+        for (GEO::index_t j = 0; j < num_coords; j += dim) {
+            double disp_sq = 0.0;
+            for (GEO::index_t c = 0; c < dim; c += 1) {
+                const double d = points[j + c] - prev_points[j + c];
+                disp_sq += d * d;
+            }
+            max_disp_sq = std::max(max_disp_sq, disp_sq);
+        }
+        if (std::sqrt(max_disp_sq) <= tol * scale) {
+            break;
+        }
+    }
+
+    const int newton_block_size = 5;
+    double energy = num_newton > 0 ? cvt_energy(CVT) : 0.0;
+    for (int i = 0; i < num_newton; i += newton_block_size) {
+        CVT.Newton_iterations(std::min(newton_block_size, num_newton - i));
+        const double new_energy = cvt_energy(CVT);
+        if (energy <= 0.0 || (energy - new_energy) / energy <= tol) {
+            break;
+        }
+        energy = new_energy;
+    }
+}
+
+
+/*
+ * Set the initial points of a CVT to init_P if it is non-empty, otherwise draw num_samples random initial points
+ */
+template <typename DerivedI>
+void cvt_initial_sampling(GEO::CentroidalVoronoiTesselation& CVT, const Eigen::MatrixBase<DerivedI>& init_P,
+                          int num_samples) {
+    if (init_P.rows() > 0) {
+        assert(init_P.rows() == num_samples);
+        std::vector<double> points(num_samples * CVT.dimension(), 0.0);
+        for (int i = 0; i < num_samples; i += 1) {
+            for (int j = 0; j < std::min(int(init_P.cols()), int(CVT.dimension())); j += 1) {
+                points[i * CVT.dimension() + j] = init_P(i, j);
+            }
+        }
+        CVT.set_points(num_samples, points.data());
+    } else {
+        bool was_quiet = GEO::Logger::instance()->is_quiet();
+        GEO::Logger::instance()->set_quiet(true);
+        CVT.compute_initial_sampling(num_samples);
+        GEO::Logger::instance()->set_quiet(was_quiet);
+    }
+}
+
+
 /*
  * Sample a mesh using lloyd relaxation
  */
-template <typename DerivedV, typename DerivedF, typename DerivedP>
+template <typename DerivedV, typename DerivedF, typename DerivedI, typename DerivedP>
 void sample_tri_mesh_lloyd(const Eigen::MatrixBase<DerivedV> &V,
-                       const Eigen::MatrixBase<DerivedF> &F,
-                       int num_samples, int num_lloyd, int num_newton,
-                       Eigen::PlainObjectBase<DerivedP> &P) {
+                           const Eigen::MatrixBase<DerivedF> &F,
+                           const Eigen::MatrixBase<DerivedI> &init_P,
+                           int num_samples, int num_lloyd, int num_newton, double tol,
+                           Eigen::PlainObjectBase<DerivedP> &P) {
     assert(num_samples > 3);
     GEO::Mesh M;
     vf_to_geogram_mesh(V, F, M);
 
     GEO::CentroidalVoronoiTesselation CVT(&M);
-    bool was_quiet = GEO::Logger::instance()->is_quiet();
-    GEO::Logger::instance()->set_quiet(false);
-    CVT.compute_initial_sampling(num_samples);
-    GEO::Logger::instance()->set_quiet(was_quiet);
-
-    if (num_lloyd > 0) {
-        CVT.Lloyd_iterations(num_lloyd);
-    }
-
-    if (num_newton > 0) {
-        CVT.Newton_iterations(num_newton);
-    }
+    cvt_initial_sampling(CVT, init_P, num_samples);
+    run_cvt_iterations(CVT, num_lloyd, num_newton, tol, GEO::bbox_diagonal(M));
 
     P.resize(3, num_samples);
     std::copy_n(CVT.embedding(0), 3*num_samples, P.data());
@@ -65,11 +148,12 @@ void sample_tri_mesh_lloyd(const Eigen::MatrixBase<DerivedV> &V,
 /*
  * Sample a mesh using lloyd relaxation
  */
-template <typename DerivedV, typename DerivedF, typename DerivedT, typename DerivedP>
+template <typename DerivedV, typename DerivedF, typename DerivedT, typename DerivedI, typename DerivedP>
 void sample_tet_mesh_lloyd(const Eigen::MatrixBase<DerivedV> &V,
                           const Eigen::MatrixBase<DerivedF> &F,
                           const Eigen::MatrixBase<DerivedT> &T,
-                          int num_samples, int num_lloyd, int num_newton,
+                          const Eigen::MatrixBase<DerivedI> &init_P,
+                          int num_samples, int num_lloyd, int num_newton, double tol,
                           Eigen::PlainObjectBase<DerivedP> &P) {
     assert(num_samples > 3);
     GEO::Mesh M;
@@ -77,18 +161,8 @@ void sample_tet_mesh_lloyd(const Eigen::MatrixBase<DerivedV> &V,
 
     GEO::CentroidalVoronoiTesselation CVT(&M);
     CVT.set_volumetric(true);
-    bool was_quiet = GEO::Logger::instance()->is_quiet();
-    GEO::Logger::instance()->set_quiet(true);
-    CVT.compute_initial_sampling(num_samples);
-    GEO::Logger::instance()->set_quiet(was_quiet);
-
-    if (num_lloyd > 0) {
-        CVT.Lloyd_iterations(num_lloyd);
-    }
-
-    if (num_newton > 0) {
-        CVT.Newton_iterations(num_newton);
-    }
+    cvt_initial_sampling(CVT, init_P, num_samples);
+    run_cvt_iterations(CVT, num_lloyd, num_newton, tol, GEO::bbox_diagonal(M));
 
     P.resize(3, num_samples);
     std::copy_n(CVT.embedding(0), 3*num_samples, P.data());
@@ -96,87 +170,205 @@ void sample_tet_mesh_lloyd(const Eigen::MatrixBase<DerivedV> &V,
 }
 
 /*
- * Sample a mesh using lloyd relaxation
+ * Tet mesh (with boundary faces) of the unit cube [0, 1]^3
+ */
+void unit_cube_tet_mesh(Eigen::MatrixXd& V, Eigen::MatrixXi& F, Eigen::MatrixXi& T) {
+  V.resize(9, 3);
+  V << 0. , 1. , 0. ,
+       0. , 0. , 1. ,
+       1. , 0. , 1. ,
+       1. , 0. , 0. ,
+       0. , 0. , 0. ,
+       1. , 1. , 1. ,
+       1. , 1. , 0. ,
+       0. , 1. , 1. ,
+       0.5, 0.5, 0.5;
+
+  T.resize(12, 4);
+  T << 8, 0, 7, 5,
+       6, 2, 5, 8,
+       3, 1, 2, 8,
+       0, 8, 7, 4,
+       7, 8, 5, 1,
+       8, 0, 5, 6,
+       3, 1, 8, 4,
+       2, 1, 5, 8,
+       8, 0, 6, 4,
+       7, 8, 1, 4,
+       6, 4, 3, 8,
+       2, 6, 3, 8;
+  F.resize(12, 3);
+  F << 0, 5, 7,
+       6, 2, 5,
+       3, 1, 2,
+       0, 7, 4,
+       7, 5, 1,
+       0, 6, 5,
+       3, 4, 1,
+       2, 1, 5,
+       0, 4, 6,
+       7, 1, 4,
+       6, 4, 3,
+       2, 6, 3;
+}
+
+
+} // namespace
+
+
+/*
+ * A Voronoi diagram restricted to a fixed domain (a triangle mesh or a tet mesh). The domain is set up once and
+ * each query only rebuilds the Delaunay triangulation of the new centers, so this is cheap to call repeatedly
+ * (e.g. inside an optimization loop which moves the centers a little at each step).
  */
-template <typename DerivedV, typename DerivedF, typename DerivedT, typename DerivedP>
-void voronoi_centroids(const Eigen::MatrixBase<DerivedV> &V,
-                     const Eigen::MatrixBase<DerivedF> &F,
-                     const Eigen::MatrixBase<DerivedT> &T,
-                     const Eigen::MatrixBase<DerivedP> &centers,
-                     Eigen::PlainObjectBase<DerivedP> &P) {
-
-    std::vector<double> centers_vec;
-    for (GEO::index_t i = 0; i < centers.rows(); i++) {
-        for (GEO::index_t j = 0; j < centers.cols(); j++) {
-            centers_vec.push_back(centers(i, j));
+class RestrictedVoronoi {
+    GEO::Mesh mesh;
+    GEO::Delaunay_var delaunay;
+    GEO::RestrictedVoronoiDiagram_var rvd;
+    bool volumetric = false;
+
+    void set_centers(const std::vector<double>& centers) {
+        if (rvd.is_null()) {
+            throw pybind11::value_error("RestrictedVoronoi has no domain. Call set_domain first.");
+        }
+        const GEO::index_t num_centers = GEO::index_t(centers.size() / 3);
+        if (num_centers < 4) {
+            throw pybind11::value_error("Need at least 4 centers to compute a restricted Voronoi diagram. Got " +
+                                        std::to_string(num_centers) + ".");
         }
+        delaunay->set_vertices(num_centers, centers.data());
     }
-    GEO::Mesh M;
-    vft_to_geogram_tet_mesh(V, F, T, M);
 
-    GEO::coord_index_t dimension_ = GEO::coord_index_t(M.vertices.dimension());
-    const std::string& delaunay = "default";
-    GEO::Delaunay_var delaunay_ = GEO::Delaunay::create(dimension_, delaunay);
-    GEO::RestrictedVoronoiDiagram_var RVD_ = GEO::RestrictedVoronoiDiagram::create(delaunay_, &M);
-    RVD_->set_volumetric(true);
-
-    std::vector<double> mg;
-    std::vector<double> m;
-    RVD_->set_check_SR(false);
-
-    P.resize(centers.rows(), centers.cols());
-
-    GEO::index_t nb_points = centers.rows();
-    mg.assign(nb_points * dimension_, 0.0);
-    m.assign(nb_points, 0.0);
-    delaunay_->set_vertices(nb_points, centers_vec.data());
-    RVD_->compute_centroids(mg.data(), m.data());
-    GEO::index_t cur = 0;
-    for(GEO::index_t j = 0; j < nb_points; j++) {
-        if(m[j] > 1e-30) {
-            double s = 1.0 / m[j];
-            for(GEO::index_t coord = 0; coord < dimension_; coord++) {
-                P(j, coord) = s * mg[cur + coord];
+public:
+    /*
+     * Set the domain to a triangle mesh (V, F) if T is empty, or to the tet mesh (V, T) (with optional boundary
+     * faces F) otherwise
+     */
+    template <typename DerivedV, typename DerivedF, typename DerivedT>
+    void set_domain(const Eigen::MatrixBase<DerivedV>& V, const Eigen::MatrixBase<DerivedF>& F,
+                    const Eigen::MatrixBase<DerivedT>& T) {
+        rvd.reset();
+        delaunay.reset();
+        volumetric = T.rows() > 0;
+        if (volumetric) {
+            vft_to_geogram_tet_mesh(V, F, T, mesh);
+        } else {
+            vf_to_geogram_mesh(V, F, mesh);
+        }
+
+        delaunay = GEO::Delaunay::create(GEO::coord_index_t(mesh.vertices.dimension()), "default");
+        rvd = GEO::RestrictedVoronoiDiagram::create(delaunay, &mesh);
+        rvd->set_volumetric(volumetric);
+        rvd->set_check_SR(false);
+    }
+
+    bool is_volumetric() const {
+        return volumetric;
+    }
+
+    /*
+     * Compute the centroid and mass (volume or area) of the restricted Voronoi cell of each center. Centers whose
+     * cell is empty keep their position as their centroid.
+     */
+    void centroids(const std::vector<double>& centers, std::vector<double>& out_centroids,
+                   std::vector<double>& out_masses) {
+        set_centers(centers);
+        const GEO::index_t num_centers = GEO::index_t(centers.size() / 3);
+        out_centroids.assign(3 * num_centers, 0.0);
+        out_masses.assign(num_centers, 0.0);
+        rvd->compute_centroids(out_centroids.data(), out_masses.data());
+        for (GEO::index_t i = 0; i < num_centers; i += 1) {
+            for (int j = 0; j < 3; j += 1) {
+                out_centroids[3 * i + j] = out_masses[i] > 1e-30 ?
+                                           out_centroids[3 * i + j] / out_masses[i] : centers[3 * i + j];
             }
         }
-        cur += dimension_;
     }
+
+    /*
+     * Compute the CVT energy of the centers and its gradient with respect to each center
+     */
+    double energy_and_gradient(const std::vector<double>& centers, std::vector<double>& out_gradient) {
+        set_centers(centers);
+        out_gradient.assign(centers.size(), 0.0);
+        double energy = 0.0;
+        rvd->compute_CVT_func_grad(energy, out_gradient.data());
+        return energy;
+    }
+};
+
+
+void restricted_voronoi_extra_bindings(pybind11::module& m) {
+    pybind11::class_<RestrictedVoronoi, std::shared_ptr<RestrictedVoronoi>>(m, "RestrictedVoronoi")
+    .def(pybind11::init([]() {
+        return std::shared_ptr<RestrictedVoronoi>(new RestrictedVoronoi());
+    }))
+    .def("is_volumetric", &RestrictedVoronoi::is_volumetric);
 }
 
 
+namespace {
+
+/*
+ * Copy a #centers x 3 matrix into a flat vector of doubles for geogram
+ */
+template <typename DerivedC>
+std::vector<double> flatten_centers(const DerivedC& centers) {
+    if (centers.cols() != 3) {
+        throw pybind11::value_error("Invalid centers must have shape (n, 3). Got centers.shape = (" +
+                                    std::to_string(centers.rows()) + ", " + std::to_string(centers.cols()) + ").");
+    }
+    std::vector<double> ret(3 * centers.rows());
+    for (std::ptrdiff_t i = 0; i < centers.rows(); i += 1) {
+        for (int j = 0; j < 3; j += 1) {
+            ret[3 * i + j] = double(centers(i, j));
+        }
+    }
+    return ret;
+}
+
 } // namespace
 
 
 
 
 
-const char* lloyd_2d_doc = R"Qu8mg5v7(
-Generate n samples in the unit square, [0, 1]^2 using Lloyd's algorithm
-(https://en.wikipedia.org/wiki/Lloyd%27s_algorithm).
 
-Parameters
-----------
-n : The number of 2d point samples to generate
-num_lloyd : The number of Lloyd iterations to do (default 10)
-num_newton : The number of Newton iterations to do when computing Voronoi diagrams (default 10)
+/*
+ * Validate the arguments shared by the Lloyd sampling functions
+ */
+template <typename DerivedI>
+void validate_lloyd_args(int num_samples, const DerivedI& init_samples, int dim, double tol) {
+  if (num_samples <= 0) {
+    throw pybind11::value_error("Number of samples must be a positive integer. Got " + std::to_string(num_samples));
+  }
+  if (tol < 0.0) {
+    throw pybind11::value_error("tol must be non-negative. Got tol = " + std::to_string(tol));
+  }
+  if (init_samples.rows() > 0 && (init_samples.rows() != num_samples || init_samples.cols() != dim)) {
+    std::stringstream ss;
+    ss << "Invalid init_samples must have shape (" << num_samples << ", " << dim << "). Got init_samples.shape = ("
+       << init_samples.rows() << ", " << init_samples.cols() << ").";
+    throw pybind11::value_error(ss.str());
+  }
+}
 
-Returns
--------
-A n by 2 array of point samples in the unit square [0, 1]^2
 
-)Qu8mg5v7";
-npe_function(lloyd_2d)
+npe_function(lloyd_2d_internal)
 npe_arg(n, int)
-npe_default_arg(num_lloyd, int, 10)
-npe_default_arg(num_newton, int, 10)
-npe_doc(lloyd_2d_doc)
+npe_arg(num_lloyd, int)
+npe_arg(num_newton, int)
+npe_arg(tol, double)
+npe_arg(random_seed, int)
+npe_arg(num_threads, int)
+npe_arg(init_samples, dense_float, dense_double)
 npe_begin_code()
 {
-  if (n <= 0) {
-    throw pybind11::value_error("n must be a positive integer. Got n = " + std::to_string(n));
-  }
+  validate_lloyd_args(n, init_samples, 2, tol);
 
   init_geogram_only_once();
+  GeogramThreadLimit thread_limit(num_threads);
+  seed_geogram_random((unsigned int) random_seed);  // After the limit so no other geogram call runs in between
 
   Eigen::MatrixXd V(4, 3);
   V << 0.0, 0.0, 0.0,
@@ -187,8 +379,9 @@ npe_begin_code()
   F << 0, 1, 3,
        1, 2, 3;
 
+  Eigen::MatrixXd init_P = init_samples.template cast<double>();
   Eigen::MatrixXd P;
-  sample_tri_mesh_lloyd(V, F, n, num_lloyd, num_newton, P);
+  sample_tri_mesh_lloyd(V, F, init_P, n, num_lloyd, num_newton, tol, P);
 
   Eigen::Matrix<double, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor> P2d;
   P2d = P.block(0, 0, P.rows(), 2);
@@ -198,75 +391,29 @@ npe_end_code()
 
 
 
-const char* lloyd_3d_doc = R"Qu8mg5v7(
-Generate n samples in the unit cube, [0, 1]^3 using Lloyd's algorithm
-(https://en.wikipedia.org/wiki/Lloyd%27s_algorithm).
-
-Parameters
-----------
-n : The number of 3d point samples to generate
-num_lloyd : The number of Lloyd iterations to do (default 10)
-num_newton : The number of Newton iterations to do when computing Voronoi diagrams (default 10)
-
-Returns
--------
-A n by 3 array of point samples in the unit square [0, 1]^3
-
-)Qu8mg5v7";
-npe_function(lloyd_3d)
+npe_function(lloyd_3d_internal)
 npe_arg(n, int)
-npe_default_arg(num_lloyd, int, 10)
-npe_default_arg(num_newton, int, 10)
-npe_doc(lloyd_3d_doc)
+npe_arg(num_lloyd, int)
+npe_arg(num_newton, int)
+npe_arg(tol, double)
+npe_arg(random_seed, int)
+npe_arg(num_threads, int)
+npe_arg(init_samples, dense_float, dense_double)
 npe_begin_code()
 {
-  if (n <= 0) {
-    throw pybind11::value_error("n must be a positive integer. Got n = " + std::to_string(n));
-  }
+  validate_lloyd_args(n, init_samples, 3, tol);
 
   init_geogram_only_once();
+  GeogramThreadLimit thread_limit(num_threads);
+  seed_geogram_random((unsigned int) random_seed);  // After the limit so no other geogram call runs in between
 
-  Eigen::MatrixXd V(9, 3);
-  V << 0. , 1. , 0. ,
-       0. , 0. , 1. ,
-       1. , 0. , 1. ,
-       1. , 0. , 0. ,
-       0. , 0. , 0. ,
-       1. , 1. , 1. ,
-       1. , 1. , 0. ,
-       0. , 1. , 1. ,
-       0.5, 0.5, 0.5;
-
-  Eigen::MatrixXi T(12, 4);
-  T << 8, 0, 7, 5,
-       6, 2, 5, 8,
-       3, 1, 2, 8,
-       0, 8, 7, 4,
-       7, 8, 5, 1,
-       8, 0, 5, 6,
-       3, 1, 8, 4,
-       2, 1, 5, 8,
-       8, 0, 6, 4,
-       7, 8, 1, 4,
-       6, 4, 3, 8,
-       2, 6, 3, 8;
-  Eigen::MatrixXi F(12, 3);
-  F << 0, 5, 7,
-       6, 2, 5,
-       3, 1, 2,
-       0, 7, 4,
-       7, 5, 1,
-       0, 6, 5,
-       3, 4, 1,
-       2, 1, 5,
-       0, 4, 6,
-       7, 1, 4,
-       6, 4, 3,
-       2, 6, 3;
-
+  Eigen::MatrixXd V;
+  Eigen::MatrixXi F, T;
+  unit_cube_tet_mesh(V, F, T);
 
+  Eigen::MatrixXd init_P = init_samples.template cast<double>();
   Eigen::MatrixXd P;
-  sample_tet_mesh_lloyd(V, F, T, n, num_lloyd, num_newton, P);
+  sample_tet_mesh_lloyd(V, F, T, init_P, n, num_lloyd, num_newton, tol, P);
   Eigen::Matrix<double, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor> P3d;
   P3d = P;
   return npe::move(P3d);
@@ -290,7 +437,7 @@ voronoi cell in the input centers.
 )Qu8mg5v7";
 npe_function(voronoi_centroids_unit_cube)
 npe_arg(centers, dense_float, dense_double)
-npe_doc(lloyd_3d_doc)
+npe_doc(voronoi_centroids_unit_cube_doc)
 npe_begin_code()
 {
   if (centers.maxCoeff() > 1.0 || centers.minCoeff() < 0.0) {
@@ -298,113 +445,131 @@ npe_begin_code()
   }
 
   init_geogram_only_once();
+  GeogramThreadLimit thread_limit;
 
-  Eigen::MatrixXd V(9, 3);
-  V << 0. , 1. , 0. ,
-       0. , 0. , 1. ,
-       1. , 0. , 1. ,
-       1. , 0. , 0. ,
-       0. , 0. , 0. ,
-       1. , 1. , 1. ,
-       1. , 1. , 0. ,
-       0. , 1. , 1. ,
-       0.5, 0.5, 0.5;
+  Eigen::MatrixXd V;
+  Eigen::MatrixXi F, T;
+  unit_cube_tet_mesh(V, F, T);
 
-  Eigen::MatrixXi T(12, 4);
-  T << 8, 0, 7, 5,
-       6, 2, 5, 8,
-       3, 1, 2, 8,
-       0, 8, 7, 4,
-       7, 8, 5, 1,
-       8, 0, 5, 6,
-       3, 1, 8, 4,
-       2, 1, 5, 8,
-       8, 0, 6, 4,
-       7, 8, 1, 4,
-       6, 4, 3, 8,
-       2, 6, 3, 8;
-  Eigen::MatrixXi F(12, 3);
-  F << 0, 5, 7,
-       6, 2, 5,
-       3, 1, 2,
-       0, 7, 4,
-       7, 5, 1,
-       0, 6, 5,
-       3, 4, 1,
-       2, 1, 5,
-       0, 4, 6,
-       7, 1, 4,
-       6, 4, 3,
-       2, 6, 3;
+  RestrictedVoronoi rv;
+  rv.set_domain(V, F, T);
 
-  Eigen::Matrix<double, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor> ctrs_copy = centers.template cast<double>();
-  Eigen::Matrix<double, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor> P3d;
-  voronoi_centroids(V, F, T, ctrs_copy, P3d);
+  std::vector<double> centroids, masses;
+  rv.centroids(flatten_centers(centers), centroids, masses);
+
+  Eigen::Matrix<double, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor> P3d =
+      Eigen::Map<Eigen::Matrix<double, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor>>(
+          centroids.data(), centers.rows(), 3);
   return npe::move(P3d);
 }
 npe_end_code()
 
 
-const char* sample_mesh_lloyd_doc = R"Qu8mg5v7(
-Generate n samples on a surface defined by a triangle mesh using
-Lloyd's algorithm (https://en.wikipedia.org/wiki/Lloyd%27s_algorithm).
+npe_function(restricted_voronoi_set_domain_internal)
+npe_arg(rv, std::shared_ptr<RestrictedVoronoi>)
+npe_arg(v, dense_float, dense_double)
+npe_arg(f, dense_int, dense_long, dense_longlong, dense_uint, dense_ulong, dense_ulonglong)
+npe_arg(t, npe_matches(f))
+npe_begin_code()
+{
+  init_geogram_only_once();
+
+  Eigen::MatrixXd V;
+  Eigen::MatrixXi F, T;
+  if (v.rows() == 0) {
+    unit_cube_tet_mesh(V, F, T);
+  } else {
+    if (t.rows() > 0) {
+      validate_point_cloud(v, false /* allow_0 */);
+      if (t.cols() != 4) {
+        throw pybind11::value_error("Invalid tets must have shape (#t, 4). Got t.shape = (" +
+                                    std::to_string(t.rows()) + ", " + std::to_string(t.cols()) + ").");
+      }
+      if (f.rows() > 0 && f.cols() != 3) {
+        throw pybind11::value_error("Invalid faces must have shape (#f, 3). Got f.shape = (" +
+                                    std::to_string(f.rows()) + ", " + std::to_string(f.cols()) + ").");
+      }
+    } else {
+      validate_mesh(v, f);
+    }
+    V = v.template cast<double>();
+    F = f.template cast<int>();
+    T = t.template cast<int>();
+    if (F.cols() != 3) {
+      F.resize(0, 3);
+    }
+  }
 
-Parameters
-----------
-v : A #v by 3 array where each row is a vertex of the input mesh
-f : A #f by 3 array of indices into `v` where each row is a triangle of the input mesh.
-n : The number of surface samples to generate
-num_lloyd : The number of Lloyd iterations to do (default 10)
-num_newton : The number of Newton iterations to do when computing Voronoi diagrams (default 10)
+  rv->set_domain(V, F, T);
+}
+npe_end_code()
 
-Returns
--------
-A n by 3 array of point samples on the input surface defined by (v, f)
 
-)Qu8mg5v7";
+npe_function(restricted_voronoi_centroids_internal)
+npe_arg(rv, std::shared_ptr<RestrictedVoronoi>)
+npe_arg(centers, dense_float, dense_double)
+npe_begin_code()
+{
+  typedef Eigen::Matrix<npe_Scalar_centers, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor> MatrixType;
+
+  GeogramThreadLimit thread_limit;
+  std::vector<double> centroids, masses;
+  rv->centroids(flatten_centers(centers), centroids, masses);
+
+  MatrixType ret_c = Eigen::Map<Eigen::Matrix<double, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor>>(
+      centroids.data(), centers.rows(), 3).template cast<npe_Scalar_centers>();
+  MatrixType ret_m = Eigen::Map<Eigen::VectorXd>(masses.data(), centers.rows()).template cast<npe_Scalar_centers>();
+  return std::make_tuple(npe::move(ret_c), npe::move(ret_m));
+}
+npe_end_code()
+
+
+npe_function(restricted_voronoi_energy_internal)
+npe_arg(rv, std::shared_ptr<RestrictedVoronoi>)
+npe_arg(centers, dense_float, dense_double)
+npe_begin_code()
+{
+  typedef Eigen::Matrix<npe_Scalar_centers, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor> MatrixType;
+
+  GeogramThreadLimit thread_limit;
+  std::vector<double> gradient;
+  const double energy = rv->energy_and_gradient(flatten_centers(centers), gradient);
+
+  MatrixType ret_g = Eigen::Map<Eigen::Matrix<double, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor>>(
+      gradient.data(), centers.rows(), 3).template cast<npe_Scalar_centers>();
+  return std::make_tuple(energy, npe::move(ret_g));
+}
+npe_end_code()
+
 
-npe_function(sample_mesh_lloyd)
+npe_function(sample_mesh_lloyd_internal)
 npe_arg(v, dense_float, dense_double)
 npe_arg(f, dense_int, dense_long, dense_longlong, dense_uint, dense_ulong, dense_ulonglong)
 npe_arg(num_samples, int)
-npe_default_arg(num_lloyd, int, 10)
-npe_default_arg(num_newton, int, 10)
-npe_default_arg(return_mesh, bool, false)
-npe_doc(sample_mesh_lloyd_doc)
+npe_arg(num_lloyd, int)
+npe_arg(num_newton, int)
+npe_arg(tol, double)
+npe_arg(random_seed, int)
+npe_arg(num_threads, int)
+npe_arg(init_samples, npe_matches(v))
 npe_begin_code()
 {
   validate_mesh(v, f);
-  if (num_samples <= 0) {
-    throw pybind11::value_error("num_samples must be > 0");
-  }
+  validate_lloyd_args(num_samples, init_samples, 3, tol);
 
   init_geogram_only_once();
+  GeogramThreadLimit thread_limit(num_threads);
+  seed_geogram_random((unsigned int) random_seed);  // After the limit so no other geogram call runs in between
 
   Eigen::MatrixXd V = v.template cast<double>();
   Eigen::MatrixXi F = f.template cast<int>();
+  Eigen::MatrixXd init_P = init_samples.template cast<double>();
 
-  GEO::Mesh M;
-  vf_to_geogram_mesh(V, F, M);
-
-  GEO::CentroidalVoronoiTesselation CVT(&M);
-  bool was_quiet = GEO::Logger::instance()->is_quiet();
-  GEO::Logger::instance()->set_quiet(true);
-  CVT.compute_initial_sampling(num_samples);
-  GEO::Logger::instance()->set_quiet(was_quiet);
-
-  if (num_lloyd > 0) {
-      CVT.Lloyd_iterations(num_lloyd);
-  }
-
-  if (num_newton > 0) {
-      CVT.Newton_iterations(num_newton);
-  }
+  Eigen::MatrixXd P;
+  sample_tri_mesh_lloyd(V, F, init_P, num_samples, num_lloyd, num_newton, tol, P);
 
-  Eigen::Matrix<double, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor> P;
-  P.resize(num_samples, 3);
-  std::copy_n(CVT.embedding(0), 3*num_samples, P.data());
-  return npe::move(P);
+  Eigen::Matrix<double, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor> P3d;
+  P3d = P;
+  return npe::move(P3d);
 }
 npe_end_code()
-
-
@@ -0,0 +1,316 @@
+#include <npe.h>
+
+#include <igl/AABB.h>
+#include <igl/fast_winding_number.h>
+#include <igl/Hit.h>
+
+#include <cstdint>
+#include <limits>
+#include <memory>
+#include <mutex>
+
+#include "common.h"
+#include "triangle_utils.h"
+
+
+/*
+ * A triangle mesh with an AABB tree (for closest point and ray queries) and a fast winding number tree (for inside
+ * outside queries) which are built once and reused across many queries.
+ *
+ * The AABB tree is built when the mesh is set and the winding number tree is built lazily the first time it is needed
+ * since closest point and ray queries don't use it. All the query methods are const and safe to call from multiple
+ * threads at once.
+ */
+class MeshQuery {
+public:
+    typedef Eigen::Matrix<double, Eigen::Dynamic, 3, Eigen::RowMajor> MatrixV;
+    typedef Eigen::Matrix<std::int64_t, Eigen::Dynamic, 3, Eigen::RowMajor> MatrixF;
+    typedef Eigen::Matrix<double, 1, 3> RowVector3;
+
+private:
+    MatrixV V;
+    MatrixF F;
+    igl::AABB<MatrixV, 3> tree;
+    std::unique_ptr<igl::FastWindingNumberBVH> fwn_bvh;
+    std::unique_ptr<std::once_flag> fwn_once;
+
+public:
+    MeshQuery() : fwn_bvh(new igl::FastWindingNumberBVH), fwn_once(new std::once_flag) {}
+
+    bool is_empty() const {
+        return F.rows() == 0;
+    }
+
+    std::int64_t num_vertices() const {
+        return V.rows();
+    }
+
+    std::int64_t num_faces() const {
+        return F.rows();
+    }
+
+    template <typename DerivedV, typename DerivedF>
+    void set_mesh(const DerivedV& v, const DerivedF& f) {
+        V = v.template cast<double>();
+        F = f.template cast<std::int64_t>();
+        tree.deinit();
+        tree.init(V, F);
+        fwn_bvh.reset(new igl::FastWindingNumberBVH);
+        fwn_once.reset(new std::once_flag);
+    }
+
+    /*
+     * Build the winding number tree if it hasn't been built yet
+     */
+    void ensure_winding_number_tree() {
+        std::call_once(*fwn_once, [&]() {
+            igl::fast_winding_number(V.cast<float>().eval(), F, 2 /* order */, *fwn_bvh);
+        });
+    }
+
+    /*
+     * Return the squared distance from q to the mesh between low_sqr_d and up_sqr_d, setting fi to the index of the
+     * closest face and c to the closest point on it
+     */
+    double squared_distance(const RowVector3& q, double low_sqr_d, double up_sqr_d, int& fi, RowVector3& c) const {
+        return tree.squared_distance(V, F, q, low_sqr_d, up_sqr_d, fi, c);
+    }
+
+    double squared_distance(const RowVector3& q, int& fi, RowVector3& c) const {
+        return tree.squared_distance(V, F, q, fi, c);
+    }
+
+    RowVector3 barycentric_coordinates(const RowVector3& c, int fi) const {
+        return triangle_barycentric_coordinates<double>(c, V.row(F(fi, 0)), V.row(F(fi, 1)), V.row(F(fi, 2)));
+    }
+
+    /*
+     * Fast winding number at q. Requires ensure_winding_number_tree to have been called.
+     */
+    double winding_number(const RowVector3& q) const {
+        return igl::fast_winding_number(*fwn_bvh, 2.0f /* accuracy_scale */, q.cast<float>().eval());
+    }
+
+    /*
+     * Whether q is inside the bounding box of the mesh. Points outside it are always outside the mesh.
+     */
+    bool in_bounding_box(const RowVector3& q) const {
+        return tree.m_box.contains(q.transpose());
+    }
+
+    bool intersect_ray(const RowVector3& origin, const RowVector3& dir, igl::Hit& hit) const {
+        return tree.intersect_ray(V, F, origin, dir, hit);
+    }
+};
+
+
+void mesh_query_extra_bindings(pybind11::module& m) {
+    pybind11::class_<MeshQuery, std::shared_ptr<MeshQuery>>(m, "MeshQuery")
+    .def(pybind11::init([]() {
+        return std::shared_ptr<MeshQuery>(new MeshQuery());
+    }))
+    .def("is_empty", &MeshQuery::is_empty)
+    .def("num_vertices", &MeshQuery::num_vertices)
+    .def("num_faces", &MeshQuery::num_faces);
+}
+
+
+namespace {
+
+void validate_mesh_query(const MeshQuery& mq) {
+    if (mq.is_empty()) {
+        throw pybind11::value_error("MeshQuery has no mesh. Call set_mesh first.");
+    }
+}
+
+} // namespace
+
+
+npe_function(mesh_query_set_mesh_internal)
+npe_arg(mq, std::shared_ptr<MeshQuery>)
+npe_arg(v, dense_float, dense_double)
+npe_arg(f, dense_int, dense_long, dense_longlong, dense_uint, dense_ulong, dense_ulonglong)
+npe_begin_code()
+{
+    validate_mesh(v, f);
+    if (f.rows() >= std::numeric_limits<int>::max()) {
+        throw pybind11::value_error("Invalid mesh, the number of faces must be less than " +
+                                    std::to_string(std::numeric_limits<int>::max()) + ".");
+    }
+    for (std::ptrdiff_t i = 0; i < f.rows(); i += 1) {
+        for (int j = 0; j < 3; j += 1) {
+            if (std::int64_t(f(i, j)) < 0 || std::int64_t(f(i, j)) >= std::int64_t(v.rows())) {
+                throw pybind11::value_error("Invalid face index in f, all indices must be in [0, #v).");
+            }
+        }
+    }
+
+    pybind11::gil_scoped_release release;
+    mq->set_mesh(v, f);
+}
+npe_end_code()
+
+
+npe_function(mesh_query_closest_points_internal)
+npe_arg(mq, std::shared_ptr<MeshQuery>)
+npe_arg(p, dense_float, dense_double)
+npe_begin_code()
+{
+    validate_mesh_query(*mq);
+    validate_point_cloud(p);
+
+    typedef npe_Scalar_p Scalar;
+    Eigen::Matrix<Scalar, Eigen::Dynamic, 1> dists(p.rows());
+    Eigen::Matrix<std::int64_t, Eigen::Dynamic, 1> face_idxs(p.rows());
+    Eigen::Matrix<Scalar, Eigen::Dynamic, 3, Eigen::RowMajor> barycentric_coords(p.rows(), 3);
+    {
+        pybind11::gil_scoped_release release;
+
+        #pragma omp parallel for
+        for (std::ptrdiff_t i = 0; i < p.rows(); i += 1) {
+            const MeshQuery::RowVector3 q(p(i, 0), p(i, 1), p(i, 2));
+            MeshQuery::RowVector3 c;
+            int fi = -1;
+            const double sqr_dist = mq->squared_distance(q, fi, c);
+            dists(i) = Scalar(std::sqrt(sqr_dist));
+            face_idxs(i) = fi;
+            barycentric_coords.row(i) = mq->barycentric_coordinates(c, fi).template cast<Scalar>();
+        }
+    }
+
+    return std::make_tuple(npe::move(dists), npe::move(face_idxs), npe::move(barycentric_coords));
+}
+npe_end_code()
+
+
+npe_function(mesh_query_signed_distance_internal)
+npe_arg(mq, std::shared_ptr<MeshQuery>)
+npe_arg(p, dense_float, dense_double)
+npe_arg(lower_bound, double)
+npe_arg(upper_bound, double)
+npe_arg(band, double)
+npe_begin_code()
+{
+    validate_mesh_query(*mq);
+    validate_point_cloud(p);
+    if (lower_bound > upper_bound) {
+        throw pybind11::value_error("Invalid bounds, lower_bound must be less than or equal to upper_bound.");
+    }
+    if (!(band > 0.0)) {
+        throw pybind11::value_error("Invalid band must be positive. Got band = " + std::to_string(band) + ".");
+    }
+
+    typedef npe_Scalar_p Scalar;
+    Eigen::Matrix<Scalar, Eigen::Dynamic, 1> sdists(p.rows());
+    Eigen::Matrix<std::int64_t, Eigen::Dynamic, 1> face_idxs(p.rows());
+    Eigen::Matrix<Scalar, Eigen::Dynamic, 3, Eigen::RowMajor> closest_points(p.rows(), 3);
+    {
+        pybind11::gil_scoped_release release;
+        mq->ensure_winding_number_tree();
+
+        // Same bounds on squared distances as igl::signed_distance, see signed_distance for how band works
+        const double max_abs = std::max(std::abs(lower_bound), std::abs(upper_bound));
+        const double up_sqr_d = max_abs * max_abs;
+        const double low_sqr_d = std::pow(std::max(max_abs - (upper_bound - lower_bound), 0.0), 2.0);
+        const bool band_limited = band * band < up_sqr_d;
+        const double search_sqr_d = band_limited ? band * band : up_sqr_d;
+
+        #pragma omp parallel for schedule(dynamic, 1024)
+        for (std::ptrdiff_t i = 0; i < p.rows(); i += 1) {
+            const MeshQuery::RowVector3 q(p(i, 0), p(i, 1), p(i, 2));
+            MeshQuery::RowVector3 c;
+            int fi = -1;
+            const double sqr_dist = mq->squared_distance(q, low_sqr_d, search_sqr_d, fi, c);
+            if (sqr_dist < low_sqr_d || (sqr_dist >= search_sqr_d && !band_limited)) {
+                sdists(i) = std::numeric_limits<Scalar>::quiet_NaN();
+                face_idxs(i) = -1;
+                closest_points.row(i).setZero();
+                continue;
+            }
+
+            const double s = mq->in_bounding_box(q) ? 1.0 - 2.0 * std::abs(mq->winding_number(q)) : 1.0;
+            if (sqr_dist >= search_sqr_d) {
+                sdists(i) = Scalar(s * band);
+                face_idxs(i) = -1;
+                closest_points.row(i).setConstant(std::numeric_limits<Scalar>::quiet_NaN());
+            } else {
+                sdists(i) = Scalar(s * std::sqrt(sqr_dist));
+                face_idxs(i) = fi;
+                closest_points.row(i) = c.template cast<Scalar>();
+            }
+        }
+    }
+
+    return std::make_tuple(npe::move(sdists), npe::move(face_idxs), npe::move(closest_points));
+}
+npe_end_code()
+
+
+npe_function(mesh_query_winding_number_internal)
+npe_arg(mq, std::shared_ptr<MeshQuery>)
+npe_arg(p, dense_float, dense_double)
+npe_begin_code()
+{
+    validate_mesh_query(*mq);
+    validate_point_cloud(p);
+
+    typedef npe_Scalar_p Scalar;
+    Eigen::Matrix<Scalar, Eigen::Dynamic, 1> winding_numbers(p.rows());
+    {
+        pybind11::gil_scoped_release release;
+        mq->ensure_winding_number_tree();
+
+        #pragma omp parallel for
+        for (std::ptrdiff_t i = 0; i < p.rows(); i += 1) {
+            winding_numbers(i) = Scalar(mq->winding_number(MeshQuery::RowVector3(p(i, 0), p(i, 1), p(i, 2))));
+        }
+    }
+
+    return npe::move(winding_numbers);
+}
+npe_end_code()
+
+
+npe_function(mesh_query_ray_intersect_internal)
+npe_arg(mq, std::shared_ptr<MeshQuery>)
+npe_arg(ray_o, dense_float, dense_double)
+npe_arg(ray_d, npe_matches(ray_o))
+npe_begin_code()
+{
+    validate_mesh_query(*mq);
+    validate_point_cloud(ray_o);
+    if (ray_d.cols() != 3 || (ray_d.rows() != ray_o.rows() && ray_d.rows() != 1)) {
+        throw pybind11::value_error("Invalid ray directions must have shape (#rays, 3) or (1, 3) where ray origins "
+                                    "have shape (#rays, 3). Got ray_d.shape = (" + std::to_string(ray_d.rows()) +
+                                    ", " + std::to_string(ray_d.cols()) + ").");
+    }
+
+    typedef npe_Scalar_ray_o Scalar;
+    Eigen::Matrix<Scalar, Eigen::Dynamic, 1> ts(ray_o.rows());
+    Eigen::Matrix<std::int64_t, Eigen::Dynamic, 1> face_idxs(ray_o.rows());
+    Eigen::Matrix<Scalar, Eigen::Dynamic, 3, Eigen::RowMajor> barycentric_coords(ray_o.rows(), 3);
+    {
+        pybind11::gil_scoped_release release;
+
+        const bool broadcast_dir = ray_d.rows() == 1;
+        #pragma omp parallel for
+        for (std::ptrdiff_t i = 0; i < ray_o.rows(); i += 1) {
+            const std::ptrdiff_t di = broadcast_dir ? 0 : i;
+            const MeshQuery::RowVector3 origin(ray_o(i, 0), ray_o(i, 1), ray_o(i, 2));
+            const MeshQuery::RowVector3 dir(ray_d(di, 0), ray_d(di, 1), ray_d(di, 2));
+            igl::Hit hit;
+            if (mq->intersect_ray(origin, dir, hit)) {
+                ts(i) = Scalar(hit.t);
+                face_idxs(i) = hit.id;
+                barycentric_coords.row(i) << Scalar(1.0f - hit.u - hit.v), Scalar(hit.u), Scalar(hit.v);
+            } else {
+                ts(i) = std::numeric_limits<Scalar>::infinity();
+                face_idxs(i) = -1;
+                barycentric_coords.row(i).setZero();
+            }
+        }
+    }
+
+    return std::make_tuple(npe::move(ts), npe::move(face_idxs), npe::move(barycentric_coords));
+}
+npe_end_code()
@@ -5,7 +5,10 @@
 #include <igl/writePLY.h>
 #include <igl/writeOFF.h>
 
+#include <cstdio>
+#include <mutex>
 #include <unordered_map>
+#include <unordered_set>
 
 #include <vcg/complex/complex.h>
 #include <wrap/io_trimesh/import.h>
@@ -47,41 +50,249 @@ typedef CMesh::FaceContainer FaceContainer;
 typedef CMesh::ScalarType ScalarType;
 
 
-bool assert_shape_and_dtype(const pybind11::array& arr, std::string name, pybind11::dtype dtype,
-                            const std::vector<ssize_t>& shape) {
-    if (!arr.dtype().is(dtype)) {
-        throw pybind11::value_error("Invalid dtype for argument '" + name + "'. Expected '" +
-                                    dtype.kind() + "' but got '" + arr.dtype().kind() + "'.");
+/*
+ * A read-only view of an optional per-vertex or per-face attribute passed in from Python.
+ *
+ * Attributes can be float32 or float64 arrays (or int32 and int64 arrays for integral attributes) with any strides,
+ * so write_mesh_vcg can read them in place without the caller converting or copying them first. None and empty
+ * arrays are treated as missing attributes.
+ */
+class AttributeArray {
+    enum Type { FLOAT32, FLOAT64, INT32, INT64 };
+
+    pybind11::array arr_;
+    const char* data_ = nullptr;
+    ssize_t strides_[3] = {0, 0, 0};
+    Type type_ = FLOAT64;
+    bool present_ = false;
+
+public:
+    /*
+     * Check obj is a valid attribute called name. If it is present, it must have shape (rows, shape[0], ...) where
+     * the last dimension can also be alt_last_dim (e.g. to allow both RGB and RGBA colors).
+     */
+    AttributeArray(const pybind11::object& obj, const std::string& name, bool integral, ssize_t rows,
+                   const std::vector<ssize_t>& shape, ssize_t alt_last_dim = -1) {
+        if (obj.is_none()) {
+            return;
+        }
+        arr_ = pybind11::array::ensure(obj);
+        if (!arr_) {
+            throw pybind11::value_error("Invalid argument '" + name + "', must be a numpy array or None.");
+        }
+        if (arr_.size() == 0) {
+            return;
+        }
+
+        const char kind = arr_.dtype().kind();
+        const ssize_t itemsize = arr_.dtype().itemsize();
+        if (!integral && kind == 'f' && itemsize == 4) {
+            type_ = FLOAT32;
+        } else if (!integral && kind == 'f' && itemsize == 8) {
+            type_ = FLOAT64;
+        } else if (integral && kind == 'i' && itemsize == 4) {
+            type_ = INT32;
+        } else if (integral && kind == 'i' && itemsize == 8) {
+            type_ = INT64;
+        } else {
+            throw pybind11::value_error("Invalid dtype for argument '" + name + "'. Expected " +
+                                        std::string(integral ? "int32 or int64" : "float32 or float64") +
+                                        " but got '" + std::string(pybind11::str(arr_.dtype())) + "'.");
+        }
+        if (!arr_.dtype().attr("isnative").cast<bool>()) {
+            arr_ = arr_.attr("astype")(arr_.dtype().attr("newbyteorder")("="));
+        }
+
+        if (arr_.ndim() != ssize_t(shape.size()) + 1) {
+            throw pybind11::value_error("Invalid number of dimensions for argument '" + name + "'. Expected " +
+                                        std::to_string(shape.size() + 1) + " but got " +
+                                        std::to_string(arr_.ndim()) + ".");
+        }
+        if (rows >= 0 && arr_.shape(0) != rows) {
+            throw pybind11::value_error("Invalid shape for argument '" + name + "' at dimension 0. Expected " +
+                                        std::to_string(rows) + " but got " + std::to_string(arr_.shape(0)) + ".");
+        }
+        for (std::size_t i = 0; i < shape.size(); i++) {
+            const ssize_t dim = arr_.shape(i + 1);
+            const bool is_last = i + 1 == shape.size();
+            if (dim != shape[i] && !(is_last && dim == alt_last_dim)) {
+                throw pybind11::value_error("Invalid shape for argument '" + name + "' at dimension " +
+                                            std::to_string(i + 1) + ". Expected " + std::to_string(shape[i]) +
+                                            (is_last && alt_last_dim >= 0 ? " or " + std::to_string(alt_last_dim) :
+                                                                            std::string("")) +
+                                            " but got " + std::to_string(dim) + ".");
+            }
+        }
+
+        data_ = static_cast<const char*>(arr_.data());
+        for (ssize_t i = 0; i < arr_.ndim(); i++) {
+            strides_[i] = arr_.strides(i);
+        }
+        present_ = true;
     }
-    if (shape.size() != arr.ndim()) {
-        throw pybind11::value_error("Invalid number of dimensions for argument '" + name + "'. Expected " +
-                                    std::to_string(shape.size()) + " but got " + std::to_string(arr.ndim()) + ".");
+
+    bool present() const {
+        return present_;
+    }
+
+    ssize_t rows() const {
+        return present_ ? arr_.shape(0) : 0;
     }
-    bool nonempty = true;
-    for (int i = 0; i < shape.size(); i++) {
-        if (arr.shape()[i] <= 0) {
-            nonempty = false;
+
+    ssize_t last_dim() const {
+        return present_ ? arr_.shape(arr_.ndim() - 1) : 0;
+    }
+
+    template <typename T>
+    T get(ssize_t i, ssize_t j = 0, ssize_t k = 0) const {
+        const char* ptr = data_ + i * strides_[0] + j * strides_[1] + k * strides_[2];
+        switch (type_) {
+            case FLOAT32: return T(*reinterpret_cast<const float*>(ptr));
+            case FLOAT64: return T(*reinterpret_cast<const double*>(ptr));
+            case INT32: return T(*reinterpret_cast<const std::int32_t*>(ptr));
+            default: return T(*reinterpret_cast<const std::int64_t*>(ptr));
         }
-        if (shape[i] < 0) {
-            if (arr.shape()[i] == 0) {
-                continue;
-            } else if (arr.shape()[i] == -shape[i]) {
-                continue;
-            }
-        } else if (shape[i] == arr.shape()[i]) {
-            continue;
+    }
+
+    /*
+     * Read an RGB or RGBA color in [0, 1] (with alpha = 1 if it is RGB) as 8 bit RGBA
+     */
+    vcg::Color4b color(ssize_t i, ssize_t j = -1) const {
+        unsigned char c[4] = {255, 255, 255, 255};
+        for (int k = 0; k < last_dim(); k++) {
+            c[k] = (unsigned char) ((j < 0 ? get<double>(i, k) : get<double>(i, j, k)) * 255.0);
         }
+        return vcg::Color4b(c[0], c[1], c[2], c[3]);
+    }
+};
+
+/*
+ * The mesh file formats VCG can read, which are dispatched to the per-format importers
+ */
+enum class MeshFormat { PLY, OBJ, OFF, STL, VMI, UNKNOWN };
+
+MeshFormat mesh_format(const std::string& filename) {
+    typedef tri::io::Importer<CMesh> Importer;
+    if (Importer::FileExtension(filename, "ply")) {
+        return MeshFormat::PLY;
+    } else if (Importer::FileExtension(filename, "obj")) {
+        return MeshFormat::OBJ;
+    } else if (Importer::FileExtension(filename, "off")) {
+        return MeshFormat::OFF;
+    } else if (Importer::FileExtension(filename, "stl")) {
+        return MeshFormat::STL;
+    } else if (Importer::FileExtension(filename, "vmi")) {
+        return MeshFormat::VMI;
+    }
+    return MeshFormat::UNKNOWN;
+}
+
+/*
+ * Load the mesh stored in filename into m and set mask to the attributes stored in the file.
+ *
+ * Unlike vcg::tri::io::Importer, this doesn't touch any global state (the working directory or the importer's record
+ * of the last file type) so it can be called from several threads at once without holding the GIL. The only importer
+ * which keeps its parsing state in statics (VMI) is serialized with a mutex. Relative material libraries in OBJ files
+ * are resolved against base_dir. Returns the VCG error code and sets error_critical if it is nonzero (see
+ * mesh_error_message for the message).
+ */
+int open_mesh_vcg(CMesh& m, const std::string& filename, MeshFormat format, const std::string& base_dir, int& mask,
+                  bool& error_critical) {
+    const char* fname = filename.c_str();
+
+    int err = 0;
+    switch (format) {
+    case MeshFormat::PLY:
+        tri::io::ImporterPLY<CMesh>::LoadMask(fname, mask);
+        err = tri::io::ImporterPLY<CMesh>::Open(m, fname);
+        error_critical = tri::io::ImporterPLY<CMesh>::ErrorCritical(err);
+        break;
+    case MeshFormat::OBJ: {
+        tri::io::ImporterOBJ<CMesh>::Info oi;
+        oi.materialDir = base_dir;
+        tri::io::ImporterOBJ<CMesh>::LoadMask(fname, oi);
+        mask = oi.mask;
+        err = tri::io::ImporterOBJ<CMesh>::Open(m, fname, oi);  // Reuses the mask in oi instead of reparsing
+        error_critical = tri::io::ImporterOBJ<CMesh>::ErrorCritical(err);
+        break;
+    }
+    case MeshFormat::OFF:
+        mask = tri::io::Mask::IOM_VERTCOORD | tri::io::Mask::IOM_FACEINDEX;
+        tri::io::ImporterOFF<CMesh>::LoadMask(fname, mask);
+        err = tri::io::ImporterOFF<CMesh>::Open(m, fname);
+        error_critical = err > 0;
+        break;
+    case MeshFormat::STL:
+        mask = tri::io::Mask::IOM_VERTCOORD | tri::io::Mask::IOM_FACEINDEX;
+        // ImporterSTL::LoadMask doesn't check that the file exists, so leave missing files to Open to report
+        if (std::FILE* fp = std::fopen(fname, "rb")) {
+            std::fclose(fp);
+            tri::io::ImporterSTL<CMesh>::LoadMask(fname, mask);
+        }
+        err = tri::io::ImporterSTL<CMesh>::Open(m, fname, mask);
+        error_critical = err > 0;
+        break;
+    case MeshFormat::VMI: {
+        static std::mutex vmi_mutex;
+        std::lock_guard<std::mutex> lock(vmi_mutex);
+        err = tri::io::ImporterVMI<CMesh>::Open(m, fname, mask);
+        error_critical = err != 0;
+        break;
+    }
+    default:
+        err = 1;
+        error_critical = true;
+        break;
+    }
+
+    return err;
+}
 
-        throw pybind11::value_error("Invalid  shape for argument '" + name + "' at dimension " +
-                                    std::to_string(i) + ". Expected " + std::to_string(shape[i]) +
-                                    " but got " + std::to_string(arr.shape()[i]) + ".");
+/*
+ * The message for a nonzero error code returned by open_mesh_vcg. Some importers fill their tables of messages lazily
+ * in function statics, so this must be called while holding the GIL.
+ */
+std::string mesh_error_message(MeshFormat format, int err) {
+    switch (format) {
+    case MeshFormat::PLY:
+        return tri::io::ImporterPLY<CMesh>::ErrorMsg(err);
+    case MeshFormat::OBJ:
+        return tri::io::ImporterOBJ<CMesh>::ErrorMsg(err);
+    case MeshFormat::OFF:
+        return tri::io::ImporterOFF<CMesh>::ErrorMsg(err);
+    case MeshFormat::STL:
+        return tri::io::ImporterSTL<CMesh>::ErrorMsg(err);
+    case MeshFormat::VMI:
+        return tri::io::ImporterVMI<CMesh>::ErrorMsg(err);
+    default:
+        return "Unknown file type";
     }
+}
 
-    return nonempty;
+/*
+ * Check a list of attribute names (as used by load_triangle_mesh on the Python side) and convert it to a set
+ */
+std::unordered_set<std::string> validate_mesh_attributes(const std::vector<std::string>& attributes) {
+    static const std::unordered_set<std::string> valid_attributes = {
+        "v", "vn", "vt", "vti", "vc", "vq", "vr", "vflags",
+        "f", "fn", "fc", "fq", "fflags",
+        "wc", "wn", "wt", "wti"
+    };
+    for (const std::string& name : attributes) {
+        if (valid_attributes.count(name) == 0) {
+            throw pybind11::value_error("Invalid mesh attribute '" + name + "'.");
+        }
+    }
+    return std::unordered_set<std::string>(attributes.begin(), attributes.end());
 }
 
+/*
+ * Copy the attributes of m into numpy arrays. Only attributes which are both in the file (mask) and requested
+ * (attributes) are allocated and copied, everything else is returned as an empty array.
+ */
 template <typename Scalar>
-void load_mesh_vcg(CMesh& m, int mask, std::unordered_map<std::string, pybind11::object>& ret) {
+void load_mesh_vcg(CMesh& m, int mask, const std::unordered_set<std::string>& attributes,
+                   std::unordered_map<std::string, pybind11::object>& ret) {
     typedef Eigen::Matrix<Scalar, Eigen::Dynamic, 3*2, Eigen::RowMajor> FMatrix32;
     typedef Eigen::Matrix<Scalar, Eigen::Dynamic, 3*3, Eigen::RowMajor> FMatrix33;
     typedef Eigen::Matrix<Scalar, Eigen::Dynamic, 3*4, Eigen::RowMajor> FMatrix34;
@@ -114,24 +325,28 @@ void load_mesh_vcg(CMesh& m, int mask, std::unordered_map<std::string, pybind11:
     IMatrix3 wedge_texindex;
     FMatrix33 wedge_normals;
 
-    const bool has_v_coord = true;  // We always assume there are spatial vertex coordinates
-    const bool has_v_flags = mask & tri::io::Mask::IOM_VERTFLAGS;
-    const bool has_v_color = mask & tri::io::Mask::IOM_VERTCOLOR;
-    const bool has_v_quality = mask & tri::io::Mask::IOM_VERTQUALITY;
-    const bool has_v_normal = mask & tri::io::Mask::IOM_VERTNORMAL;
-    const bool has_v_texcoord = mask & tri::io::Mask::IOM_VERTTEXCOORD;
-    const bool has_v_radius = mask & tri::io::Mask::IOM_VERTRADIUS;
-
-    const bool has_f_index = true; //mask & tri::io::Mask::IOM_FACEINDEX;
-    const bool has_f_flags = mask & tri::io::Mask::IOM_FACEFLAGS;
-    const bool has_f_color = mask & tri::io::Mask::IOM_FACECOLOR;
-    const bool has_f_quality = mask & tri::io::Mask::IOM_FACEQUALITY;
-    const bool has_f_normal = mask & tri::io::Mask::IOM_FACENORMAL;
-
-    const bool has_w_color = mask & vcg::tri::io::Mask::IOM_WEDGCOLOR;
-    const bool has_w_texcoord = mask & vcg::tri::io::Mask::IOM_WEDGTEXCOORD;
-    const bool has_w_texindex = mask & vcg::tri::io::Mask::IOM_WEDGTEXMULTI;
-    const bool has_w_normal = mask & vcg::tri::io::Mask::IOM_WEDGNORMAL;
+    auto requested = [&](const char* name) { return attributes.count(name) > 0; };
+    const bool has_textures = m.textures.size() > 0 || m.normalmaps.size() > 0;
+
+    const bool has_v_coord = requested("v");  // We always assume there are spatial vertex coordinates in the file
+    const bool has_v_flags = (mask & tri::io::Mask::IOM_VERTFLAGS) && requested("vflags");
+    const bool has_v_color = (mask & tri::io::Mask::IOM_VERTCOLOR) && requested("vc");
+    const bool has_v_quality = (mask & tri::io::Mask::IOM_VERTQUALITY) && requested("vq");
+    const bool has_v_normal = (mask & tri::io::Mask::IOM_VERTNORMAL) && requested("vn");
+    const bool has_v_texcoord = (mask & tri::io::Mask::IOM_VERTTEXCOORD) && requested("vt");
+    const bool has_v_texindex = (mask & tri::io::Mask::IOM_VERTTEXCOORD) && has_textures && requested("vti");
+    const bool has_v_radius = (mask & tri::io::Mask::IOM_VERTRADIUS) && requested("vr");
+
+    const bool has_f_index = requested("f"); //mask & tri::io::Mask::IOM_FACEINDEX;
+    const bool has_f_flags = (mask & tri::io::Mask::IOM_FACEFLAGS) && requested("fflags");
+    const bool has_f_color = (mask & tri::io::Mask::IOM_FACECOLOR) && requested("fc");
+    const bool has_f_quality = (mask & tri::io::Mask::IOM_FACEQUALITY) && requested("fq");
+    const bool has_f_normal = (mask & tri::io::Mask::IOM_FACENORMAL) && requested("fn");
+
+    const bool has_w_color = (mask & vcg::tri::io::Mask::IOM_WEDGCOLOR) && requested("wc");
+    const bool has_w_texcoord = (mask & vcg::tri::io::Mask::IOM_WEDGTEXCOORD) && requested("wt");
+    const bool has_w_texindex = (mask & vcg::tri::io::Mask::IOM_WEDGTEXCOORD) && has_textures && requested("wti");
+    const bool has_w_normal = (mask & vcg::tri::io::Mask::IOM_WEDGNORMAL) && requested("wn");
 
     {
         if (has_v_coord) {
@@ -157,9 +372,9 @@ void load_mesh_vcg(CMesh& m, int mask, std::unordered_map<std::string, pybind11:
         if (has_v_texcoord) {
 //            std::cout << "has vertex texcoords" << std::endl;
             vertex_texcoord.resize(num_vertices, 2);
-            if (m.textures.size() > 0 || m.normalmaps.size() > 0) {
-                vertex_texindex.resize(num_vertices, 1);
-            }
+        }
+        if (has_v_texindex) {
+            vertex_texindex.resize(num_vertices, 1);
         }
         if (has_v_radius) {
 //            std::cout << "has vertex radius" << std::endl;
@@ -200,9 +415,9 @@ void load_mesh_vcg(CMesh& m, int mask, std::unordered_map<std::string, pybind11:
         if (has_w_texcoord) {
 //            std::cout << "has wedge texcoord" << std::endl;
             wedge_texcoords.resize(num_faces, 3 * 2);
-            if (m.textures.size() > 0 || m.normalmaps.size() > 0) {
-                wedge_texindex.resize(num_faces, 3);
-            }
+        }
+        if (has_w_texindex) {
+            wedge_texindex.resize(num_faces, 3);
         }
         if (has_w_normal) {
 //            std::cout << "has wedge normal" << std::endl;
@@ -230,13 +445,13 @@ void load_mesh_vcg(CMesh& m, int mask, std::unordered_map<std::string, pybind11:
         if (has_v_texcoord) {
             vertex_texcoord(vcount, 0) = it->cT().U();
             vertex_texcoord(vcount, 1) = it->cT().V();
-            if (m.textures.size() > 0) {
-                int texindex = int(it->cT().N());
-                if (texindex < 0 || texindex >= m.textures.size()) {
-                    texindex = -1;
-                }
-                vertex_texindex(vcount, 0) = texindex;
+        }
+        if (has_v_texindex) {
+            int texindex = int(it->cT().N());
+            if (texindex < 0 || texindex >= m.textures.size()) {
+                texindex = -1;
             }
+            vertex_texindex(vcount, 0) = texindex;
         }
         if (has_v_radius) {
             vertex_radius(vcount, 0) = it->cR();
@@ -274,13 +489,15 @@ void load_mesh_vcg(CMesh& m, int mask, std::unordered_map<std::string, pybind11:
             for (int i = 0; i < 3; i++) {
                 wedge_texcoords(fcount, i + 0) = it->cWT(i).U();
                 wedge_texcoords(fcount, i + 1) = it->cWT(i).V();
-                if (m.textures.size() > 0) {
-                    int texindex = int(it->cWT(i).N());
-                    if (texindex < 0 || texindex >= m.textures.size()) {
-                        texindex = -1;
-                    }
-                    wedge_texindex(fcount, i) = texindex;
+            }
+        }
+        if (has_w_texindex) {
+            for (int i = 0; i < 3; i++) {
+                int texindex = int(it->cWT(i).N());
+                if (texindex < 0 || texindex >= m.textures.size()) {
+                    texindex = -1;
                 }
+                wedge_texindex(fcount, i) = texindex;
             }
         }
         if (has_w_normal) {
@@ -349,198 +566,211 @@ void load_mesh_vcg(CMesh& m, int mask, std::unordered_map<std::string, pybind11:
 }
 
 
-template <typename ScalarF, typename ScalarI>
-void write_mesh_vcg(std::string filename, pybind11::array& v_positions, pybind11::array& v_normals,
-                    pybind11::array& v_texcoords, pybind11::array& v_colors, pybind11::array& v_quality,
-                    pybind11::array& v_radius, pybind11::array& v_texids, pybind11::array& v_flags,
-                    pybind11::array& f_vertex_ids, pybind11::array& f_normals, pybind11::array& f_colors,
-                    pybind11::array& f_quality, pybind11::array& f_flags,
-                    pybind11::array& w_colors, pybind11::array& w_normals, pybind11::array& w_texcoords,
-                    pybind11::array& w_texids,
-                    std::vector<std::string>& textures, std::vector<std::string>& normal_maps,
-                    pybind11::dtype dtype_f, pybind11::dtype dtype_i) {
-
-    ssize_t num_vertices = v_positions.shape()[0];
-    ssize_t num_faces = f_vertex_ids.shape()[0];
-
-    bool has_v_positions = assert_shape_and_dtype(v_positions, "v_positions", dtype_f, {-num_vertices, 3});
-    bool has_v_normals = assert_shape_and_dtype(v_normals, "v_normals", dtype_f, {-num_vertices, 3});
-    bool has_v_texcoords = assert_shape_and_dtype(v_texcoords, "v_texcoords", dtype_f, {-num_vertices, 2});
-    bool has_v_colors = assert_shape_and_dtype(v_colors, "v_colors", dtype_f, {-num_vertices, 4});
-    bool has_v_quality = assert_shape_and_dtype(v_quality, "v_quality", dtype_f, {-num_vertices});
-    bool has_v_radius = assert_shape_and_dtype(v_radius, "v_radius", dtype_f, {-num_vertices});
-    bool has_v_texids = assert_shape_and_dtype(v_texids, "v_texids", dtype_i, {-num_vertices});
-    bool has_v_flags = assert_shape_and_dtype(v_flags, "v_flags", dtype_i, {-num_vertices});
-
-    bool has_f_vertex_ids = assert_shape_and_dtype(f_vertex_ids, "f_vertex_ids", dtype_i, {-num_faces, 3});
-    bool has_f_normals = assert_shape_and_dtype(f_normals, "f_normals", dtype_f, {-num_faces, 3});
-    bool has_f_colors = assert_shape_and_dtype(f_colors, "f_colors", dtype_f, {-num_faces, 4});
-    bool has_f_quality = assert_shape_and_dtype(f_quality, "f_quality", dtype_f, {-num_faces});
-    bool has_f_flags = assert_shape_and_dtype(f_flags, "f_flags", dtype_i, {-num_faces});
-
-    bool has_w_normals = assert_shape_and_dtype(w_normals, "w_normals", dtype_f, {-num_faces, 3, 3});
-    bool has_w_colors = assert_shape_and_dtype(w_colors, "w_colors", dtype_f, {-num_faces, 3, 4});
-    bool has_w_texcoords = assert_shape_and_dtype(w_texcoords, "w_texcoords", dtype_f, {-num_faces, 3, 2});
-    bool has_w_texids = assert_shape_and_dtype(w_texids, "w_texids", dtype_i, {-num_faces, 3});
+void write_mesh_vcg(const std::string& filename,
+                    const pybind11::object& v_positions_obj, const pybind11::object& v_normals_obj,
+                    const pybind11::object& v_texcoords_obj, const pybind11::object& v_colors_obj,
+                    const pybind11::object& v_quality_obj, const pybind11::object& v_radius_obj,
+                    const pybind11::object& v_texids_obj, const pybind11::object& v_flags_obj,
+                    const pybind11::object& f_vertex_ids_obj, const pybind11::object& f_normals_obj,
+                    const pybind11::object& f_colors_obj, const pybind11::object& f_quality_obj,
+                    const pybind11::object& f_flags_obj,
+                    const pybind11::object& w_colors_obj, const pybind11::object& w_normals_obj,
+                    const pybind11::object& w_texcoords_obj, const pybind11::object& w_texids_obj,
+                    const std::vector<std::string>& textures, const std::vector<std::string>& normal_maps) {
+
+    const AttributeArray v_positions(v_positions_obj, "v_positions", false, -1, {3});
+    const AttributeArray f_vertex_ids(f_vertex_ids_obj, "f_vertex_ids", true, -1, {3});
+    const ssize_t num_vertices = v_positions.rows();
+    const ssize_t num_faces = f_vertex_ids.rows();
+
+    const AttributeArray v_normals(v_normals_obj, "v_normals", false, num_vertices, {3});
+    const AttributeArray v_texcoords(v_texcoords_obj, "v_texcoords", false, num_vertices, {2});
+    const AttributeArray v_colors(v_colors_obj, "v_colors", false, num_vertices, {4}, 3);
+    const AttributeArray v_quality(v_quality_obj, "v_quality", false, num_vertices, {});
+    const AttributeArray v_radius(v_radius_obj, "v_radius", false, num_vertices, {});
+    const AttributeArray v_texids(v_texids_obj, "v_texids", true, num_vertices, {});
+    const AttributeArray v_flags(v_flags_obj, "v_flags", true, num_vertices, {});
+
+    const AttributeArray f_normals(f_normals_obj, "f_normals", false, num_faces, {3});
+    const AttributeArray f_colors(f_colors_obj, "f_colors", false, num_faces, {4}, 3);
+    const AttributeArray f_quality(f_quality_obj, "f_quality", false, num_faces, {});
+    const AttributeArray f_flags(f_flags_obj, "f_flags", true, num_faces, {});
+
+    const AttributeArray w_normals(w_normals_obj, "w_normals", false, num_faces, {3, 3});
+    const AttributeArray w_colors(w_colors_obj, "w_colors", false, num_faces, {3, 4}, 3);
+    const AttributeArray w_texcoords(w_texcoords_obj, "w_texcoords", false, num_faces, {3, 2});
+    const AttributeArray w_texids(w_texids_obj, "w_texids", true, num_faces, {3});
 
     int mask = tri::io::Mask::IOM_NONE;
-    if (has_v_positions) {
+    if (v_positions.present()) {
         mask |= tri::io::Mask::IOM_VERTCOORD;
     }
-    if (has_v_normals) {
+    if (v_normals.present()) {
         mask |= tri::io::Mask::IOM_VERTNORMAL;
     }
-    if (has_v_texcoords) {
+    if (v_texcoords.present()) {
         mask |= tri::io::Mask::IOM_VERTTEXCOORD;
     }
-    if (has_v_colors) {
+    if (v_colors.present()) {
         mask |= tri::io::Mask::IOM_VERTCOLOR;
     }
-    if (has_v_quality) {
+    if (v_quality.present()) {
         mask |= tri::io::Mask::IOM_VERTQUALITY;
     }
-    if (has_v_radius) {
+    if (v_radius.present()) {
         mask |= tri::io::Mask::IOM_VERTRADIUS;
     }
-    if (has_v_flags) {
+    if (v_flags.present()) {
         mask |= tri::io::Mask::IOM_VERTFLAGS;
     }
 
-    if (has_f_vertex_ids) {
+    if (f_vertex_ids.present()) {
         mask |= tri::io::Mask::IOM_FACEINDEX;
     }
-    if (has_f_normals) {
+    if (f_normals.present()) {
         mask |= tri::io::Mask::IOM_FACENORMAL;
     }
-    if (has_f_colors) {
+    if (f_colors.present()) {
         mask |= tri::io::Mask::IOM_FACECOLOR;
     }
-    if (has_f_quality) {
+    if (f_quality.present()) {
         mask |= tri::io::Mask::IOM_FACEQUALITY;
     }
-    if (has_f_flags) {
+    if (f_flags.present()) {
         mask |= tri::io::Mask::IOM_FACEFLAGS;
     }
 
-    if (has_w_normals) {
+    if (w_normals.present()) {
         mask |= tri::io::Mask::IOM_WEDGNORMAL;
     }
-    if (has_w_colors) {
+    if (w_colors.present()) {
         mask |= tri::io::Mask::IOM_WEDGCOLOR;
     }
-    if (has_w_texcoords) {
+    if (w_texcoords.present()) {
         mask |= tri::io::Mask::IOM_WEDGTEXCOORD;
     }
-    if (has_w_texids) {
+    if (w_texids.present()) {
         mask |= tri::io::Mask::IOM_WEDGTEXMULTI;
     }
 
+    // Everything below only reads from the arrays validated above so we don't need the GIL
+    pybind11::gil_scoped_release release;
 
     CMesh m;
     CMesh::VertexIterator vi = vcg::tri::Allocator<CMesh>::AddVertices(m, num_vertices);
-    for (int i = 0; i < num_vertices; i++) {
-        if (has_v_positions) {
-            vi->P() = CMesh::CoordType(*((ScalarF*)v_positions.data(i, 0)),
-                                       *((ScalarF*)v_positions.data(i, 1)),
-                                       *((ScalarF*)v_positions.data(i, 2)));
-        }
-        if (has_v_normals) {
-            vi->N() = CMesh::VertexType::NormalType(*((ScalarF*)v_normals.data(i, 0)),
-                                                    *((ScalarF*)v_normals.data(i, 1)),
-                                                    *((ScalarF*)v_normals.data(i, 2)));
-        }
-        if (has_v_texcoords) {
-            vi->T() = CMesh::VertexType::TexCoordType(*((ScalarF*)v_texcoords.data(i, 0)),
-                                                      *((ScalarF*)v_texcoords.data(i, 1)));
-            if (has_v_texids) {
-                vi->T().N() = *((ScalarI*)v_texids.data(i));
+    for (ssize_t i = 0; i < num_vertices; i++) {
+        vi->P() = CMesh::CoordType(v_positions.get<double>(i, 0),
+                                   v_positions.get<double>(i, 1),
+                                   v_positions.get<double>(i, 2));
+        if (v_normals.present()) {
+            vi->N() = CMesh::VertexType::NormalType(v_normals.get<double>(i, 0),
+                                                    v_normals.get<double>(i, 1),
+                                                    v_normals.get<double>(i, 2));
+        }
+        if (v_texcoords.present()) {
+            vi->T() = CMesh::VertexType::TexCoordType(v_texcoords.get<double>(i, 0),
+                                                      v_texcoords.get<double>(i, 1));
+            if (v_texids.present()) {
+                vi->T().N() = v_texids.get<short>(i);
             }
         }
-        if (has_v_colors) {
-            vi->C() = CMesh::VertexType::ColorType((unsigned char) (*((ScalarF*)v_colors.data(i, 0)) * 255.0),
-                                                   (unsigned char) (*((ScalarF*)v_colors.data(i, 1)) * 255.0),
-                                                   (unsigned char) (*((ScalarF*)v_colors.data(i, 2)) * 255.0),
-                                                       (unsigned char) (*((ScalarF*)v_colors.data(i, 3)) * 255.0));
+        if (v_colors.present()) {
+            vi->C() = v_colors.color(i);
         }
-        if (has_v_quality) {
-            vi->Q() = CMesh::VertexType::QualityType(*((ScalarF*) v_quality.data(i)));
+        if (v_quality.present()) {
+            vi->Q() = v_quality.get<CMesh::VertexType::QualityType>(i);
         }
-        if (has_v_radius) {
-            vi->R() = CMesh::VertexType::QualityType(*((ScalarF*) v_radius.data(i)));
+        if (v_radius.present()) {
+            vi->R() = v_radius.get<CMesh::VertexType::RadiusType>(i);
         }
-        if (has_v_flags) {
-            vi->Flags() = int(*((ScalarI*) v_flags.data(i)));
+        if (v_flags.present()) {
+            vi->Flags() = v_flags.get<int>(i);
         }
         ++vi;
     }
 
     CMesh::FaceIterator fi = vcg::tri::Allocator<CMesh>::AddFaces(m, num_faces);
-    for (int i = 0; i < num_faces; i++) {
-        if (has_f_vertex_ids) {
-            ScalarI fv1 = *((ScalarI*)f_vertex_ids.data(i, 0));
-            ScalarI fv2 = *((ScalarI*)f_vertex_ids.data(i, 1));
-            ScalarI fv3 = *((ScalarI*)f_vertex_ids.data(i, 2));
-            if (fv1 >= m.vert.size() || fv2 >= m.vert.size() || fv3 >= m.vert.size()) {
-                throw pybind11::value_error("Invalid face (" + std::to_string(fv1) + ", " + std::to_string(fv2) +
-                                            ", " + std::to_string(fv3) + ") at index " + std::to_string(i) +
-                                            " exceeds the number of vertices (" + std::to_string(num_vertices) + ").");
-            }
-
-            fi->V(0) = &(m.vert.at(fv1));
-            fi->V(1) = &(m.vert.at(fv2));
-            fi->V(2) = &(m.vert.at(fv3));
+    for (ssize_t i = 0; i < num_faces; i++) {
+        const std::int64_t fv1 = f_vertex_ids.get<std::int64_t>(i, 0);
+        const std::int64_t fv2 = f_vertex_ids.get<std::int64_t>(i, 1);
+        const std::int64_t fv3 = f_vertex_ids.get<std::int64_t>(i, 2);
+        if (fv1 < 0 || fv2 < 0 || fv3 < 0 || fv1 >= num_vertices || fv2 >= num_vertices || fv3 >= num_vertices) {
+            throw pybind11::value_error("Invalid face (" + std::to_string(fv1) + ", " + std::to_string(fv2) +
+                                        ", " + std::to_string(fv3) + ") at index " + std::to_string(i) +
+                                        " exceeds the number of vertices (" + std::to_string(num_vertices) + ").");
         }
-        if (has_f_normals) {
-            fi->N() = CMesh::FaceType::NormalType(*((ScalarF*)f_normals.data(i, 0)),
-                                                  *((ScalarF*)f_normals.data(i, 1)),
-                                                  *((ScalarF*)f_normals.data(i, 2)));
+        fi->V(0) = &(m.vert[fv1]);
+        fi->V(1) = &(m.vert[fv2]);
+        fi->V(2) = &(m.vert[fv3]);
+
+        if (f_normals.present()) {
+            fi->N() = CMesh::FaceType::NormalType(f_normals.get<double>(i, 0),
+                                                  f_normals.get<double>(i, 1),
+                                                  f_normals.get<double>(i, 2));
         }
-        if (has_f_colors) {
-            fi->C() = CMesh::FaceType::ColorType((unsigned char) (*((ScalarF*)f_colors.data(i, 0)) * 255.0),
-                                                 (unsigned char) (*((ScalarF*)f_colors.data(i, 1)) * 255.0),
-                                                 (unsigned char) (*((ScalarF*)f_colors.data(i, 2)) * 255.0),
-                                                 (unsigned char) (*((ScalarF*)f_colors.data(i, 3)) * 255.0));
+        if (f_colors.present()) {
+            fi->C() = f_colors.color(i);
         }
-        if (has_f_quality) {
-            fi->Q() = CMesh::FaceType::QualityType(*((ScalarF*) f_quality.data(i)));
+        if (f_quality.present()) {
+            fi->Q() = f_quality.get<CMesh::FaceType::QualityType>(i);
         }
-        if (has_f_flags) {
-            fi->Flags() = int(*((ScalarI*) f_flags.data(i)));
+        if (f_flags.present()) {
+            fi->Flags() = f_flags.get<int>(i);
         }
 
-        if (has_w_colors) {
+        if (w_colors.present()) {
             for (int j = 0; j < 3; j++) {
-                fi->WC(j) = CMesh::FaceType::ColorType((unsigned char) (*((ScalarF*)w_colors.data(i, j, 0)) * 255.0),
-                                                       (unsigned char) (*((ScalarF*)w_colors.data(i, j, 1)) * 255.0),
-                                                       (unsigned char) (*((ScalarF*)w_colors.data(i, j, 2)) * 255.0),
-                                                       (unsigned char) (*((ScalarF*)w_colors.data(i, j, 3)) * 255.0));
+                fi->WC(j) = w_colors.color(i, j);
             }
         }
-        if (has_w_texcoords) {
+        if (w_texcoords.present()) {
             for (int j = 0; j < 3; j++) {
-                fi->WT(j) = CMesh::FaceType::TexCoordType(*((ScalarF*)w_texcoords.data(i, j, 0)),
-                                                          *((ScalarF*)w_texcoords.data(i, j, 1)));
-                if (has_w_texids) {
-                    ScalarI texindex = *((ScalarI*)w_texids.data(i, j));
-                    fi->WT(j).N() = texindex;
+                fi->WT(j) = CMesh::FaceType::TexCoordType(w_texcoords.get<double>(i, j, 0),
+                                                          w_texcoords.get<double>(i, j, 1));
+                if (w_texids.present()) {
+                    fi->WT(j).N() = w_texids.get<short>(i, j);
                 }
             }
         }
-        if (has_w_normals) {
+        if (w_normals.present()) {
             for (int j = 0; j < 3; j++) {
-                fi->WN(j) = CMesh::FaceType::NormalType(*((ScalarF*)w_normals.data(i, j, 0)),
-                                                        *((ScalarF*)w_normals.data(i, j, 1)),
-                                                        *((ScalarF*)w_normals.data(i, j, 2)));
+                fi->WN(j) = CMesh::FaceType::NormalType(w_normals.get<double>(i, j, 0),
+                                                        w_normals.get<double>(i, j, 1),
+                                                        w_normals.get<double>(i, j, 2));
             }
         }
 
         ++fi;
     }
 
-    int err = tri::io::Exporter<CMesh>::Save(m, filename.c_str(), mask);
+    // Dispatch to the per-format exporters rather than through tri::io::Exporter, whose static record of the last file
+    // type isn't thread safe. The exporters fill their tables of error messages lazily in function statics, so
+    // messages are only looked up once the GIL is held again.
+    typedef tri::io::Exporter<CMesh> Exporter;
+    const char* fname = filename.c_str();
+    const char* (*error_message)(int) = nullptr;
+    int err = 1;
+    if (Exporter::FileExtension(filename, "ply")) {
+        err = tri::io::ExporterPLY<CMesh>::Save(m, fname, mask);
+        error_message = &tri::io::ExporterPLY<CMesh>::ErrorMsg;
+    } else if (Exporter::FileExtension(filename, "stl")) {
+        err = tri::io::ExporterSTL<CMesh>::Save(m, fname);
+        error_message = &tri::io::ExporterSTL<CMesh>::ErrorMsg;
+    } else if (Exporter::FileExtension(filename, "off")) {
+        err = tri::io::ExporterOFF<CMesh>::Save(m, fname, mask);
+        error_message = &tri::io::ExporterOFF<CMesh>::ErrorMsg;
+    } else if (Exporter::FileExtension(filename, "dxf")) {
+        err = tri::io::ExporterDXF<CMesh>::Save(m, fname);
+        error_message = &tri::io::ExporterDXF<CMesh>::ErrorMsg;
+    } else if (Exporter::FileExtension(filename, "obj")) {
+        err = tri::io::ExporterOBJ<CMesh>::Save(m, fname, mask);
+        error_message = &tri::io::ExporterOBJ<CMesh>::ErrorMsg;
+    }
+
     if (err) {
-        throw pybind11::value_error("Error during loading " + filename + ": '" +
-                                    tri::io::Exporter<CMesh>::ErrorMsg(err) + "'");
+        pybind11::gil_scoped_acquire acquire;
+        throw pybind11::value_error("Error during saving " + filename + ": '" +
+                                    (error_message ? error_message(err) : "Unknown type") + "'");
     }
 }
 
@@ -555,36 +785,46 @@ Load a mesh
 npe_function(load_mesh_internal)
 npe_doc(ds_load_mesh)
 npe_arg(filename, std::string)
+npe_arg(base_dir, std::string)
+npe_arg(attributes, std::vector<std::string>)
 npe_default_arg(dtype, npe::dtype, "float64")
 npe_begin_code()
 {
+    const std::unordered_set<std::string> requested_attributes = validate_mesh_attributes(attributes);
+    const bool is_double = dtype.equal(npe::dtype("float64"));
+    if (!is_double && !dtype.equal(npe::dtype("float32"))) {
+        throw pybind11::value_error("Invalid dtype. Must be one of float32 or float64");
+    }
+
     CMesh m;
+    const MeshFormat format = mesh_format(filename);
     int mask = 0;
-    tri::io::Importer<CMesh>::LoadMask(filename.c_str(), mask);
+    int err = 0;
+    bool error_critical = false;
+    {
+        pybind11::gil_scoped_release release;
+        err = open_mesh_vcg(m, filename, format, base_dir, mask, error_critical);
+    }
 
-    int err = tri::io::Importer<CMesh>::Open(m, filename.c_str());
     if (err) {
-        if(tri::io::Importer<CMesh>::ErrorCritical(err)) {
-            throw pybind11::value_error("Error during loading " + filename + ": '" + tri::io::Importer<CMesh>::ErrorMsg(err) + "'");
-        } else{
+        const std::string error_message = mesh_error_message(format, err);
+        if (error_critical) {
+            throw pybind11::value_error("Error during loading " + filename + ": '" + error_message + "'");
+        } else {
             std::string warning_str = "Noncritical error (" + std::to_string(err) + ") during loading " +
-                    filename + ": '" + tri::io::Importer<CMesh>::ErrorMsg(err) + "'";
+                    filename + ": '" + error_message + "'";
             runtime_warning(warning_str);
         }
     }
 
     std::unordered_map<std::string, pybind11::object> ret;
-    if (dtype.equal(npe::dtype("float64"))) {
-        load_mesh_vcg<double>(m, mask, ret);
-    } else if (dtype.equal(npe::dtype("float32"))) {
-        load_mesh_vcg<float>(m, mask, ret);
-    } else{
-        throw pybind11::value_error("Invalid dtype. Must be one of float32 or float64");
+    if (is_double) {
+        load_mesh_vcg<double>(m, mask, requested_attributes, ret);
+    } else {
+        load_mesh_vcg<float>(m, mask, requested_attributes, ret);
     }
 
     return ret;
-
-
 }
 npe_end_code()
 
@@ -597,35 +837,32 @@ npe_function(save_mesh_internal)
 npe_doc(ds_save_mesh)
 npe_arg(filename, std::string)
 
-npe_arg(v_positions, pybind11::array)
-npe_arg(v_normals, pybind11::array)
-npe_arg(v_texcoords, pybind11::array)
-npe_arg(v_colors, pybind11::array)
-npe_arg(v_quality, pybind11::array)
-npe_arg(v_radius, pybind11::array)
-npe_arg(v_texids, pybind11::array)
-npe_arg(v_flags, pybind11::array)
-
-npe_arg(f_vertex_ids, pybind11::array)
-npe_arg(f_normals, pybind11::array)
-npe_arg(f_colors, pybind11::array)
-npe_arg(f_quality, pybind11::array)
-npe_arg(f_flags, pybind11::array)
-
-npe_arg(w_colors, pybind11::array)
-npe_arg(w_normals, pybind11::array)
-npe_arg(w_texcoords, pybind11::array)
-npe_arg(w_texids, pybind11::array)
+npe_arg(v_positions, pybind11::object)
+npe_arg(v_normals, pybind11::object)
+npe_arg(v_texcoords, pybind11::object)
+npe_arg(v_colors, pybind11::object)
+npe_arg(v_quality, pybind11::object)
+npe_arg(v_radius, pybind11::object)
+npe_arg(v_texids, pybind11::object)
+npe_arg(v_flags, pybind11::object)
+
+npe_arg(f_vertex_ids, pybind11::object)
+npe_arg(f_normals, pybind11::object)
+npe_arg(f_colors, pybind11::object)
+npe_arg(f_quality, pybind11::object)
+npe_arg(f_flags, pybind11::object)
+
+npe_arg(w_colors, pybind11::object)
+npe_arg(w_normals, pybind11::object)
+npe_arg(w_texcoords, pybind11::object)
+npe_arg(w_texids, pybind11::object)
 
 npe_arg(textures, std::vector<std::string>)
 npe_arg(normal_maps, std::vector<std::string>)
 
-npe_arg(dtype_f, npe::dtype)
-npe_arg(dtype_i, npe::dtype)
-
 npe_begin_code()
 {
-    write_mesh_vcg<double, int>(filename,
+    write_mesh_vcg(filename,
                    v_positions,
                    v_normals,
                    v_texcoords,
@@ -644,8 +881,6 @@ npe_begin_code()
                    w_texcoords,
                    w_texids,
                    textures,
-                   normal_maps,
-                   dtype_f,
-                   dtype_i);
+                   normal_maps);
 }
 npe_end_code()
\ No newline at end of file
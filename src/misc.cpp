@@ -1,206 +1,596 @@
-//
-// FIXME: This function is not publically exposed.
-//
 #include <npe.h>
 #include <npe_typedefs.h>
-#include "common.h"
+
+#include <algorithm>
+#include <array>
+#include <cstdint>
+#include <initializer_list>
+#include <limits>
+#include <type_traits>
 #include <vector>
 #include <tuple>
 
+#include "common.h"
 
-const char* ds_voxel_mesh = R"igl_Qu8mg5v7(
-Given a 3D grid of voxels representing an indicator function
-(<= 0 meaning outside and > 0 meaning inside), construct a
-triangular mesh of the boundary cells
 
-Parameters
-----------
-data: Flat list of voxel data
-nx: Number of voxels in the x axis
-ny: Number of voxels in the y axis
-nz: Number of voxels in the z axis
+namespace {
 
-Returns
--------
-v : array of shape [n, 3] of n vertices for the mesh
-f : array of shape [m, 3] of m faces for the mesh
+// libigl's marching cubes lookup tables (aiCubeEdgeFlags, a2eConnection and a2fConnectionTable). The header only
+// defines const arrays and has no include guard, so it is included exactly once, here.
+#include <igl/marching_cubes_tables.h>
 
-See also
---------
 
-Notes
------
+// Output vertices are the same type as floating point inputs and double for boolean and integer inputs
+template <typename T>
+using VoxelMeshScalar = typename std::conditional<std::is_floating_point<T>::value, T, double>::type;
 
-Examples
---------
-)igl_Qu8mg5v7";
 
-npe_function(voxel_mesh)
-npe_doc(ds_voxel_mesh)
-npe_arg(data, dense_float, dense_double)
-npe_arg(nx, std::uint64_t)
-npe_arg(ny, std::uint64_t)
-npe_arg(nz, std::uint64_t)
+// State of a row of a thresholded plane, rows which are entirely inside or outside can usually be skipped
+enum VoxelRowState : std::uint8_t { ROW_OUTSIDE = 0, ROW_INSIDE = 1, ROW_MIXED = 2 };
+
+
+// Whether rows with the given states are all entirely inside or all entirely outside
+bool same_uniform_rows(std::initializer_list<std::uint8_t> states) {
+    const std::uint8_t first = *states.begin();
+    return first != ROW_MIXED && std::all_of(states.begin(), states.end(), [&](std::uint8_t s) { return s == first; });
+}
+
+
+// A dense C-ordered grid of nx * ny * nz values where values above the isovalue are inside. The grid is processed
+// one x plane at a time by thresholding the plane into a mask of (ny + 2) * (nz + 2) bytes with a border of outside
+// values, so neighbour lookups within and between planes never need bounds checks. Alongside the mask we keep the
+// state of each of its ny + 2 rows.
+template <typename DataScalar>
+struct VoxelGrid {
+    const DataScalar* data;
+    std::int64_t nx, ny, nz;
+    double isovalue;
+
+    std::int64_t index(std::int64_t x, std::int64_t y, std::int64_t z) const {
+        return (x * ny + y) * nz + z;
+    }
+
+    std::int64_t mask_size() const {
+        return (ny + 2) * (nz + 2);
+    }
+
+    std::int64_t mask_index(std::int64_t y, std::int64_t z) const {
+        return (y + 1) * (nz + 2) + (z + 1);
+    }
+
+    // Planes outside the grid are entirely outside
+    void threshold_plane(std::int64_t x, std::vector<std::uint8_t>& mask, std::vector<std::uint8_t>& rows) const {
+        std::fill(mask.begin(), mask.end(), std::uint8_t(0));
+        std::fill(rows.begin(), rows.end(), std::uint8_t(ROW_OUTSIDE));
+        if (x < 0 || x >= nx) {
+            return;
+        }
+        for (std::int64_t y = 0; y < ny; y += 1) {
+            const DataScalar* row = data + index(x, y, 0);
+            std::uint8_t* mask_row = mask.data() + mask_index(y, 0);
+            std::int64_t num_inside = 0;
+            for (std::int64_t z = 0; z < nz; z += 1) {
+                mask_row[z] = double(row[z]) > isovalue;
+                num_inside += mask_row[z];
+            }
+            rows[y + 1] = num_inside == 0 ? ROW_OUTSIDE : (num_inside == nz ? ROW_INSIDE : ROW_MIXED);
+        }
+    }
+};
+
+
+// A sliding window of N consecutive thresholded planes of a grid. Slabs handled one after the other by the same
+// thread reuse the planes they share instead of thresholding them again.
+template <typename DataScalar, int N>
+class PlaneMaskWindow {
+    const VoxelGrid<DataScalar>& grid;
+    std::array<std::vector<std::uint8_t>, N> masks;
+    std::array<std::vector<std::uint8_t>, N> row_states;
+    std::array<std::int64_t, N> planes;
+
+public:
+    explicit PlaneMaskWindow(const VoxelGrid<DataScalar>& grid) : grid(grid) {
+        for (int k = 0; k < N; k += 1) {
+            masks[k].resize(grid.mask_size());
+            row_states[k].resize(grid.ny + 2);
+            planes[k] = std::numeric_limits<std::int64_t>::min();
+        }
+    }
+
+    // Make mask k hold plane first + k
+    void slide_to(std::int64_t first) {
+        for (int k = 0; k < N; k += 1) {
+            int j = k;
+            while (j < N && planes[j] != first + k) {
+                j += 1;
+            }
+            if (j < N) {
+                std::swap(masks[k], masks[j]);
+                std::swap(row_states[k], row_states[j]);
+                std::swap(planes[k], planes[j]);
+            } else {
+                grid.threshold_plane(first + k, masks[k], row_states[k]);
+                planes[k] = first + k;
+            }
+        }
+    }
+
+    const std::uint8_t* operator[](int k) const {
+        return masks[k].data();
+    }
+
+    // State of row y + 1 of mask k is rows(k)[y + 1]
+    const std::uint8_t* rows(int k) const {
+        return row_states[k].data();
+    }
+};
+
+
+void validate_voxel_grid_args(std::int64_t num_values, std::int64_t nx, std::int64_t ny, std::int64_t nz) {
+    if (nx <= 0 || ny <= 0 || nz <= 0) {
+        throw pybind11::value_error("Invalid grid size, nx, ny, and nz must all be positive.");
+    }
+    if (nx * ny * nz != num_values) {
+        throw pybind11::value_error("Invalid shape for data. Expected len(data) = nx * ny * nz.");
+    }
+}
+
+
+void validate_num_mesh_vertices(std::int64_t num_vertices) {
+    if (num_vertices > std::int64_t(std::numeric_limits<std::int32_t>::max())) {
+        throw pybind11::value_error("The output mesh has more than 2^31 - 1 vertices which can't be indexed by int32 "
+                                    "faces. Try meshing a smaller grid.");
+    }
+}
+
+
+// Turns per-slab counts into offsets in place and returns the total
+std::int64_t exclusive_prefix_sum(std::vector<std::int64_t>& counts) {
+    std::int64_t total = 0;
+    for (std::int64_t& c : counts) {
+        const std::int64_t count = c;
+        c = total;
+        total += count;
+    }
+    return total;
+}
+
+}
+
+
+const char* voxel_mesh_internal_doc = R"Qu8mg5v7(
+See voxel_mesh
+)Qu8mg5v7";
+npe_function(voxel_mesh_internal)
+npe_arg(data, dense_bool, dense_uchar, dense_int, dense_long, dense_longlong, dense_float, dense_double)
+npe_arg(nx, std::int64_t)
+npe_arg(ny, std::int64_t)
+npe_arg(nz, std::int64_t)
+npe_arg(isovalue, double)
+npe_arg(origin_x, double)
+npe_arg(origin_y, double)
+npe_arg(origin_z, double)
+npe_arg(voxel_size_x, double)
+npe_arg(voxel_size_y, double)
+npe_arg(voxel_size_z, double)
+npe_doc(voxel_mesh_internal_doc)
 npe_begin_code()
 {
+    typedef VoxelMeshScalar<npe_Scalar_data> Scalar;
+    typedef Eigen::Matrix<Scalar, Eigen::Dynamic, 3, Eigen::RowMajor> MatrixV;
+    typedef Eigen::Matrix<std::int32_t, Eigen::Dynamic, 3, Eigen::RowMajor> MatrixF;
+
     if (data.rows() != 1 && data.cols() != 1) {
         throw pybind11::value_error("Invalid shape for data. Expected a flat array.");
     }
+    validate_voxel_grid_args(data.size(), nx, ny, nz);
 
-    if (nx*ny*nz != data.rows()*data.cols()) {
-        throw pybind11::value_error("Invalid shape for data. Expected len(data) = nx * ny * nz.");
-    }
+    const VoxelGrid<npe_Scalar_data> grid {data.data(), nx, ny, nz, isovalue};
+    const std::array<double, 3> origin {origin_x, origin_y, origin_z};
+    const std::array<double, 3> voxel_size {voxel_size_x, voxel_size_y, voxel_size_z};
+    const std::int64_t row_stride = nz + 2;
 
-    std::vector<Eigen::RowVector3d> vs;
-    std::vector<Eigen::RowVector3i> fs;
-
-    for (std::uint64_t x = 0; x < nx; x++) {
-        for (std::uint64_t y = 0; y < ny; y++) {
-            for (std::uint64_t z = 0; z < nz; z++) {
-                std::uint64_t idx = x*nx*ny + y*ny + z;
-                std::uint64_t idx_in = x*nx*ny + y*ny + (z+1);
-                std::uint64_t idx_out = x*nx*ny + y*ny + (z-1);
-                std::uint64_t idx_left = (x-1)*nx*ny + y*ny + z;
-                std::uint64_t idx_right = (x+1)*nx*ny + y*ny + z;
-                std::uint64_t idx_up = x*nx*ny + (y+1)*ny + z;
-                std::uint64_t idx_down = x*nx*ny + (y-1)*ny + z;
-
-                bool inside = data.data()[idx] > 0.0;
-
-                typedef typename npe_Matrix_data::Scalar Scalar;
-                Scalar val_in;
-                Scalar val_out;
-                Scalar val_left;
-                Scalar val_right;
-                Scalar val_up;
-                Scalar val_down;
-
-                if (inside) {
-                    if (z == 0) {
-                        val_out = 0.0;
-                        val_in = data.data()[idx_in];
-                    } else if (z == nz-1) {
-                        val_in = 0.0;
-                        val_out = data.data()[idx_out];
-                    } else {
-                        val_in = data.data()[idx_in];
-                        val_out = data.data()[idx_out];
-                    }
+    // Voxel (x, y, z) spans the corners (x..x+1, y..y+1, z..z+1). A corner on corner plane x is a vertex of the
+    // output iff the 8 voxels around it (in voxel planes x-1 and x) are mixed, which is exactly when a boundary face
+    // touches it.
+    auto corner_used = [&](const std::uint8_t* prev, const std::uint8_t* cur, std::int64_t y, std::int64_t z) {
+        const std::int64_t i = grid.mask_index(y - 1, z - 1), j = i + row_stride;
+        const int num_inside = prev[i] + prev[i + 1] + prev[j] + prev[j + 1] +
+                               cur[i] + cur[i + 1] + cur[j] + cur[j + 1];
+        return num_inside > 0 && num_inside < 8;
+    };
 
-                    if (y == 0) {
-                        val_down = 0.0;
-                        val_up = data.data()[idx_up];
-                    } else if (y == ny - 1) {
-                        val_up = data.data()[idx_up];
-                        val_down = 0.0;
-                    } else  {
-                        val_up = data.data()[idx_up];
-                        val_down = data.data()[idx_down];
-                    }
+    // Corner row y lies between voxel rows y-1 and y. If these are all outside in both voxel planes it has no vertices,
+    // and if they are all inside it only has vertices at its two ends.
+    auto corner_row_state = [&](const std::uint8_t* prev_rows, const std::uint8_t* cur_rows, std::int64_t y) {
+        return same_uniform_rows({prev_rows[y], prev_rows[y + 1], cur_rows[y], cur_rows[y + 1]}) ?
+               prev_rows[y] : std::uint8_t(ROW_MIXED);
+    };
 
-                    if (x == 0) {
-                        val_left = 0.0;
-                        val_right = data.data()[idx_right];
-                    } else if (x == nx - 1) {
-                        val_right = 0.0;
-                        val_left = data.data()[idx_left];
-                    } else {
-                        val_left = data.data()[idx_left];
-                        val_right = data.data()[idx_right];
-                    }
+    // Whether the neighbours of an inside voxel in the -x, +x, -y, +y, -z, +z directions are outside
+    auto boundary_sides = [&](const std::uint8_t* prev, const std::uint8_t* cur, const std::uint8_t* next,
+                              std::int64_t i) {
+        return std::array<bool, 6> {!prev[i], !next[i], !cur[i - row_stride], !cur[i + row_stride],
+                                    !cur[i - 1], !cur[i + 1]};
+    };
+
+    MatrixV v_out;
+    MatrixF f_out;
+    {
+        pybind11::gil_scoped_release release;
+
+        // First pass: count the vertices on each plane of corners and the faces in each slab of voxels
+        std::vector<std::int64_t> plane_vertex_offsets(nx + 1, 0);
+        std::vector<std::int64_t> slab_face_offsets(nx, 0);
+        #pragma omp parallel
+        {
+            // Voxel planes x-1, x and x+1
+            PlaneMaskWindow<npe_Scalar_data, 3> masks(grid);
+
+            #pragma omp for schedule(dynamic, 8)
+            for (std::int64_t x = 0; x <= nx; x += 1) {
+                masks.slide_to(x - 1);
+                const std::uint8_t* prev = masks[0];
+                const std::uint8_t* cur = masks[1];
+                const std::uint8_t* next = masks[2];
 
-                    Eigen::RowVector3d ctr((double)x, (double)y, (double)z);
-                    Eigen::RowVector3d in(0.0, 0.0, 0.5);
-                    Eigen::RowVector3d right(0.5, 0.0, 0.0);
-                    Eigen::RowVector3d up(0.0, 0.5, 0.0);
-
-                    Eigen::RowVector3d xp_yp_zp = ctr + right + up + in;
-                    Eigen::RowVector3d xn_yp_zp = ctr - right + up + in;
-                    Eigen::RowVector3d xp_yn_zp = ctr + right - up + in;
-                    Eigen::RowVector3d xp_yp_zn = ctr + right + up - in;
-                    Eigen::RowVector3d xn_yn_zp = ctr - right - up + in;
-                    Eigen::RowVector3d xn_yp_zn = ctr - right + up - in;
-                    Eigen::RowVector3d xp_yn_zn = ctr + right - up - in;
-                    Eigen::RowVector3d xn_yn_zn = ctr - right - up - in;
-
-
-                    if (val_right <= 0.0) {
-                        int vsize = vs.size();
-                        vs.push_back(xp_yn_zn);
-                        vs.push_back(xp_yn_zp);
-                        vs.push_back(xp_yp_zp);
-                        vs.push_back(xp_yp_zn);
-                        fs.push_back(Eigen::RowVector3i(vsize+0, vsize+2, vsize+1));
-                        fs.push_back(Eigen::RowVector3i(vsize+0, vsize+3, vsize+2));
+                std::int64_t num_vertices = 0, num_faces = 0;
+                for (std::int64_t y = 0; y <= ny; y += 1) {
+                    const std::uint8_t state = corner_row_state(masks.rows(0), masks.rows(1), y);
+                    if (state != ROW_MIXED) {
+                        num_vertices += state == ROW_INSIDE ? 2 : 0;
+                        continue;
                     }
-                    if (val_left <= 0.0) {
-                        int vsize = vs.size();
-                        vs.push_back(xn_yn_zn);
-                        vs.push_back(xn_yn_zp);
-                        vs.push_back(xn_yp_zp);
-                        vs.push_back(xn_yp_zn);
-                        fs.push_back(Eigen::RowVector3i(vsize+0, vsize+1, vsize+2));
-                        fs.push_back(Eigen::RowVector3i(vsize+0, vsize+2, vsize+3));
+                    for (std::int64_t z = 0; z <= nz; z += 1) {
+                        num_vertices += corner_used(prev, cur, y, z);
                     }
-
-                    if (val_in <= 0.0) {
-                        int vsize = vs.size();
-                        vs.push_back(xn_yn_zp);
-                        vs.push_back(xn_yp_zp);
-                        vs.push_back(xp_yp_zp);
-                        vs.push_back(xp_yn_zp);
-                        fs.push_back(Eigen::RowVector3i(vsize+0, vsize+2, vsize+1));
-                        fs.push_back(Eigen::RowVector3i(vsize+0, vsize+3, vsize+2));
+                }
+                for (std::int64_t y = 0; y < ny && x < nx; y += 1) {
+                    if (masks.rows(1)[y + 1] == ROW_OUTSIDE) {
+                        continue;
                     }
-                    if (val_out <= 0.0) {
-                        int vsize = vs.size();
-                        vs.push_back(xn_yn_zn);
-                        vs.push_back(xn_yp_zn);
-                        vs.push_back(xp_yp_zn);
-                        vs.push_back(xp_yn_zn);
-                        fs.push_back(Eigen::RowVector3i(vsize+0, vsize+1, vsize+2));
-                        fs.push_back(Eigen::RowVector3i(vsize+0, vsize+2, vsize+3));
+                    for (std::int64_t z = 0; z < nz; z += 1) {
+                        const std::int64_t i = grid.mask_index(y, z);
+                        if (cur[i]) {
+                            for (bool b : boundary_sides(prev, cur, next, i)) {
+                                num_faces += 2 * b;
+                            }
+                        }
                     }
+                }
+                plane_vertex_offsets[x] = num_vertices;
+                if (x < nx) {
+                    slab_face_offsets[x] = num_faces;
+                }
+            }
+        }
+        const std::int64_t num_vertices = exclusive_prefix_sum(plane_vertex_offsets);
+        const std::int64_t num_faces = exclusive_prefix_sum(slab_face_offsets);
+        validate_num_mesh_vertices(num_vertices);
+        v_out.resize(num_vertices, 3);
+        f_out.resize(num_faces, 3);
 
-                    if (val_up <= 0.0) {
-                        int vsize = vs.size();
-                        vs.push_back(xn_yp_zn);
-                        vs.push_back(xn_yp_zp);
-                        vs.push_back(xp_yp_zp);
-                        vs.push_back(xp_yp_zn);
-                        fs.push_back(Eigen::RowVector3i(vsize+0, vsize+1, vsize+2));
-                        fs.push_back(Eigen::RowVector3i(vsize+0, vsize+2, vsize+3));
+        // Second pass: each slab numbers the corners on its two bounding planes, writes the vertices on its lower
+        // plane (and the last slab the upper one too), and writes its faces at its offset
+        #pragma omp parallel
+        {
+            // Voxel planes x-1, x and x+1
+            PlaneMaskWindow<npe_Scalar_data, 3> masks(grid);
+            std::array<std::vector<std::int32_t>, 2> plane_ids {
+                std::vector<std::int32_t>((ny + 1) * (nz + 1)), std::vector<std::int32_t>((ny + 1) * (nz + 1))};
+
+            // Number the corners on corner plane x which lies between voxel planes k and k + 1 of the window
+            auto number_plane = [&](std::int64_t x, int k, std::vector<std::int32_t>& ids, bool write) {
+                std::int64_t vid = plane_vertex_offsets[x];
+                for (std::int64_t y = 0; y <= ny; y += 1) {
+                    const std::uint8_t state = corner_row_state(masks.rows(k), masks.rows(k + 1), y);
+                    if (state == ROW_OUTSIDE) {
+                        std::fill_n(ids.begin() + y * (nz + 1), nz + 1, -1);
+                        continue;
+                    }
+                    for (std::int64_t z = 0; z <= nz; z += 1) {
+                        const bool used = state == ROW_INSIDE ? (z == 0 || z == nz) :
+                                          corner_used(masks[k], masks[k + 1], y, z);
+                        if (!used) {
+                            ids[y * (nz + 1) + z] = -1;
+                            continue;
+                        }
+                        ids[y * (nz + 1) + z] = std::int32_t(vid);
+                        if (write) {
+                            v_out(vid, 0) = Scalar(origin[0] + x * voxel_size[0]);
+                            v_out(vid, 1) = Scalar(origin[1] + y * voxel_size[1]);
+                            v_out(vid, 2) = Scalar(origin[2] + z * voxel_size[2]);
+                        }
+                        vid += 1;
                     }
+                }
+            };
+
+            #pragma omp for schedule(dynamic, 8)
+            for (std::int64_t x = 0; x < nx; x += 1) {
+                masks.slide_to(x - 1);
+                number_plane(x, 0, plane_ids[0], true);
+                number_plane(x + 1, 1, plane_ids[1], x == nx - 1);
 
-                    if (val_down <= 0.0) {
-                        int vsize = vs.size();
-                        vs.push_back(xn_yn_zn);
-                        vs.push_back(xn_yn_zp);
-                        vs.push_back(xp_yn_zp);
-                        vs.push_back(xp_yn_zn);
-                        fs.push_back(Eigen::RowVector3i(vsize+0, vsize+2, vsize+1));
-                        fs.push_back(Eigen::RowVector3i(vsize+0, vsize+3, vsize+2));
+                std::int64_t fid = slab_face_offsets[x];
+                for (std::int64_t y = 0; y < ny; y += 1) {
+                    if (masks.rows(1)[y + 1] == ROW_OUTSIDE) {
+                        continue;
                     }
+                    for (std::int64_t z = 0; z < nz; z += 1) {
+                        const std::int64_t i = grid.mask_index(y, z);
+                        if (!masks[1][i]) {
+                            continue;
+                        }
+                        const std::array<bool, 6> sides =
+                                boundary_sides(masks[0], masks[1], masks[2], i);
+                        // Corner x coordinates are relative to this slab, i.e. 0 or 1
+                        const std::array<std::int64_t, 3> ijk {0, y, z};
+                        for (int axis = 0; axis < 3; axis += 1) {
+                            for (int side = 0; side < 2; side += 1) {
+                                if (!sides[2 * axis + side]) {
+                                    continue;
+                                }
 
+                                // The quad on this side spans the other two axes (u, w) where (u, w, axis) is
+                                // right handed, so going (0, 0) -> (1, 0) -> (1, 1) -> (0, 1) faces +axis
+                                const int u = (axis + 1) % 3, w = (axis + 2) % 3;
+                                std::array<std::int32_t, 4> quad;
+                                for (int q = 0; q < 4; q += 1) {
+                                    std::array<std::int64_t, 3> c = ijk;
+                                    c[axis] += side;
+                                    c[u] += (q == 1 || q == 2);
+                                    c[w] += (q >= 2);
+                                    quad[q] = plane_ids[c[0]][c[1] * (nz + 1) + c[2]];
+                                }
+                                if (side == 0) {
+                                    std::swap(quad[1], quad[3]);
+                                }
+                                f_out.row(fid++) << quad[0], quad[1], quad[2];
+                                f_out.row(fid++) << quad[0], quad[2], quad[3];
+                            }
+                        }
+                    }
                 }
             }
         }
     }
 
-    EigenDenseF64 retv(vs.size(), 3);
-    for (int i = 0; i < vs.size(); i++) {
-        retv(i, 0) = vs[i][0];
-        retv(i, 1) = vs[i][1];
-        retv(i, 2) = vs[i][2];
+    return std::make_tuple(npe::move(v_out), npe::move(f_out));
+}
+npe_end_code()
+
+
+
+const char* voxel_marching_cubes_internal_doc = R"Qu8mg5v7(
+See voxel_mesh
+)Qu8mg5v7";
+npe_function(voxel_marching_cubes_internal)
+npe_arg(data, dense_float, dense_double)
+npe_arg(nx, std::int64_t)
+npe_arg(ny, std::int64_t)
+npe_arg(nz, std::int64_t)
+npe_arg(isovalue, double)
+npe_arg(origin_x, double)
+npe_arg(origin_y, double)
+npe_arg(origin_z, double)
+npe_arg(voxel_size_x, double)
+npe_arg(voxel_size_y, double)
+npe_arg(voxel_size_z, double)
+npe_doc(voxel_marching_cubes_internal_doc)
+npe_begin_code()
+{
+    typedef npe_Scalar_data Scalar;
+    typedef Eigen::Matrix<Scalar, Eigen::Dynamic, 3, Eigen::RowMajor> MatrixV;
+    typedef Eigen::Matrix<std::int32_t, Eigen::Dynamic, 3, Eigen::RowMajor> MatrixF;
+
+    if (data.rows() != 1 && data.cols() != 1) {
+        throw pybind11::value_error("Invalid shape for data. Expected a flat array.");
     }
+    validate_voxel_grid_args(data.size(), nx, ny, nz);
+    if (nx < 2 || ny < 2 || nz < 2) {
+        // There are no cubes between the samples to march over
+        return std::make_tuple(npe::move(MatrixV(0, 3)), npe::move(MatrixF(0, 3)));
+    }
+
+    const VoxelGrid<Scalar> grid {data.data(), nx, ny, nz, isovalue};
+    const std::array<double, 3> origin {origin_x, origin_y, origin_z};
+    const std::array<double, 3> voxel_size {voxel_size_x, voxel_size_y, voxel_size_z};
+    const std::int64_t row_stride = nz + 2;
+
+    // Corner offsets of a cube in the order used by the marching cubes tables
+    const int corner_offsets[8][3] = {{0, 0, 0}, {1, 0, 0}, {1, 1, 0}, {0, 1, 0},
+                                      {0, 0, 1}, {1, 0, 1}, {1, 1, 1}, {0, 1, 1}};
 
-    EigenDenseF64 retf(fs.size(), 3);
-    for (int i = 0; i < fs.size(); i++) {
-        retf(i, 0) = fs[i][0];
-        retf(i, 1) = fs[i][1];
-        retf(i, 2) = fs[i][2];
+    // Every grid edge crossing the isosurface gets one output vertex. Edges along x between sample planes x and x+1
+    // belong to slab x, edges along y and z belong to sample plane x. Vertices are numbered plane 0, slab 0, plane 1,
+    // slab 1, ..., plane nx-1 and within a plane or slab by edge direction, then y, then z.
+    const std::int64_t num_y_edges = (ny - 1) * nz;
+    const std::int64_t num_z_edges = ny * (nz - 1);
+    auto edge_slot = [&](int axis, std::int64_t y, std::int64_t z) {
+        // Index of an edge within its slab (axis 0) or within its plane (axes 1 and 2)
+        return axis == 2 ? num_y_edges + y * (nz - 1) + z : y * nz + z;
+    };
+    auto cube_config = [&](const std::uint8_t* lo, const std::uint8_t* hi, std::int64_t y, std::int64_t z) {
+        const std::int64_t i = grid.mask_index(y, z), j = i + row_stride;
+        return int(lo[i]) | int(hi[i]) << 1 | int(hi[j]) << 2 | int(lo[j]) << 3 |
+               int(lo[i + 1]) << 4 | int(hi[i + 1]) << 5 | int(hi[j + 1]) << 6 | int(lo[j + 1]) << 7;
+    };
+    // Sample rows y and y+1 of planes x and x+1 bound the cubes in row y of slab x and all their edges. If they are
+    // all inside or all outside, none of these edges cross the isosurface.
+    auto cube_row_uniform = [&](const std::uint8_t* lo_rows, const std::uint8_t* hi_rows, std::int64_t y) {
+        return same_uniform_rows({lo_rows[y + 1], lo_rows[y + 2], hi_rows[y + 1], hi_rows[y + 2]});
+    };
+    auto num_triangles = [&](int config) {
+        int count = 0;
+        while (count < 5 && a2fConnectionTable[config][3 * count] >= 0) {
+            count += 1;
+        }
+        return count;
+    };
+
+    MatrixV v_out;
+    MatrixF f_out;
+    {
+        pybind11::gil_scoped_release release;
+
+        // First pass: count the vertices in each plane and slab, and the triangles in each slab of cubes
+        std::vector<std::int64_t> vertex_offsets(2 * nx - 1, 0);
+        std::vector<std::int64_t> slab_face_offsets(nx - 1, 0);
+        #pragma omp parallel
+        {
+            // Sample planes x and x+1
+            PlaneMaskWindow<Scalar, 2> masks(grid);
+
+            #pragma omp for schedule(dynamic, 8)
+            for (std::int64_t x = 0; x < nx; x += 1) {
+                masks.slide_to(x);
+                const std::uint8_t* lo = masks[0];
+                const std::uint8_t* hi = masks[1];
+
+                std::int64_t num_plane_vertices = 0, num_slab_vertices = 0, num_faces = 0;
+                for (std::int64_t y = 0; y < ny; y += 1) {
+                    if (cube_row_uniform(masks.rows(0), masks.rows(1), y)) {
+                        continue;
+                    }
+                    for (std::int64_t z = 0; z < nz; z += 1) {
+                        const std::int64_t i = grid.mask_index(y, z);
+                        num_plane_vertices += (y < ny - 1 && lo[i] != lo[i + row_stride]);
+                        num_plane_vertices += (z < nz - 1 && lo[i] != lo[i + 1]);
+                        if (x < nx - 1) {
+                            num_slab_vertices += lo[i] != hi[i];
+                            if (y < ny - 1 && z < nz - 1) {
+                                num_faces += num_triangles(cube_config(lo, hi, y, z));
+                            }
+                        }
+                    }
+                }
+                vertex_offsets[2 * x] = num_plane_vertices;
+                if (x < nx - 1) {
+                    vertex_offsets[2 * x + 1] = num_slab_vertices;
+                    slab_face_offsets[x] = num_faces;
+                }
+            }
+        }
+        const std::int64_t num_vertices = exclusive_prefix_sum(vertex_offsets);
+        const std::int64_t num_faces = exclusive_prefix_sum(slab_face_offsets);
+        validate_num_mesh_vertices(num_vertices);
+        v_out.resize(num_vertices, 3);
+        f_out.resize(num_faces, 3);
+
+        // Place the vertex on the edge from sample (x, y, z) along axis by linearly interpolating the isovalue
+        auto write_vertex = [&](std::int64_t vid, std::int64_t x, std::int64_t y, std::int64_t z, int axis) {
+            std::array<std::int64_t, 3> b {x, y, z};
+            b[axis] += 1;
+            const double sa = double(data.data()[grid.index(x, y, z)]);
+            const double sb = double(data.data()[grid.index(b[0], b[1], b[2])]);
+            std::array<double, 3> p {double(x), double(y), double(z)};
+            p[axis] += (isovalue - sa) / (sb - sa);
+            for (int d = 0; d < 3; d += 1) {
+                v_out(vid, d) = Scalar(origin[d] + p[d] * voxel_size[d]);
+            }
+        };
+
+        // Second pass: each slab numbers the crossing edges on its two bounding planes and in its interior, writes
+        // the vertices on its lower plane and interior (and the last slab its upper plane too), and writes its
+        // triangles at its offset
+        #pragma omp parallel
+        {
+            // Sample planes x and x+1
+            PlaneMaskWindow<Scalar, 2> masks(grid);
+            std::array<std::vector<std::int32_t>, 2> plane_ids {
+                std::vector<std::int32_t>(num_y_edges + num_z_edges),
+                std::vector<std::int32_t>(num_y_edges + num_z_edges)};
+            std::vector<std::int32_t> slab_ids(ny * nz);
+
+            // Number the crossing edges on sample plane x which is plane k of the window
+            auto number_plane = [&](std::int64_t x, int k, std::vector<std::int32_t>& ids, bool write) {
+                const std::uint8_t* mask = masks[k];
+                const std::uint8_t* rows = masks.rows(k);
+                std::int64_t vid = vertex_offsets[2 * x];
+                for (int axis = 1; axis < 3; axis += 1) {
+                    const std::int64_t offset = axis == 1 ? row_stride : 1;
+                    for (std::int64_t y = 0; y < ny - (axis == 1); y += 1) {
+                        const bool uniform = axis == 1 ? same_uniform_rows({rows[y + 1], rows[y + 2]}) :
+                                             rows[y + 1] != ROW_MIXED;
+                        if (uniform) {
+                            std::fill_n(ids.begin() + edge_slot(axis, y, 0), nz - (axis == 2), -1);
+                            continue;
+                        }
+                        for (std::int64_t z = 0; z < nz - (axis == 2); z += 1) {
+                            const std::int64_t i = grid.mask_index(y, z);
+                            const std::int64_t slot = edge_slot(axis, y, z);
+                            if (mask[i] == mask[i + offset]) {
+                                ids[slot] = -1;
+                                continue;
+                            }
+                            ids[slot] = std::int32_t(vid);
+                            if (write) {
+                                write_vertex(vid, x, y, z, axis);
+                            }
+                            vid += 1;
+                        }
+                    }
+                }
+            };
+
+            #pragma omp for schedule(dynamic, 8)
+            for (std::int64_t x = 0; x < nx - 1; x += 1) {
+                masks.slide_to(x);
+                const std::uint8_t* lo = masks[0];
+                const std::uint8_t* hi = masks[1];
+                number_plane(x, 0, plane_ids[0], true);
+                number_plane(x + 1, 1, plane_ids[1], x == nx - 2);
+
+                std::int64_t vid = vertex_offsets[2 * x + 1];
+                for (std::int64_t y = 0; y < ny; y += 1) {
+                    if (same_uniform_rows({masks.rows(0)[y + 1], masks.rows(1)[y + 1]})) {
+                        std::fill_n(slab_ids.begin() + edge_slot(0, y, 0), nz, -1);
+                        continue;
+                    }
+                    for (std::int64_t z = 0; z < nz; z += 1) {
+                        const std::int64_t i = grid.mask_index(y, z);
+                        const std::int64_t slot = edge_slot(0, y, z);
+                        if (lo[i] == hi[i]) {
+                            slab_ids[slot] = -1;
+                            continue;
+                        }
+                        slab_ids[slot] = std::int32_t(vid);
+                        write_vertex(vid, x, y, z, 0);
+                        vid += 1;
+                    }
+                }
+
+                std::int64_t fid = slab_face_offsets[x];
+                for (std::int64_t y = 0; y < ny - 1; y += 1) {
+                    if (cube_row_uniform(masks.rows(0), masks.rows(1), y)) {
+                        continue;
+                    }
+                    for (std::int64_t z = 0; z < nz - 1; z += 1) {
+                        const int* tris = a2fConnectionTable[cube_config(lo, hi, y, z)];
+                        if (tris[0] < 0) {
+                            continue;
+                        }
+                        std::array<std::int32_t, 12> edge_ids;
+                        for (int e = 0; e < 12; e += 1) {
+                            const int* a = corner_offsets[a2eConnection[e][0]];
+                            const int* b = corner_offsets[a2eConnection[e][1]];
+                            const int axis = a[0] != b[0] ? 0 : (a[1] != b[1] ? 1 : 2);
+                            const std::int64_t slot = edge_slot(axis, y + std::min(a[1], b[1]),
+                                                                z + std::min(a[2], b[2]));
+                            edge_ids[e] = axis == 0 ? slab_ids[slot] : plane_ids[a[0]][slot];
+                        }
+                        for (int t = 0; t < 5 && tris[3 * t] >= 0; t += 1) {
+                            // The tables wind triangles clockwise seen from outside, flip them to face outwards
+                            f_out.row(fid++) << edge_ids[tris[3 * t]], edge_ids[tris[3 * t + 2]],
+                                                edge_ids[tris[3 * t + 1]];
+                        }
+                    }
+                }
+            }
+        }
     }
 
-    return std::make_tuple(npe::move(retv), npe::move(retf));
+    return std::make_tuple(npe::move(v_out), npe::move(f_out));
 }
 npe_end_code()
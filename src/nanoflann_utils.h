@@ -0,0 +1,44 @@
+#include <Eigen/Core>
+#include <cstddef>
+
+#include "nanoflann.hpp"
+
+#ifndef NANOFLANN_UTILS_H
+#define NANOFLANN_UTILS_H
+
+/*
+ * nanoflann dataset adaptor which reads points directly out of a #points x 3 Eigen matrix or map (such as the
+ * arguments numpyeigen passes in) so we don't need to copy the input to build a KD tree.
+ */
+template <typename MatrixType>
+struct EigenRowsDatasetAdaptor {
+    typedef typename MatrixType::Scalar Scalar;
+
+    const MatrixType& points;
+
+    explicit EigenRowsDatasetAdaptor(const MatrixType& pts) : points(pts) {}
+
+    inline std::size_t kdtree_get_point_count() const {
+        return points.rows();
+    }
+
+    inline Scalar kdtree_get_pt(const std::size_t idx, const std::size_t dim) const {
+        return points(idx, dim);
+    }
+
+    template <class BBox>
+    bool kdtree_get_bbox(BBox&) const {
+        return false;
+    }
+};
+
+
+/*
+ * A 3D KD tree over the rows of an Eigen matrix or map using squared L2 distances
+ */
+template <typename MatrixType>
+using EigenKDTree3 = nanoflann::KDTreeSingleIndexAdaptor<
+        nanoflann::L2_Simple_Adaptor<typename MatrixType::Scalar, EigenRowsDatasetAdaptor<MatrixType>>,
+        EigenRowsDatasetAdaptor<MatrixType>, 3, std::size_t>;
+
+#endif // NANOFLANN_UTILS_H
@@ -1,111 +1,479 @@
 #include <npe.h>
-#include <vcg/complex/complex.h>
-#include <vcg/complex/algorithms/pointcloud_normal.h>
-#include <igl/per_vertex_normals.h>
+#include <pybind11/pybind11.h>
+#include <pybind11/numpy.h>
+#include <Eigen/Eigenvalues>
 #include <string>
+#include <sstream>
+#include <vector>
+#include <algorithm>
+#include <cmath>
+#include <type_traits>
 
-#include "vcg_utils.h"
+#include "nanoflann_utils.h"
+#include "kd_tree.h"
 #include "common.h"
+#include "parallel_utils.h"
 
 
 namespace {
 
-using namespace vcg;
-class VCGMeshEdge;
-class VCGMeshFace;
-class VCGMeshVertex;
-struct VCGMeshUsedTypes : public UsedTypes<	Use<VCGMeshVertex>   ::AsVertexType,
-        Use<VCGMeshEdge>     ::AsEdgeType,
-        Use<VCGMeshFace>     ::AsFaceType>{};
-class VCGMeshVertex  : public Vertex<VCGMeshUsedTypes, vertex::Coord3d, vertex::Normal3d, vertex::BitFlags> {};
-class VCGMeshFace    : public Face<VCGMeshUsedTypes, face::FFAdj,  face::Normal3d, face::VertexRef, face::BitFlags> {};
-class VCGMeshEdge    : public Edge<VCGMeshUsedTypes>{};
-class VCGMesh : public tri::TriMesh<std::vector<VCGMeshVertex>, std::vector<VCGMeshFace>, std::vector<VCGMeshEdge>> {};
+/*
+ * Fit a plane to the neighbors of a point. The normal is the eigenvector of the (3x3) covariance matrix of the
+ * neighborhood with the smallest eigenvalue, which we compute in closed form. The eigenvalues of the covariance
+ * matrix are returned in increasing order in eigenvalues.
+ */
+template <typename DerivedV>
+void fit_plane(const DerivedV& V, const std::size_t* nbr_idxs, std::size_t num_nbrs,
+               Eigen::Vector3d& normal, Eigen::Vector3d& eigenvalues) {
+    Eigen::Vector3d mean = Eigen::Vector3d::Zero();
+    for (std::size_t j = 0; j < num_nbrs; j += 1) {
+        mean += Eigen::Vector3d(V(nbr_idxs[j], 0), V(nbr_idxs[j], 1), V(nbr_idxs[j], 2));
+    }
+    mean /= double(num_nbrs);
+
+    Eigen::Matrix3d cov = Eigen::Matrix3d::Zero();
+    for (std::size_t j = 0; j < num_nbrs; j += 1) {
+        const Eigen::Vector3d d = Eigen::Vector3d(V(nbr_idxs[j], 0), V(nbr_idxs[j], 1), V(nbr_idxs[j], 2)) - mean;
+        cov.noalias() += d * d.transpose();
+    }
+    cov /= double(num_nbrs);
 
+    Eigen::SelfAdjointEigenSolver<Eigen::Matrix3d> eig;
+    eig.computeDirect(cov);
+    normal = eig.eigenvectors().col(0);  // Eigenvalues are sorted in increasing order
+    eigenvalues = eig.eigenvalues();
 }
 
 
-const char* estimate_point_cloud_normals_doc = R"Qu8mg5v7(
-Estimate normals for a point cloud by locally fitting a plane to a small neighborhood of points
+/*
+ * Neighborhood of a query point used to fit normals. This is one of
+ *   - the k nearest neighbors (radius <= 0),
+ *   - all the points within a radius (radius > 0, max_k <= 0), or
+ *   - the (at most) max_k nearest neighbors within a radius (radius > 0, max_k > 0).
+ * If a radius query returns fewer than 3 points (too few to fit a plane), we fall back to the 3 nearest neighbors.
+ *
+ * Each instance owns its query buffers, so use one per thread.
+ */
+template <typename KDTreeType>
+class NeighborhoodQuery {
+    typedef typename KDTreeType::ElementType Scalar;
+    typedef typename KDTreeType::DistanceType DistanceType;
 
-Parameters
-----------
-v : #v by 3 array of vertex positions (each row is a vertex)
-k : Number of nearest neighbors to use in the estimate for the normal of a point. Default: 10.
-smoothing_iterations : Number of smoothing iterations to apply to the estimated normals. Default: 0.
+    const KDTreeType& tree;
+    std::size_t num_points;
+    std::size_t max_k;
+    DistanceType radius_sq;
+    bool use_radius;
 
-Returns
--------
-A #v x 3 array of normals where each row i is the normal at vertex v[i]
+    std::vector<std::size_t> idxs;
+    std::vector<DistanceType> dists;
+    std::vector<std::pair<std::size_t, DistanceType>> matches;
 
-)Qu8mg5v7";
-npe_function(estimate_point_cloud_normals)
-npe_arg(v, dense_float, dense_double)
-npe_default_arg(k, int, 10)
-npe_default_arg(smoothing_iterations, int, 0)
-npe_doc(estimate_point_cloud_normals_doc)
-npe_begin_code()
-{
-    VCGMesh m;
-    vcg_mesh_from_v(v, m);
+public:
+    NeighborhoodQuery(const KDTreeType& tree, std::size_t num_points, int max_k, double radius) :
+            tree(tree), num_points(num_points), max_k(max_k > 0 ? std::min(std::size_t(max_k), num_points) : num_points),
+            radius_sq(DistanceType(radius * radius)), use_radius(radius > 0.0) {
+        if (!use_radius) {
+            idxs.resize(this->max_k);
+            dists.resize(this->max_k);
+        }
+    }
+
+    std::size_t query(const Scalar* q) {
+        if (!use_radius) {
+            return tree.knnSearch(q, max_k, idxs.data(), dists.data());
+        }
+
+        const std::size_t num_found = tree.radiusSearch(q, radius_sq, matches, nanoflann::SearchParams(32, 0, true));
+        if (num_found < 3) {
+            const std::size_t num_fallback = std::min(std::size_t(3), num_points);
+            idxs.resize(num_fallback);
+            dists.resize(num_fallback);
+            return tree.knnSearch(q, num_fallback, idxs.data(), dists.data());
+        }
 
-    tri::PointCloudNormal<VCGMesh>::Param p;
-    p.fittingAdjNum = k;
-    p.smoothingIterNum = smoothing_iterations;
-    p.viewPoint = vcg::Point3d(0.0f, 0.0f, 0.0f);
-    p.useViewPoint = false;
+        const std::size_t num_nbrs = std::min(num_found, max_k);
+        idxs.resize(num_nbrs);
+        for (std::size_t j = 0; j < num_nbrs; j += 1) {
+            idxs[j] = matches[j].first;
+        }
+        return num_nbrs;
+    }
 
-    tri::PointCloudNormal<VCGMesh>::Compute(m, p, (vcg::CallBackPos*) nullptr);
+    const std::size_t* indices() const {
+        return idxs.data();
+    }
+};
 
-    npe_Matrix_v ret(m.vn, 3);
 
-    int vcount = 0;
-    for (VCGMesh::VertexIterator vit = m.vert.begin(); vit != m.vert.end(); vit++) {
-        ret(vcount, 0) = vit->N()[0];
-        ret(vcount, 1) = vit->N()[1];
-        ret(vcount, 2) = vit->N()[2];
-        vcount += 1;
+/*
+ * Flip the normal n at point p so it points towards the viewpoint view
+ */
+template <typename Scalar>
+void orient_towards(Eigen::Vector3d& n, const Eigen::Vector3d& p, Scalar view_x, Scalar view_y, Scalar view_z) {
+    if (n.dot(Eigen::Vector3d(view_x, view_y, view_z) - p) < 0.0) {
+        n = -n;
     }
+}
+
+
+/*
+ * Consistently orient normals by greedily propagating orientations along the k nearest neighbor graph, always
+ * following the edge between the most parallel normals first (this is what VCG's PointCloudNormal does when
+ * there is no viewpoint).
+ */
+template <typename KDTreeType, typename DerivedV, typename DerivedN>
+void orient_normals_by_propagation(const KDTreeType& tree, const DerivedV& V, DerivedN& N, int num_nbrs) {
+    struct WeightedArc {
+        std::size_t src, dst;
+        double w;
+        bool operator<(const WeightedArc& other) const { return w < other.w; }
+    };
 
-    return npe::move(ret);
+    const std::size_t num_points = V.rows();
+    num_nbrs = std::min(num_nbrs, int(num_points));
+    std::vector<bool> visited(num_points, false);
+    std::vector<WeightedArc> heap;
+    std::vector<std::size_t> nbr_idxs(num_nbrs);
+    std::vector<typename KDTreeType::DistanceType> nbr_dists(num_nbrs);
 
+    auto push_neighbors = [&](std::size_t i) {
+        const typename DerivedV::Scalar query[3] = {V(i, 0), V(i, 1), V(i, 2)};
+        const std::size_t num_found = tree.knnSearch(query, num_nbrs, nbr_idxs.data(), nbr_dists.data());
+        for (std::size_t j = 0; j < num_found; j += 1) {
+            const std::size_t nj = nbr_idxs[j];
+            if (nj == i || visited[nj]) {
+                continue;
+            }
+            const double w = std::abs(double(N(i, 0) * N(nj, 0) + N(i, 1) * N(nj, 1) + N(i, 2) * N(nj, 2)));
+            if (w >= 0.3) {
+                heap.push_back(WeightedArc{i, nj, w});
+                std::push_heap(heap.begin(), heap.end());
+            }
+        }
+    };
+
+    for (std::size_t seed = 0; seed < num_points; seed += 1) {
+        if (visited[seed]) {
+            continue;
+        }
+        visited[seed] = true;
+        push_neighbors(seed);
+
+        while (!heap.empty()) {
+            std::pop_heap(heap.begin(), heap.end());
+            const WeightedArc arc = heap.back();
+            heap.pop_back();
+            if (visited[arc.dst]) {
+                continue;
+            }
+            visited[arc.dst] = true;
+            const double dot = N(arc.src, 0) * N(arc.dst, 0) + N(arc.src, 1) * N(arc.dst, 1) +
+                               N(arc.src, 2) * N(arc.dst, 2);
+            if (dot < 0.0) {
+                N.row(arc.dst) *= -1;
+            }
+            push_neighbors(arc.dst);
+        }
+    }
+}
+
+
+/*
+ * Estimate normals for a point cloud by fitting a plane to a neighborhood of each point (see NeighborhoodQuery).
+ *
+ * tree is a KD tree over V with a nanoflann style query interface (either a nanoflann tree or a FlatKDTreeView of a
+ * prebuilt KDTree) which is shared by every pass. The per-point fits run in parallel
+ * and also output the covariance eigenvalues and surface variation (lambda_0 / (lambda_0 + lambda_1 + lambda_2))
+ * of each neighborhood if curvature and eigenvalues are non-null. If view_point or sensor_positions is set,
+ * normals are oriented towards the viewpoint (or per-point sensor position) in the same pass. Otherwise they are
+ * consistently oriented by propagation along the neighbor graph.
+ */
+template <typename KDTreeType, typename DerivedV, typename DerivedS, typename DerivedN, typename DerivedC,
+          typename DerivedE>
+void estimate_point_cloud_normals_pca(const KDTreeType& tree, const DerivedV& V, const DerivedS& sensor_positions,
+                                      int max_k, double radius, int smoothing_iterations,
+                                      bool use_view_point, const Eigen::Vector3d& view_point,
+                                      DerivedN& N, DerivedC* curvature, DerivedE* eigenvalues) {
+    typedef typename DerivedV::Scalar Scalar;
+
+    const std::ptrdiff_t num_points = V.rows();
+    const bool use_sensor_positions = sensor_positions.rows() > 0;
+    const bool orient_in_fit = (use_view_point || use_sensor_positions) && smoothing_iterations <= 0;
+
+    N.resize(num_points, 3);
+    if (curvature) {
+        curvature->resize(num_points, 1);
+    }
+    if (eigenvalues) {
+        eigenvalues->resize(num_points, 3);
+    }
+
+    auto orient = [&](std::ptrdiff_t i, Eigen::Vector3d& n) {
+        const Eigen::Vector3d p(V(i, 0), V(i, 1), V(i, 2));
+        if (use_sensor_positions) {
+            orient_towards(n, p, sensor_positions(i, 0), sensor_positions(i, 1), sensor_positions(i, 2));
+        } else if (use_view_point) {
+            orient_towards(n, p, view_point[0], view_point[1], view_point[2]);
+        }
+    };
+
+    #pragma omp parallel
+    {
+        NeighborhoodQuery<KDTreeType> nbrs(tree, num_points, max_k, radius);
+
+        #pragma omp for
+        for (std::ptrdiff_t i = 0; i < num_points; i += 1) {
+            const Scalar query[3] = {V(i, 0), V(i, 1), V(i, 2)};
+            const std::size_t num_found = nbrs.query(query);
+
+            Eigen::Vector3d n, lambda;
+            fit_plane(V, nbrs.indices(), num_found, n, lambda);
+            if (orient_in_fit) {
+                orient(i, n);
+            }
+            for (int j = 0; j < 3; j += 1) {
+                N(i, j) = n[j];
+            }
+            if (curvature) {
+                const double lambda_sum = lambda.sum();
+                (*curvature)(i, 0) = lambda_sum > 0.0 ? lambda[0] / lambda_sum : 0.0;
+            }
+            if (eigenvalues) {
+                for (int j = 0; j < 3; j += 1) {
+                    (*eigenvalues)(i, j) = lambda[j];
+                }
+            }
+        }
+    }
+
+    // Smooth normals by averaging (sign-corrected) normals over the same neighborhoods
+    if (smoothing_iterations > 0) {
+        DerivedN N_smooth(num_points, 3);
+        for (int iter = 0; iter < smoothing_iterations; iter += 1) {
+            #pragma omp parallel
+            {
+                NeighborhoodQuery<KDTreeType> nbrs(tree, num_points, max_k, radius);
+
+                #pragma omp for
+                for (std::ptrdiff_t i = 0; i < num_points; i += 1) {
+                    const Scalar query[3] = {V(i, 0), V(i, 1), V(i, 2)};
+                    const std::size_t num_found = nbrs.query(query);
+                    const std::size_t* nbr_idxs = nbrs.indices();
+
+                    Eigen::Vector3d ni(N(i, 0), N(i, 1), N(i, 2));
+                    Eigen::Vector3d acc = Eigen::Vector3d::Zero();
+                    for (std::size_t j = 0; j < num_found; j += 1) {
+                        const std::size_t nj = nbr_idxs[j];
+                        const Eigen::Vector3d n_nbr(N(nj, 0), N(nj, 1), N(nj, 2));
+                        acc += (n_nbr.dot(ni) > 0.0) ? n_nbr : Eigen::Vector3d(-n_nbr);
+                    }
+                    const double acc_norm = acc.norm();
+                    if (acc_norm > 0.0) {
+                        acc /= acc_norm;
+                    }
+                    for (int j = 0; j < 3; j += 1) {
+                        N_smooth(i, j) = acc[j];
+                    }
+                }
+            }
+            N.swap(N_smooth);
+        }
+    }
+
+    if (orient_in_fit) {
+        return;
+    } else if (use_view_point || use_sensor_positions) {
+        #pragma omp parallel for
+        for (std::ptrdiff_t i = 0; i < num_points; i += 1) {
+            Eigen::Vector3d n(N(i, 0), N(i, 1), N(i, 2));
+            orient(i, n);
+            for (int j = 0; j < 3; j += 1) {
+                N(i, j) = n[j];
+            }
+        }
+    } else {
+        orient_normals_by_propagation(tree, V, N, 8 /* same as VCG's coherentAdjNum */);
+    }
 }
-npe_end_code()
 
+/*
+ * Compute per-vertex normals of a triangle mesh as a weighted sum of the (unit) normals of the faces around each
+ * vertex, writing them into the #v x 3 row-major buffer out.
+ *
+ * weighting is 0 for uniform, 1 for area and 2 for (interior) angle weights. Faces are processed in parallel and
+ * write their normal and per-corner weights into their own slots. Vertices then gather those in parallel using a
+ * vertex to face-corner adjacency in CSR format (which is also built in parallel), so no atomics are needed to sum the
+ * normals. Vertices which are not referenced by any face (or only by degenerate faces) get a zero normal.
+ */
+template <typename DerivedV, typename DerivedF, typename Scalar>
+void per_vertex_normals_csr(const DerivedV& V, const DerivedF& F, int weighting, Scalar* out) {
+    const std::ptrdiff_t num_vertices = V.rows();
+    const std::ptrdiff_t num_faces = F.rows();
 
-const char* estimate_mesh_normals_doc = R"igl_Qu8mg5v7(
-Compute vertex normals of a mesh from its vertices and faces using face area weighting
+    // Build the vertex to face-corner adjacency (corner 3 * fi + c is vertex c of face fi) in parallel: count the
+    // corners of each vertex, prefix sum the counts into offsets and scatter the corners into their vertex's range.
+    // The scatter order depends on the scheduling so each range is sorted afterwards, which keeps the summation order
+    // (and hence the output) deterministic.
+    std::vector<std::ptrdiff_t> vf_offsets(num_vertices + 1, 0);
+    #pragma omp parallel for
+    for (std::ptrdiff_t fi = 0; fi < num_faces; fi += 1) {
+        for (int c = 0; c < 3; c += 1) {
+            #pragma omp atomic
+            vf_offsets[F(fi, c) + 1] += 1;
+        }
+    }
+    parallel_inclusive_scan(vf_offsets);
+    std::vector<std::ptrdiff_t> vf_corners(vf_offsets[num_vertices]);
+    {
+        std::vector<std::ptrdiff_t> fill_pos(vf_offsets.begin(), vf_offsets.end() - 1);
+        #pragma omp parallel for
+        for (std::ptrdiff_t fi = 0; fi < num_faces; fi += 1) {
+            for (int c = 0; c < 3; c += 1) {
+                std::ptrdiff_t pos;
+                #pragma omp atomic capture
+                pos = fill_pos[F(fi, c)]++;
+                vf_corners[pos] = 3 * fi + c;
+            }
+        }
+    }
+    #pragma omp parallel for schedule(dynamic, 1024)
+    for (std::ptrdiff_t vi = 0; vi < num_vertices; vi += 1) {
+        std::sort(vf_corners.begin() + vf_offsets[vi], vf_corners.begin() + vf_offsets[vi + 1]);
+    }
 
-Parameters
-----------
-v : #v by 3 Matrix of mesh vertex 3D positions
-f : #f by 3 Matrix of face (triangle) indices
-weighting_type : Weighting type must be one of 'uniform', 'angle', or 'area' (default is 'uniform')
+    // Per-face unit normals and per-corner weights
+    std::vector<Eigen::Vector3d> face_normals(num_faces);
+    std::vector<double> corner_weights(3 * num_faces);
+    #pragma omp parallel for
+    for (std::ptrdiff_t fi = 0; fi < num_faces; fi += 1) {
+        Eigen::Vector3d p[3];
+        for (int c = 0; c < 3; c += 1) {
+            p[c] = Eigen::Vector3d(V(F(fi, c), 0), V(F(fi, c), 1), V(F(fi, c), 2));
+        }
+        const Eigen::Vector3d cross = (p[1] - p[0]).cross(p[2] - p[0]);
+        const double double_area = cross.norm();
+        face_normals[fi] = double_area > 0.0 ? Eigen::Vector3d(cross / double_area) : Eigen::Vector3d::Zero();
 
-Returns
--------
-n : list of vertex normals of shape #v by 3
+        for (int c = 0; c < 3; c += 1) {
+            double w = 1.0;
+            if (weighting == 1) {
+                w = double_area;
+            } else if (weighting == 2) {
+                const Eigen::Vector3d e1 = p[(c + 1) % 3] - p[c], e2 = p[(c + 2) % 3] - p[c];
+                w = std::atan2(e1.cross(e2).norm(), e1.dot(e2));
+            }
+            corner_weights[3 * fi + c] = w;
+        }
+    }
+
+    // Gather the weighted face normals around each vertex
+    #pragma omp parallel for
+    for (std::ptrdiff_t vi = 0; vi < num_vertices; vi += 1) {
+        Eigen::Vector3d acc = Eigen::Vector3d::Zero();
+        for (std::ptrdiff_t j = vf_offsets[vi]; j < vf_offsets[vi + 1]; j += 1) {
+            const std::ptrdiff_t corner = vf_corners[j];
+            acc += corner_weights[corner] * face_normals[corner / 3];
+        }
+        const double acc_norm = acc.norm();
+        if (acc_norm > 0.0) {
+            acc /= acc_norm;
+        }
+        for (int j = 0; j < 3; j += 1) {
+            out[3 * vi + j] = Scalar(acc[j]);
+        }
+    }
+}
 
-See also
---------
+}
 
-Notes
------
 
-Examples
---------
-)igl_Qu8mg5v7";
-npe_function(estimate_mesh_normals_doc)
-npe_doc(estimate_mesh_normals_doc)
+npe_function(estimate_point_cloud_normals_internal)
+npe_arg(v, dense_float, dense_double)
+npe_arg(sensor_positions, npe_matches(v))
+npe_arg(k, int)
+npe_arg(radius, double)
+npe_arg(smoothing_iterations, int)
+npe_arg(use_view_point, bool)
+npe_arg(view_point_x, double)
+npe_arg(view_point_y, double)
+npe_arg(view_point_z, double)
+npe_arg(max_points_per_leaf, int)
+npe_arg(return_curvature, bool)
+npe_arg(return_eigenvalues, bool)
+npe_arg(tree_points, npe_matches(v))
+npe_arg(tree_indices, dense_long, dense_longlong)
+npe_arg(tree_nodes, npe_matches(tree_indices))
+npe_arg(tree_splits, npe_matches(v))
+npe_begin_code()
+{
+    validate_point_cloud(v, false /* allow_0 */);
+    if (radius <= 0.0 && k <= 0) {
+        throw pybind11::value_error("Invalid value for k (" + std::to_string(k) + ") must be greater than 0 "
+                                    "when radius is not set.");
+    }
+    if (sensor_positions.rows() > 0 && (sensor_positions.rows() != v.rows() || sensor_positions.cols() != 3)) {
+        std::stringstream ss;
+        ss << "Invalid sensor_positions must have the same shape as the input points. Got points.shape = ("
+           << v.rows() << ", " << v.cols() << "), sensor_positions.shape = (" << sensor_positions.rows() << ", "
+           << sensor_positions.cols() << ").";
+        throw pybind11::value_error(ss.str());
+    }
+
+    // An empty tree_points means there is no prebuilt KD tree, so build a nanoflann tree over v
+    const bool use_prebuilt_tree = tree_points.rows() > 0;
+    if (use_prebuilt_tree) {
+        validate_kd_tree(tree_points, tree_indices, tree_nodes, tree_splits);
+        if (tree_points.rows() != v.rows()) {
+            throw pybind11::value_error("Invalid kd_tree has " + std::to_string(tree_points.rows()) +
+                                        " points but the input has " + std::to_string(v.rows()) + " points.");
+        }
+    }
+
+    typedef Eigen::Matrix<npe_Scalar_v, Eigen::Dynamic, 1> CurvatureMatrix;
+    typedef Eigen::Matrix<npe_Scalar_v, Eigen::Dynamic, 3, Eigen::RowMajor> EigenvalueMatrix;
+
+    EigenDenseLike<npe_Matrix_v> ret_n;
+    CurvatureMatrix ret_c(0, 1);
+    EigenvalueMatrix ret_e(0, 3);
+    const Eigen::Vector3d view_point(view_point_x, view_point_y, view_point_z);
+    CurvatureMatrix* curvature = return_curvature ? &ret_c : (CurvatureMatrix*) nullptr;
+    EigenvalueMatrix* eigenvalues = return_eigenvalues ? &ret_e : (EigenvalueMatrix*) nullptr;
+    if (use_prebuilt_tree) {
+        // Instantiate with the types of the arguments (maps of the numpy arrays) so queries read the tree in place
+        FlatKDTreeView<typename std::decay<decltype(tree_points)>::type,
+                       typename std::decay<decltype(tree_indices)>::type,
+                       typename std::decay<decltype(tree_nodes)>::type,
+                       typename std::decay<decltype(tree_splits)>::type> tree(
+                tree_points, tree_indices, tree_nodes, tree_splits);
+        estimate_point_cloud_normals_pca(tree, v, sensor_positions, k, radius, smoothing_iterations,
+                                         use_view_point, view_point, ret_n, curvature, eigenvalues);
+    } else {
+        typedef typename std::decay<decltype(v)>::type MatrixV;
+        EigenRowsDatasetAdaptor<MatrixV> dataset(v);
+        EigenKDTree3<MatrixV> tree(3, dataset, nanoflann::KDTreeSingleIndexAdaptorParams(max_points_per_leaf));
+        tree.buildIndex();
+        estimate_point_cloud_normals_pca(tree, v, sensor_positions, k, radius, smoothing_iterations,
+                                         use_view_point, view_point, ret_n, curvature, eigenvalues);
+    }
+    return std::make_tuple(npe::move(ret_n), npe::move(ret_c), npe::move(ret_e));
+}
+npe_end_code()
+
+
+npe_function(estimate_mesh_normals_internal)
 npe_arg(v, dense_float, dense_double)
 npe_arg(f, dense_int, dense_longlong, dense_uint, dense_ulonglong)
-npe_default_arg(weighting_type, std::string, std::string("uniform"))
+npe_arg(weighting_type, std::string)
+npe_arg(out, pybind11::array)
 npe_begin_code()
 {
+    typedef npe_Scalar_v Scalar;
+
     validate_mesh(v, f);
     int weighting = -1;
     if (weighting_type == "uniform") {
-        weighting  = 0;
+        weighting = 0;
     } else if (weighting_type == "area") {
         weighting = 1;
     } else if (weighting_type == "angle") {
@@ -115,10 +483,38 @@ npe_begin_code()
                                     weighting_type + "'");
     }
 
-    npe_Matrix_v n;
-    igl::PerVertexNormalsWeightingType wtype = igl::PerVertexNormalsWeightingType(weighting);
-    igl::per_vertex_normals(v, f, wtype, n);
+    if (!out.dtype().equal(pybind11::dtype::of<Scalar>())) {
+        throw pybind11::value_error("Invalid dtype for out, must have the same dtype as v.");
+    }
+    if (!(out.flags() & pybind11::array::c_style) || !out.writeable()) {
+        throw pybind11::value_error("Invalid out array, must be writeable and C-contiguous.");
+    }
+    if (out.ndim() != 2 || out.shape(0) != v.rows() || out.shape(1) != 3) {
+        throw pybind11::value_error("Invalid shape for out, must have the same shape as v (" +
+                                    std::to_string(v.rows()) + ", 3).");
+    }
+
+    // Check indices up front since we use them to build the adjacency
+    bool invalid_index = false;
+    #pragma omp parallel for reduction(||: invalid_index)
+    for (std::ptrdiff_t fi = 0; fi < f.rows(); fi += 1) {
+        for (int c = 0; c < 3; c += 1) {
+            const std::ptrdiff_t vi = f(fi, c);
+            if (vi < 0 || vi >= v.rows()) {
+                invalid_index = true;
+            }
+        }
+    }
+    if (invalid_index) {
+        throw pybind11::value_error("Invalid vertex index in f, all indices must be in [0, #v).");
+    }
+
+    Scalar* out_ptr = static_cast<Scalar*>(out.mutable_data());
+    {
+        pybind11::gil_scoped_release release;
+        per_vertex_normals_csr(v, f, weighting, out_ptr);
+    }
 
-    return npe::move(n);
+    return out;
 }
-npe_end_code()
\ No newline at end of file
+npe_end_code()
@@ -1,11 +1,47 @@
 #include <npe.h>
 #include <octree/octree.cpp>
 
+#include <cstdint>
 #include <iostream>
+#include <vector>
+
+#include "common.h"
 
 
 namespace py = pybind11;
 
+
+namespace {
+
+/*
+ * Append node and its descendants to the flat octree arrays (see flatten_octree_internal) in depth first order and
+ * return the index of node
+ */
+std::int64_t flatten_octree_node(const std::shared_ptr<OctreeNode>& node,
+                                 std::vector<std::int64_t>& children,
+                                 std::vector<std::int64_t>& point_offsets,
+                                 std::vector<std::int64_t>& point_indices) {
+    const std::int64_t node_index = std::int64_t(point_offsets.size());
+    children.insert(children.end(), 8, -1);
+    point_offsets.push_back(std::int64_t(point_indices.size()));
+
+    if (auto leaf_node = std::dynamic_pointer_cast<OctreePointColorLeafNode>(node)) {
+        point_indices.insert(point_indices.end(), leaf_node->indices_.begin(), leaf_node->indices_.end());
+    } else if (auto internal_node = std::dynamic_pointer_cast<OctreeInternalNode>(node)) {
+        for (int i = 0; i < 8; i += 1) {
+            if (internal_node->children_[i] != nullptr) {
+                const std::int64_t child_index = flatten_octree_node(internal_node->children_[i], children,
+                                                                     point_offsets, point_indices);
+                children[node_index * 8 + i] = child_index;
+            }
+        }
+    }
+    return node_index;
+}
+
+} // namespace
+
+
 void hack_extra_bindings(pybind11::module& m) {
     py::class_<Octree, std::shared_ptr<Octree>>(m, "Octree")
     .def(py::init([](size_t max_depth, double ox, double oy, double oz, double size){
@@ -31,6 +67,27 @@ void hack_extra_bindings(pybind11::module& m) {
                 std::make_tuple(std::get<0>(ret)[0], std::get<0>(ret)[1], std::get<0>(ret)[2]),
                 std::make_tuple(std::get<1>(ret)[0], std::get<1>(ret)[1], std::get<0>(ret)[2]));
     });
+
+    // Flatten an octree into arrays which can be shared between processes and queried with query_octree_internal:
+    //  - children: #m x 8 index of the children of each node in depth first order (-1 for no child). Child i of a
+    //              node is the octant x_i + 2 * y_i + 4 * z_i where x_i, y_i, z_i are 1 on the upper half of each axis.
+    //  - point_offsets: #m + 1 the points in node i are point_indices[point_offsets[i]:point_offsets[i + 1]]
+    //  - point_indices: the indices of the points in each leaf node
+    // along with the origin and size of the root node.
+    m.def("flatten_octree_internal", [](const Octree& octree) {
+        std::vector<std::int64_t> children, point_offsets, point_indices;
+        if (octree.root_node_ != nullptr) {
+            flatten_octree_node(octree.root_node_, children, point_offsets, point_indices);
+        }
+        point_offsets.push_back(std::int64_t(point_indices.size()));
+
+        EigenDenseI64 ret_children = Eigen::Map<EigenDenseI64>(children.data(), children.size() / 8, 8);
+        EigenDenseI64 ret_offsets = Eigen::Map<EigenDenseI64>(point_offsets.data(), point_offsets.size(), 1);
+        EigenDenseI64 ret_indices = Eigen::Map<EigenDenseI64>(point_indices.data(), point_indices.size(), 1);
+        return std::make_tuple(npe::move(ret_children), npe::move(ret_offsets), npe::move(ret_indices),
+                               std::make_tuple(octree.origin_[0], octree.origin_[1], octree.origin_[2]),
+                               octree.size_);
+    });
 }
 
 
@@ -72,63 +129,71 @@ npe_begin_code()
 npe_end_code()
 
 
-const char* get_octree_point_leaves_internal_doc = R"Qu8mg5v7(
 
+const char* query_octree_internal_doc = R"Qu8mg5v7(
+Locate the leaf node containing each query point in an octree flattened by flatten_octree_internal.
+
+Returns
+-------
+A tuple (leaf, depth, origin, size, child_index) where leaf[i] is the index of the leaf node containing points[i]
+(or -1 if no leaf contains it), and depth[i], origin[i], size[i] and child_index[i] are the depth, minimum corner, edge
+length and index in its parent of that leaf.
 )Qu8mg5v7";
-npe_function(get_octree_point_leaves_internal)
-npe_arg(octree, std::shared_ptr<Octree>)
+npe_function(query_octree_internal)
 npe_arg(points, dense_float, dense_double)
-npe_doc(get_octree_point_leaves_internal_doc)
+npe_arg(children, dense_long, dense_longlong)
+npe_arg(ox, double)
+npe_arg(oy, double)
+npe_arg(oz, double)
+npe_arg(size, double)
+npe_arg(max_depth, int)
+npe_doc(query_octree_internal_doc)
 npe_begin_code()
 {
-    std::vector<pybind11::tuple> ret_info(points.rows());
-    std::vector<pybind11::list> ret_idxs(points.rows());
-
-    #pragma omp parallel
-    #pragma omp for
-    for (int i = 0; i < points.rows(); i += 1) {
-        auto ret_i = octree->LocateLeafNode(points.row(i).template cast<double>());
-        if (ret_i.second == nullptr) {
-            ret_info[i] = pybind11::none();
-            ret_idxs[i] = pybind11::list();
-        } else {
-            ret_info[i] = pybind11::cast(
-                    std::make_tuple(npe::move(ret_i.second->origin_), ret_i.second->size_,
-                                    ret_i.second->depth_, ret_i.second->child_index_));
-            ret_info[i] = pybind11::cast(
-                    std::dynamic_pointer_cast<OctreePointColorLeafNode>(ret_i.first)->indices_);
-        }
+    validate_point_cloud(points);
+    if (children.rows() > 0 && children.cols() != 8) {
+        throw pybind11::value_error("Invalid children must have shape (m, 8), got (" + std::to_string(children.rows()) +
+                                    ", " + std::to_string(children.cols()) + ").");
     }
-    return std::make_tuple(ret_info, ret_idxs);
-}
-npe_end_code()
-
-
 
-const char* get_octree_point_depths_internal_doc = R"Qu8mg5v7(
-
-)Qu8mg5v7";
-npe_function(get_octree_point_depths_internal)
-npe_arg(octree, std::shared_ptr<Octree>)
-npe_arg(points, dense_float, dense_double)
-npe_doc(get_octree_point_depths_internal_doc)
-npe_begin_code()
-{
+    EigenDenseI64 ret_leaf(points.rows(), 1);
     Eigen::VectorXi ret_depth(points.rows());
-
-    #pragma omp parallel
-    #pragma omp for
-    for (int i = 0; i < points.rows(); i += 1) {
-        auto ret_i = octree->LocateLeafNode(points.row(i).template cast<double>());
-        if (ret_i.second == nullptr) {
-            ret_depth[i] = -1;
-        } else {
-            ret_depth[i] = ret_i.second->depth_;
+    EigenDenseF64 ret_origin(points.rows(), 3);
+    Eigen::VectorXd ret_size(points.rows());
+    Eigen::VectorXi ret_child_index(points.rows());
+    const Eigen::Vector3d root_origin(ox, oy, oz);
+    {
+        pybind11::gil_scoped_release release;
+
+        // This follows the same steps as Octree::InsertPoint and Octree::LocateLeafNode
+        #pragma omp parallel for
+        for (std::ptrdiff_t i = 0; i < points.rows(); i += 1) {
+            const Eigen::Vector3d point = points.row(i).template cast<double>();
+            std::int64_t node = children.rows() > 0 && Octree::IsPointInBound(point, root_origin, size) ? 0 : -1;
+            Eigen::Vector3d origin = root_origin;
+            double node_size = size;
+            int depth = 0, child_index = 0;
+            while (node >= 0 && depth < max_depth) {
+                const double child_size = node_size / 2.0;
+                const int x_index = point[0] < origin[0] + child_size ? 0 : 1;
+                const int y_index = point[1] < origin[1] + child_size ? 0 : 1;
+                const int z_index = point[2] < origin[2] + child_size ? 0 : 1;
+                child_index = x_index + y_index * 2 + z_index * 4;
+                origin += Eigen::Vector3d(x_index * child_size, y_index * child_size, z_index * child_size);
+                node_size = child_size;
+                depth += 1;
+                node = Octree::IsPointInBound(point, origin, node_size) ? children(node, child_index) : -1;
+            }
+
+            ret_leaf(i, 0) = node;
+            ret_depth[i] = node >= 0 ? depth : -1;
+            ret_origin.row(i) = origin.transpose();
+            ret_size[i] = node_size;
+            ret_child_index[i] = child_index;
         }
     }
-    return npe::move(ret_depth);
+
+    return std::make_tuple(npe::move(ret_leaf), npe::move(ret_depth), npe::move(ret_origin), npe::move(ret_size),
+                           npe::move(ret_child_index));
 }
 npe_end_code()
-
-
-
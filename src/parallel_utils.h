@@ -0,0 +1,95 @@
+#include <algorithm>
+#include <cstddef>
+#include <vector>
+
+#ifdef _OPENMP
+#include <omp.h>
+#endif
+
+#ifndef PARALLEL_UTILS_H
+#define PARALLEL_UTILS_H
+
+/*
+ * The maximum number of threads parallel kernels started from the calling thread will use.
+ * This is the OpenMP setting of the calling thread (see set_num_threads) or 1 if OpenMP is not available.
+ */
+inline int max_num_threads() {
+#ifdef _OPENMP
+    return omp_get_max_threads();
+#else
+    return 1;
+#endif
+}
+
+/*
+ * Set the maximum number of threads parallel kernels started from the calling thread will use.
+ * This has no effect if OpenMP is not available.
+ */
+inline void set_max_num_threads(int num_threads) {
+#ifdef _OPENMP
+    omp_set_num_threads(num_threads);
+#else
+    (void) num_threads;
+#endif
+}
+
+/*
+ * Sort values in parallel by sorting fixed size blocks and then merging pairs of sorted runs
+ */
+template <typename T>
+void parallel_sort(std::vector<T>& values) {
+    const std::ptrdiff_t n = values.size();
+    const std::ptrdiff_t block_size = 1 << 20;
+    const std::ptrdiff_t num_blocks = (n + block_size - 1) / block_size;
+
+    #pragma omp parallel for
+    for (std::ptrdiff_t b = 0; b < num_blocks; b += 1) {
+        std::sort(values.begin() + b * block_size, values.begin() + std::min(n, (b + 1) * block_size));
+    }
+
+    for (std::ptrdiff_t width = block_size; width < n; width *= 2) {
+        const std::ptrdiff_t num_merges = (n + 2 * width - 1) / (2 * width);
+        #pragma omp parallel for
+        for (std::ptrdiff_t m = 0; m < num_merges; m += 1) {
+            const std::ptrdiff_t start = m * 2 * width;
+            const std::ptrdiff_t mid = std::min(n, start + width);
+            const std::ptrdiff_t end = std::min(n, start + 2 * width);
+            std::inplace_merge(values.begin() + start, values.begin() + mid, values.begin() + end);
+        }
+    }
+}
+
+/*
+ * Replace values with their inclusive prefix sums in parallel by summing fixed size blocks, scanning the block sums
+ * and then scanning each block starting from the sum of the blocks before it
+ */
+template <typename T>
+void parallel_inclusive_scan(std::vector<T>& values) {
+    const std::ptrdiff_t n = values.size();
+    const std::ptrdiff_t block_size = 1 << 16;
+    const std::ptrdiff_t num_blocks = (n + block_size - 1) / block_size;
+
+    std::vector<T> block_offsets(num_blocks + 1, T(0));
+    #pragma omp parallel for
+    for (std::ptrdiff_t b = 0; b < num_blocks; b += 1) {
+        T sum = T(0);
+        for (std::ptrdiff_t i = b * block_size; i < std::min(n, (b + 1) * block_size); i += 1) {
+            sum += values[i];
+        }
+        block_offsets[b + 1] = sum;
+    }
+    for (std::ptrdiff_t b = 0; b < num_blocks; b += 1) {
+        block_offsets[b + 1] += block_offsets[b];
+    }
+
+    #pragma omp parallel for
+    for (std::ptrdiff_t b = 0; b < num_blocks; b += 1) {
+        T sum = block_offsets[b];
+        for (std::ptrdiff_t i = b * block_size; i < std::min(n, (b + 1) * block_size); i += 1) {
+            sum += values[i];
+            values[i] = sum;
+        }
+    }
+}
+
+#endif
@@ -7,6 +7,7 @@
 
 #include "nanoflann.hpp"
 #include "common.h"
+#include "profiling.h"
 
 
 namespace {
@@ -19,6 +20,7 @@ void shortest_distances_nanoflann(Source& query_mat,
                                   Source& dataset_mat,
                                   Eigen::PlainObjectBase<DerivedCorrs> &corrs,
                                   Eigen::PlainObjectBase<DerivedDists> &distances,
+                                  KernelProfiler& profiler,
                                   int num_nbrs=1, bool squared_dist=false,
                                   int max_points_per_leaf=10) {
     assert(query_mat.cols() == 3);
@@ -29,34 +31,43 @@ void shortest_distances_nanoflann(Source& query_mat,
     using IndexType = typename KdTreeType::IndexType;
     using ScalarType = typename KdTreeType::num_t;
 
+    profiler.phase("build_index");
     KdTreeType mat_index(3, std::cref(dataset_mat), max_points_per_leaf /* max leaf */);
     mat_index.index->buildIndex();
 
-    std::array<ScalarType, 3> query_point;
-    std::vector<IndexType> out_indices(num_nbrs);
-    std::vector<ScalarType> out_dists_sqr(num_nbrs);
-
+    profiler.phase("allocate_outputs", std::int64_t(query_mat.rows()) * num_nbrs *
+                                       (sizeof(typename DerivedCorrs::Scalar) + sizeof(typename DerivedDists::Scalar)));
     corrs.resize(query_mat.rows(), num_nbrs);
     distances.resize(query_mat.rows(), num_nbrs);
 
-    for(int i = 0; i < query_mat.rows(); ++i) {
-        for (int j = 0; j < query_mat.cols(); ++j) { query_point[j] = query_mat(i, j); }
-
-        const size_t founds = mat_index.index->knnSearch(query_point.data(), num_nbrs,
-                                             out_indices.data(), out_dists_sqr.data());
-        assert(founds >= 1);
-
-        for (int k = 0; k < founds; k++) {
-            corrs(i, k) = out_indices[k];
-            if (squared_dist) {
-                distances(i, k) = out_dists_sqr[k];
-            } else {
-                distances(i, k) = sqrt(out_dists_sqr[k]);
+    profiler.phase("query");
+    // Queries are independent and only read the tree so we run them in parallel
+    #pragma omp parallel
+    {
+        std::array<ScalarType, 3> query_point;
+        std::vector<IndexType> out_indices(num_nbrs);
+        std::vector<ScalarType> out_dists_sqr(num_nbrs);
+
+        #pragma omp for schedule(dynamic, 256)
+        for (std::ptrdiff_t i = 0; i < std::ptrdiff_t(query_mat.rows()); ++i) {
+            for (int j = 0; j < query_mat.cols(); ++j) { query_point[j] = query_mat(i, j); }
+
+            const size_t founds = mat_index.index->knnSearch(query_point.data(), num_nbrs,
+                                                 out_indices.data(), out_dists_sqr.data());
+            assert(founds >= 1);
+
+            for (int k = 0; k < founds; k++) {
+                corrs(i, k) = out_indices[k];
+                if (squared_dist) {
+                    distances(i, k) = out_dists_sqr[k];
+                } else {
+                    distances(i, k) = sqrt(out_dists_sqr[k]);
+                }
+            }
+            for (int k = founds; k < num_nbrs; k++) {
+                corrs(i, k) = -1;
+                distances(i, k) = -1.0;
             }
-        }
-        for (int k = founds; k < num_nbrs; k++) {
-            corrs(i, k) = -1;
-            distances(i, k) = -1.0;
         }
     }
 }
@@ -112,6 +123,9 @@ npe_begin_code()
         throw pybind11::value_error(ss.str());
     }
 
+    KernelProfiler profiler("k_nearest_neighbors");
+    profiler.phase("copy_inputs", std::int64_t(source.size() + target.size()) * sizeof(npe_Scalar_source));
+
     // FIXME: nanoflann does not work with Eigen::Maps so we have to do a copy here :(
     EigenDenseLike<npe_Matrix_source> src = source;
     EigenDenseLike<npe_Matrix_target> dst = target;
@@ -121,7 +135,7 @@ npe_begin_code()
     using IndexType = typename npe_Matrix_source::Index;
     Eigen::Matrix<IndexType, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor> corrs;
 
-    shortest_distances_nanoflann(src, dst, corrs, dists, k, squared_distances, max_points_per_leaf);
+    shortest_distances_nanoflann(src, dst, corrs, dists, profiler, k, squared_distances, max_points_per_leaf);
 
     return std::make_tuple(npe::move(dists), npe::move(corrs));
 }
@@ -175,6 +189,9 @@ npe_begin_code()
         throw pybind11::value_error(ss.str());
     }
 
+    KernelProfiler profiler("one_sided_hausdorff_distance");
+    profiler.phase("copy_inputs", std::int64_t(source.size() + target.size()) * sizeof(npe_Scalar_source));
+
     // FIXME: nanoflann does not work with Eigen::Maps so we have to do a copy here :(
     EigenDenseLike<npe_Matrix_source> src = source;
     EigenDenseLike<npe_Matrix_target> dst = target;
@@ -184,8 +201,9 @@ npe_begin_code()
     using IndexType = typename kd_tree::IndexType;
     Eigen::Matrix<IndexType, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor> corrs;
 
-    shortest_distances_nanoflann(src, dst, corrs, dists, 1, squared_distances, max_points_per_leaf);
+    shortest_distances_nanoflann(src, dst, corrs, dists, profiler, 1, squared_distances, max_points_per_leaf);
 
+    profiler.phase("reduce");
     size_t max_index_source = -1;
     size_t dummy = -1;
     npe_Scalar_source max_dist = dists.maxCoeff(&max_index_source, &dummy);
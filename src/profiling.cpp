@@ -0,0 +1,33 @@
+#include <pybind11/pybind11.h>
+
+#include "profiling.h"
+
+
+void profiling_extra_bindings(pybind11::module& m) {
+    using namespace pybind11::literals;
+
+    m.def("set_profiling_enabled_internal", [](bool enabled) {
+        profiling_enabled().store(enabled);
+    });
+    m.def("take_profile_records_internal", []() {
+        std::vector<ProfileRecord> records;
+        {
+            std::lock_guard<std::mutex> guard(profile_records_mutex());
+            records.swap(profile_records());
+        }
+        pybind11::list ret;
+        for (const ProfileRecord& r : records) {
+            ret.append(pybind11::dict("call_id"_a=r.call_id, "kernel"_a=r.kernel, "phase"_a=r.phase,
+                                      "seconds"_a=r.seconds, "bytes"_a=r.bytes, "num_threads"_a=r.num_threads));
+        }
+        return ret;
+    });
+
+    // Pick up the current setting in case profiling was enabled before this module was loaded. If the profiling
+    // module has not been imported then no profile has been started.
+    pybind11::dict modules = pybind11::module::import("sys").attr("modules");
+    if (modules.contains("point_cloud_utils._profiling")) {
+        pybind11::object is_profiling_enabled = modules["point_cloud_utils._profiling"].attr("is_profiling_enabled");
+        profiling_enabled().store(is_profiling_enabled().cast<bool>());
+    }
+}
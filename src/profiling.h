@@ -0,0 +1,127 @@
+#include <atomic>
+#include <chrono>
+#include <cstdint>
+#include <mutex>
+#include <string>
+#include <vector>
+
+#include "parallel_utils.h"
+
+#ifndef PROFILING_H
+#define PROFILING_H
+
+/*
+ * The timing of one phase of a call to a native kernel, recorded while profiling is enabled (see pcu.profile)
+ */
+struct ProfileRecord {
+    std::int64_t call_id;    // Phases of the same kernel call share a call id
+    std::string kernel;
+    std::string phase;
+    double seconds;
+    std::int64_t bytes;      // The number of bytes the phase copied or allocated (0 if it didn't)
+    int num_threads;         // The thread limit in effect during the call
+};
+
+/*
+ * Profiling state. Each extension module has its own copy of these since they are header only (and symbols are hidden)
+ * so the python side enables profiling and collects records in every loaded module.
+ */
+inline std::atomic<bool>& profiling_enabled() {
+    static std::atomic<bool> enabled(false);
+    return enabled;
+}
+
+inline std::mutex& profile_records_mutex() {
+    static std::mutex mutex;
+    return mutex;
+}
+
+inline std::vector<ProfileRecord>& profile_records() {
+    static std::vector<ProfileRecord> records;
+    return records;
+}
+
+inline std::int64_t next_profile_call_id() {
+    static std::atomic<std::int64_t> call_id(0);
+    return call_id++;
+}
+
+
+/*
+ * Records the phases of one call to a native kernel. Each call to phase() ends the current phase and starts a new one,
+ * and the last phase ends when the profiler goes out of scope, at which point the phases are added to the profile
+ * records. When profiling is disabled, the constructor reads a single atomic flag and every method returns
+ * immediately, so kernels can be instrumented unconditionally.
+ *
+ *   KernelProfiler profiler("k_nearest_neighbors");
+ *   profiler.phase("copy_inputs", num_bytes_copied);
+ *   ...
+ *   profiler.phase("build_index");
+ *   ...
+ */
+class KernelProfiler {
+    typedef std::chrono::steady_clock Clock;
+
+    const bool active;
+    const char* kernel;
+    const char* current_phase = nullptr;
+    std::int64_t current_bytes = 0;
+    Clock::time_point phase_start;
+    std::int64_t call_id = 0;
+    int num_threads = 1;
+    std::vector<ProfileRecord> records;
+
+    void end_phase(Clock::time_point now) {
+        if (current_phase != nullptr) {
+            const double seconds = std::chrono::duration<double>(now - phase_start).count();
+            records.push_back(ProfileRecord{call_id, kernel, current_phase, seconds, current_bytes, num_threads});
+        }
+    }
+
+public:
+    explicit KernelProfiler(const char* kernel_name) :
+        active(profiling_enabled().load(std::memory_order_relaxed)), kernel(kernel_name) {
+        if (active) {
+            call_id = next_profile_call_id();
+            num_threads = max_num_threads();
+        }
+    }
+
+    KernelProfiler(const KernelProfiler&) = delete;
+    KernelProfiler& operator=(const KernelProfiler&) = delete;
+
+    /*
+     * End the current phase and start a new one called name which copies or allocates bytes bytes
+     */
+    void phase(const char* name, std::int64_t bytes = 0) {
+        if (!active) {
+            return;
+        }
+        const Clock::time_point now = Clock::now();
+        end_phase(now);
+        current_phase = name;
+        current_bytes = bytes;
+        phase_start = now;
+    }
+
+    /*
+     * Count bytes more bytes copied or allocated in the current phase
+     */
+    void add_bytes(std::int64_t bytes) {
+        if (active) {
+            current_bytes += bytes;
+        }
+    }
+
+    ~KernelProfiler() {
+        if (!active) {
+            return;
+        }
+        end_phase(Clock::now());
+        std::lock_guard<std::mutex> guard(profile_records_mutex());
+        std::vector<ProfileRecord>& all_records = profile_records();
+        all_records.insert(all_records.end(), records.begin(), records.end());
+    }
+};
+
+#endif // PROFILING_H
@@ -1,99 +1,328 @@
 #include <npe.h>
 
-#include <igl/remove_duplicate_vertices.h>
+#include <algorithm>
+#include <cmath>
+#include <cstdint>
+#include <cstring>
+#include <limits>
+#include <utility>
+#include <vector>
 
 #include "common.h"
+#include "parallel_utils.h"
 
-const char* remove_duplicate_points_doc = R"igl_Qu8mg5v7(
-Removes duplicated points from a point cloud where two points are considered the same if their distance is below
-some threshold
-
-Parameters
-----------
-x : #x by 3 Matrix of 3D positions
-epsilon: threshold below which two points are considered equal
-return_index: If true, return indices to map between input and output
-
-Returns
--------
-x_new : #x_new x 3 Point cloud with duplicates removed
-if return indices is set, this function also returns:
-    svi : #x x 1 indices so that x_new = x[svi]
-    svj : #x_new x 1 indices so that x = x_new[svj]
-
-See also
---------
-remove_duplicate_mesh_vertices
+
+namespace {
+
+typedef Eigen::Matrix<std::int64_t, Eigen::Dynamic, 1> IndexVector;
+typedef std::pair<std::uint64_t, std::int64_t> CellEntry;  // (hash of a point's grid cell, index of the point)
+
+
+inline std::uint64_t hash_cell(std::int64_t x, std::int64_t y, std::int64_t z) {
+    std::uint64_t h = std::uint64_t(x) * 0x9E3779B97F4A7C15ULL;
+    h ^= std::uint64_t(y) + 0xC2B2AE3D27D4EB4FULL + (h << 6) + (h >> 2);
+    h ^= std::uint64_t(z) + 0x165667B19E3779F9ULL + (h << 6) + (h >> 2);
+    // splitmix64 finalizer so every bit of the hash depends on every bit of the cell
+    h = (h ^ (h >> 30)) * 0xBF58476D1CE4E5B9ULL;
+    h = (h ^ (h >> 27)) * 0x94D049BB133111EBULL;
+    return h ^ (h >> 31);
+}
+
+
+/*
+ * An open addressing hash table mapping the hash of each grid cell to the start of its run of points in a sorted array
+ * of CellEntry (so different cells with the same hash share a run, which only costs extra distance checks).
+ */
+class CellTable {
+    std::vector<std::int64_t> slots_;  // Index of the first entry of a run in cells_, or -1 if the slot is empty
+    std::uint64_t mask_ = 0;
+    const std::vector<CellEntry>& cells_;
+
+public:
+    explicit CellTable(const std::vector<CellEntry>& cells) : cells_(cells) {
+        const std::ptrdiff_t n = cells.size();
+        std::vector<char> is_start(n);
+        std::int64_t num_runs = 0;
+        #pragma omp parallel for reduction(+: num_runs)
+        for (std::ptrdiff_t k = 0; k < n; k += 1) {
+            is_start[k] = k == 0 || cells[k].first != cells[k - 1].first;
+            num_runs += is_start[k];
+        }
+
+        std::uint64_t num_slots = 16;
+        while (num_slots < 2 * std::uint64_t(num_runs)) {
+            num_slots *= 2;
+        }
+        mask_ = num_slots - 1;
+        slots_.assign(num_slots, -1);
+        for (std::ptrdiff_t k = 0; k < n; k += 1) {
+            if (is_start[k]) {
+                std::uint64_t slot = cells[k].first & mask_;
+                while (slots_[slot] >= 0) {
+                    slot = (slot + 1) & mask_;
+                }
+                slots_[slot] = k;
+            }
+        }
+    }
+
+    /*
+     * Return the start of the run of entries with the given hash, or cells.size() if there are none
+     */
+    std::size_t find(std::uint64_t key) const {
+        for (std::uint64_t slot = key & mask_; slots_[slot] >= 0; slot = (slot + 1) & mask_) {
+            if (cells_[slots_[slot]].first == key) {
+                return slots_[slot];
+            }
+        }
+        return cells_.size();
+    }
+};
+
+
+/*
+ * Find duplicate points in x (a #x x 3 matrix or map) where two points are duplicates if their distance is less than
+ * epsilon (or if they are exactly equal if epsilon is 0).
+ *
+ * Points are bucketed into a hash grid with cells of size 2 * epsilon. Each point is merged into the lowest indexed
+ * point within epsilon of it, which can only be in its own cell or the neighboring cells on the sides of the cell it is
+ * closest to (8 cells in total), and chains of merged points are collapsed so every point maps to a point which is
+ * kept. Merging is transitive, so a point can be further than epsilon from its kept point (at most epsilon times the
+ * length of its chain). On return, svi holds the indices of the kept points in increasing order and svj maps every
+ * point in x to the index of its kept point in svi. Everything runs in parallel.
+ */
+template <typename MatrixType>
+void find_duplicate_points(const MatrixType& x, double epsilon, std::vector<std::int64_t>& svi,
+                           std::vector<std::int64_t>& svj) {
+    const std::ptrdiff_t n = x.rows();
+    const double inv_cell_size = epsilon > 0.0 ? 0.5 / epsilon : 0.0;
+
+    // Grid cells are integer coordinates x / (2 * epsilon) when epsilon > 0, and the bits of each coordinate
+    // otherwise. side is the direction (-1 or 1) of the closest neighboring cell in each dimension (or 0 if epsilon is 0).
+    auto cell_of = [&](std::ptrdiff_t i, std::int64_t* c, int* side) {
+        for (int d = 0; d < 3; d += 1) {
+            if (epsilon > 0.0) {
+                const double q = double(x(i, d)) * inv_cell_size;
+                const double cell = std::floor(q);
+                c[d] = std::int64_t(cell);
+                side[d] = q - cell < 0.5 ? -1 : 1;
+            } else {
+                const double v = double(x(i, d)) + 0.0;  // Adding 0 turns -0 into 0 so they share a cell
+                std::memcpy(&c[d], &v, sizeof(double));
+                side[d] = 0;
+            }
+        }
+    };
+    auto is_duplicate = [&](std::ptrdiff_t i, std::ptrdiff_t j) {
+        double dist2 = 0.0;
+        for (int d = 0; d < 3; d += 1) {
+            const double diff = double(x(i, d)) - double(x(j, d));
+            dist2 += diff * diff;
+        }
+        return epsilon > 0.0 ? dist2 < epsilon * epsilon : dist2 == 0.0;
+    };
+
+    std::vector<CellEntry> cells(n);
+    #pragma omp parallel for
+    for (std::ptrdiff_t i = 0; i < n; i += 1) {
+        std::int64_t c[3];
+        int side[3];
+        cell_of(i, c, side);
+        cells[i] = CellEntry(hash_cell(c[0], c[1], c[2]), i);
+    }
+    parallel_sort(cells);  // Points in the same cell are now contiguous and sorted by index
+
+    // rep[i] is the lowest index point within epsilon of point i (possibly i itself)
+    std::vector<std::int64_t> rep(n);
+    {
+        const CellTable table(cells);
+        // Visit points in cell order so consecutive points look up the same cells, which are then in cache
+        #pragma omp parallel for schedule(dynamic, 4096)
+        for (std::ptrdiff_t p = 0; p < n; p += 1) {
+            const std::int64_t i = cells[p].second;
+            std::int64_t c[3];
+            int side[3];
+            cell_of(i, c, side);
+            std::int64_t best = i;
+            for (int k = 0; k < 8; k += 1) {
+                const int dx = (k & 1) ? side[0] : 0, dy = (k & 2) ? side[1] : 0, dz = (k & 4) ? side[2] : 0;
+                if ((k & 1 && dx == 0) || (k & 2 && dy == 0) || (k & 4 && dz == 0)) {
+                    continue;  // When epsilon is 0 we only look in the point's own cell
+                }
+                const std::uint64_t key = hash_cell(c[0] + dx, c[1] + dy, c[2] + dz);
+                for (std::size_t e = table.find(key); e < cells.size() && cells[e].first == key; e += 1) {
+                    if (cells[e].second >= best) {
+                        break;
+                    }
+                    if (is_duplicate(i, cells[e].second)) {
+                        best = cells[e].second;
+                        break;
+                    }
+                }
+            }
+            rep[i] = best;
+        }
+    }
+    std::vector<CellEntry>().swap(cells);
+
+    // Follow chains of merged points to a point which is kept (rep[root] == root). Indices strictly decrease along a
+    // chain so this terminates.
+    svj.resize(n);
+    #pragma omp parallel for
+    for (std::ptrdiff_t i = 0; i < n; i += 1) {
+        std::int64_t root = i;
+        while (rep[root] != root) {
+            root = rep[root];
+        }
+        svj[i] = root;
+    }
+
+    // Number the kept points in order using a blocked prefix sum. Afterwards rep[i] is the output index of kept point i.
+    const std::ptrdiff_t block_size = 1 << 16;
+    const std::ptrdiff_t num_blocks = (n + block_size - 1) / block_size;
+    std::vector<std::int64_t> block_offsets(num_blocks + 1, 0);
+    #pragma omp parallel for
+    for (std::ptrdiff_t b = 0; b < num_blocks; b += 1) {
+        std::int64_t count = 0;
+        for (std::ptrdiff_t i = b * block_size; i < std::min(n, (b + 1) * block_size); i += 1) {
+            count += svj[i] == i ? 1 : 0;
+        }
+        block_offsets[b + 1] = count;
+    }
+    for (std::ptrdiff_t b = 0; b < num_blocks; b += 1) {
+        block_offsets[b + 1] += block_offsets[b];
+    }
+
+    svi.resize(block_offsets[num_blocks]);
+    #pragma omp parallel for
+    for (std::ptrdiff_t b = 0; b < num_blocks; b += 1) {
+        std::int64_t count = block_offsets[b];
+        for (std::ptrdiff_t i = b * block_size; i < std::min(n, (b + 1) * block_size); i += 1) {
+            if (svj[i] == i) {
+                rep[i] = count;
+                svi[count] = i;
+                count += 1;
+            }
+        }
+    }
+
+    #pragma omp parallel for
+    for (std::ptrdiff_t i = 0; i < n; i += 1) {
+        svj[i] = rep[svj[i]];
+    }
+}
+
+
+template <typename MatrixType>
+void validate_duplicate_points_args(const MatrixType& x, double epsilon) {
+    if (!(epsilon >= 0.0)) {
+        throw pybind11::value_error("Invalid epsilon, must be greater than or equal to zero. Got " +
+                                    std::to_string(epsilon) + ".");
+    }
+
+    // Points must be finite and grid cell coordinates must fit in 64 bit integers
+    const double max_coord = epsilon > 0.0 ? 8.0e18 * epsilon : std::numeric_limits<double>::max();
+    bool invalid = false;
+    #pragma omp parallel for reduction(||: invalid)
+    for (std::ptrdiff_t i = 0; i < x.rows(); i += 1) {
+        for (int d = 0; d < 3; d += 1) {
+            invalid = invalid || !(std::abs(double(x(i, d))) <= max_coord);
+        }
+    }
+    if (invalid) {
+        throw pybind11::value_error("Invalid input points, all coordinates must be finite and less than 8e18 times "
+                                    "epsilon in magnitude.");
+    }
+}
+
+
+template <typename T>
+IndexVector to_index_vector(const std::vector<T>& v) {
+    return Eigen::Map<const IndexVector>(v.data(), v.size());
+}
+
+}
+
+
+const char* remove_duplicate_points_internal_doc = R"igl_Qu8mg5v7(
+See remove_duplicate_points
 )igl_Qu8mg5v7";
-npe_function(remove_duplicate_points)
-npe_doc(remove_duplicate_points_doc)
+npe_function(remove_duplicate_points_internal)
+npe_doc(remove_duplicate_points_internal_doc)
 npe_arg(points, dense_float, dense_double)
 npe_arg(epsilon, double)
-npe_default_arg(return_index, bool, false)
 npe_begin_code()
 {
     validate_point_cloud(points);
-    Eigen::Matrix<npe_Scalar_points, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor> x_copy = points;
-    Eigen::Matrix<npe_Scalar_points, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor> x_out;
-    Eigen::Matrix<int32_t, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor> svi;
-    Eigen::Matrix<int32_t, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor> svj;
+    validate_duplicate_points_args(points, epsilon);
 
-    igl::remove_duplicate_vertices(x_copy, epsilon, x_out, svi, svj);
+    std::vector<std::int64_t> svi, svj;
+    Eigen::Matrix<npe_Scalar_points, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor> x_out;
+    {
+        pybind11::gil_scoped_release release;
+        find_duplicate_points(points, epsilon, svi, svj);
 
-    if (return_index) {
-        return pybind11::cast(std::make_tuple(npe::move(x_out), npe::move(svi), npe::move(svj)));
-    } else {
-        return npe::move(x_out);
+        x_out.resize(svi.size(), 3);
+        #pragma omp parallel for
+        for (std::ptrdiff_t i = 0; i < std::ptrdiff_t(svi.size()); i += 1) {
+            x_out.row(i) = points.row(svi[i]);
+        }
     }
+
+    IndexVector svi_out = to_index_vector(svi);
+    IndexVector svj_out = to_index_vector(svj);
+    return std::make_tuple(npe::move(x_out), npe::move(svi_out), npe::move(svj_out));
 }
 npe_end_code()
 
 
 
-const char* remove_duplicate_mesh_vertices_doc = R"igl_Qu8mg5v7(
-Removes duplicated vertices from a triangle mesh two vertices are considered the same if their distance is below
-some threshold
-
-Parameters
-----------
-v : #v by 3 Matrix of mesh vertex 3D positions
-f : #f by 3 Matrix of face (triangle) indices
-epsilon: threshold below which two points are considered equal
-return_index: If true, return indices to map between input and output
-
-Returns
--------
-x_new : #x_new x 3 Point cloud with duplicates removed
-if return indices is set, this function also returns:
-    svi : #x x 1 indices so that x_new = x[svi]
-    svj : #x_new x 1 indices so that x = x_new[svj]
-
-See also
---------
-remove_duplicate_points
+const char* remove_duplicate_mesh_vertices_internal_doc = R"igl_Qu8mg5v7(
+See remove_duplicate_mesh_vertices
 )igl_Qu8mg5v7";
-npe_function(remove_duplicate_mesh_vertices)
-npe_doc(remove_duplicate_mesh_vertices_doc)
+npe_function(remove_duplicate_mesh_vertices_internal)
+npe_doc(remove_duplicate_mesh_vertices_internal_doc)
 npe_arg(v, dense_float, dense_double)
 npe_arg(f, dense_int, dense_longlong, dense_uint, dense_ulonglong)
 npe_arg(epsilon, double)
-npe_default_arg(return_index, bool, false)
 npe_begin_code()
 {
     validate_mesh(v, f);
-    Eigen::Matrix<npe_Scalar_v, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor> v_copy = v;
-    Eigen::Matrix<npe_Scalar_f, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor> f_copy = f;
+    validate_duplicate_points_args(v, epsilon);
+
+    std::vector<std::int64_t> svi, svj;
     Eigen::Matrix<npe_Scalar_v, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor> v_out;
-    Eigen::Matrix<npe_Scalar_f, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor> f_out;
-    Eigen::Matrix<int32_t, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor> svi;
-    Eigen::Matrix<int32_t, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor> svj;
+    Eigen::Matrix<npe_Scalar_f, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor> f_out(f.rows(), 3);
+    bool invalid_face_index = false;
+    {
+        pybind11::gil_scoped_release release;
+        find_duplicate_points(v, epsilon, svi, svj);
 
-    igl::remove_duplicate_vertices(v_copy, f_copy, epsilon, v_out, f_out, svi, svj);
+        v_out.resize(svi.size(), 3);
+        #pragma omp parallel for
+        for (std::ptrdiff_t i = 0; i < std::ptrdiff_t(svi.size()); i += 1) {
+            v_out.row(i) = v.row(svi[i]);
+        }
 
-    if (return_index) {
-        return pybind11::cast(std::make_tuple(npe::move(v_out), npe::move(f_out), npe::move(svi), npe::move(svj)));
-    } else {
-        return pybind11::cast(std::make_tuple(npe::move(v_out), npe::move(f_out)));
+        const std::int64_t num_vertices = v.rows();
+        #pragma omp parallel for reduction(||: invalid_face_index)
+        for (std::ptrdiff_t i = 0; i < f.rows(); i += 1) {
+            for (int j = 0; j < 3; j += 1) {
+                const std::int64_t fij = std::int64_t(f(i, j));
+                if (fij < 0 || fij >= num_vertices) {
+                    invalid_face_index = true;
+                    continue;
+                }
+                f_out(i, j) = npe_Scalar_f(svj[fij]);
+            }
+        }
     }
+    if (invalid_face_index) {
+        throw pybind11::value_error("Invalid vertex index in f, all indices must be in [0, #v).");
+    }
+
+    IndexVector svi_out = to_index_vector(svi);
+    IndexVector svj_out = to_index_vector(svj);
+    return std::make_tuple(npe::move(v_out), npe::move(f_out), npe::move(svi_out), npe::move(svj_out));
 }
-npe_end_code()
\ No newline at end of file
+npe_end_code()
@@ -6,8 +6,13 @@
 #include <fstream>
 #include <iostream>
 #include <functional>
+#include <numeric>
+#include <algorithm>
+#include <chrono>
+#include <cstdint>
 
 #include "common.h"
+#include "profiling.h"
 #include "vcg_utils.h"
 
 
@@ -101,6 +106,75 @@ public:
     }
 }; // end class EigenVertexIndexSampler
 
+
+/*
+ * Stateless 64-bit mixing function (the SplitMix64 finalizer). Used as a counter-based random number generator:
+ * the i^th random number of a stream only depends on the seed and i, so results do not depend on how work is
+ * split between threads.
+ */
+inline std::uint64_t mix_bits_64(std::uint64_t z) {
+    z = (z ^ (z >> 30)) * 0xbf58476d1ce4e5b9ULL;
+    z = (z ^ (z >> 27)) * 0x94d049bb133111ebULL;
+    return z ^ (z >> 31);
+}
+
+/*
+ * Return the counter^th uniform random number in [0, 1) of the stream identified by seed
+ */
+inline double counter_uniform_01(std::uint64_t seed, std::uint64_t counter) {
+    const std::uint64_t bits = mix_bits_64(seed + 0x9e3779b97f4a7c15ULL * (counter + 1));
+    return double(bits >> 11) * (1.0 / 9007199254740992.0);
+}
+
+
+/*
+ * Draw num_samples uniformly distributed samples on the triangle mesh (V, F). The cumulative distribution of face
+ * areas is built once, then every sample is drawn independently (and in parallel) using a counter-based random
+ * stream, so the output only depends on the seed and not on the number of threads.
+ */
+template <typename DerivedV, typename DerivedF, typename DerivedFI, typename DerivedBC>
+void sample_mesh_random_area_cdf(const DerivedV& V, const DerivedF& F,
+                                 std::ptrdiff_t num_samples, std::uint64_t seed,
+                                 DerivedFI& out_fi, DerivedBC& out_bc) {
+    const std::ptrdiff_t num_faces = F.rows();
+
+    std::vector<double> face_area_cdf(num_faces);
+    #pragma omp parallel for
+    for (std::ptrdiff_t i = 0; i < num_faces; i += 1) {
+        Eigen::RowVector3d v0(V(F(i, 0), 0), V(F(i, 0), 1), V(F(i, 0), 2));
+        Eigen::RowVector3d v1(V(F(i, 1), 0), V(F(i, 1), 1), V(F(i, 1), 2));
+        Eigen::RowVector3d v2(V(F(i, 2), 0), V(F(i, 2), 1), V(F(i, 2), 2));
+        face_area_cdf[i] = 0.5 * (v1 - v0).cross(v2 - v0).norm();
+    }
+    std::partial_sum(face_area_cdf.begin(), face_area_cdf.end(), face_area_cdf.begin());
+
+    const double total_area = face_area_cdf.empty() ? 0.0 : face_area_cdf.back();
+    if (!(total_area > 0.0)) {
+        throw pybind11::value_error("Cannot sample a mesh with zero surface area.");
+    }
+
+    out_fi.resize(num_samples, 1);
+    out_bc.resize(num_samples, 3);
+
+    const std::uint64_t stream = mix_bits_64(seed);
+    #pragma omp parallel for
+    for (std::ptrdiff_t i = 0; i < num_samples; i += 1) {
+        const double u_face = counter_uniform_01(stream, 3 * i + 0);
+        const double u_1 = counter_uniform_01(stream, 3 * i + 1);
+        const double u_2 = counter_uniform_01(stream, 3 * i + 2);
+
+        const auto face_it = std::upper_bound(face_area_cdf.begin(), face_area_cdf.end(), u_face * total_area);
+        const std::ptrdiff_t fi = std::min(std::ptrdiff_t(face_it - face_area_cdf.begin()), num_faces - 1);
+
+        // Uniform barycentric coordinates on a triangle (Osada et al. 2002, "Shape Distributions")
+        const double sqrt_u_1 = std::sqrt(u_1);
+        out_fi(i, 0) = fi;
+        out_bc(i, 0) = 1.0 - sqrt_u_1;
+        out_bc(i, 1) = sqrt_u_1 * (1.0 - u_2);
+        out_bc(i, 2) = sqrt_u_1 * u_2;
+    }
+}
+
 } // namespace
 
 
@@ -166,6 +240,9 @@ npe_begin_code()
     typedef EigenVertexIndexSampler<MeshType> PoissonDiskSampler;
     typedef EigenBarycentricSampler<VCGMesh, EigenRetBC> MonteCarloSampler;
 
+    KernelProfiler profiler("sample_mesh_poisson_disk");
+    profiler.phase("convert_to_vcg", std::int64_t(v.size()) * sizeof(npe_Scalar_v) +
+                                     std::int64_t(f.size()) * sizeof(npe_Scalar_f));
     VCGMesh input_mesh;
     vcg_mesh_from_vf(v, f, input_mesh);
     typename tri::SurfaceSampling<MeshType, PoissonDiskSampler>::PoissonDiskParam pp;
@@ -197,6 +274,8 @@ npe_begin_code()
     }
 
     // Generate dense samples on the mesh
+    profiler.phase("montecarlo_sampling",
+                   std::int64_t(num_dense_samples) * (3 * sizeof(npe_Scalar_v) + sizeof(std::ptrdiff_t)));
     tri::SurfaceSampling<MeshType, MonteCarloSampler>::Montecarlo(input_mesh, mcSampler, num_dense_samples);
     tri::UpdateBounding<MeshType>::Box(montecarlo_mesh);
     //    int t1=clock();
@@ -210,6 +289,7 @@ npe_begin_code()
       pp.radiusVariance = radiusVariance;
     }
 
+    profiler.phase("poisson_disk_pruning");
     if (radius <= 0.0 && num_samples > 0) {
         tri::SurfaceSampling<MeshType, PoissonDiskSampler>::PoissonDiskPruningByNumber(pdSampler, montecarlo_mesh, num_samples, radius, pp, sample_num_tolerance);
 
@@ -219,6 +299,8 @@ npe_begin_code()
     //    int t2=clock();
     //    pp.pds.totalTime = t2-t0;
 
+    profiler.phase("copy_outputs",
+                   std::int64_t(pdSampler.vcount) * (3 * sizeof(npe_Scalar_v) + sizeof(std::ptrdiff_t)));
     EigenRetBC ret_bc(pdSampler.vcount, 3);
     typename MonteCarloSampler::IndexArray ret_fi(pdSampler.vcount);
     for (int i = 0; i < pdSampler.vcount; i++) {
@@ -231,52 +313,76 @@ npe_begin_code()
 npe_end_code()
 
 
-const char* sample_mesh_random_doc = R"Qu8mg5v7(
-Generate uniformly distributed random point samples on a mesh
-
-Parameters
-----------
-v : #v by 3 array of mesh vertex positions
-f : #f by 3 array of mesh face indices
-num_samples : The number of samples to generate
-random_seed : A random seed used to generate the samples.
-              Passing in 0 will use the current time. (0 by default).
-Returns
--------
-A (num_samples,) shaped array of face indices into f where
-A (num_samples, 3) shaped array of barycentric coordinates
-
-)Qu8mg5v7";
-npe_function(sample_mesh_random)
+npe_function(sample_mesh_random_internal)
 npe_arg(v, dense_float, dense_double)
 npe_arg(f, dense_int, dense_longlong, dense_uint, dense_ulonglong)
+npe_arg(n, npe_matches(v))
 npe_arg(num_samples, int)
-npe_default_arg(random_seed, unsigned int, 0)
-npe_doc(sample_mesh_random_doc)
+npe_arg(random_seed, unsigned int)
+npe_arg(return_positions, bool)
+npe_arg(return_normals, bool)
 npe_begin_code()
 {
-    validate_mesh(v, f);
-
-    typedef EigenDenseLike<npe_Matrix_v> EigenRetBC;
-    typedef EigenBarycentricSampler<VCGMesh, EigenRetBC> MonteCarloSampler;
+    validate_mesh(v, f, n);
+    if (num_samples < 0) {
+        throw pybind11::value_error("num_samples must be >= 0. Got num_samples = " + std::to_string(num_samples));
+    }
 
-    VCGMesh m;
-    vcg_mesh_from_vf(v, f, m);
+    std::uint64_t seed = random_seed;
+    if (seed == 0) {
+        seed = std::chrono::high_resolution_clock::now().time_since_epoch().count();
+    }
 
-    EigenRetBC ret_bc(num_samples, 3);
-    typename MonteCarloSampler::IndexArray ret_fi(num_samples);
+    typedef EigenDenseLike<npe_Matrix_v> EigenRetV;
+    Eigen::Matrix<std::ptrdiff_t, Eigen::Dynamic, 1> ret_fi;
+    EigenRetV ret_bc, ret_p, ret_n;
 
-    MonteCarloSampler mrs(&m, nullptr, ret_bc, ret_fi);
+    sample_mesh_random_area_cdf(v, f, num_samples, seed, ret_fi, ret_bc);
 
-    if(random_seed > 0) {
-        tri::SurfaceSampling<VCGMesh, MonteCarloSampler>::SamplingRandomGenerator().initialize(random_seed);
+    const bool has_vertex_normals = n.rows() > 0;
+    if (return_positions) {
+        ret_p.resize(num_samples, 3);
+    }
+    if (return_normals) {
+        ret_n.resize(num_samples, 3);
     }
 
-    tri::SurfaceSampling<VCGMesh, MonteCarloSampler>::Montecarlo(m, mrs, num_samples);
+    if (return_positions || return_normals) {
+        #pragma omp parallel for
+        for (std::ptrdiff_t i = 0; i < num_samples; i += 1) {
+            const std::ptrdiff_t fi = ret_fi(i, 0);
+            const std::ptrdiff_t i0 = f(fi, 0), i1 = f(fi, 1), i2 = f(fi, 2);
+            const npe_Scalar_v b0 = ret_bc(i, 0), b1 = ret_bc(i, 1), b2 = ret_bc(i, 2);
+
+            if (return_positions) {
+                for (int j = 0; j < 3; j += 1) {
+                    ret_p(i, j) = b0 * v(i0, j) + b1 * v(i1, j) + b2 * v(i2, j);
+                }
+            }
 
-    mrs.trim();
-    return std::make_tuple(npe::move(ret_fi), npe::move(ret_bc));
+            if (return_normals) {
+                Eigen::Matrix<npe_Scalar_v, 1, 3> nrm;
+                if (has_vertex_normals) {
+                    for (int j = 0; j < 3; j += 1) {
+                        nrm[j] = b0 * n(i0, j) + b1 * n(i1, j) + b2 * n(i2, j);
+                    }
+                } else {
+                    Eigen::Matrix<npe_Scalar_v, 1, 3> v0(v(i0, 0), v(i0, 1), v(i0, 2));
+                    Eigen::Matrix<npe_Scalar_v, 1, 3> v1(v(i1, 0), v(i1, 1), v(i1, 2));
+                    Eigen::Matrix<npe_Scalar_v, 1, 3> v2(v(i2, 0), v(i2, 1), v(i2, 2));
+                    nrm = (v1 - v0).cross(v2 - v0);
+                }
+                const npe_Scalar_v nrm_len = nrm.norm();
+                if (nrm_len > npe_Scalar_v(0)) {
+                    nrm /= nrm_len;
+                }
+                for (int j = 0; j < 3; j += 1) {
+                    ret_n(i, j) = nrm[j];
+                }
+            }
+        }
+    }
+
+    return std::make_tuple(npe::move(ret_fi), npe::move(ret_bc), npe::move(ret_p), npe::move(ret_n));
 }
 npe_end_code()
-
-
@@ -3,11 +3,19 @@
 #include <vcg/complex/algorithms/point_sampling.h>
 #include <vcg/complex/algorithms/clustering.h>
 
+#include <algorithm>
+#include <cmath>
+#include <cstdint>
 #include <fstream>
 #include <iostream>
 #include <functional>
+#include <limits>
+#include <string>
+#include <utility>
+#include <vector>
 
 #include "common.h"
+#include "parallel_utils.h"
 #include "vcg_utils.h"
 
 
@@ -199,7 +207,153 @@ void downsample_point_cloud_to_voxels(const DerivedV& V,
         }
     }
 }
+
+
+typedef Eigen::Matrix<std::int64_t, Eigen::Dynamic, 1> IndexVector;
+typedef Eigen::Matrix<std::int64_t, Eigen::Dynamic, 3, Eigen::RowMajor> VoxelCoordMatrix;
+
+
+/*
+ * Bucket the points in V into a grid of num_voxels[0] x num_voxels[1] x num_voxels[2] voxels of size voxel_size3
+ * whose minimum corner is voxel_min_bound. Points get the same voxel indices as in downsample_point_cloud_to_voxels
+ * and points outside the grid are ignored.
+ *
+ * Each point is keyed (in parallel) by the linear index of its voxel. If the grid has at most twice as many voxels as
+ * there are points, the points are bucketed with a counting sort over all the voxels. Otherwise the (key, point index)
+ * pairs are sorted in parallel and each run of equal keys becomes an output voxel. On return, voxel_ijk holds the
+ * coordinates of the occupied voxels in increasing linear index order, the points in voxel k are
+ * sorted_points[voxel_starts[k]:voxel_starts[k + 1]] (in increasing order), and point_voxel maps each point to the
+ * index of its voxel (or -1 if it is outside the grid).
+ */
+template <typename DerivedV>
+void voxelize_points(const DerivedV& V,
+                     Eigen::Vector3d voxel_size3,
+                     Eigen::Vector3d voxel_min_bound,
+                     const std::int64_t num_voxels[3],
+                     VoxelCoordMatrix& voxel_ijk,
+                     std::vector<std::int64_t>& voxel_starts,
+                     std::vector<std::int64_t>& sorted_points,
+                     IndexVector& point_voxel) {
+    const std::ptrdiff_t n = V.rows();
+    const std::int64_t total_voxels = num_voxels[0] * num_voxels[1] * num_voxels[2];
+    auto set_voxel_ijk = [&](std::int64_t voxel, std::int64_t key) {
+        voxel_ijk(voxel, 0) = key / (num_voxels[1] * num_voxels[2]);
+        voxel_ijk(voxel, 1) = (key / num_voxels[2]) % num_voxels[1];
+        voxel_ijk(voxel, 2) = key % num_voxels[2];
+    };
+
+    std::vector<std::int64_t> keys(n);
+    #pragma omp parallel for
+    for (std::ptrdiff_t i = 0; i < n; i += 1) {
+        std::int64_t key = 0;
+        for (int d = 0; d < 3; d += 1) {
+            const double q = std::floor((double(V(i, d)) - voxel_min_bound[d]) / voxel_size3[d]);
+            if (!(q >= 0.0 && q < double(num_voxels[d]))) {
+                key = -1;
+                break;
+            }
+            key = key * num_voxels[d] + std::int64_t(q);
+        }
+        keys[i] = key;
+    }
+    point_voxel.setConstant(n, -1);
+
+    if (total_voxels <= 2 * std::int64_t(n)) {
+        // Counting sort: count the points in each voxel, number the occupied voxels in order, then place each point
+        std::vector<std::int64_t> voxel_of_key(total_voxels, 0);
+        #pragma omp parallel for
+        for (std::ptrdiff_t i = 0; i < n; i += 1) {
+            if (keys[i] >= 0) {
+                #pragma omp atomic
+                voxel_of_key[keys[i]] += 1;
+            }
+        }
+
+        std::int64_t num_occupied = 0;
+        for (std::int64_t key = 0; key < total_voxels; key += 1) {
+            num_occupied += voxel_of_key[key] > 0 ? 1 : 0;
+        }
+        voxel_ijk.resize(num_occupied, 3);
+        voxel_starts.resize(num_occupied + 1);
+        std::int64_t voxel = 0, num_inside = 0;
+        for (std::int64_t key = 0; key < total_voxels; key += 1) {
+            const std::int64_t count = voxel_of_key[key];
+            if (count == 0) {
+                voxel_of_key[key] = -1;
+                continue;
+            }
+            set_voxel_ijk(voxel, key);
+            voxel_starts[voxel] = num_inside;
+            voxel_of_key[key] = voxel;
+            num_inside += count;
+            voxel += 1;
+        }
+        voxel_starts[num_occupied] = num_inside;
+
+        sorted_points.resize(num_inside);
+        std::vector<std::int64_t> next(voxel_starts.begin(), voxel_starts.end() - 1);
+        for (std::ptrdiff_t i = 0; i < n; i += 1) {
+            if (keys[i] >= 0) {
+                const std::int64_t v = voxel_of_key[keys[i]];
+                sorted_points[next[v]++] = i;
+                point_voxel[i] = v;
+            }
+        }
+        return;
+    }
+
+    std::vector<std::pair<std::int64_t, std::int64_t>> sorted_keys(n);
+    #pragma omp parallel for
+    for (std::ptrdiff_t i = 0; i < n; i += 1) {
+        sorted_keys[i] = std::make_pair(keys[i], std::int64_t(i));
+    }
+    std::vector<std::int64_t>().swap(keys);
+    parallel_sort(sorted_keys);
+
+    // Points outside the grid have negative keys and are sorted to the front
+    const std::ptrdiff_t begin = std::partition_point(sorted_keys.begin(), sorted_keys.end(),
+        [](const std::pair<std::int64_t, std::int64_t>& k) { return k.first < 0; }) - sorted_keys.begin();
+    auto is_run_start = [&](std::ptrdiff_t k) {
+        return k == begin || sorted_keys[k].first != sorted_keys[k - 1].first;
+    };
+
+    // Number the voxels (runs of equal keys) using a blocked prefix sum
+    const std::ptrdiff_t block_size = 1 << 16;
+    const std::ptrdiff_t num_blocks = (n - begin + block_size - 1) / block_size;
+    std::vector<std::int64_t> block_offsets(num_blocks + 1, 0);
+    #pragma omp parallel for
+    for (std::ptrdiff_t b = 0; b < num_blocks; b += 1) {
+        std::int64_t count = 0;
+        for (std::ptrdiff_t k = begin + b * block_size; k < std::min(n, begin + (b + 1) * block_size); k += 1) {
+            count += is_run_start(k) ? 1 : 0;
+        }
+        block_offsets[b + 1] = count;
+    }
+    for (std::ptrdiff_t b = 0; b < num_blocks; b += 1) {
+        block_offsets[b + 1] += block_offsets[b];
+    }
+
+    const std::int64_t num_occupied = block_offsets[num_blocks];
+    voxel_ijk.resize(num_occupied, 3);
+    voxel_starts.resize(num_occupied + 1);
+    voxel_starts[num_occupied] = n - begin;
+    sorted_points.resize(n - begin);
+    #pragma omp parallel for
+    for (std::ptrdiff_t b = 0; b < num_blocks; b += 1) {
+        std::int64_t voxel = block_offsets[b] - 1;
+        for (std::ptrdiff_t k = begin + b * block_size; k < std::min(n, begin + (b + 1) * block_size); k += 1) {
+            if (is_run_start(k)) {
+                voxel += 1;
+                voxel_starts[voxel] = k - begin;
+                set_voxel_ijk(voxel, sorted_keys[k].first);
+            }
+            sorted_points[k - begin] = sorted_keys[k].second;
+            point_voxel[sorted_keys[k].second] = voxel;
+        }
+    }
 }
+}
+
 
 
 
@@ -309,4 +463,121 @@ npe_function(downsample_point_cloud_voxel_grid_internal)
 
         return std::make_tuple(npe::move(outV), npe::move(outN), npe::move(outC));
     }
-npe_end_code()
\ No newline at end of file
+npe_end_code()
+
+
+const char* voxelize_point_cloud_internal_doc = R"Qu8mg5v7(
+See voxelize_point_cloud
+)Qu8mg5v7";
+npe_function(voxelize_point_cloud_internal)
+    npe_arg(points, dense_float, dense_double)
+    npe_arg(features, dense_float, dense_double)
+    npe_arg(voxel_size_x, double)
+    npe_arg(voxel_size_y, double)
+    npe_arg(voxel_size_z, double)
+    npe_arg(voxel_min_x, double)
+    npe_arg(voxel_min_y, double)
+    npe_arg(voxel_min_z, double)
+    npe_arg(num_voxels_x, std::int64_t)
+    npe_arg(num_voxels_y, std::int64_t)
+    npe_arg(num_voxels_z, std::int64_t)
+    npe_arg(reduction, std::string)
+    npe_doc(voxelize_point_cloud_internal_doc)
+    npe_begin_code()
+    {
+        validate_point_cloud(points);
+
+        const bool has_features = features.cols() != 0;
+        if (has_features && features.rows() != points.rows()) {
+            throw pybind11::value_error("Invalid number of features (" + std::to_string(features.rows()) +
+                                        "). Must match number of input points (" +
+                                        std::to_string(points.rows()) + ").");
+        }
+        enum { REDUCE_MEAN, REDUCE_SUM, REDUCE_MAX, REDUCE_MIN } reduction_type;
+        if (reduction == "mean") {
+            reduction_type = REDUCE_MEAN;
+        } else if (reduction == "sum") {
+            reduction_type = REDUCE_SUM;
+        } else if (reduction == "max") {
+            reduction_type = REDUCE_MAX;
+        } else if (reduction == "min") {
+            reduction_type = REDUCE_MIN;
+        } else {
+            throw pybind11::value_error("Invalid reduction must be one of 'mean', 'sum', 'max', or 'min', but got '" +
+                                        reduction + "'");
+        }
+
+        const Eigen::Vector3d voxel_size(voxel_size_x, voxel_size_y, voxel_size_z);
+        const Eigen::Vector3d voxel_min_bound(voxel_min_x, voxel_min_y, voxel_min_z);
+        const std::int64_t num_voxels[3] = {num_voxels_x, num_voxels_y, num_voxels_z};
+        for (int i = 0; i < 3; i++) {
+            if (!(voxel_size[i] > 0.0)) {
+                throw pybind11::value_error("Voxel size must be positive");
+            }
+            if (num_voxels[i] <= 0) {
+                throw pybind11::value_error("Number of voxels along each axis must be positive");
+            }
+        }
+        // Linear voxel indices must fit in 64 bit integers
+        if (double(num_voxels[0]) * double(num_voxels[1]) * double(num_voxels[2]) >= 9.0e18) {
+            throw pybind11::value_error("Voxel size is too small, the grid has too many voxels");
+        }
+
+        VoxelCoordMatrix voxel_ijk;
+        IndexVector point_voxel, counts;
+        Eigen::Matrix<npe_Scalar_features, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor> voxel_features;
+        {
+            pybind11::gil_scoped_release release;
+
+            std::vector<std::int64_t> voxel_starts, sorted_points;
+            voxelize_points(points, voxel_size, voxel_min_bound, num_voxels,
+                            voxel_ijk, voxel_starts, sorted_points, point_voxel);
+
+            const std::ptrdiff_t num_occupied = voxel_ijk.rows();
+            const std::ptrdiff_t num_channels = features.cols();
+            counts.resize(num_occupied);
+            voxel_features.resize(has_features ? num_occupied : 0, num_channels);
+            #pragma omp parallel
+            {
+                std::vector<double> acc(num_channels);
+
+                #pragma omp for schedule(dynamic, 1024)
+                for (std::ptrdiff_t k = 0; k < num_occupied; k += 1) {
+                    const std::int64_t start = voxel_starts[k], end = voxel_starts[k + 1];
+                    counts[k] = end - start;
+                    if (!has_features) {
+                        continue;
+                    }
+
+                    if (reduction_type == REDUCE_MAX) {
+                        std::fill(acc.begin(), acc.end(), -std::numeric_limits<double>::infinity());
+                    } else if (reduction_type == REDUCE_MIN) {
+                        std::fill(acc.begin(), acc.end(), std::numeric_limits<double>::infinity());
+                    } else {
+                        std::fill(acc.begin(), acc.end(), 0.0);
+                    }
+                    for (std::int64_t s = start; s < end; s += 1) {
+                        const std::int64_t i = sorted_points[s];
+                        for (std::ptrdiff_t c = 0; c < num_channels; c += 1) {
+                            const double value = double(features(i, c));
+                            if (reduction_type == REDUCE_MAX) {
+                                acc[c] = std::max(acc[c], value);
+                            } else if (reduction_type == REDUCE_MIN) {
+                                acc[c] = std::min(acc[c], value);
+                            } else {
+                                acc[c] += value;
+                            }
+                        }
+                    }
+                    for (std::ptrdiff_t c = 0; c < num_channels; c += 1) {
+                        const double value = reduction_type == REDUCE_MEAN ? acc[c] / double(end - start) : acc[c];
+                        voxel_features(k, c) = npe_Scalar_features(value);
+                    }
+                }
+            }
+        }
+
+        return std::make_tuple(npe::move(voxel_ijk), npe::move(point_voxel), npe::move(counts),
+                               npe::move(voxel_features));
+    }
+npe_end_code()
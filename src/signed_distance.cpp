@@ -1,25 +1,46 @@
 #include <npe.h>
-#include <igl/signed_distance.h>
+#include <igl/AABB.h>
+#include <igl/fast_winding_number.h>
+#include <cstdint>
 #include <numeric>
+#include <utility>
+#include <vector>
 
 #include "common.h"
+#include "parallel_utils.h"
+#include "profiling.h"
 
 const char* signed_distance_doc = R"igl_Qu8mg5v7(
 Computes signed distances of a point cloud with respect to a Mesh using Fast Winding Numbers
 
+Queries are processed in parallel directly on the input arrays (float32 inputs are processed in float32).
+If band is set, only queries within band of the mesh get an exact distance: the closest point search for every other
+query stops as soon as it is known to be farther than band, and those queries get a value of +/-band. The sign of
+queries outside the bounding box of the mesh is known to be positive without evaluating the winding number, so far
+away queries are very cheap. This is useful for building narrow band SDF samples where most queries are far from
+the surface.
+
+The signed distance of a query is its distance to the mesh scaled by 1 - 2|w|, where w is the (approximate) winding
+number of the mesh at the query, so it is negative inside the mesh. Queries outside the bounding box of the mesh use
+a factor of exactly 1 since w is zero there up to the error of the fast winding number approximation.
+
 Parameters
 ----------
 p : (#p, 3)-shaped array point cloud (one 3D point per row)
 v: (#v, 3)-shaped array of mesh vertex positions (one vertex position per row)
 f: (#f, 3)-shaped array of mesh face indexes into v (a row (fi, fj, fk) indicate the 3 vertices of a face)
-lower_bound: The minimum distance value possible (use this to clamp SDF values). negative infinite by default
-upper_bound: The maximum distance value possible (use this to clamp SDF values). negative infinite by default
+lower_bound: The minimum distance value possible. Queries whose distance falls outside [lower_bound, upper_bound]
+             get a signed distance of NaN, a face index of -1 and a closest point of 0. negative infinite by default
+upper_bound: The maximum distance value possible. infinite by default
+band: Width of the narrow band around the surface in which to compute exact distances. Queries farther than band from
+      the mesh get a signed distance of +/-band, a face index of -1 and a closest point of NaN. infinite by default.
 
 Returns
 -------
 A tuple (s, i, c) where
     s is a (#p,) shaped array of signed distance values for each point in p
-    i is a (#p,) shaped array of indices to the closest face for each point in p
+    i is a (#p,) shaped array of indices to the closest face for each point in p (or -1 for points outside the
+      distance bounds or the band)
     c is a (#p, 3) shaped array of the closest point on the mesh for each point in p
 )igl_Qu8mg5v7";
 npe_function(signed_distance)
@@ -28,22 +49,447 @@ npe_arg(v, npe_matches(p))
 npe_arg(f, dense_int, dense_long, dense_longlong)
 npe_default_arg(lower_bound, float, -std::numeric_limits<float>::infinity())
 npe_default_arg(upper_bound, float, std::numeric_limits<float>::infinity())
+npe_default_arg(band, float, std::numeric_limits<float>::infinity())
+npe_doc(signed_distance_doc)
 npe_begin_code()
 {
+    typedef npe_Scalar_p Scalar;
+    typedef Eigen::Matrix<Scalar, 1, 3> RowVector3;
+
     validate_mesh(v, f);
     validate_point_cloud(p, false /* allow_0 */);
+    if (f.rows() >= std::numeric_limits<int>::max()) {
+        throw pybind11::value_error("Invalid mesh, the number of faces must be less than " +
+                                    std::to_string(std::numeric_limits<int>::max()) + ".");
+    }
+    for (std::ptrdiff_t i = 0; i < f.rows(); i += 1) {
+        for (int j = 0; j < 3; j += 1) {
+            if (std::int64_t(f(i, j)) < 0 || std::int64_t(f(i, j)) >= std::int64_t(v.rows())) {
+                throw pybind11::value_error("Invalid face index in f, all indices must be in [0, #v).");
+            }
+        }
+    }
+    if (!(band > 0.0f)) {
+        throw pybind11::value_error("Invalid band must be positive. Got band = " + std::to_string(band) + ".");
+    }
+
+    KernelProfiler profiler("signed_distance");
+    profiler.phase("allocate_outputs", std::int64_t(p.rows()) * (4 * sizeof(Scalar) + sizeof(int)));
+    EigenDense<Scalar> s(p.rows(), 1);
+    EigenDense<int> i(p.rows(), 1);
+    EigenDense<Scalar> c(p.rows(), 3);
+    {
+        pybind11::gil_scoped_release release;
+
+        // Build the trees directly on the inputs. The winding number tree keeps its own compact float copy of the
+        // mesh so there is no need to cast it first.
+        profiler.phase("build_aabb_tree");
+        igl::AABB<typename std::decay<decltype(v)>::type, 3> tree;
+        tree.init(v, f);
+        profiler.phase("build_winding_number_tree", std::int64_t(f.rows()) * 9 * sizeof(float));
+        igl::FastWindingNumberBVH fwn_bvh;
+        igl::fast_winding_number(v, f, 2 /* order */, fwn_bvh);
+
+        // Same bounds on squared distances as igl::signed_distance
+        const Scalar max_abs = std::max(std::abs(Scalar(lower_bound)), std::abs(Scalar(upper_bound)));
+        const Scalar up_sqr_d = max_abs * max_abs;
+        const Scalar low_sqr_d = std::pow(std::max(max_abs - Scalar(upper_bound - lower_bound), Scalar(0)), 2);
+        const Scalar band_sqr_d = Scalar(band) * Scalar(band);
+        const bool band_limited = band_sqr_d < up_sqr_d;
+        const Scalar search_sqr_d = band_limited ? band_sqr_d : up_sqr_d;
+
+        profiler.phase("query");
+        #pragma omp parallel for schedule(dynamic, 1024)
+        for (std::ptrdiff_t k = 0; k < p.rows(); k += 1) {
+            const RowVector3 q = p.row(k);
+            RowVector3 ck;
+            int fi = -1;
+            const Scalar sqr_d = tree.squared_distance(v, f, q, low_sqr_d, search_sqr_d, fi, ck);
 
-    EigenDense<npe_Scalar_p> s;
-    EigenDense<int> i;
-    EigenDense<npe_Scalar_p> c;
-    EigenDense<npe_Scalar_p> n;
+            if (sqr_d < low_sqr_d || (sqr_d >= search_sqr_d && !band_limited)) {
+                // Out of bounds. Unlike igl::signed_distance (which uses #f + 1), the face index is -1 as for queries
+                // outside the band and in MeshQuery
+                s(k, 0) = std::numeric_limits<Scalar>::quiet_NaN();
+                i(k, 0) = -1;
+                c.row(k).setZero();
+                continue;
+            }
 
-    EigenDense<npe_Scalar_p> p_cp = p.template cast<npe_Scalar_p>();
-    EigenDense<npe_Scalar_p> v_cp = v.template cast<npe_Scalar_p>();
-    EigenDense<int> f_cp = f.template cast<int>(); // FIXME: LibIGL only works with int
-    igl::signed_distance(p_cp, v_cp, f_cp, igl::SignedDistanceType::SIGNED_DISTANCE_TYPE_FAST_WINDING_NUMBER,
-                         (npe_Scalar_p) lower_bound, (npe_Scalar_p) upper_bound, s, i, c, n);
+            // Only evaluate the winding number if the query could be inside the mesh
+            Scalar sign = Scalar(1);
+            if (tree.m_box.contains(q.transpose())) {
+                const Scalar w = igl::fast_winding_number(fwn_bvh, 2.0f /* accuracy_scale */, q);
+                sign = Scalar(1) - Scalar(2) * std::abs(w);
+            }
+
+            if (sqr_d >= search_sqr_d) {
+                // Outside the band, we only know the distance is at least band
+                s(k, 0) = sign * Scalar(band);
+                i(k, 0) = -1;
+                c.row(k).setConstant(std::numeric_limits<Scalar>::quiet_NaN());
+            } else {
+                s(k, 0) = sign * std::sqrt(sqr_d);
+                i(k, 0) = fi;
+                c.row(k) = ck;
+            }
+        }
+    }
 
     return std::make_tuple(npe::move(s), npe::move(i), npe::move(c));
 }
-npe_end_code()
\ No newline at end of file
+npe_end_code()
+
+
+namespace {
+
+/*
+ * A mesh is closed (watertight and consistently oriented) if every directed edge (a, b) is matched by an edge (b, a),
+ * i.e. the directed edges and the reversed directed edges are the same multiset.
+ */
+template <typename DerivedF>
+bool is_closed_mesh(const DerivedF& F) {
+    const std::ptrdiff_t num_edges = 3 * F.rows();
+    std::vector<std::pair<std::int64_t, std::int64_t>> edges(num_edges), reversed_edges(num_edges);
+    #pragma omp parallel for
+    for (std::ptrdiff_t fi = 0; fi < F.rows(); fi += 1) {
+        for (int c = 0; c < 3; c += 1) {
+            const std::int64_t a = F(fi, c), b = F(fi, (c + 1) % 3);
+            edges[3 * fi + c] = std::make_pair(a, b);
+            reversed_edges[3 * fi + c] = std::make_pair(b, a);
+        }
+    }
+    parallel_sort(edges);
+    parallel_sort(reversed_edges);
+    return edges == reversed_edges;
+}
+
+
+/*
+ * Evaluates a signed distance (or occupancy) field of a triangle mesh on the nodes of a regular grid in cubic bricks of
+ * nodes, exploiting the coherence of the grid:
+ *  - The unsigned distance d_c at the center of each brick is computed first. If d_c is larger than the radius r of
+ *    the brick, the ball of radius d_c around the center contains no surface, so every node in the brick is on the
+ *    same side of the surface and a single winding number evaluation gives the sign of the whole brick. If d_c - r is
+ *    larger than the band, every node in the brick is farther than band from the surface and the brick is filled
+ *    without any more work.
+ *  - Otherwise the surface may cross the brick and each node is evaluated. A node takes the sign of its neighbor
+ *    whenever either of their distances is larger than the spacing between them (since the segment between them
+ *    cannot cross the surface), so the winding number is only evaluated at nodes closer to the surface than the grid
+ *    spacing.
+ *  - Closest point searches are bounded above using the distance at the brick center (and the band) so they prune
+ *    most of the AABB tree. In occupancy mode, searches are bounded by the grid spacing since only the sign is needed.
+ *
+ * Sharing signs between nodes relies on the thresholded winding number only changing across the surface, which holds
+ * for closed meshes. The winding number of an open mesh varies continuously away from the surface (e.g. across the
+ * hole of a cup), so for open meshes every node evaluates its own winding number and only the distance computations
+ * are shared.
+ */
+template <typename DerivedV, typename DerivedF>
+class SignedDistanceGridEvaluator {
+    typedef typename DerivedV::Scalar Scalar;
+    typedef Eigen::Matrix<Scalar, 1, 3> RowVector3;
+
+    const DerivedV& V;
+    const DerivedF& F;
+    igl::AABB<DerivedV, 3> tree;
+    igl::FastWindingNumberBVH fwn_bvh;
+
+    RowVector3 bmin, h;
+    std::int64_t res[3];
+    std::int64_t brick_size;
+    Scalar band;
+    bool occupancy;
+    bool closed;
+
+    /*
+     * Squared distance from q to the mesh if it is less than up_sqr_d, or up_sqr_d otherwise
+     */
+    Scalar squared_distance(const RowVector3& q, Scalar up_sqr_d) const {
+        RowVector3 c;
+        int fi = -1;
+        return tree.squared_distance(V, F, q, Scalar(0), up_sqr_d, fi, c);
+    }
+
+    bool is_inside(const RowVector3& q) const {
+        if (!tree.m_box.contains(q.transpose())) {
+            return false;
+        }
+        return std::abs(igl::fast_winding_number(fwn_bvh, 2.0f /* accuracy_scale */, q)) > Scalar(0.5);
+    }
+
+    float node_value(bool inside, Scalar dist) const {
+        if (occupancy) {
+            return inside ? 1.0f : 0.0f;
+        }
+        return float(inside ? -std::min(dist, band) : std::min(dist, band));
+    }
+
+public:
+    SignedDistanceGridEvaluator(const DerivedV& v, const DerivedF& f, const RowVector3& bbox_min,
+                                const RowVector3& bbox_max, const std::int64_t resolution[3],
+                                std::int64_t brick_size, Scalar band, bool occupancy) :
+            V(v), F(f), bmin(bbox_min), brick_size(brick_size), band(band), occupancy(occupancy) {
+        for (int a = 0; a < 3; a += 1) {
+            res[a] = resolution[a];
+            h[a] = (bbox_max[a] - bbox_min[a]) / Scalar(resolution[a] - 1);
+        }
+        tree.init(V, F);
+        igl::fast_winding_number(V, F, 2 /* order */, fwn_bvh);
+        closed = is_closed_mesh(F);
+    }
+
+    std::int64_t num_bricks(int axis) const {
+        return (res[axis] + brick_size - 1) / brick_size;
+    }
+
+    /*
+     * Evaluate the brick with index (bi, bj, bk) writing the value at node (i, j, k) of the grid to
+     * out[i * stride[0] + j * stride[1] + k * stride[2]] where (i, j, k) is relative to the first node of the brick.
+     * Returns false (and writes nothing) if skip_far is set and every node in the brick is farther than band from
+     * the surface.
+     */
+    bool evaluate_brick(std::int64_t bi, std::int64_t bj, std::int64_t bk, float* out, const std::int64_t stride[3],
+                        bool skip_far) const {
+        const std::int64_t b0[3] = {bi * brick_size, bj * brick_size, bk * brick_size};
+        std::int64_t extent[3];
+        RowVector3 center, half_diag;
+        for (int a = 0; a < 3; a += 1) {
+            extent[a] = std::min(brick_size, res[a] - b0[a]);
+            center[a] = bmin[a] + h[a] * (Scalar(b0[a]) + Scalar(extent[a] - 1) / Scalar(2));
+            half_diag[a] = h[a] * Scalar(extent[a] - 1) / Scalar(2);
+        }
+        const Scalar radius = half_diag.norm();
+        const Scalar max_h = h.maxCoeff();
+        const auto node = [&](std::int64_t i, std::int64_t j, std::int64_t k) {
+            return RowVector3(bmin[0] + h[0] * Scalar(b0[0] + i), bmin[1] + h[1] * Scalar(b0[1] + j),
+                              bmin[2] + h[2] * Scalar(b0[2] + k));
+        };
+
+        // Distance to the brick center. We only care about it up to radius + band (or just past radius in occupancy
+        // mode, unless we are skipping bricks farther than band, since then only the sign matters).
+        const Scalar center_cap = radius + max_h + (occupancy && !skip_far ? Scalar(0) : band);
+        const Scalar center_dist = std::sqrt(squared_distance(center, center_cap * center_cap));
+        if (center_dist > radius) {
+            // The surface doesn't cross the brick. For closed meshes every node is on the same side as the center.
+            const bool far = center_dist - radius >= band;
+            if (skip_far && far) {
+                return false;
+            }
+            const bool center_inside = closed && is_inside(center);
+            for (std::int64_t i = 0; i < extent[0]; i += 1) {
+                for (std::int64_t j = 0; j < extent[1]; j += 1) {
+                    for (std::int64_t k = 0; k < extent[2]; k += 1) {
+                        const RowVector3 q = node(i, j, k);
+                        const bool inside = closed ? center_inside : is_inside(q);
+                        Scalar dist = band;
+                        if (!occupancy && !far) {
+                            const Scalar cap = std::min(center_dist + (q - center).norm() + max_h, band);
+                            dist = std::sqrt(squared_distance(q, cap * cap));
+                        }
+                        out[i * stride[0] + j * stride[1] + k * stride[2]] = node_value(inside, dist);
+                    }
+                }
+            }
+            return true;
+        }
+
+        // The surface may cross this brick so evaluate every node, propagating signs between neighboring nodes
+        std::vector<Scalar> dists(extent[0] * extent[1] * extent[2]);
+        std::vector<char> signs(dists.size());
+        for (std::int64_t i = 0; i < extent[0]; i += 1) {
+            for (std::int64_t j = 0; j < extent[1]; j += 1) {
+                for (std::int64_t k = 0; k < extent[2]; k += 1) {
+                    const std::int64_t idx = (i * extent[1] + j) * extent[2] + k;
+                    const RowVector3 q = node(i, j, k);
+                    const Scalar cap = occupancy ? Scalar(2) * max_h :
+                                       std::min(center_dist + (q - center).norm() + max_h, band);
+                    const Scalar dist = std::sqrt(squared_distance(q, cap * cap));
+
+                    // The previously evaluated neighbor of this node and the spacing between them
+                    std::int64_t nbr = -1;
+                    Scalar spacing = 0;
+                    if (k > 0) {
+                        nbr = idx - 1;
+                        spacing = h[2];
+                    } else if (j > 0) {
+                        nbr = idx - extent[2];
+                        spacing = h[1];
+                    } else if (i > 0) {
+                        nbr = idx - extent[1] * extent[2];
+                        spacing = h[0];
+                    }
+
+                    bool inside;
+                    if (closed && nbr >= 0 && std::max(dist, dists[nbr]) > spacing) {
+                        inside = signs[nbr] != 0;
+                    } else {
+                        inside = is_inside(q);
+                    }
+                    dists[idx] = dist;
+                    signs[idx] = inside ? 1 : 0;
+                    out[i * stride[0] + j * stride[1] + k * stride[2]] = node_value(inside, dist);
+                }
+            }
+        }
+        return true;
+    }
+};
+
+
+template <typename DerivedV, typename DerivedF>
+void validate_signed_distance_grid_args(const DerivedV& v, const DerivedF& f, const std::int64_t res[3],
+                                        std::int64_t brick_size, double band) {
+    validate_mesh(v, f);
+    if (f.rows() >= std::numeric_limits<int>::max()) {
+        throw pybind11::value_error("Invalid mesh, the number of faces must be less than " +
+                                    std::to_string(std::numeric_limits<int>::max()) + ".");
+    }
+    for (std::ptrdiff_t i = 0; i < f.rows(); i += 1) {
+        for (int j = 0; j < 3; j += 1) {
+            if (std::int64_t(f(i, j)) < 0 || std::int64_t(f(i, j)) >= std::int64_t(v.rows())) {
+                throw pybind11::value_error("Invalid face index in f, all indices must be in [0, #v).");
+            }
+        }
+    }
+    for (int a = 0; a < 3; a += 1) {
+        if (res[a] < 2) {
+            throw pybind11::value_error("Invalid resolution, must be at least 2 along every axis.");
+        }
+    }
+    if (brick_size < 2) {
+        throw pybind11::value_error("Invalid brick_size, must be at least 2. Got " + std::to_string(brick_size) + ".");
+    }
+    if (!(band > 0.0)) {
+        throw pybind11::value_error("Invalid band must be positive. Got band = " + std::to_string(band) + ".");
+    }
+}
+
+} // namespace
+
+
+npe_function(signed_distance_grid_internal)
+npe_arg(v, dense_float, dense_double)
+npe_arg(f, dense_int, dense_long, dense_longlong)
+npe_arg(bbox_min_x, double)
+npe_arg(bbox_min_y, double)
+npe_arg(bbox_min_z, double)
+npe_arg(bbox_max_x, double)
+npe_arg(bbox_max_y, double)
+npe_arg(bbox_max_z, double)
+npe_arg(brick_size, std::int64_t)
+npe_arg(band, double)
+npe_arg(occupancy, bool)
+npe_arg(out, pybind11::array)
+npe_begin_code()
+{
+    typedef npe_Scalar_v Scalar;
+    typedef Eigen::Matrix<Scalar, 1, 3> RowVector3;
+
+    if (!out.dtype().equal(pybind11::dtype::of<float>()) || out.ndim() != 3) {
+        throw pybind11::value_error("Invalid out, must be a 3D float32 array.");
+    }
+    if (!(out.flags() & pybind11::array::c_style) || !out.writeable()) {
+        throw pybind11::value_error("Invalid out, must be a writeable C-contiguous array.");
+    }
+    const std::int64_t res[3] = {out.shape(0), out.shape(1), out.shape(2)};
+    validate_signed_distance_grid_args(v, f, res, brick_size, band);
+
+    const RowVector3 bmin(bbox_min_x, bbox_min_y, bbox_min_z), bmax(bbox_max_x, bbox_max_y, bbox_max_z);
+    float* out_data = static_cast<float*>(out.mutable_data());
+    {
+        pybind11::gil_scoped_release release;
+
+        SignedDistanceGridEvaluator<typename std::decay<decltype(v)>::type, typename std::decay<decltype(f)>::type>
+                grid(v, f, bmin, bmax, res, brick_size, Scalar(std::min(band, double(std::numeric_limits<Scalar>::max()))),
+                     occupancy);
+        const std::int64_t nb[3] = {grid.num_bricks(0), grid.num_bricks(1), grid.num_bricks(2)};
+        const std::int64_t stride[3] = {res[1] * res[2], res[2], 1};
+
+        #pragma omp parallel for schedule(dynamic)
+        for (std::int64_t b = 0; b < nb[0] * nb[1] * nb[2]; b += 1) {
+            const std::int64_t bi = b / (nb[1] * nb[2]), bj = (b / nb[2]) % nb[1], bk = b % nb[2];
+            float* brick_out = out_data + bi * brick_size * stride[0] + bj * brick_size * stride[1] +
+                               bk * brick_size * stride[2];
+            grid.evaluate_brick(bi, bj, bk, brick_out, stride, false /* skip_far */);
+        }
+    }
+}
+npe_end_code()
+
+
+npe_function(sparse_signed_distance_grid_internal)
+npe_arg(v, dense_float, dense_double)
+npe_arg(f, dense_int, dense_long, dense_longlong)
+npe_arg(bbox_min_x, double)
+npe_arg(bbox_min_y, double)
+npe_arg(bbox_min_z, double)
+npe_arg(bbox_max_x, double)
+npe_arg(bbox_max_y, double)
+npe_arg(bbox_max_z, double)
+npe_arg(res_x, std::int64_t)
+npe_arg(res_y, std::int64_t)
+npe_arg(res_z, std::int64_t)
+npe_arg(brick_size, std::int64_t)
+npe_arg(band, double)
+npe_arg(occupancy, bool)
+npe_begin_code()
+{
+    typedef npe_Scalar_v Scalar;
+    typedef Eigen::Matrix<Scalar, 1, 3> RowVector3;
+
+    const std::int64_t res[3] = {res_x, res_y, res_z};
+    validate_signed_distance_grid_args(v, f, res, brick_size, band);
+
+    const RowVector3 bmin(bbox_min_x, bbox_min_y, bbox_min_z), bmax(bbox_max_x, bbox_max_y, bbox_max_z);
+    const std::int64_t brick_volume = brick_size * brick_size * brick_size;
+    std::vector<std::int64_t> brick_coords;
+    std::vector<float> brick_values;
+    {
+        pybind11::gil_scoped_release release;
+
+        SignedDistanceGridEvaluator<typename std::decay<decltype(v)>::type, typename std::decay<decltype(f)>::type>
+                grid(v, f, bmin, bmax, res, brick_size, Scalar(std::min(band, double(std::numeric_limits<Scalar>::max()))),
+                     occupancy);
+        const std::int64_t nb[3] = {grid.num_bricks(0), grid.num_bricks(1), grid.num_bricks(2)};
+        const std::int64_t stride[3] = {brick_size * brick_size, brick_size, 1};
+        const std::int64_t num_bricks = nb[0] * nb[1] * nb[2];
+
+        // Bricks are processed in blocks, each of which keeps the bricks it emits in its own buffers. These are
+        // concatenated in order at the end so the output doesn't depend on the number of threads.
+        const std::int64_t block_size = 64;
+        const std::int64_t num_blocks = (num_bricks + block_size - 1) / block_size;
+        std::vector<std::vector<std::int64_t>> block_coords(num_blocks);
+        std::vector<std::vector<float>> block_values(num_blocks);
+
+        #pragma omp parallel for schedule(dynamic)
+        for (std::int64_t blk = 0; blk < num_blocks; blk += 1) {
+            std::vector<float> buf(brick_volume);
+            for (std::int64_t b = blk * block_size; b < std::min(num_bricks, (blk + 1) * block_size); b += 1) {
+                const std::int64_t bi = b / (nb[1] * nb[2]), bj = (b / nb[2]) % nb[1], bk = b % nb[2];
+                // Nodes of bricks on the boundary which lie outside the grid are NaN
+                std::fill(buf.begin(), buf.end(), std::numeric_limits<float>::quiet_NaN());
+                if (grid.evaluate_brick(bi, bj, bk, buf.data(), stride, true /* skip_far */)) {
+                    block_coords[blk].insert(block_coords[blk].end(), {bi, bj, bk});
+                    block_values[blk].insert(block_values[blk].end(), buf.begin(), buf.end());
+                }
+            }
+        }
+
+        for (std::int64_t blk = 0; blk < num_blocks; blk += 1) {
+            brick_coords.insert(brick_coords.end(), block_coords[blk].begin(), block_coords[blk].end());
+            brick_values.insert(brick_values.end(), block_values[blk].begin(), block_values[blk].end());
+            std::vector<std::int64_t>().swap(block_coords[blk]);  // Free memory as we go
+            std::vector<float>().swap(block_values[blk]);
+        }
+    }
+
+    const std::int64_t num_out = brick_coords.size() / 3;
+    Eigen::Matrix<std::int64_t, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor> coords =
+            Eigen::Map<Eigen::Matrix<std::int64_t, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor>>(
+                    brick_coords.data(), num_out, 3);
+    Eigen::Matrix<float, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor> values =
+            Eigen::Map<Eigen::Matrix<float, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor>>(
+                    brick_values.data(), num_out, brick_volume);
+    return std::make_tuple(npe::move(coords), npe::move(values));
+}
+npe_end_code()
@@ -0,0 +1,17 @@
+#include <pybind11/pybind11.h>
+
+#include "parallel_utils.h"
+
+
+void threading_extra_bindings(pybind11::module& m) {
+    m.def("get_num_threads_internal", []() {
+        return max_num_threads();
+    });
+    m.def("set_num_threads_internal", [](int num_threads) {
+        if (num_threads <= 0) {
+            throw pybind11::value_error("Invalid number of threads (" + std::to_string(num_threads) +
+                                        ") must be positive.");
+        }
+        set_max_num_threads(num_threads);
+    });
+}
@@ -0,0 +1,23 @@
+#include <Eigen/Core>
+
+#ifndef TRIANGLE_UTILS_H
+#define TRIANGLE_UTILS_H
+
+/*
+ * Barycentric coordinates of the point p with respect to the triangle (a, b, c). This uses the same formula as
+ * igl::barycentric_coordinates so results match it exactly (including NaNs for degenerate triangles).
+ */
+template <typename Scalar>
+Eigen::Matrix<Scalar, 1, 3> triangle_barycentric_coordinates(const Eigen::Matrix<Scalar, 1, 3>& p,
+                                                             const Eigen::Matrix<Scalar, 1, 3>& a,
+                                                             const Eigen::Matrix<Scalar, 1, 3>& b,
+                                                             const Eigen::Matrix<Scalar, 1, 3>& c) {
+    const Eigen::Matrix<Scalar, 1, 3> v0 = b - a, v1 = c - a, v2 = p - a;
+    const Scalar d00 = v0.dot(v0), d01 = v0.dot(v1), d11 = v1.dot(v1), d20 = v2.dot(v0), d21 = v2.dot(v1);
+    const Scalar denom = d00 * d11 - d01 * d01;
+    const Scalar bv = (d11 * d20 - d01 * d21) / denom;
+    const Scalar bw = (d00 * d21 - d01 * d20) / denom;
+    return Eigen::Matrix<Scalar, 1, 3>(Scalar(1) - bv - bw, bv, bw);
+}
+
+#endif // TRIANGLE_UTILS_H
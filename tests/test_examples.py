@@ -3,6 +3,11 @@ import unittest
 import os
 
 
+def _query_kd_tree(tree, points):
+    # Runs in the worker processes of test_kd_tree (this has to be a module level function so it can be pickled)
+    return tree.query(points, k=4)[1]
+
+
 class TestDenseBindings(unittest.TestCase):
     def setUp(self):
         self.test_path = os.path.join(os.path.dirname(
@@ -81,6 +86,61 @@ class TestDenseBindings(unittest.TestCase):
         if bc1.shape == bc3.shape:
             self.assertFalse(np.all(bc1 == bc3))
 
+    def test_sample_mesh_random_positions_and_normals(self):
+        import point_cloud_utils as pcu
+        import numpy as np
+
+        v, f, n = pcu.load_mesh_vfn(os.path.join(self.test_path, "cube_twist.obj"))
+
+        f_idx, bc, p, nrm = pcu.sample_mesh_random(v, f, num_samples=1000, random_seed=1234567,
+                                                   return_positions=True, return_normals=True)
+        self.assertEqual(f_idx.shape, (1000,))
+        self.assertEqual(bc.shape, (1000, 3))
+        self.assertEqual(p.shape, (1000, 3))
+        self.assertEqual(nrm.shape, (1000, 3))
+        self.assertTrue(np.all(bc >= 0.0))
+        self.assertTrue(np.allclose(bc.sum(-1), 1.0))
+        self.assertTrue(np.allclose((v[f[f_idx]] * bc[:, :, np.newaxis]).sum(1), p))
+        self.assertTrue(np.allclose(np.linalg.norm(nrm, axis=-1), 1.0))
+
+        # Interpolated vertex normals
+        f_idx2, bc2, nrm2 = pcu.sample_mesh_random(v, f, num_samples=1000, random_seed=1234567, n=n,
+                                                   return_normals=True)
+        self.assertTrue(np.all(f_idx == f_idx2))
+        self.assertTrue(np.all(bc == bc2))
+        self.assertEqual(nrm2.shape, (1000, 3))
+
+        # float32 inputs stay float32
+        f_idx3, bc3 = pcu.sample_mesh_random(v.astype(np.float32), f, num_samples=1000, random_seed=1234567)
+        self.assertEqual(bc3.dtype, np.float32)
+
+    def test_interpolate_barycentric(self):
+        import point_cloud_utils as pcu
+        import numpy as np
+
+        v, f, n = pcu.load_mesh_vfn(os.path.join(self.test_path, "cube_twist.obj"))
+        c = np.random.rand(v.shape[0], 4)
+        q = np.random.rand(v.shape[0])
+
+        fi, bc = pcu.sample_mesh_random(v, f, num_samples=1000, random_seed=1234567)
+
+        p = pcu.interpolate_barycentric(v, f, fi, bc)
+        self.assertEqual(p.shape, (1000, 3))
+        self.assertTrue(np.allclose(p, (v[f[fi]] * bc[:, :, np.newaxis]).sum(1)))
+
+        p2, n2, c2, q2 = pcu.interpolate_barycentric([v, n, c, q], f, fi, bc)
+        self.assertTrue(np.all(p == p2))
+        self.assertTrue(np.allclose(n2, (n[f[fi]] * bc[:, :, np.newaxis]).sum(1)))
+        self.assertTrue(np.allclose(c2, (c[f[fi]] * bc[:, :, np.newaxis]).sum(1)))
+        self.assertEqual(q2.shape, (1000,))
+        self.assertTrue(np.allclose(q2, (q[f[fi]] * bc).sum(1)))
+
+        with self.assertRaises(ValueError):
+            pcu.interpolate_barycentric(v, f, fi + f.shape[0], bc)
+
+        with self.assertRaises(ValueError):
+            pcu.interpolate_barycentric([v, c[1:]], f, fi, bc)
+
     def test_downsample_point_cloud_voxel_grid(self):
         import point_cloud_utils as pcu
         import numpy as np
@@ -242,6 +302,123 @@ class TestDenseBindings(unittest.TestCase):
         # Generate 100 points on the unit cube with Lloyd's algorithm
         samples_3d = pcu.lloyd_3d(100)
 
+    def test_restricted_voronoi(self):
+        import point_cloud_utils as pcu
+        import numpy as np
+
+        centers = np.random.rand(64, 3)
+
+        # Unit cube domain matches voronoi_centroids_unit_cube
+        rv = pcu.RestrictedVoronoi()
+        self.assertTrue(rv.is_volumetric)
+        ctrs, vols = rv.centroids(centers, return_masses=True)
+        self.assertEqual(ctrs.shape, centers.shape)
+        self.assertEqual(vols.shape, (centers.shape[0],))
+        self.assertAlmostEqual(vols.sum(), 1.0, places=5)
+        self.assertTrue(np.allclose(ctrs, pcu.voronoi_centroids_unit_cube(centers)))
+
+        # Lloyd steps reuse the same domain and decrease the CVT energy
+        energy, grad = rv.cvt_energy(centers, return_gradient=True)
+        self.assertEqual(grad.shape, centers.shape)
+        for _ in range(5):
+            centers = rv.centroids(centers)
+        self.assertLess(rv.cvt_energy(centers), energy)
+
+        # Surface domain
+        v, f = pcu.load_mesh_vf(os.path.join(self.test_path, "cube_twist.obj"))
+        rv = pcu.RestrictedVoronoi(v, f)
+        self.assertFalse(rv.is_volumetric)
+        fi, bc = pcu.sample_mesh_random(v, f, 100)
+        ctrs, areas = rv.centroids(pcu.interpolate_barycentric(v, f, fi, bc), return_masses=True)
+        self.assertEqual(ctrs.shape, (100, 3))
+        self.assertTrue(np.all(areas >= 0.0))
+
+    def test_voronoi_diagram_3d(self):
+        import point_cloud_utils as pcu
+        import numpy as np
+
+        centers = np.random.rand(200, 3)
+        volumes, cell_face_offsets, face_neighbors, face_areas, vertices, face_vertex_offsets, face_vertices = \
+            pcu.voronoi_diagram_3d(centers)
+        self.assertEqual(volumes.shape, (200,))
+        self.assertAlmostEqual(volumes.sum(), 1.0, places=5)
+        self.assertEqual(cell_face_offsets.shape, (201,))
+        self.assertEqual(cell_face_offsets[-1], face_neighbors.shape[0])
+        self.assertEqual(face_areas.shape, face_neighbors.shape)
+        self.assertEqual(face_vertex_offsets.shape, (face_neighbors.shape[0] + 1,))
+        self.assertEqual(face_vertex_offsets[-1], face_vertices.shape[0])
+        self.assertTrue(np.all(face_vertices < vertices.shape[0]))
+        self.assertTrue(np.all(vertices >= -1e-6) and np.all(vertices <= 1.0 + 1e-6))
+
+        # Adjacency is symmetric
+        cell_idx = np.repeat(np.arange(200), np.diff(cell_face_offsets))
+        interior = face_neighbors >= 0
+        pairs = set(zip(cell_idx[interior], face_neighbors[interior]))
+        self.assertTrue(all((j, i) in pairs for i, j in pairs))
+
+        # The cheaper volume and adjacency only mode gives the same result
+        volumes2, cell_face_offsets2, face_neighbors2, face_areas2 = \
+            pcu.voronoi_diagram_3d(centers, return_geometry=False)
+        self.assertTrue(np.allclose(volumes, volumes2))
+        self.assertTrue(np.all(cell_face_offsets == cell_face_offsets2))
+        self.assertTrue(np.all(face_neighbors == face_neighbors2))
+        self.assertTrue(np.allclose(face_areas, face_areas2))
+
+        # Custom bounding box
+        volumes, _, _, _ = pcu.voronoi_diagram_3d(2.0 * centers, bbox_min=(0.0, 0.0, 0.0),
+                                                  bbox_max=(2.0, 2.0, 2.0), return_geometry=False)
+        self.assertAlmostEqual(volumes.sum(), 8.0, places=4)
+
+    def test_lloyd_relaxation_tol_seed_and_init(self):
+        import point_cloud_utils as pcu
+        import numpy as np
+
+        v, f = pcu.load_mesh_vf(os.path.join(self.test_path, "cube_twist.obj"))
+
+        # The same seed gives the same samples
+        s1 = pcu.sample_mesh_lloyd(v, f, 500, random_seed=7, num_threads=1)
+        s2 = pcu.sample_mesh_lloyd(v, f, 500, random_seed=7, num_threads=1)
+        self.assertEqual(s1.shape, (500, 3))
+        self.assertTrue(np.allclose(s1, s2))
+
+        # A seed of 0 seeds from the current time
+        s1 = pcu.sample_mesh_lloyd(v, f, 500, num_lloyd=0, num_newton=0)
+        s2 = pcu.sample_mesh_lloyd(v, f, 500, num_lloyd=0, num_newton=0)
+        self.assertFalse(np.allclose(s1, s2))
+
+        # Stop early once the samples have converged: the result is a fixed point of Lloyd's algorithm up to tol,
+        # unlike the random initial samples
+        tol = 1e-3
+        diag = np.linalg.norm(v.max(0) - v.min(0))
+        samples = pcu.sample_mesh_lloyd(v, f, 500, num_lloyd=1000, num_newton=1000, tol=tol, random_seed=5)
+        self.assertEqual(samples.shape, (500, 3))
+        refined = pcu.sample_mesh_lloyd(v, f, 500, num_lloyd=1, num_newton=0, init_samples=samples)
+        self.assertLess(np.linalg.norm(refined - samples, axis=1).max(), 5.0 * tol * diag)
+        init = pcu.sample_mesh_lloyd(v, f, 500, num_lloyd=0, num_newton=0, random_seed=5)
+        refined = pcu.sample_mesh_lloyd(v, f, 500, num_lloyd=1, num_newton=0, init_samples=init)
+        self.assertGreater(np.linalg.norm(refined - init, axis=1).max(), 5.0 * tol * diag)
+
+        # return_mesh is deprecated but still accepted positionally
+        with self.assertWarns(DeprecationWarning):
+            samples = pcu.sample_mesh_lloyd(v, f, 500, 2, 0, False)
+        self.assertEqual(samples.shape, (500, 3))
+
+        # Start from an initial sample set
+        init = pcu.sample_mesh_lloyd(v, f, 500, num_lloyd=0, num_newton=0)
+        samples = pcu.sample_mesh_lloyd(v, f, 500, num_lloyd=2, num_newton=0, init_samples=init)
+        self.assertEqual(samples.shape, (500, 3))
+
+        init_2d = np.random.rand(100, 2)
+        samples_2d = pcu.lloyd_2d(100, tol=1e-4, init_samples=init_2d)
+        self.assertEqual(samples_2d.shape, (100, 2))
+        self.assertTrue(np.all(samples_2d >= 0.0) and np.all(samples_2d <= 1.0))
+
+        samples_3d = pcu.lloyd_3d(100, random_seed=3, tol=1e-4, num_threads=2)
+        self.assertEqual(samples_3d.shape, (100, 3))
+
+        with self.assertRaises(ValueError):
+            pcu.lloyd_2d(100, init_samples=np.random.rand(10, 2))
+
     def test_sinkhorn(self):
         import point_cloud_utils as pcu
         import numpy as np
@@ -392,6 +569,116 @@ class TestDenseBindings(unittest.TestCase):
         # Estimate normals for the point set, v using 12 nearest neighbors per point
         n = pcu.estimate_point_cloud_normals(v, k=12)
         self.assertEqual(n.shape, v.shape)
+        self.assertTrue(np.allclose(np.linalg.norm(n, axis=1), 1.0))
+
+        # Normals oriented towards a viewpoint
+        view_point = np.array([0.0, 0.0, 10.0])
+        n = pcu.estimate_point_cloud_normals(v, k=12, view_point=view_point)
+        self.assertTrue(np.all(np.sum(n * (view_point[np.newaxis, :] - v), axis=1) >= 0.0))
+
+        # Normals oriented towards per-point sensor positions
+        sensor_positions = 2.0 * v
+        n = pcu.estimate_point_cloud_normals(v, k=12, sensor_positions=sensor_positions, smoothing_iterations=2)
+        self.assertEqual(n.shape, v.shape)
+        self.assertTrue(np.all(np.sum(n * (sensor_positions - v), axis=1) >= 0.0))
+
+    def test_estimate_mesh_normals(self):
+        import point_cloud_utils as pcu
+        import numpy as np
+
+        v, f = pcu.load_mesh_vf(os.path.join(self.test_path, "cube_twist.obj"))
+
+        for weighting_type in ('uniform', 'area', 'angle'):
+            n = pcu.estimate_mesh_normals(v, f, weighting_type=weighting_type)
+            self.assertEqual(n.shape, v.shape)
+            self.assertTrue(np.allclose(np.linalg.norm(n, axis=1), 1.0))
+
+            # Different face index dtypes give the same result
+            for dtype in (np.int32, np.int64, np.uint32):
+                self.assertTrue(np.allclose(pcu.estimate_mesh_normals(v, f.astype(dtype), weighting_type), n))
+
+        # Writing into a caller-provided buffer
+        out = np.zeros_like(v)
+        n = pcu.estimate_mesh_normals(v, f, weighting_type='area', out=out)
+        self.assertTrue(n is out)
+        self.assertTrue(np.allclose(np.linalg.norm(out, axis=1), 1.0))
+
+        # The dtype of out is compared by value, so an equal dtype which is a different object (here because it has
+        # metadata) is accepted and a byte-swapped one is not
+        out = np.zeros(v.shape, dtype=np.dtype(v.dtype, metadata={'units': 'none'}))
+        self.assertTrue(pcu.estimate_mesh_normals(v, f, weighting_type='area', out=out) is out)
+        self.assertTrue(np.allclose(out, n))
+        with self.assertRaises(ValueError):
+            pcu.estimate_mesh_normals(v, f, out=np.zeros(v.shape, dtype=v.dtype.newbyteorder()))
+
+        # Unreferenced vertices get a zero normal
+        v2 = np.concatenate([v, np.zeros([1, 3], dtype=v.dtype)])
+        n2 = pcu.estimate_mesh_normals(v2, f)
+        self.assertTrue(np.all(n2[-1] == 0.0))
+
+        with self.assertRaises(ValueError):
+            pcu.estimate_mesh_normals(v, f, weighting_type='not_a_weighting')
+        with self.assertRaises(ValueError):
+            pcu.estimate_mesh_normals(v, f, out=np.zeros([v.shape[0] + 1, 3], dtype=v.dtype))
+
+    def test_estimate_point_cloud_normals_radius_and_curvature(self):
+        import point_cloud_utils as pcu
+        import numpy as np
+
+        # Points on the plane z = 0 with uneven density
+        v = np.concatenate([np.random.rand(1000, 3) * np.array([1.0, 1.0, 0.0]),
+                            np.random.rand(100, 3) * np.array([1.0, 1.0, 0.0]) + np.array([1.0, 0.0, 0.0])])
+
+        n = pcu.estimate_point_cloud_normals(v, radius=0.2, k=-1, view_point=[0.0, 0.0, 1.0])
+        self.assertEqual(n.shape, v.shape)
+        self.assertTrue(np.allclose(n, np.array([[0.0, 0.0, 1.0]]), atol=1e-5))
+
+        # Hybrid neighborhoods with curvature and eigenvalue outputs
+        n, c, e = pcu.estimate_point_cloud_normals(v, radius=0.2, k=16, return_curvature=True,
+                                                   return_eigenvalues=True)
+        self.assertEqual(n.shape, v.shape)
+        self.assertEqual(c.shape, (v.shape[0],))
+        self.assertEqual(e.shape, v.shape)
+        self.assertTrue(np.all(e[:, 0] <= e[:, 1]))
+        self.assertTrue(np.all(e[:, 1] <= e[:, 2]))
+        self.assertTrue(np.allclose(c, 0.0, atol=1e-5))
+
+        # Points on a sphere have non-zero surface variation
+        s = np.random.randn(1000, 3)
+        s /= np.linalg.norm(s, axis=1, keepdims=True)
+        n, c = pcu.estimate_point_cloud_normals(s, k=20, return_curvature=True)
+        self.assertTrue(np.all(c > 0.0))
+        self.assertTrue(np.all(c <= 1.0 / 3.0 + 1e-6))
+
+    def test_estimate_point_cloud_normals_kd_tree(self):
+        import point_cloud_utils as pcu
+        import numpy as np
+
+        s = np.random.randn(2000, 3)
+        s /= np.linalg.norm(s, axis=1, keepdims=True)
+        tree = pcu.KDTree(s, max_points_per_leaf=7)
+
+        # A prebuilt tree gives the same neighborhoods as the tree built internally
+        for kwargs in (dict(k=12), dict(k=12, smoothing_iterations=2), dict(radius=0.15, k=-1),
+                       dict(radius=0.15, k=16, view_point=[0.0, 0.0, 0.0])):
+            n, c = pcu.estimate_point_cloud_normals(s, return_curvature=True, **kwargs)
+            n_tree, c_tree = pcu.estimate_point_cloud_normals(s, return_curvature=True, kd_tree=tree, **kwargs)
+            self.assertTrue(np.allclose(n, n_tree))
+            self.assertTrue(np.allclose(c, c_tree))
+
+        # A tree attached from a buffer works too
+        n = pcu.estimate_point_cloud_normals(s, k=12, kd_tree=pcu.KDTree.from_buffer(tree.to_buffer()))
+        self.assertTrue(np.allclose(n, pcu.estimate_point_cloud_normals(s, k=12)))
+
+        # The tree must be built over the input points
+        with self.assertRaises(ValueError):
+            pcu.estimate_point_cloud_normals(s[:-1], k=12, kd_tree=tree)
+        with self.assertRaises(ValueError):
+            pcu.estimate_point_cloud_normals(s + 1.0, k=12, kd_tree=tree)
+        with self.assertRaises(ValueError):
+            pcu.estimate_point_cloud_normals(s.astype(np.float32), k=12, kd_tree=tree)
+        with self.assertRaises(ValueError):
+            pcu.estimate_point_cloud_normals(s, k=12, kd_tree=s)
 
     def skip_test_morton_coding_big_data(self):
         import point_cloud_utils as pcu
@@ -471,6 +758,32 @@ class TestDenseBindings(unittest.TestCase):
         self.assertLess(v2.shape[0], v.shape[0])
         self.assertTrue(np.all(np.equal(v2[idx_v2_to_v], v)))
         self.assertTrue(np.all(np.equal(v[idx_v_to_v2], v2)))
+        self.assertEqual(idx_v_to_v2.dtype, np.int64)
+        self.assertEqual(idx_v2_to_v.shape, (v.shape[0],))
+
+        # Points closer than epsilon are merged even when they straddle a grid cell boundary
+        eps = 1e-3
+        rng = np.random.default_rng(1234567)
+        p = rng.random((1000, 3))
+        p2 = np.concatenate([p, p + 0.1 * eps * rng.standard_normal((1000, 3))], axis=0)
+        p3, svi, svj = pcu.remove_duplicate_points(p2, eps, return_index=True)
+        self.assertEqual(p3.shape[0], 1000)
+        self.assertTrue(np.all(svi == np.arange(1000)))
+        self.assertTrue(np.all(np.linalg.norm(p3[svj] - p2, axis=-1) < eps))
+
+        # Merging is transitive, so a chain of points each closer than epsilon to the next collapses into one point
+        chain = np.array([[0.0, 0.0, 0.0], [0.6, 0.0, 0.0], [1.2, 0.0, 0.0], [1.8, 0.0, 0.0]]) * eps + 0.5
+        chain3, svi, svj = pcu.remove_duplicate_points(chain, eps, return_index=True)
+        self.assertEqual(chain3.shape[0], 1)
+        self.assertTrue(np.all(svi == [0]))
+        self.assertTrue(np.all(svj == 0))
+
+        v, f = pcu.load_mesh_vf(os.path.join(self.test_path, "cube_twist.obj"))
+        v2, f2, svi, svj = pcu.remove_duplicate_mesh_vertices(np.concatenate([v, v]), np.concatenate([f, f + v.shape[0]]),
+                                                              1e-9, return_index=True)
+        self.assertLessEqual(v2.shape[0], v.shape[0])
+        self.assertTrue(np.all(svj[f] == svj[f + v.shape[0]]))
+        self.assertTrue(np.all(f2[:f.shape[0]] == f2[f.shape[0]:]))
 
     def test_downsample_mesh_voxel_grid(self):
         import point_cloud_utils as pcu
@@ -506,6 +819,647 @@ class TestDenseBindings(unittest.TestCase):
 
         self.assertAlmostEqual(np.max(d - d2), 0.0)
 
+        # int64 faces and float32 inputs give the same results, and closest points can be returned directly
+        d64, fi64, bc64, c64 = pcu.closest_points_on_mesh(p, v, f.astype(np.int64), return_points=True)
+        self.assertEqual(fi64.dtype, np.int64)
+        self.assertTrue(np.array_equal(fi64, fi))
+        self.assertTrue(np.allclose(d64, d))
+        self.assertTrue(np.allclose(c64, closest_points))
+
+        d32, _, bc32 = pcu.closest_points_on_mesh(p.astype(np.float32), v.astype(np.float32), f)
+        self.assertEqual(d32.dtype, np.float32)
+        self.assertTrue(np.allclose(d32, d, atol=1e-5))
+
+    def test_ply_fast_path(self):
+        import point_cloud_utils as pcu
+        import numpy as np
+        import tempfile
+
+        # Binary point cloud without faces goes through the NumPy PLY reader
+        v = pcu.load_mesh_v(os.path.join(self.test_path, "duplicated_pcloud.ply"))
+        mesh = pcu.load_triangle_mesh(os.path.join(self.test_path, "duplicated_pcloud.ply"))
+        self.assertEqual(v.dtype, np.float64)
+        self.assertTrue(np.array_equal(v, mesh.v))
+
+        v, f = pcu.load_mesh_vf(os.path.join(self.test_path, "cube_twist.obj"))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "mesh.ply")
+            pcu.save_mesh_vf(path, v, f)
+            v2, f2 = pcu.load_mesh_vf(path)
+            self.assertTrue(np.array_equal(v, v2))
+            self.assertTrue(np.array_equal(f, f2))
+
+            mesh = pcu.load_triangle_mesh(path)
+            self.assertTrue(np.array_equal(mesh.v, v2))
+            self.assertTrue(np.array_equal(mesh.f, f2))
+
+            v3 = pcu.load_mesh_v(path, dtype=np.float32)
+            self.assertEqual(v3.dtype, np.float32)
+            self.assertTrue(np.allclose(v3, v))
+
+            # Files with integer vertex positions or a non-int32 face index type go through the general loader
+            v_grid = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0], [1, 1, 0]])
+            f_grid = np.array([[0, 1, 2], [1, 3, 2]])
+            for vertex_type, index_type in (('int', 'int'), ('float', 'uint'), ('short', 'ushort')):
+                path = os.path.join(tmpdir, "mesh_%s_%s.ply" % (vertex_type, index_type))
+                np_types = {'int': '<i4', 'uint': '<u4', 'short': '<i2', 'ushort': '<u2', 'float': '<f4'}
+                faces = np.zeros(f_grid.shape[0], dtype=[('count', 'u1'), ('indices', np_types[index_type], (3,))])
+                faces['count'] = 3
+                faces['indices'] = f_grid
+                with open(path, 'wb') as fh:
+                    fh.write(("ply\nformat binary_little_endian 1.0\nelement vertex %d\n" % v_grid.shape[0]).encode())
+                    fh.write("".join("property %s %s\n" % (vertex_type, c) for c in 'xyz').encode())
+                    fh.write(("element face %d\nproperty list uchar %s vertex_indices\nend_header\n" %
+                              (f_grid.shape[0], index_type)).encode())
+                    fh.write(v_grid.astype(np_types[vertex_type]).tobytes())
+                    fh.write(faces.tobytes())
+                v4, f4 = pcu.load_mesh_vf(path)
+                self.assertTrue(np.array_equal(v4, v_grid))
+                self.assertTrue(np.array_equal(f4, f_grid))
+
+    def test_load_triangle_mesh_attributes(self):
+        import point_cloud_utils as pcu
+        import numpy as np
+
+        path = os.path.join(self.test_path, "cube_twist.obj")
+        mesh = pcu.load_triangle_mesh(path)
+        self.assertIsNotNone(mesh.vn)
+
+        mesh_vf = pcu.load_triangle_mesh(path, attributes=['v', 'f'])
+        self.assertTrue(np.array_equal(mesh.v, mesh_vf.v))
+        self.assertTrue(np.array_equal(mesh.f, mesh_vf.f))
+        self.assertIsNone(mesh_vf.vn)
+        self.assertIsNone(mesh_vf.face_data.wedge_normals)
+        self.assertIsNone(mesh_vf.face_data.wedge_texcoords)
+
+        v, n = pcu.load_mesh_vn(path)
+        self.assertTrue(np.array_equal(v, mesh.v))
+        self.assertTrue(np.array_equal(n, mesh.vn))
+
+        with self.assertRaises(ValueError):
+            pcu.load_triangle_mesh(path, attributes=['v', 'not_an_attribute'])
+
+    def test_load_stl_face_colors(self):
+        import point_cloud_utils as pcu
+        import numpy as np
+        import tempfile
+
+        # A binary STL with two triangles whose attribute bytes hold BGR555 colors (pure red)
+        facet_dtype = np.dtype([('n', '<f4', (3,)), ('v', '<f4', (3, 3)), ('attr', '<u2')])
+        facets = np.zeros(2, dtype=facet_dtype)
+        facets['v'][0] = [[0, 0, 0], [1, 0, 0], [0, 1, 0]]
+        facets['v'][1] = [[1, 0, 0], [1, 1, 0], [0, 1, 0]]
+        facets['n'] = [0, 0, 1]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for attr in (31 * 1024, 0):
+                path = os.path.join(tmpdir, "colored.stl" if attr != 0 else "plain.stl")
+                facets['attr'] = attr
+                with open(path, 'wb') as fh:
+                    fh.write(b' ' * 80)
+                    fh.write(np.array([facets.shape[0]], dtype='<u4').tobytes())
+                    fh.write(facets.tobytes())
+
+                mesh = pcu.load_triangle_mesh(path)
+                self.assertEqual(mesh.f.shape, (2, 3))
+                self.assertTrue(np.array_equal(mesh.v[mesh.f], facets['v']))
+                if attr == 0:
+                    self.assertIsNone(mesh.face_data.colors)
+                else:
+                    self.assertEqual(mesh.face_data.colors.shape[0], 2)
+                    self.assertTrue(np.allclose(mesh.face_data.colors[:, :3], [248.0 / 255.0, 0.0, 0.0], atol=1e-2))
+
+    def test_load_meshes(self):
+        import point_cloud_utils as pcu
+        import numpy as np
+
+        paths = [os.path.join(self.test_path, "cube_twist.obj"),
+                 os.path.join(self.test_path, "duplicated_pcloud.ply")] * 8
+        cwd = os.getcwd()
+        meshes = pcu.load_meshes(paths, n_threads=4)
+        self.assertEqual(os.getcwd(), cwd)
+        self.assertEqual(len(meshes), len(paths))
+        for path, mesh in zip(paths, meshes):
+            expected = pcu.load_triangle_mesh(path)
+            self.assertTrue(np.array_equal(mesh.v, expected.v))
+            if expected.f is None:
+                self.assertIsNone(mesh.f)
+            else:
+                self.assertTrue(np.array_equal(mesh.f, expected.f))
+
+        meshes = pcu.load_meshes(paths[:2], n_threads=1, attributes=['v'])
+        self.assertIsNone(meshes[0].f)
+
+    def test_save_mesh_native_dtypes(self):
+        import point_cloud_utils as pcu
+        import numpy as np
+        import tempfile
+
+        v, f, n = pcu.load_mesh_vfn(os.path.join(self.test_path, "cube_twist.obj"))
+        v, n, f = v.astype(np.float32), n.astype(np.float32), f.astype(np.int64)
+        c = np.random.rand(v.shape[0], 3).astype(np.float32)
+        q = np.random.rand(f.shape[0]).astype(np.float32)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # Streamed PLY path (positions, normals, colors and faces only)
+            path = os.path.join(tmpdir, "mesh.ply")
+            pcu.save_triangle_mesh(path, v=v, f=f, vn=n, vc=c)
+            mesh = pcu.load_triangle_mesh(path)
+            self.assertTrue(np.allclose(mesh.v, v))
+            self.assertTrue(np.array_equal(mesh.f, f))
+            self.assertTrue(np.allclose(mesh.vn, n))
+            self.assertEqual(mesh.vc.shape, (v.shape[0], 4))
+            self.assertTrue(np.all(np.abs(mesh.vc[:, :3] - c) <= 1.0 / 255.0))
+            self.assertTrue(np.all(mesh.vc[:, 3] == 1.0))
+
+            # General writer with non-contiguous float32/int64 inputs and RGB colors
+            path = os.path.join(tmpdir, "mesh_q.ply")
+            vs = np.concatenate([v, v], axis=1)[:, :3]
+            pcu.save_triangle_mesh(path, v=vs, f=f, vc=c, fq=q)
+            mesh = pcu.load_triangle_mesh(path)
+            self.assertTrue(np.allclose(mesh.v, v))
+            self.assertTrue(np.array_equal(mesh.f, f))
+            self.assertTrue(np.allclose(mesh.face_data.quality, q))
+            self.assertTrue(np.all(mesh.vc[:, 3] == 1.0))
+
+            with self.assertRaises(ValueError):
+                pcu.save_triangle_mesh(path, v=v, f=f, vc=c[:, :2])
+
+    def test_mesh_cache(self):
+        import point_cloud_utils as pcu
+        import numpy as np
+        import tempfile
+
+        path = os.path.join(self.test_path, "cube_twist.obj")
+        expected = pcu.load_triangle_mesh(path)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = pcu.enable_mesh_cache(tmpdir)
+            try:
+                mesh1 = pcu.load_triangle_mesh(path)
+                self.assertEqual(len([n for n in os.listdir(tmpdir) if n.endswith(cache.SUFFIX)]), 1)
+                mesh2 = pcu.load_triangle_mesh(path)
+                self.assertIsInstance(mesh2.v, np.memmap)
+                for mesh in (mesh1, mesh2):
+                    self.assertTrue(np.array_equal(mesh.v, expected.v))
+                    self.assertTrue(np.array_equal(mesh.f, expected.f))
+                    self.assertTrue(np.array_equal(mesh.vn, expected.vn))
+
+                # Cached arrays are copy-on-write
+                mesh2.v[:] = 0.0
+                self.assertTrue(np.array_equal(pcu.load_triangle_mesh(path).v, expected.v))
+
+                # Truncated or corrupt entries are treated as cache misses and replaced
+                entry = [os.path.join(tmpdir, n) for n in os.listdir(tmpdir) if n.endswith(cache.SUFFIX)][0]
+                del mesh2
+                for truncated_size in (4, 12, 100, os.path.getsize(entry) // 2):
+                    with open(entry, 'r+b') as fh:
+                        fh.truncate(truncated_size)
+                    mesh3 = pcu.load_triangle_mesh(path)
+                    self.assertTrue(np.array_equal(mesh3.v, expected.v))
+                    self.assertTrue(np.array_equal(mesh3.f, expected.f))
+                    del mesh3
+
+                # Different attributes get a separate entry, and the least recently used entries are evicted
+                pcu.load_triangle_mesh(path, attributes=['v', 'f'])
+                self.assertEqual(len([n for n in os.listdir(tmpdir) if n.endswith(cache.SUFFIX)]), 2)
+                cache.max_size = 1
+                cache.evict()
+                self.assertEqual(len([n for n in os.listdir(tmpdir) if n.endswith(cache.SUFFIX)]), 0)
+            finally:
+                pcu.disable_mesh_cache()
+
+    def test_mesh_query(self):
+        import point_cloud_utils as pcu
+        import numpy as np
+
+        v, f = pcu.load_mesh_vf(os.path.join(self.test_path, "cube_twist.obj"))
+        v -= v.min(0)
+        v /= v.max(0)
+        v -= 0.5
+        v *= 2.0
+
+        mq = pcu.MeshQuery(v, f)
+        self.assertEqual(mq.num_faces, f.shape[0])
+
+        for _ in range(3):
+            p = np.random.rand(1000, 3) * 2.0 - 1.0
+            d, fi, bc = mq.closest_points(p)
+            d2, fi2, bc2 = pcu.closest_points_on_mesh(p, v, f)
+            self.assertTrue(np.allclose(d, d2))
+
+            s, _, c = mq.signed_distance(p)
+            s2, _, c2 = pcu.signed_distance(p, v, f)
+            self.assertTrue(np.allclose(s, s2.ravel()))
+            self.assertTrue(np.allclose(np.abs(s), d))
+
+            w = mq.winding_number(p)
+            self.assertTrue(np.all((w > 0.5) == (s < 0.0)))
+
+        # Rays shot at the mesh from outside hit it at the closest point
+        ray_o = np.array([[0.0, 0.0, 5.0], [0.0, 0.0, -5.0]])
+        t, fi, bc = mq.ray_intersect(ray_o, np.array([0.0, 0.0, -1.0]))
+        self.assertGreaterEqual(fi[0], 0)
+        self.assertEqual(fi[1], -1)
+        self.assertTrue(np.isinf(t[1]))
+        hit = (v[f[fi[0]]] * bc[0][:, np.newaxis]).sum(0)
+        self.assertTrue(np.allclose(hit, ray_o[0] + t[0] * np.array([0.0, 0.0, -1.0]), atol=1e-5))
+
+    def test_signed_distance_band(self):
+        import point_cloud_utils as pcu
+        import numpy as np
+
+        v, f = pcu.load_mesh_vf(os.path.join(self.test_path, "cube_twist.obj"))
+        v -= v.min(0)
+        v /= v.max(0)
+        v -= 0.5
+        v *= 2.0
+        p = np.random.rand(1000, 3) * 4.0 - 2.0
+
+        s, fi, c = pcu.signed_distance(p, v, f)
+        s, fi = s.ravel(), fi.ravel()
+        band = 0.1
+        s_band, fi_band, c_band = pcu.signed_distance(p, v, f, band=band)
+        s_band, fi_band = s_band.ravel(), fi_band.ravel()
+
+        # Queries in the band are exact, everything else is clamped to +/-band with the right sign
+        near = np.abs(s) < band
+        self.assertTrue(np.any(near) and not np.all(near))
+        self.assertTrue(np.allclose(s_band[near], s[near]))
+        self.assertTrue(np.array_equal(fi_band[near], fi[near]))
+        self.assertTrue(np.allclose(s_band[~near], np.sign(s[~near]) * band, atol=1e-3))
+        self.assertTrue(np.all(fi_band[~near] == -1))
+        self.assertTrue(np.all(np.isnan(c_band[~near])))
+
+        # float32 inputs are processed in float32
+        s32, _, _ = pcu.signed_distance(p.astype(np.float32), v.astype(np.float32), f, band=band)
+        self.assertEqual(s32.dtype, np.float32)
+        self.assertTrue(np.allclose(s32.ravel(), s_band, atol=1e-4))
+
+        mq = pcu.MeshQuery(v, f)
+        s_mq, _, _ = mq.signed_distance(p, band=band)
+        self.assertTrue(np.allclose(s_mq, s_band))
+
+        # Queries outside [lower_bound, upper_bound] get NaN and a face index of -1 in both implementations
+        s_bounded, fi_bounded, _ = pcu.signed_distance(p, v, f, lower_bound=-0.5, upper_bound=0.5)
+        s_mq_bounded, fi_mq_bounded, _ = mq.signed_distance(p, lower_bound=-0.5, upper_bound=0.5)
+        outside = np.isnan(s_bounded.ravel())
+        self.assertTrue(np.any(outside))
+        self.assertTrue(np.all(fi_bounded.ravel()[outside] == -1))
+        self.assertTrue(np.array_equal(np.isnan(s_mq_bounded), outside))
+        self.assertTrue(np.all(fi_mq_bounded[outside] == -1))
+
+    def test_signed_distance_grid(self):
+        import point_cloud_utils as pcu
+        import numpy as np
+
+        v, f = pcu.load_mesh_vf(os.path.join(self.test_path, "cube_twist.obj"))
+        v -= v.min(0)
+        v /= v.max(0)
+        v -= 0.5
+        v *= 2.0
+
+        bbox = (np.array([-1.2] * 3), np.array([1.2] * 3))
+        res = (37, 30, 25)
+        grid = pcu.signed_distance_grid(v, f, bbox, res)
+        self.assertEqual(grid.shape, res)
+        self.assertEqual(grid.dtype, np.float32)
+
+        xs = [np.linspace(bbox[0][i], bbox[1][i], res[i]) for i in range(3)]
+        p = np.stack(np.meshgrid(*xs, indexing='ij'), axis=-1).reshape(-1, 3)
+        d, _, _ = pcu.closest_points_on_mesh(p, v, f)
+        s, _, _ = pcu.signed_distance(p, v, f)
+        s = s.ravel().reshape(res)
+        self.assertTrue(np.allclose(np.abs(grid), d.reshape(res), atol=1e-5))
+        self.assertTrue(np.all((grid < 0.0) == (s < 0.0)))
+
+        occ = pcu.signed_distance_grid(v, f, bbox, res, occupancy=True, out=np.zeros(res, dtype=np.float32))
+        self.assertTrue(np.array_equal(occ, (grid < 0.0).astype(np.float32)))
+
+        # Sparse bricks only cover nodes near the surface and match the dense grid there
+        brick_ijk, bricks = pcu.signed_distance_grid(v, f, bbox, res, sparse=True, brick_size=4)
+        self.assertEqual(bricks.shape[1:], (4, 4, 4))
+        self.assertLess(bricks.shape[0], np.prod([(r + 3) // 4 for r in res]))
+        band = np.linalg.norm((bbox[1] - bbox[0]) / (np.array(res) - 1))
+        for ijk, brick in zip(brick_ijk, bricks):
+            i, j, k = ijk * 4
+            dense = np.clip(grid[i:i + 4, j:j + 4, k:k + 4], -band, band)
+            self.assertTrue(np.allclose(brick[:dense.shape[0], :dense.shape[1], :dense.shape[2]], dense, atol=1e-5))
+
+        # An open mesh (a unit cube without its top) gets the same signs as signed_distance
+        v = np.array([[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0], [0, 0, 1], [1, 0, 1], [1, 1, 1], [0, 1, 1]],
+                     dtype=np.float64)
+        f = np.array([[0, 2, 1], [0, 3, 2], [0, 1, 5], [0, 5, 4], [1, 2, 6], [1, 6, 5], [2, 3, 7], [2, 7, 6],
+                      [3, 0, 4], [3, 4, 7]], dtype=np.int32)
+        bbox = (np.array([-0.3, -0.3, -0.3]), np.array([1.3, 1.3, 1.5]))
+        res = (23, 19, 29)
+        xs = [np.linspace(bbox[0][i], bbox[1][i], res[i]) for i in range(3)]
+        p = np.stack(np.meshgrid(*xs, indexing='ij'), axis=-1).reshape(-1, 3)
+        d, _, _ = pcu.closest_points_on_mesh(p, v, f)
+        s, _, _ = pcu.signed_distance(p, v, f)
+        s = s.ravel().reshape(res)
+        grid = pcu.signed_distance_grid(v, f, bbox, res, brick_size=4)
+        self.assertTrue(np.allclose(np.abs(grid), d.reshape(res), atol=1e-5))
+        self.assertTrue(np.all((grid < 0.0) == (s < 0.0)))
+        occ = pcu.signed_distance_grid(v, f, bbox, res, occupancy=True, brick_size=4)
+        self.assertTrue(np.array_equal(occ, (s < 0.0).astype(np.float32)))
+
+    def test_voxel_mesh(self):
+        import point_cloud_utils as pcu
+        import numpy as np
+
+        def signed_volume(v, f):
+            a, b, c = v[f[:, 0]], v[f[:, 1]], v[f[:, 2]]
+            return np.sum(a * np.cross(b, c)) / 6.0
+
+        def is_closed_and_oriented(f):
+            # Every directed edge must be matched by an edge going the other way
+            e = np.concatenate([f[:, [0, 1]], f[:, [1, 2]], f[:, [2, 0]]])
+            fwd = np.unique(e, axis=0, return_counts=True)
+            bwd = np.unique(e[:, ::-1], axis=0, return_counts=True)
+            return np.array_equal(fwd[0], bwd[0]) and np.array_equal(fwd[1], bwd[1])
+
+        rng = np.random.default_rng(0)
+        voxels = rng.random((13, 9, 17)) > 0.6
+        voxel_size = np.array([0.5, 1.0, 2.0])
+        v, f = pcu.voxel_mesh(voxels, voxel_size=voxel_size, voxel_origin=(1.0, 2.0, 3.0))
+        self.assertEqual(f.dtype, np.int32)
+        self.assertEqual(v.dtype, np.float64)
+        self.assertEqual(np.unique(v, axis=0).shape[0], v.shape[0])
+        self.assertEqual(np.unique(f).shape[0], v.shape[0])
+        self.assertTrue(is_closed_and_oriented(f))
+        self.assertAlmostEqual(signed_volume(v, f), voxels.sum() * np.prod(voxel_size))
+        self.assertTrue(np.all(v >= np.array([1.0, 2.0, 3.0])))
+
+        # Sparse voxel coordinates give the same mesh
+        vs, fs = pcu.voxel_mesh(np.argwhere(voxels), voxel_size=voxel_size, voxel_origin=(1.0, 2.0, 3.0))
+        self.assertEqual(vs.shape, v.shape)
+        self.assertEqual(fs.shape, f.shape)
+        self.assertTrue(np.array_equal(np.unique(vs, axis=0), np.unique(v, axis=0)))
+        self.assertAlmostEqual(signed_volume(vs, fs), signed_volume(v, f))
+
+        # No sparse voxels give an empty mesh with the same dtypes as any other sparse input
+        ve, fe = pcu.voxel_mesh(np.zeros([0, 3], dtype=np.int64))
+        self.assertEqual(ve.shape, (0, 3))
+        self.assertEqual(fe.shape, (0, 3))
+        self.assertEqual(ve.dtype, vs.dtype)
+        self.assertEqual(fe.dtype, fs.dtype)
+
+        # Marching cubes on a sampled sphere
+        x = np.arange(40) - 19.5
+        sdf = (15.0 - np.linalg.norm(np.stack(np.meshgrid(x, x, x, indexing='ij'), axis=-1), axis=-1))
+        v, f = pcu.voxel_mesh(sdf.astype(np.float32), marching_cubes=True, voxel_origin=(-20.0, -20.0, -20.0))
+        self.assertEqual(v.dtype, np.float32)
+        self.assertEqual(f.dtype, np.int32)
+        self.assertTrue(is_closed_and_oriented(f))
+        self.assertLess(np.max(np.abs(np.linalg.norm(v, axis=-1) - 15.0)), 0.05)
+        self.assertAlmostEqual(signed_volume(v.astype(np.float64), f) / (4.0 / 3.0 * np.pi * 15.0 ** 3), 1.0, places=2)
+
+
+    def test_voxelize_point_cloud(self):
+        import point_cloud_utils as pcu
+        import numpy as np
+
+        rng = np.random.default_rng(0)
+        pts = rng.random((5000, 3)) * np.array([1.0, 2.0, 3.0])
+        feats = rng.random((pts.shape[0], 2))
+        voxel_size = np.array([0.1, 0.25, 0.2])
+
+        ijk, point_voxel, counts, voxel_feats = pcu.voxelize_point_cloud(pts, voxel_size, features=feats)
+        ref_ijk = np.floor((pts - pts.min(0)) / voxel_size).astype(np.int64)
+        ref_unique, ref_inverse, ref_counts = np.unique(ref_ijk, axis=0, return_inverse=True, return_counts=True)
+        self.assertTrue(np.array_equal(ijk, ref_unique))
+        self.assertTrue(np.array_equal(point_voxel, ref_inverse.ravel()))
+        self.assertTrue(np.array_equal(counts, ref_counts))
+        for reduction, fn in [('mean', np.mean), ('max', np.max)]:
+            _, _, _, voxel_feats = pcu.voxelize_point_cloud(pts, voxel_size, features=feats, reduction=reduction)
+            for k in range(0, ijk.shape[0], 17):
+                self.assertTrue(np.allclose(voxel_feats[k], fn(feats[point_voxel == k], axis=0)))
+
+        # Points outside the bounds are ignored
+        ijk, point_voxel, counts, _ = pcu.voxelize_point_cloud(pts, 0.1, min_bound=(0.25, 0.25, 0.25),
+                                                               max_bound=(0.75, 0.75, 0.75))
+        pts_ijk = np.floor((pts - 0.25) / 0.1)
+        inside = np.all(pts_ijk >= 0, axis=1) & np.all(pts_ijk <= np.floor(0.5 / 0.1), axis=1)
+        self.assertTrue(np.array_equal(point_voxel >= 0, inside))
+        self.assertEqual(counts.sum(), inside.sum())
+
+        # Dense grids
+        dense_counts, dense_feats = pcu.voxelize_point_cloud(pts, voxel_size, features=feats[:, 0], reduction='sum',
+                                                             dense=True)
+        self.assertEqual(dense_counts.shape, tuple(ref_ijk.max(0) + 1))
+        self.assertEqual(dense_feats.shape, dense_counts.shape)
+        self.assertEqual(dense_counts.sum(), pts.shape[0])
+        self.assertEqual(np.count_nonzero(dense_counts), ref_unique.shape[0])
+        self.assertAlmostEqual(dense_feats.sum(), feats[:, 0].sum())
+
+    def test_num_threads(self):
+        import point_cloud_utils as pcu
+        import numpy as np
+
+        prev_num_threads = pcu.get_num_threads()
+        self.assertGreaterEqual(prev_num_threads, 1)
+        with self.assertRaises(ValueError):
+            pcu.set_num_threads(0)
+
+        x = np.random.rand(1000, 3)
+        y = np.random.rand(500, 3)
+        dists, corrs = pcu.k_nearest_neighbors(x, y, k=4)
+        with pcu.limit_num_threads(1):
+            self.assertEqual(pcu.get_num_threads(), 1)
+            with pcu.limit_num_threads(2):
+                self.assertEqual(pcu.get_num_threads(), 2)
+            self.assertEqual(pcu.get_num_threads(), 1)
+            dists_1, corrs_1 = pcu.k_nearest_neighbors(x, y, k=4)
+            samples = pcu.lloyd_3d(50, random_seed=7)
+        self.assertEqual(pcu.get_num_threads(), prev_num_threads)
+        self.assertTrue(np.array_equal(corrs, corrs_1))
+        self.assertTrue(np.array_equal(dists, dists_1))
+        self.assertEqual(samples.shape, (50, 3))
+
+    def test_lazy_imports(self):
+        import subprocess
+        import sys
+
+        # Importing the package must not load any submodules, and using a function must only load the module it
+        # lives in
+        code = "import sys, point_cloud_utils as pcu\n" \
+               "loaded = lambda: sorted(m for m in sys.modules if m.startswith('point_cloud_utils.'))\n" \
+               "print(loaded())\n" \
+               "pcu.k_nearest_neighbors\n" \
+               "print(loaded())\n" \
+               "assert 'TriangleMesh' in dir(pcu) and 'hausdorff_distance' in pcu.__all__\n" \
+               "assert not hasattr(pcu, 'not_a_function')\n" \
+               "assert not hasattr(pcu, 'load_ply_vf') and 'save_mesh_cache_file' not in dir(pcu)\n" \
+               "assert 'np' not in pcu.__all__ and set(pcu.__all__) <= set(dir(pcu))\n"
+        out = subprocess.check_output([sys.executable, "-c", code])
+        lines = out.decode().splitlines()
+        self.assertEqual(lines[0], "[]")
+        self.assertEqual(lines[1], "['point_cloud_utils._pcu_distance']")
+
+    def test_profile(self):
+        import point_cloud_utils as pcu
+        import numpy as np
+        import json
+
+        v, f = pcu.load_mesh_vf(os.path.join(self.test_path, "cube_twist.obj"))
+        x = np.random.rand(1000, 3)
+        y = np.random.rand(500, 3)
+
+        with pcu.profile() as p:
+            pcu.k_nearest_neighbors(x, y, k=4)
+            with pcu.profile() as inner:
+                pcu.signed_distance(x, v, f)
+        pcu.k_nearest_neighbors(x, y, k=4)
+
+        phases = [(r['kernel'], r['phase']) for r in p.records]
+        self.assertEqual(phases, [("k_nearest_neighbors", "copy_inputs"), ("k_nearest_neighbors", "build_index"),
+                                  ("k_nearest_neighbors", "allocate_outputs"), ("k_nearest_neighbors", "query"),
+                                  ("signed_distance", "allocate_outputs"), ("signed_distance", "build_aabb_tree"),
+                                  ("signed_distance", "build_winding_number_tree"), ("signed_distance", "query")])
+        self.assertEqual(len(set(r['call_id'] for r in p.records)), 2)
+        self.assertEqual([(r['kernel'], r['phase']) for r in inner.records], phases[4:])
+        for r in p.records:
+            self.assertEqual(r['module'], "_pcu_distance")
+            self.assertGreaterEqual(r['seconds'], 0.0)
+            self.assertGreaterEqual(r['num_threads'], 1)
+        self.assertEqual(p.records[0]['bytes'], (x.size + y.size) * x.itemsize)
+
+        summary = p.summary()
+        self.assertEqual(len(summary), 8)
+        self.assertTrue(all(s['calls'] == 1 for s in summary))
+        self.assertEqual(json.loads(p.to_json())['summary'], summary)
+        self.assertIn("build_winding_number_tree", str(p))
+
+    def test_kd_tree(self):
+        import point_cloud_utils as pcu
+        import numpy as np
+        import concurrent.futures
+        import pickle
+        import tempfile
+
+        x = np.random.rand(10000, 3)
+        y = np.random.rand(1000, 3)
+        tree = pcu.KDTree(x)
+        self.assertEqual(tree.num_points, x.shape[0])
+        dists, corrs = tree.query(y, k=4)
+        dists_ref, corrs_ref = pcu.k_nearest_neighbors(y, x, k=4)
+        self.assertTrue(np.allclose(dists, dists_ref))
+        self.assertTrue(np.array_equal(corrs, corrs_ref))
+
+        small_dists, small_corrs = pcu.KDTree(x[:3], max_points_per_leaf=1).query(y, k=4)
+        self.assertTrue(np.all(small_corrs[:, 3] == -1))
+        self.assertTrue(np.all(small_dists[:, 3] == -1.0))
+        self.assertTrue(np.array_equal(np.sort(small_corrs[:, :3], axis=1), np.tile(np.arange(3), (y.shape[0], 1))))
+
+        # Attached, unpickled and memory-mapped trees give the same results
+        for attached in (pcu.KDTree.from_buffer(tree.to_buffer()), pickle.loads(pickle.dumps(tree))):
+            self.assertTrue(np.array_equal(attached.query(y, k=4)[1], corrs))
+        with self.assertRaises(ValueError):
+            pcu.Octree.from_buffer(tree.to_buffer())
+
+        # Corrupt buffers are rejected when they are attached instead of crashing queries
+        buffer = tree.to_buffer()
+        for corrupt in (buffer[:len(buffer) // 2], buffer[:12]):
+            with self.assertRaises(ValueError):
+                pcu.KDTree.from_buffer(corrupt)
+        attached = pcu.KDTree.from_buffer(bytearray(buffer))
+        attached._nodes[attached._nodes[:, 3] >= 0, 2] = attached._nodes.shape[0] + 7
+        with self.assertRaises(ValueError):
+            pcu.KDTree.from_buffer(attached.to_buffer())
+        attached = pcu.KDTree.from_buffer(bytearray(buffer))
+        attached._indices[17] = x.shape[0]
+        with self.assertRaises(ValueError):
+            pcu.KDTree.from_buffer(attached.to_buffer())
+        attached = pcu.KDTree.from_buffer(bytearray(buffer))
+        attached._nodes = attached._nodes.astype(np.int32)
+        with self.assertRaises(ValueError):
+            pcu.KDTree.from_buffer(attached.to_buffer())
+
+        # A valid but maximally unbalanced tree (a chain of nodes each splitting off one point) is searched without
+        # recursing once per level
+        num_chain = 200000
+        chain_points = np.zeros((num_chain + 1, 3))
+        chain_points[:, 0] = np.arange(num_chain + 1)
+        chain_nodes = np.zeros((2 * num_chain + 1, 4), dtype=np.int64)
+        chain_splits = np.zeros(2 * num_chain + 1)
+        depth = np.arange(num_chain)
+        chain_nodes[2 * depth] = np.stack([depth, np.full(num_chain, num_chain + 1), 2 * depth + 2,
+                                           np.zeros(num_chain, dtype=np.int64)], axis=1)
+        chain_nodes[2 * depth + 1] = np.stack([depth, depth + 1, -np.ones(num_chain, dtype=np.int64),
+                                               -np.ones(num_chain, dtype=np.int64)], axis=1)
+        chain_nodes[-1] = [num_chain, num_chain + 1, -1, -1]
+        chain_splits[2 * depth] = depth
+        chain_tree = pcu.KDTree.__new__(pcu.KDTree)
+        chain_tree._init_from_arrays(dict(max_points_per_leaf=1),
+                                     dict(_tree_points=chain_points, _indices=np.arange(num_chain + 1),
+                                          _nodes=chain_nodes, _splits=chain_splits))
+        chain_tree = pcu.KDTree.from_buffer(chain_tree.to_buffer())
+        chain_queries = np.array([[num_chain + 5.0, 0.0, 0.0], [3.2, 0.0, 0.0]])
+        self.assertTrue(np.array_equal(chain_tree.query(chain_queries, k=2)[1],
+                                       [[num_chain, num_chain - 1], [3, 4]]))
+
+        # The tree spans many leaves and is queried concurrently from several threads, each using several threads
+        self.assertGreater(tree._nodes.shape[0], 1000)
+        def query_chunk(chunk):
+            with pcu.limit_num_threads(2):
+                return tree.query(chunk, k=4)[1]
+        with concurrent.futures.ThreadPoolExecutor(4) as pool:
+            results = list(pool.map(query_chunk, np.array_split(y, 8)))
+        self.assertTrue(np.array_equal(np.concatenate(results), corrs))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "tree.pcuindex")
+            tree.save(path)
+            loaded = pcu.KDTree.load(path)
+            self.assertTrue(np.array_equal(loaded.query(y, k=4)[1], corrs))
+            self.assertLess(len(pickle.dumps(loaded)), 1000)  # Only the filename is pickled
+            loaded.close()
+
+        # Share the tree with a process pool through shared memory
+        with tree.to_shared_memory() as shared_tree:
+            self.assertLess(len(pickle.dumps(shared_tree)), 1000)  # Only the name of the segment is pickled
+            with concurrent.futures.ProcessPoolExecutor(2) as pool:
+                chunks = np.array_split(y, 4)
+                results = list(pool.map(_query_kd_tree, [shared_tree] * len(chunks), chunks))
+        self.assertTrue(np.array_equal(np.concatenate(results), corrs))
+
+    def test_octree(self):
+        import point_cloud_utils as pcu
+        import numpy as np
+        import pickle
+
+        x = np.random.rand(5000, 3)
+        octree = pcu.Octree(4)
+        self.assertTrue(octree.is_empty())
+        octree.build_from_point_cloud(x)
+        self.assertFalse(octree.is_empty())
+        self.assertTrue(np.all(octree.min_bound <= x.min(0)))
+        self.assertTrue(np.all(octree.max_bound > x.max(0)))
+        self.assertTrue(np.all(octree.point_depths(x) == 4))
+        self.assertTrue(np.all(octree.point_depths(x + 10.0) == -1))
+
+        info, indices = octree.find(x[:100])
+        for i in range(100):
+            self.assertIn(i, indices[i])
+            origin, size, depth, _ = info[i]
+            self.assertEqual(depth, 4)
+            self.assertTrue(np.all(origin <= x[i]) and np.all(x[i] < origin + size))
+        self.assertIsNone(octree.find(x[:1] + 10.0)[0][0])
+
+        with octree.to_shared_memory() as shared_octree:
+            for attached in (shared_octree, pickle.loads(pickle.dumps(shared_octree)),
+                             pickle.loads(pickle.dumps(octree))):
+                self.assertTrue(np.array_equal(attached.min_bound, octree.min_bound))
+                self.assertTrue(np.array_equal(attached.point_depths(x), octree.point_depths(x)))
+                attached_indices = attached.find(x[:100])[1]
+                self.assertTrue(all(np.array_equal(a, b) for a, b in zip(attached_indices, indices)))
+
+        corrupt = pcu.Octree.from_buffer(octree.to_buffer())
+        corrupt._children[corrupt._children >= 0] = 0  # Cycles back to the root
+        with self.assertRaises(ValueError):
+            pcu.Octree.from_buffer(corrupt.to_buffer())
+
+        octree.clear()
+        self.assertTrue(octree.is_empty())
 
 
 if __name__ == '__main__':